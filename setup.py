@@ -231,10 +231,15 @@ except pkgconfig.PackageNotFoundError as e:
     print("Package Not Found", e)
     print("Falling back to static flags.")
 
+if IS_LINUX:
+    # shm_open lives in librt on glibc versions older than 2.34
+    library_flags.setdefault("libraries", []).append("rt")
+
 MEMRAY_EXTENSION = Extension(
     name="memray._memray",
     sources=[
         "src/memray/_memray.pyx",
+        "src/memray/_memray/allocation_filter.cpp",
         "src/memray/_memray/compat.cpp",
         "src/memray/_memray/hooks.cpp",
         "src/memray/_memray/tracking_api.cpp",
@@ -249,6 +254,7 @@ MEMRAY_EXTENSION = Extension(
         "src/memray/_memray/snapshot.cpp",
         "src/memray/_memray/socket_reader_thread.cpp",
         "src/memray/_memray/native_resolver.cpp",
+        "src/memray/_memray/ptrace_injector.cpp",
     ],
     language="c++",
     extra_compile_args=["-std=c++17", "-Wall", *EXTRA_COMPILE_ARGS],
@@ -1,4 +1,5 @@
 from ._ipython import load_ipython_extension
+from ._memray import AllocationFilter
 from ._memray import AllocationRecord
 from ._memray import AllocatorType
 from ._memray import Destination
@@ -6,6 +7,9 @@ from ._memray import FileDestination
 from ._memray import FileFormat
 from ._memray import FileReader
 from ._memray import MemorySnapshot
+from ._memray import RingBufferDestination
+from ._memray import SharedMemoryDestination
+from ._memray import SharedMemoryReader
 from ._memray import SocketDestination
 from ._memray import SocketReader
 from ._memray import Tracker
@@ -16,6 +20,7 @@ from ._metadata import Metadata
 from ._version import __version__
 
 __all__ = [
+    "AllocationFilter",
     "AllocationRecord",
     "AllocatorType",
     "FileFormat",
@@ -25,9 +30,12 @@ __all__ = [
     "Tracker",
     "FileReader",
     "SocketReader",
+    "SharedMemoryReader",
     "Destination",
     "FileDestination",
     "SocketDestination",
+    "SharedMemoryDestination",
+    "RingBufferDestination",
     "Metadata",
     "__version__",
     "set_log_level",
@@ -1,5 +1,8 @@
+from memray._allocation_filter import AllocationFilter as AllocationFilter
 from memray._destination import Destination as Destination
 from memray._destination import FileDestination as FileDestination
+from memray._destination import RingBufferDestination as RingBufferDestination
+from memray._destination import SharedMemoryDestination as SharedMemoryDestination
 from memray._destination import SocketDestination as SocketDestination
 from memray._metadata import Metadata as Metadata
 
@@ -8,6 +11,7 @@ from ._memray import AllocatorType as AllocatorType
 from ._memray import FileFormat as FileFormat
 from ._memray import FileReader as FileReader
 from ._memray import MemorySnapshot as MemorySnapshot
+from ._memray import SharedMemoryReader as SharedMemoryReader
 from ._memray import SocketReader as SocketReader
 from ._memray import Tracker as Tracker
 from ._memray import dump_all_records as dump_all_records
@@ -0,0 +1,42 @@
+import typing
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class AllocationFilter:
+    """Specify which allocations a tracked process should send to a reader.
+
+    When a ``SocketReader`` is given a filter, it sends it to the tracked
+    process as soon as it connects. Once the tracker receives it, shortly
+    after, it drops every allocation that doesn't match it before it is sent
+    over the socket (see
+    :ref:`Filtering live data`). An allocation is sent only if it matches
+    every kind of rule that the filter sets. Deallocations are always sent.
+
+    Args:
+        threads: The native thread IDs of the threads whose allocations
+            should be sent, as returned by `threading.get_native_id`. By
+            default, allocations from every thread are sent.
+        min_size: The smallest allocation, in bytes, that should be sent.
+        files: Only send allocations made while a function defined in a file
+            whose path starts with one of these prefixes is on the stack.
+        modules: Only send allocations made while a function defined in one
+            of these modules, or in a module nested inside one of them, is on
+            the stack. Modules are matched by the path of their source file,
+            so ``"pkg.sub"`` matches ``.../pkg/sub.py`` and any file under
+            ``.../pkg/sub/``.
+    """
+
+    threads: typing.Tuple[int, ...] = ()
+    min_size: int = 0
+    files: typing.Tuple[str, ...] = ()
+    modules: typing.Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if self.min_size < 0:
+            raise ValueError("min_size must be non-negative")
+        if any(tid < 0 for tid in self.threads):
+            raise ValueError("thread IDs must be non-negative")
+        for rule in (*self.files, *self.modules):
+            if not rule or "\n" in rule:
+                raise ValueError(f"Invalid file or module filter: {rule!r}")
@@ -0,0 +1,369 @@
+"""Share a single live tracking session between several viewers.
+
+A tracked process can only stream its records to one `SocketReader`. A
+`LiveBroker` is that reader: it keeps the only aggregator for the session and
+serves the per-location totals it produces to any number of `BrokerReader`
+clients. Clients can connect and disconnect at any time. Each one receives a
+full snapshot when it connects, followed by only the locations that changed
+since the previous update. Every client has its own thread to send it
+messages, and a client that falls too far behind is dropped, so that a slow
+viewer can't stall the others or the broker itself.
+
+Messages are JSON documents, each one prefixed by its length as a 4 byte big
+endian integer.
+"""
+
+import contextlib
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from memray import SocketReader
+from memray._errors import MemrayError
+from memray.reporters.tui import IncrementalAggregator
+from memray.reporters.tui import LocationRollupRow
+from memray.reporters.tui import fetch_live_snapshot
+
+PROTOCOL_VERSION = 1
+
+_HEADER = struct.Struct("!I")
+# How long a client may take to accept a message before being dropped.
+_SEND_TIMEOUT = 5.0
+# How many messages may be waiting to be sent to a client before it's
+# considered too slow to keep up, and dropped.
+_MAX_PENDING_MESSAGES = 16
+_ACCEPT_POLL_INTERVAL = 0.1
+
+_LocationKey = Tuple[str, str]
+# (own_memory, total_memory, n_allocations, thread_ids)
+_LocationTotals = Tuple[int, int, int, List[int]]
+
+
+def _encode_message(message: Dict[str, Any]) -> bytes:
+    data = json.dumps(message).encode("utf-8")
+    return _HEADER.pack(len(data)) + data
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    data = _recv_exactly(sock, size)
+    if data is None:
+        return None
+    message: Dict[str, Any] = json.loads(data)
+    return message
+
+
+class _Client:
+    """A client connected to a `LiveBroker`.
+
+    Messages are queued and sent by a thread dedicated to the client, so that
+    queueing a message never blocks.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        sock.settimeout(_SEND_TIMEOUT)
+        self._sock = sock
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._send_messages, daemon=True)
+        self._is_connected = True
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def send(self, data: bytes) -> bool:
+        """Queue a message to be sent to the client.
+
+        Returns False if the client disconnected, or if it isn't keeping up
+        with the messages that were already queued for it.
+        """
+        if not self._is_connected or self._queue.qsize() >= _MAX_PENDING_MESSAGES:
+            return False
+        self._queue.put(data)
+        return True
+
+    def close(self) -> None:
+        self._is_connected = False
+        self._queue.put(None)
+        # Interrupt a send that the client isn't reading.
+        with contextlib.suppress(OSError):
+            self._sock.shutdown(socket.SHUT_RDWR)
+        if self._thread.is_alive():
+            self._thread.join()
+        self._sock.close()
+
+    def _send_messages(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                self._sock.sendall(data)
+            except OSError:
+                self._is_connected = False
+                return
+
+
+class LiveBroker:
+    """Serve the live data read from a tracked process to many clients.
+
+    Args:
+        reader: An open reader connected to the tracked process.
+        port: The port to accept client connections on.
+        address: The address to bind the server socket to.
+    """
+
+    def __init__(
+        self, reader: SocketReader, port: int, address: str = "127.0.0.1"
+    ) -> None:
+        self._reader = reader
+        self._aggregator = IncrementalAggregator(reader.has_native_traces)
+        self._lock = threading.Lock()
+        self._clients: List[_Client] = []
+        self._locations: Dict[_LocationKey, _LocationTotals] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._version = 0
+        self._server = socket.create_server((address, port))
+        self._closing = threading.Event()
+        self._accept_thread = threading.Thread(target=self._accept_clients)
+
+    @property
+    def port(self) -> int:
+        port: int = self._server.getsockname()[1]
+        return port
+
+    @property
+    def n_clients(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def start(self) -> None:
+        """Publish the initial snapshot and start accepting clients."""
+        self.publish()
+        self._accept_thread.start()
+
+    def serve(self, poll_interval: float = 1.0) -> None:
+        """Publish updates until the tracked process disconnects."""
+        self.start()
+        try:
+            while self._reader.is_active:
+                time.sleep(poll_interval)
+                self.publish()
+        finally:
+            self.close()
+
+    def publish(self) -> None:
+        """Fetch the latest data and send what changed to every client."""
+        snapshot = fetch_live_snapshot(self._reader, self._aggregator)
+        locations = {
+            (location.function, location.file): (
+                entry.own_memory,
+                entry.total_memory,
+                entry.n_allocations,
+                sorted(entry.thread_ids),
+            )
+            for location, entry in snapshot.records_by_location.items()
+        }
+
+        with self._lock:
+            changed = [
+                [*key, *totals]
+                for key, totals in locations.items()
+                if self._locations.get(key) != totals
+            ]
+            removed = [list(key) for key in self._locations if key not in locations]
+            self._locations = locations
+            self._thread_names = dict(snapshot.thread_names)
+            self._version += 1
+            update = self._update_message(full=False, changed=changed)
+            update["removed"] = removed
+            data = _encode_message(update)
+            for client in list(self._clients):
+                if not client.send(data):
+                    client.close()
+                    self._clients.remove(client)
+
+    def close(self) -> None:
+        self._closing.set()
+        if self._accept_thread.is_alive():
+            self._accept_thread.join()
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+
+    def _update_message(self, full: bool, changed: List[Any]) -> Dict[str, Any]:
+        return {
+            "version": self._version,
+            "full": full,
+            "changed": changed,
+            "removed": [],
+            "thread_names": self._thread_names,
+        }
+
+    def _accept_clients(self) -> None:
+        # Closing a socket doesn't interrupt a blocked accept() on every
+        # platform, so poll for new connections instead.
+        self._server.settimeout(_ACCEPT_POLL_INTERVAL)
+        while not self._closing.is_set():
+            try:
+                sock, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            client = _Client(sock)
+            with self._lock:
+                # Holding the lock ensures that no update is published between
+                # the full snapshot and the client being registered.
+                hello = {
+                    "protocol": PROTOCOL_VERSION,
+                    "pid": self._reader.pid,
+                    "command_line": self._reader.command_line,
+                }
+                snapshot = self._update_message(
+                    full=True,
+                    changed=[
+                        [*key, *totals] for key, totals in self._locations.items()
+                    ],
+                )
+                client.send(_encode_message(hello))
+                client.send(_encode_message(snapshot))
+                client.start()
+                self._clients.append(client)
+
+
+class BrokerReader:
+    """Read a live tracking session through a `LiveBroker`.
+
+    This can be used by the live TUI in place of a `SocketReader`. The broker
+    already merges the stacks of every location, so the reader behaves like a
+    `SocketReader` for a capture without native traces, and it has no history.
+
+    Args:
+        port: The port the broker accepts connections on.
+        address: The address the broker is listening on.
+    """
+
+    has_native_traces = False
+    history_retention = 0.0
+
+    def __init__(self, port: int, address: str = "127.0.0.1") -> None:
+        self._port = port
+        self._address = address
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._locations: Dict[_LocationKey, _LocationTotals] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._version = 0
+        self._is_active = False
+        self.pid: Optional[int] = None
+        self.command_line: Optional[str] = None
+
+    def __enter__(self) -> "BrokerReader":
+        self._sock = socket.create_connection((self._address, self._port))
+        hello = _recv_message(self._sock)
+        if hello is None or hello.get("protocol") != PROTOCOL_VERSION:
+            self._sock.close()
+            raise MemrayError(
+                f"Port {self._port} is not served by a compatible memray broker"
+            )
+        self.pid = hello["pid"]
+        self.command_line = hello["command_line"]
+
+        # Wait for the initial snapshot so the reader is never seen empty.
+        snapshot = _recv_message(self._sock)
+        self._is_active = snapshot is not None
+        if snapshot is not None:
+            self._apply(snapshot)
+        self._thread = threading.Thread(target=self._receive_updates, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._sock is not None:
+            with contextlib.suppress(OSError):
+                self._sock.shutdown(socket.SHUT_RDWR)
+            self._sock.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def is_active(self) -> bool:
+        return self._is_active
+
+    @property
+    def version(self) -> int:
+        """The version of the last update received from the broker."""
+        return self._version
+
+    def get_location_rollup(
+        self,
+    ) -> Tuple[List[LocationRollupRow], Dict[int, str]]:
+        with self._lock:
+            rows = [
+                (function, file, own, total, n_allocations, tuple(tids))
+                for (function, file), totals in self._locations.items()
+                for own, total, n_allocations, tids in (totals,)
+            ]
+            thread_names = dict(self._thread_names)
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows, thread_names
+
+    def get_history_timestamps(self) -> List[int]:
+        return []
+
+    def get_history_location_rollup(
+        self, index: int
+    ) -> Tuple[List[LocationRollupRow], Dict[int, str]]:
+        raise IndexError(index)
+
+    def get_history_snapshot(self, index: int) -> List[Any]:
+        raise IndexError(index)
+
+    def _receive_updates(self) -> None:
+        assert self._sock is not None
+        while True:
+            try:
+                update = _recv_message(self._sock)
+            except OSError:
+                update = None
+            if update is None:
+                self._is_active = False
+                return
+            self._apply(update)
+
+    def _apply(self, update: Dict[str, Any]) -> None:
+        with self._lock:
+            if update["full"]:
+                self._locations.clear()
+            for function, file in update["removed"]:
+                self._locations.pop((function, file), None)
+            for function, file, own, total, n_allocations, tids in update["changed"]:
+                self._locations[function, file] = (own, total, n_allocations, tids)
+            self._thread_names = {
+                int(tid): name for tid, name in update["thread_names"].items()
+            }
+            self._version = update["version"]
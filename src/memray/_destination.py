@@ -17,11 +17,24 @@ class FileDestination(Destination):
         overwrite: By default, if a file already exists at that path an
             exception will be raised. If you provide ``overwrite=True``, then
             the existing file will be overwritten instead.
+        rotate_size: If provided, the capture is split into segments named
+            after *path* with a numeric suffix (``.1``, ``.2``, ...), and a
+            new segment is started once the current one holds this many
+            bytes (see :ref:`Rotating capture files`). Each segment can be
+            read on its own.
+        rotate_interval: If provided, the capture is split into segments
+            like with *rotate_size*, and a new segment is started once the
+            current one is this many seconds old.
+        keep: If provided, only this many of the most recent segments are
+            kept, and older ones are deleted as new ones are started.
     """
 
     path: typing.Union[pathlib.Path, str]
     overwrite: bool = False
     compress_on_exit: bool = True
+    rotate_size: typing.Optional[int] = None
+    rotate_interval: typing.Optional[int] = None
+    keep: typing.Optional[int] = None
 
 
 @dataclass(frozen=True)
@@ -45,7 +58,79 @@ class SocketDestination(Destination):
             :ref:`Native Tracking`, because the client on the remote machine
             won't have access to the shared libraries used by the tracked
             process.
+        compress: Whether to compress the records sent to the client with
+            LZ4. This reduces the bandwidth needed to send them to a client
+            on another machine, at the cost of some CPU time in the tracked
+            process. Readers detect compressed streams automatically.
     """
 
     server_port: int
     address: str = "127.0.0.1"
+    compress: bool = False
+
+
+@dataclass(frozen=True)
+class SharedMemoryDestination(Destination):
+    """Specify a shared memory segment to stream captured allocations through.
+
+    This works like a `SocketDestination`, except that records are handed to
+    the reader through a ring buffer in a POSIX shared memory segment instead
+    of a TCP connection, so the tracked process doesn't need to make a system
+    call to send them. The reader must run on the same machine, and attach
+    with a ``memray.SharedMemoryReader`` using the same name. The `Tracker`
+    constructor will not return until a reader has attached.
+
+    Args:
+        name: The name of the shared memory segment to create. It must not
+            already exist, and should be short, as some platforms limit
+            these names to 31 characters.
+        buffer_size: The size of the ring buffer, in bytes. It is rounded up
+            to a power of two. If the reader falls behind and the buffer
+            fills up, the tracked process waits for the reader to catch up.
+    """
+
+    name: str
+    buffer_size: int = 16 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class RingBufferDestination(Destination):
+    """Keep only the most recent captured allocations in memory.
+
+    This turns the `Tracker` into a flight recorder: nothing is written while
+    the program runs. Instead, the most recent records are kept in memory,
+    and older records are folded into the set of allocations that they leave
+    alive. Whenever the buffer is dumped, a capture file is written holding
+    those surviving allocations followed by every recent record, which can be
+    used with any reporter (see :ref:`Flight recorder mode`).
+
+    The buffer is dumped by calling `Tracker.dump_ring_buffer`, when the
+    process receives *dump_signal*, or when an exception escapes the
+    tracker's ``with`` block. Dumps that aren't given a file name are written
+    next to *path*, with the first numeric suffix (``.1``, ``.2``, ...) that
+    doesn't name an existing file.
+
+    Args:
+        path: The path that dumps are named after.
+        max_bytes: How much memory the recent records can use. Only the
+            records are counted, not the allocations that outlived them, nor
+            the stacks and frames they refer to.
+        max_seconds: If provided, records older than this many seconds are
+            folded into the surviving allocations too, even if there is room
+            left for them.
+        overwrite: Whether `Tracker.dump_ring_buffer` may overwrite an
+            existing file when it is given a file name.
+        dump_signal: A signal number that dumps the buffer when the process
+            receives it, like ``signal.SIGUSR1``. The handler is installed
+            when the tracker is activated, which must happen in the main
+            thread, and removed when it is deactivated.
+        dump_on_exception: Whether to dump the buffer when an exception
+            escapes the tracker's ``with`` block.
+    """
+
+    path: typing.Union[pathlib.Path, str]
+    max_bytes: int = 64 * 1024 * 1024
+    max_seconds: typing.Optional[int] = None
+    overwrite: bool = False
+    dump_signal: typing.Optional[int] = None
+    dump_on_exception: bool = True
@@ -0,0 +1,88 @@
+import pathlib
+import re
+import typing
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+# cgroup v1 reports "no limit" as a huge number rounded down to a page size.
+_CGROUP_V1_UNLIMITED = 2**62
+
+
+def _read_limit(path: pathlib.Path) -> typing.Optional[int]:
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+    if value == "max" or not value.isdigit() or int(value) >= _CGROUP_V1_UNLIMITED:
+        return None
+    return int(value)
+
+
+def cgroup_memory_limit() -> typing.Optional[int]:
+    """Return the memory limit of the cgroup this process runs in, in bytes.
+
+    The limit of a cgroup is the lowest limit set on it or on any of its
+    ancestors. Returns None if no limit applies, or if it can't be read.
+    """
+    try:
+        lines = pathlib.Path("/proc/self/cgroup").read_text().splitlines()
+    except OSError:
+        return None
+
+    limits = []
+    for line in lines:
+        _, controllers, cgroup = line.split(":", 2)
+        if controllers == "":
+            root, limit_file = pathlib.Path("/sys/fs/cgroup"), "memory.max"
+        elif "memory" in controllers.split(","):
+            root, limit_file = (
+                pathlib.Path("/sys/fs/cgroup/memory"),
+                "memory.limit_in_bytes",
+            )
+        else:
+            continue
+
+        directory = root / cgroup.lstrip("/")
+        while True:
+            limit = _read_limit(directory / limit_file)
+            if limit is not None:
+                limits.append(limit)
+            if directory == root:
+                break
+            directory = directory.parent
+
+    return min(limits, default=None)
+
+
+def parse_size(value: typing.Union[int, str], *, allow_percentage: bool) -> int:
+    """Parse a number of bytes, like ``1048576``, ``"512M"`` or ``"2GB"``.
+
+    If *allow_percentage* is true, a percentage like ``"90%"`` is also
+    accepted, and is taken as a share of the cgroup memory limit.
+    """
+    if isinstance(value, int):
+        size = value
+    elif allow_percentage and value.strip().endswith("%"):
+        try:
+            percentage = float(value.strip()[:-1])
+        except ValueError:
+            raise ValueError(f"Invalid percentage: {value!r}") from None
+        if not 0 < percentage <= 100:
+            raise ValueError(f"Percentage must be between 0 and 100: {value!r}")
+        limit = cgroup_memory_limit()
+        if limit is None:
+            raise ValueError(
+                f"Cannot use {value!r}: this process has no cgroup memory limit"
+            )
+        size = int(limit * percentage / 100)
+    else:
+        match = _SIZE_RE.match(value)
+        if not match:
+            raise ValueError(f"Invalid size: {value!r}")
+        number, unit = match.groups()
+        size = int(float(number) * _UNITS[unit.lower()])
+
+    if size <= 0:
+        raise ValueError(f"Size must be positive: {value!r}")
+    return size
@@ -3,6 +3,7 @@ from pathlib import Path
 from types import FrameType
 from types import TracebackType
 from typing import Any
+from typing import Dict
 from typing import Iterable
 from typing import Iterator
 from typing import List
@@ -13,7 +14,10 @@ from typing import Type
 from typing import Union
 from typing import overload
 
+from memray._allocation_filter import AllocationFilter as AllocationFilter
 from memray._destination import FileDestination as FileDestination
+from memray._destination import RingBufferDestination as RingBufferDestination
+from memray._destination import SharedMemoryDestination as SharedMemoryDestination
 from memray._destination import SocketDestination as SocketDestination
 from memray._metadata import Metadata
 from memray._stats import Stats
@@ -25,6 +29,20 @@ NativeStackElement = Tuple[str, str, int]
 MemorySnapshot = NamedTuple(
     "MemorySnapshot", [("time", int), ("rss", int), ("heap", int)]
 )
+SnapshotDelta = NamedTuple(
+    "SnapshotDelta",
+    [("version", int), ("full", bool), ("records", Dict[int, "AllocationRecord"])],
+)
+LiveStats = NamedTuple(
+    "LiveStats",
+    [
+        ("heap_size", int),
+        ("total_allocations", Optional[int]),
+        ("total_allocated_bytes", Optional[int]),
+        ("rss", Optional[int]),
+        ("time", Optional[int]),
+    ],
+)
 
 def set_log_level(level: int) -> None: ...
 
@@ -179,7 +197,14 @@ def compute_statistics(
 def dump_all_records(file_name: Union[str, Path]) -> None: ...
 
 class SocketReader:
-    def __init__(self, port: int) -> None: ...
+    def __init__(
+        self,
+        port: int,
+        *,
+        history_retention: float = ...,
+        history_interval: float = ...,
+        allocation_filter: Optional[AllocationFilter] = ...,
+    ) -> None: ...
     def __enter__(self) -> "SocketReader": ...
     def __exit__(
         self,
@@ -190,6 +215,20 @@ class SocketReader:
     def get_current_snapshot(
         self, *, merge_threads: bool
     ) -> Iterator[AllocationRecord]: ...
+    def get_snapshot_delta(self, since_version: int = ...) -> SnapshotDelta: ...
+    def get_location_rollup(
+        self,
+    ) -> Tuple[
+        List[Tuple[str, str, int, int, int, Tuple[int, ...]]], Dict[int, str]
+    ]: ...
+    def get_live_stats(self) -> LiveStats: ...
+    def get_history_timestamps(self) -> List[int]: ...
+    def get_history_location_rollup(
+        self, sample_index: int
+    ) -> Tuple[
+        List[Tuple[str, str, int, int, int, Tuple[int, ...]]], Dict[int, str]
+    ]: ...
+    def get_history_snapshot(self, sample_index: int) -> List[AllocationRecord]: ...
     @property
     def command_line(self) -> Optional[str]: ...
     @property
@@ -198,6 +237,18 @@ class SocketReader:
     def pid(self) -> Optional[int]: ...
     @property
     def has_native_traces(self) -> bool: ...
+    @property
+    def history_retention(self) -> float: ...
+
+class SharedMemoryReader(SocketReader):
+    def __init__(
+        self,
+        name: str,
+        *,
+        history_retention: float = ...,
+        history_interval: float = ...,
+    ) -> None: ...
+    def __enter__(self) -> "SharedMemoryReader": ...
 
 class Tracker:
     @property
@@ -212,6 +263,10 @@ class Tracker:
         follow_fork: bool = ...,
         trace_python_allocators: bool = ...,
         file_format: FileFormat = ...,
+        dump_when_rss_exceeds: Union[int, str, None] = ...,
+        dump_on_growth_rate: Union[int, str, None] = ...,
+        temporary_allocation_threshold: Optional[int] = ...,
+        aggregation_memory_budget: Union[int, str, None] = ...,
     ) -> None: ...
     @overload
     def __init__(
@@ -223,6 +278,10 @@ class Tracker:
         follow_fork: bool = ...,
         trace_python_allocators: bool = ...,
         file_format: FileFormat = ...,
+        dump_when_rss_exceeds: Union[int, str, None] = ...,
+        dump_on_growth_rate: Union[int, str, None] = ...,
+        temporary_allocation_threshold: Optional[int] = ...,
+        aggregation_memory_budget: Union[int, str, None] = ...,
     ) -> None: ...
     def __enter__(self) -> Any: ...
     def __exit__(
@@ -231,6 +290,10 @@ class Tracker:
         excinst: Optional[BaseException],
         exctb: Optional[TracebackType],
     ) -> bool: ...
+    def dump_ring_buffer(self, file_name: Union[Path, str, None] = ...) -> Path: ...
+    def dump_snapshot(
+        self, file_name: Union[Path, str, None] = ..., *, overwrite: bool = ...
+    ) -> Path: ...
 
 def greenlet_trace(event: str, args: Any) -> None: ...
 
@@ -250,6 +313,9 @@ def get_symbolic_support() -> SymbolicSupport: ...
 
 RTLD_NOW: int
 RTLD_DEFAULT: int
+PTRACE_INJECTION_SUPPORTED: bool
+
+def ptrace_inject(pid: int, library_path: str, port: int) -> None: ...
 
 class HighWaterMarkAggregatorTestHarness:
     def add_allocation(
@@ -268,6 +334,41 @@ class HighWaterMarkAggregatorTestHarness:
     def get_temporal_allocations(self) -> list[TemporalAllocationRecord]: ...
     def get_allocations(self) -> list[dict[str, int]]: ...
 
+class IncrementalSnapshotAggregatorTestHarness:
+    def __init__(self, history_retention_ms: int = ...) -> None: ...
+    def add_allocation(
+        self,
+        tid: int,
+        address: int,
+        size: int,
+        allocator: int,
+        native_frame_id: int,
+        frame_index: int,
+        native_segment_generation: int,
+    ) -> None: ...
+    def set_location_totals(
+        self,
+        tid: int,
+        size: int,
+        n_allocations: int,
+        native_frame_id: int,
+        frame_index: int,
+        native_segment_generation: int,
+    ) -> None: ...
+    def get_snapshot_delta(self, since_version: int = ...) -> SnapshotDelta: ...
+    def get_snapshot_allocations(
+        self, merge_threads: bool
+    ) -> list[AllocationRecord]: ...
+    @property
+    def heap_size(self) -> int: ...
+    @property
+    def total_allocations(self) -> int: ...
+    @property
+    def total_allocated_bytes(self) -> int: ...
+    def take_history_sample(self, timestamp_ms: int) -> None: ...
+    def get_history_timestamps(self) -> list[int]: ...
+    def get_history_allocations(self, sample_index: int) -> list[AllocationRecord]: ...
+
 class AllocationLifetimeAggregatorTestHarness:
     def add_allocation(
         self,
@@ -3,6 +3,7 @@ import contextlib
 import os
 import pathlib
 import platform
+import signal
 import sys
 
 cimport cython
@@ -19,6 +20,7 @@ from posix.time cimport clock_gettime
 from posix.time cimport timespec
 
 from _memray.algorithm cimport count
+from _memray.allocation_filter cimport AllocationFilter as _AllocationFilter
 from _memray.hooks cimport Allocator
 from _memray.hooks cimport isDeallocator
 from _memray.logging cimport setLogThreshold
@@ -27,17 +29,22 @@ from _memray.record_reader cimport RecordReader
 from _memray.record_reader cimport RecordResult
 from _memray.record_writer cimport RecordWriter
 from _memray.record_writer cimport createRecordWriter
+from _memray.record_writer cimport createRingBufferRecordWriter
+from _memray.record_writer cimport createRotatingRecordWriter
 from _memray.records cimport AggregatedAllocation
+from _memray.records cimport AggregatedTemporaryAllocations
 from _memray.records cimport Allocation as _Allocation
 from _memray.records cimport FileFormat as _FileFormat
 from _memray.records cimport MemoryRecord
 from _memray.records cimport MemorySnapshot as _MemorySnapshot
 from _memray.sink cimport FileSink
 from _memray.sink cimport NullSink
+from _memray.sink cimport SharedMemorySink
 from _memray.sink cimport Sink
 from _memray.sink cimport SocketSink
 from _memray.snapshot cimport NO_THREAD_INFO
 from _memray.snapshot cimport AbstractAggregator
+from _memray.snapshot cimport AggregatedCaptureIntervalReaggregator
 from _memray.snapshot cimport AggregatedCaptureReaggregator
 from _memray.snapshot cimport AllocationLifetime
 from _memray.snapshot cimport AllocationLifetimeAggregator
@@ -46,13 +53,19 @@ from _memray.snapshot cimport HighWatermark
 from _memray.snapshot cimport HighWaterMarkAggregator
 from _memray.snapshot cimport HighWatermarkFinder
 from _memray.snapshot cimport HighWaterMarkLocationKey
+from _memray.snapshot cimport IncrementalSnapshotAggregator
 from _memray.snapshot cimport Py_GetSnapshotAllocationRecords
 from _memray.snapshot cimport Py_ListFromSnapshotAllocationRecords
+from _memray.snapshot cimport Py_TupleFromSnapshotDelta
 from _memray.snapshot cimport SnapshotAllocationAggregator
+from _memray.snapshot cimport SnapshotHistory
 from _memray.snapshot cimport TemporaryAllocationsAggregator
 from _memray.socket_reader_thread cimport BackgroundSocketReader
 from _memray.source cimport FileSource
+from _memray.source cimport SharedMemorySource
 from _memray.source cimport SocketSource
+from _memray.source cimport Source
+from _memray.tracking_api cimport DumpTriggers
 from _memray.tracking_api cimport Tracker as NativeTracker
 from _memray.tracking_api cimport install_trace_function
 from cpython cimport PyErr_CheckSignals
@@ -69,9 +82,13 @@ from libcpp.unordered_map cimport unordered_map
 from libcpp.utility cimport move
 from libcpp.vector cimport vector
 
+from ._allocation_filter import AllocationFilter
 from ._destination import Destination
 from ._destination import FileDestination
+from ._destination import RingBufferDestination
+from ._destination import SharedMemoryDestination
 from ._destination import SocketDestination
+from ._memory_limits import parse_size
 from ._metadata import Metadata
 from ._stats import Stats
 from ._thread_name_interceptor import ThreadNameInterceptor
@@ -568,6 +585,10 @@ cdef class TemporalAllocationGenerator:
 
 
 MemorySnapshot = collections.namedtuple("MemorySnapshot", "time rss heap")
+SnapshotDelta = collections.namedtuple("SnapshotDelta", "version full records")
+LiveStats = collections.namedtuple(
+    "LiveStats", "heap_size total_allocations total_allocated_bytes rss time"
+)
 
 cdef class ProfileFunctionGuard:
     def __dealloc__(self):
@@ -584,6 +605,13 @@ cdef class ProfileFunctionGuard:
 tracker_creation_lock = threading.Lock()
 
 
+def _shared_memory_name(name):
+    # POSIX shared memory object names must start with a slash.
+    if not name.startswith("/"):
+        name = "/" + name
+    return os.fsencode(name)
+
+
 cdef class Tracker:
     """Context manager for tracking memory allocations in a Python script.
 
@@ -606,9 +634,9 @@ cdef class Tracker:
             captured allocations into. This is the only argument that can be
             passed positionally. If not provided, the *destination* keyword
             argument must be provided.
-        destination (FileDestination or SocketDestination): The destination to
-            write captured allocations to. If provided, the *file_name*
-            argument must not be provided.
+        destination (FileDestination, SocketDestination, SharedMemoryDestination or RingBufferDestination):
+            The destination to write captured allocations to. If provided,
+            the *file_name* argument must not be provided.
         native_traces (bool): Whether or not to capture native stack frames, in
             addition to Python stack frames (see :ref:`Native Tracking`).
             Defaults to False.
@@ -629,6 +657,27 @@ cdef class Tracker:
         file_format (FileFormat): The format that should be used when writing
             to the capture file. See the `FileFormat` documentation for a list
             of supported file formats and their limitations.
+        dump_when_rss_exceeds (int or str): If provided, a snapshot is written
+            each time the resident set size of the process rises above this
+            many bytes, while tracking continues (see :ref:`RSS triggers`).
+            Sizes like ``"2G"`` are accepted, as are percentages like
+            ``"90%"``, which are taken as a share of the memory limit of the
+            process's cgroup.
+        dump_on_growth_rate (int or str): If provided, a snapshot is written
+            each time the resident set size of the process starts growing
+            faster than this many bytes per second.
+        temporary_allocation_threshold (int): The largest threshold that
+            :doc:`temporary allocations </temporary_allocations>` can be found
+            with in an output file using `FileFormat.AGGREGATED_ALLOCATIONS`.
+            Temporary allocations can be found with this threshold or any
+            lower one. Defaults to 1.
+        aggregation_memory_budget (int or str): If provided, how much memory
+            the aggregation for an output file using
+            `FileFormat.AGGREGATED_ALLOCATIONS` may use before the time
+            resolution of its high water mark history is lowered (see
+            :ref:`aggregation memory budget`). Accepts the same sizes and
+            percentages as *dump_when_rss_exceeds*. By default there is no
+            limit.
     """
     cdef bool _native_traces
     cdef unsigned int _memory_interval_ms
@@ -637,6 +686,11 @@ cdef class Tracker:
     cdef object _previous_profile_func
     cdef object _previous_thread_profile_func
     cdef unique_ptr[RecordWriter] _writer
+    cdef object _ring_buffer
+    cdef object _snapshot_destination
+    cdef DumpTriggers _dump_triggers
+    cdef object _previous_dump_signal_handler
+    cdef bool _active
 
     cdef unique_ptr[Sink] _make_writer(self, destination) except*:
         # Creating a Sink can raise Python exceptions (if is interrupted by signal
@@ -654,14 +708,32 @@ cdef class Tracker:
                                                  destination.compress_on_exit))
 
         elif isinstance(destination, SocketDestination):
-            return unique_ptr[Sink](new SocketSink(destination.address, destination.server_port))
+            return unique_ptr[Sink](
+                new SocketSink(
+                    destination.address, destination.server_port, destination.compress
+                )
+            )
+        elif isinstance(destination, SharedMemoryDestination):
+            if destination.buffer_size <= 0:
+                raise ValueError("buffer_size must be positive")
+            return unique_ptr[Sink](
+                new SharedMemorySink(
+                    _shared_memory_name(destination.name), destination.buffer_size
+                )
+            )
         else:
-            raise TypeError("destination must be a SocketDestination or FileDestination")
+            raise TypeError(
+                "destination must be a SocketDestination, SharedMemoryDestination"
+                " or FileDestination"
+            )
 
     def __cinit__(self, object file_name=None, *, object destination=None,
                   bool native_traces=False, unsigned int memory_interval_ms = 10,
                   bool follow_fork=False, bool trace_python_allocators=False,
-                  FileFormat file_format=FileFormat.ALL_ALLOCATIONS):
+                  FileFormat file_format=FileFormat.ALL_ALLOCATIONS,
+                  object dump_when_rss_exceeds=None, object dump_on_growth_rate=None,
+                  object temporary_allocation_threshold=None,
+                  object aggregation_memory_budget=None):
         if (file_name, destination).count(None) != 1:
             raise TypeError("Exactly one of 'file_name' or 'destination' argument must be specified")
 
@@ -678,8 +750,117 @@ cdef class Tracker:
             if follow_fork:
                 raise RuntimeError("follow_fork requires an output file")
 
+        if dump_when_rss_exceeds is not None or dump_on_growth_rate is not None:
+            if not (
+                isinstance(destination, RingBufferDestination)
+                or isinstance(destination, FileDestination)
+                and file_format == FileFormat.AGGREGATED_ALLOCATIONS
+            ):
+                raise ValueError(
+                    "RSS triggers require a RingBufferDestination or an output file"
+                    " using FileFormat.AGGREGATED_ALLOCATIONS"
+                )
+            self._dump_triggers.path = os.fsencode(destination.path)
+            if dump_when_rss_exceeds is not None:
+                self._dump_triggers.rss_threshold = parse_size(
+                    dump_when_rss_exceeds, allow_percentage=True
+                )
+            if dump_on_growth_rate is not None:
+                self._dump_triggers.rss_growth_rate = parse_size(
+                    dump_on_growth_rate, allow_percentage=False
+                )
+
+        if temporary_allocation_threshold is not None:
+            if not (
+                isinstance(destination, FileDestination)
+                and file_format == FileFormat.AGGREGATED_ALLOCATIONS
+            ):
+                raise ValueError(
+                    "temporary_allocation_threshold requires an output file using"
+                    " FileFormat.AGGREGATED_ALLOCATIONS"
+                )
+            if temporary_allocation_threshold < 0:
+                raise ValueError("temporary_allocation_threshold must be non-negative")
+        else:
+            temporary_allocation_threshold = 1
+
+        if aggregation_memory_budget is not None:
+            if not (
+                isinstance(destination, FileDestination)
+                and file_format == FileFormat.AGGREGATED_ALLOCATIONS
+            ):
+                raise ValueError(
+                    "aggregation_memory_budget requires an output file using"
+                    " FileFormat.AGGREGATED_ALLOCATIONS"
+                )
+            aggregation_memory_budget = parse_size(
+                aggregation_memory_budget, allow_percentage=True
+            )
+        else:
+            aggregation_memory_budget = 0
+
+        if isinstance(destination, RingBufferDestination):
+            if destination.max_bytes <= 0:
+                raise ValueError("max_bytes must be positive")
+            if destination.max_seconds is not None and destination.max_seconds <= 0:
+                raise ValueError("max_seconds must be positive")
             if file_format != FileFormat.ALL_ALLOCATIONS:
-                raise RuntimeError("AGGREGATED_ALLOCATIONS requires an output file")
+                raise ValueError(
+                    "RingBufferDestination only supports FileFormat.ALL_ALLOCATIONS"
+                )
+            if destination.dump_signal is not None and (
+                destination.dump_signal not in signal.valid_signals()
+                or destination.dump_signal in (signal.SIGKILL, signal.SIGSTOP)
+            ):
+                raise ValueError(
+                    f"dump_signal {destination.dump_signal} cannot be caught"
+                )
+            self._ring_buffer = destination
+            self._writer = move(
+                createRingBufferRecordWriter(
+                    command_line,
+                    native_traces,
+                    trace_python_allocators,
+                    destination.max_bytes,
+                    destination.max_seconds or 0,
+                )
+            )
+            return
+
+        if isinstance(destination, FileDestination) and (
+            destination.rotate_size is not None
+            or destination.rotate_interval is not None
+        ):
+            if destination.rotate_size is not None and destination.rotate_size <= 0:
+                raise ValueError("rotate_size must be positive")
+            if destination.rotate_interval is not None and destination.rotate_interval <= 0:
+                raise ValueError("rotate_interval must be positive")
+            if destination.keep is not None and destination.keep <= 0:
+                raise ValueError("keep must be positive")
+            if file_format != FileFormat.ALL_ALLOCATIONS:
+                raise ValueError("Rotation only supports FileFormat.ALL_ALLOCATIONS")
+            self._writer = move(
+                createRotatingRecordWriter(
+                    os.fsencode(destination.path),
+                    destination.overwrite,
+                    destination.compress_on_exit,
+                    command_line,
+                    native_traces,
+                    trace_python_allocators,
+                    destination.rotate_size or 0,
+                    destination.rotate_interval or 0,
+                    destination.keep or 0,
+                )
+            )
+            return
+        if isinstance(destination, FileDestination) and destination.keep is not None:
+            raise ValueError("keep requires rotate_size or rotate_interval")
+
+        if (
+            isinstance(destination, FileDestination)
+            and file_format == FileFormat.AGGREGATED_ALLOCATIONS
+        ):
+            self._snapshot_destination = destination
 
         self._writer = move(
             createRecordWriter(
@@ -688,6 +869,9 @@ cdef class Tracker:
                 native_traces,
                 file_format,
                 trace_python_allocators,
+                isinstance(destination, (SocketDestination, SharedMemoryDestination)),
+                temporary_allocation_threshold,
+                aggregation_memory_budget,
             )
         )
 
@@ -700,6 +884,14 @@ cdef class Tracker:
 
             if self._writer == NULL:
                 raise RuntimeError("Attempting to use stale output handle")
+
+            # Installing a signal handler fails off the main thread, so do it
+            # before changing any other state.
+            if self._ring_buffer is not None and self._ring_buffer.dump_signal is not None:
+                self._previous_dump_signal_handler = signal.signal(
+                    self._ring_buffer.dump_signal, self._handle_dump_signal
+                )
+
             writer = move(self._writer)
 
             for attr in ("_name", "_ident"):
@@ -714,27 +906,139 @@ cdef class Tracker:
             self._previous_thread_profile_func = threading._profile_hook
             threading.setprofile(start_thread_trace)
 
-            if "greenlet" in sys.modules:
-                NativeTracker.beginTrackingGreenlets()
-
-            NativeTracker.createTracker(
-                move(writer),
-                self._native_traces,
-                self._memory_interval_ms,
-                self._follow_fork,
-                self._trace_python_allocators,
-            )
+            try:
+                if "greenlet" in sys.modules:
+                    NativeTracker.beginTrackingGreenlets()
+
+                NativeTracker.createTracker(
+                    move(writer),
+                    self._native_traces,
+                    self._memory_interval_ms,
+                    self._follow_fork,
+                    self._trace_python_allocators,
+                    self._dump_triggers,
+                )
+            except BaseException:
+                self._restore_global_state()
+                raise
+            self._active = True
             return self
 
     @cython.profile(False)
     def __exit__(self, exc_type, exc_value, exc_traceback):
         with tracker_creation_lock:
+            if (
+                self._ring_buffer is not None
+                and self._ring_buffer.dump_on_exception
+                and exc_type is not None
+                and issubclass(exc_type, Exception)
+            ):
+                self._dump_ring_buffer_and_report()
+
+            self._active = False
             NativeTracker.destroyTracker()
-            sys.setprofile(self._previous_profile_func)
-            threading.setprofile(self._previous_thread_profile_func)
+            self._restore_global_state()
 
-            for attr in ("_name", "_ident"):
-                delattr(threading.Thread, attr)
+    def _restore_global_state(self):
+        sys.setprofile(self._previous_profile_func)
+        threading.setprofile(self._previous_thread_profile_func)
+
+        for attr in ("_name", "_ident"):
+            delattr(threading.Thread, attr)
+
+        if self._ring_buffer is not None and self._ring_buffer.dump_signal is not None:
+            signal.signal(
+                self._ring_buffer.dump_signal, self._previous_dump_signal_handler
+            )
+
+    def dump_ring_buffer(self, file_name=None):
+        """Write the records kept by a `RingBufferDestination` to a capture file.
+
+        The tracker must be active, and must have been created with a
+        `RingBufferDestination`. The records are written to a new capture
+        file that can be used with any reporter, just like a file written
+        by a `FileDestination`, and tracking continues afterwards.
+
+        Args:
+            file_name (str or pathlib.Path): The name of the file to write
+                the records into. If not provided, the destination's path is
+                used with the first numeric suffix (``.1``, ``.2``, ...) that
+                doesn't name an existing file.
+
+        Returns:
+            pathlib.Path: The path of the capture file that was written.
+        """
+        if self._ring_buffer is None:
+            raise RuntimeError("Only a RingBufferDestination can be dumped")
+        if not self._active:
+            raise RuntimeError("The tracker must be active to dump its records")
+
+        if file_name is None:
+            path = _next_numbered_path(self._ring_buffer.path)
+            overwrite = False
+        else:
+            path = pathlib.Path(file_name)
+            overwrite = self._ring_buffer.overwrite
+        NativeTracker.dumpToFile(os.fsencode(path), overwrite)
+        return path
+
+    def dump_snapshot(self, file_name=None, *, overwrite=False):
+        """Write the allocations that are alive right now to a capture file.
+
+        The tracker must be active, and must be writing to a file using
+        `FileFormat.AGGREGATED_ALLOCATIONS`. The snapshot is a small capture
+        file in that same format, holding every allocation that hasn't been
+        freed yet, aggregated by the location that made it. Tracking
+        continues afterwards, so snapshots taken at different times can be
+        compared to see where the heap grew.
+
+        Args:
+            file_name (str or pathlib.Path): The name of the file to write
+                the snapshot into. If not provided, the output file's path is
+                used with the first numeric suffix (``.1``, ``.2``, ...) that
+                doesn't name an existing file.
+            overwrite (bool): Whether to overwrite *file_name* if it already
+                exists. Defaults to False.
+
+        Returns:
+            pathlib.Path: The path of the snapshot that was written.
+        """
+        if self._snapshot_destination is None:
+            raise RuntimeError(
+                "Snapshots require an output file using"
+                " FileFormat.AGGREGATED_ALLOCATIONS"
+            )
+        if not self._active:
+            raise RuntimeError("The tracker must be active to take a snapshot")
+
+        if file_name is None:
+            path = _next_numbered_path(self._snapshot_destination.path)
+            overwrite = False
+        else:
+            path = pathlib.Path(file_name)
+        NativeTracker.dumpToFile(os.fsencode(path), overwrite)
+        return path
+
+    def _handle_dump_signal(self, signum, frame):
+        self._dump_ring_buffer_and_report()
+
+    def _dump_ring_buffer_and_report(self):
+        # Dumps that the program didn't ask for must not raise into it.
+        try:
+            path = self.dump_ring_buffer()
+        except Exception as exc:
+            print(f"Memray failed to dump its ring buffer: {exc}", file=sys.stderr)
+        else:
+            print(f"Memray dumped its ring buffer to {path}", file=sys.stderr)
+
+
+def _next_numbered_path(path):
+    n = 1
+    while True:
+        candidate = pathlib.Path(f"{os.fspath(path)}.{n}")
+        if not candidate.exists():
+            return candidate
+        n += 1
 
 
 def start_thread_trace(frame, event, arg):
@@ -1030,6 +1334,67 @@ cdef class FileReader:
 
         reader.close()
 
+    def _reaggregate_temporary_allocations(self, bool merge_threads, size_t threshold):
+        """Find temporary allocations in an AGGREGATED_ALLOCATIONS capture file.
+
+        The writer counts temporary allocations by how many other allocations
+        their thread made before they were deallocated, so any threshold up to
+        the one it was configured with can be used.
+        """
+        cdef AggregatedCaptureReaggregator aggregator
+        cdef shared_ptr[RecordReader] reader_sp = make_shared[RecordReader](
+            unique_ptr[FileSource](new FileSource(self._path))
+        )
+        cdef RecordReader* reader = reader_sp.get()
+
+        cdef ProgressIndicator progress_indicator = ProgressIndicator(
+            "Processing temporary allocations",
+            total=None,
+            report_progress=self._report_progress
+        )
+
+        cdef AggregatedTemporaryAllocations record
+        with progress_indicator:
+            while True:
+                PyErr_CheckSignals()
+                ret = reader.nextRecord()
+                if ret == RecordResult.RecordResultTemporaryAllocations:
+                    record = reader.getLatestTemporaryAllocations()
+                    if record.distance <= threshold:
+                        aggregator.addAllocation(record.toAllocation())
+                    progress_indicator.update(1)
+                elif ret in (
+                    RecordResult.RecordResultMemorySnapshot,
+                    RecordResult.RecordResultAggregatedAllocationRecord,
+                    RecordResult.RecordResultAggregatedAllocationInterval,
+                    RecordResult.RecordResultAllocationStats,
+                ):
+                    pass
+                else:
+                    assert ret != RecordResult.RecordResultMemoryRecord
+                    assert ret != RecordResult.RecordResultAllocationRecord
+                    break
+
+        if not reader.hasAllocationStats():
+            raise NotImplementedError(
+                "Can't find temporary allocations using a pre-aggregated capture file"
+                " written by an older version of Memray."
+            )
+        if threshold > reader.getTemporaryAllocationThreshold():
+            raise ValueError(
+                "Temporary allocations in this capture file can only be found with a"
+                f" threshold of at most {reader.getTemporaryAllocationThreshold()}"
+            )
+
+        for elem in Py_ListFromSnapshotAllocationRecords(
+            aggregator.getSnapshotAllocations(merge_threads)
+        ):
+            alloc = AllocationRecord(elem)
+            (<AllocationRecord> alloc)._reader = reader_sp
+            yield alloc
+
+        reader.close()
+
     def _aggregate_allocations(self, size_t records_to_process, bool merge_threads,
                                size_t temporary_buffer_size=0):
         cdef unique_ptr[AbstractAggregator] the_aggregator
@@ -1106,9 +1471,8 @@ cdef class FileReader:
     def get_temporary_allocation_records(self, merge_threads=True, threshold=1):
         self._ensure_not_closed()
         if self._header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
-            raise NotImplementedError(
-                "Can't find temporary allocations using a pre-aggregated capture file."
-            )
+            yield from self._reaggregate_temporary_allocations(merge_threads, threshold)
+            return
 
         cdef size_t max_records = self._header["stats"]["n_allocations"]
         yield from self._aggregate_allocations(
@@ -1121,7 +1485,8 @@ cdef class FileReader:
         self._ensure_not_closed()
         if self._header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
             raise NotImplementedError(
-                "Can't get allocation history using a pre-aggregated capture file."
+                "Can't get the history of leaked allocations using a pre-aggregated"
+                " capture file."
             )
 
         cdef shared_ptr[RecordReader] reader_sp = make_shared[RecordReader](
@@ -1165,12 +1530,55 @@ cdef class FileReader:
         gen.setup(move(aggregator.generateIndex()), reader_sp)
         yield from gen
 
+    def _reaggregate_allocation_history(self, bool merge_threads):
+        """Read the allocation history from an AGGREGATED_ALLOCATIONS capture file.
+
+        The writer stores, for every location, the runs of memory snapshots
+        during which it contributed the same amount to the high water mark.
+        """
+        cdef AggregatedCaptureIntervalReaggregator aggregator
+        cdef shared_ptr[RecordReader] reader_sp = make_shared[RecordReader](
+            unique_ptr[FileSource](new FileSource(self._path))
+        )
+        cdef RecordReader* reader = reader_sp.get()
+
+        cdef ProgressIndicator progress_indicator = ProgressIndicator(
+            "Processing allocation history",
+            total=None,
+            report_progress=self._report_progress
+        )
+        with progress_indicator:
+            while True:
+                PyErr_CheckSignals()
+                ret = reader.nextRecord()
+                if ret == RecordResult.RecordResultAggregatedAllocationInterval:
+                    aggregator.addInterval(reader.getLatestAggregatedAllocationInterval())
+                    progress_indicator.update(1)
+                elif (
+                    ret == RecordResult.RecordResultMemorySnapshot
+                    or ret == RecordResult.RecordResultAggregatedAllocationRecord
+                ):
+                    pass
+                else:
+                    assert ret != RecordResult.RecordResultMemoryRecord
+                    assert ret != RecordResult.RecordResultAllocationRecord
+                    break
+
+        hwm_by_snapshot = reader.getHighWaterMarkBytesBySnapshot()
+        if len(hwm_by_snapshot) == 0:
+            raise NotImplementedError(
+                "Can't get allocation history using a pre-aggregated capture file"
+                " written by an older version of Memray."
+            )
+
+        cdef TemporalAllocationGenerator gen = TemporalAllocationGenerator()
+        gen.setup(move(aggregator.generateIndex(merge_threads)), reader_sp)
+        return gen, hwm_by_snapshot
+
     def get_temporal_high_water_mark_allocation_records(self, merge_threads=True):
         self._ensure_not_closed()
         if self._header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
-            raise NotImplementedError(
-                "Can't get allocation history using a pre-aggregated capture file."
-            )
+            return self._reaggregate_allocation_history(merge_threads)
 
         cdef shared_ptr[RecordReader] reader_sp = make_shared[RecordReader](
             unique_ptr[FileSource](new FileSource(self._path))
@@ -1261,11 +1669,6 @@ def compute_statistics(
     cdef header = reader.getHeader()
     total = header["stats"]["n_allocations"] or None
 
-    if header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
-        raise NotImplementedError(
-            "Can't compute statistics using a pre-aggregated capture file."
-        )
-
     cdef AllocationStatsAggregator aggregator
     cdef ProgressIndicator progress_indicator = ProgressIndicator(
         "Computing statistics",
@@ -1282,17 +1685,32 @@ def compute_statistics(
                     reader.getLatestPythonFrameId(reader.getLatestAllocation()),
                 )
                 progress_indicator.update(1)
-            elif ret == RecordResult.RecordResultMemoryRecord:
-                pass
-            elif ret == RecordResult.RecordResultMemorySnapshot:
+            elif ret == RecordResult.RecordResultAggregatedAllocationRecord:
+                aggregator.addHighWaterMarkContribution(
+                    reader.getLatestAggregatedAllocation().contributionToHighWaterMark()
+                )
+                progress_indicator.update(1)
+            elif ret == RecordResult.RecordResultAllocationStats:
+                aggregator.addStatsEntry(reader.getLatestAllocationStatsEntry())
+            elif ret in (
+                RecordResult.RecordResultMemoryRecord,
+                RecordResult.RecordResultMemorySnapshot,
+                RecordResult.RecordResultAggregatedAllocationInterval,
+            ):
                 pass
             else:
-                assert ret != RecordResult.RecordResultMemorySnapshot
-                assert ret != RecordResult.RecordResultAggregatedAllocationRecord
                 break
 
-    # Ignore the n_allocations in the header, use our observed value.
-    header["stats"]["n_allocations"] = progress_indicator.num_processed
+    if header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
+        if not reader.hasAllocationStats():
+            raise NotImplementedError(
+                "Can't compute statistics using a pre-aggregated capture file"
+                " written by an older version of Memray."
+            )
+        header["stats"]["n_allocations"] = aggregator.totalAllocations()
+    else:
+        # Ignore the n_allocations in the header, use our observed value.
+        header["stats"]["n_allocations"] = progress_indicator.num_processed
 
     # Convert allocation counts by allocator/by size to Python dicts.
     cdef dict tmp = aggregator.allocationCountByAllocator()
@@ -1336,30 +1754,66 @@ def dump_all_records(object file_name):
     _reader.get().dumpAllRecords()
 
 
+cdef cppstring _serialize_allocation_filter(object allocation_filter) except*:
+    cdef _AllocationFilter native_filter
+    if allocation_filter is not None:
+        native_filter.min_size = allocation_filter.min_size
+        for tid in allocation_filter.threads:
+            native_filter.native_thread_ids.push_back(tid)
+        for prefix in allocation_filter.files:
+            native_filter.file_prefixes.push_back(os.fsencode(prefix))
+        for module in allocation_filter.modules:
+            native_filter.modules.push_back(module.encode("utf-8"))
+    return native_filter.serialize()
+
+
 cdef class SocketReader:
     cdef BackgroundSocketReader* _impl
     cdef shared_ptr[RecordReader] _reader
     cdef object _header
     cdef object _port
+    cdef object _allocation_filter
+    cdef uint64_t _history_retention_ms
+    cdef uint64_t _history_interval_ms
 
-    def __cinit__(self, int port):
+    def __cinit__(self, *args, **kwargs):
         self._impl = NULL
 
-    def __init__(self, port: int):
+    def __init__(
+        self,
+        port: int,
+        *,
+        history_retention: float = 0.0,
+        history_interval: float = 1.0,
+        allocation_filter: Optional[AllocationFilter] = None,
+    ):
+        self._set_history(history_retention, history_interval)
         self._header = {}
         self._port = port
+        self._allocation_filter = allocation_filter
+
+    cdef _set_history(self, history_retention, history_interval):
+        if history_retention < 0:
+            raise ValueError("history_retention must be non-negative")
+        if history_interval <= 0:
+            raise ValueError("history_interval must be positive")
+        self._history_retention_ms = int(history_retention * 1000)
+        self._history_interval_ms = int(history_interval * 1000)
 
     cdef _teardown(self):
         with nogil:
             del self._impl
         self._impl = NULL
 
-    cdef unique_ptr[SocketSource] _make_source(self) except*:
+    cdef unique_ptr[Source] _make_source(self) except*:
         # Creating a SocketSource can raise Python exceptions (if is interrupted by signal
         # handlers). If this happens, this method will propagate the appropriate exception.
         # We cannot use make_unique or C++ exceptions from SocketSource() won't be caught.
-        cdef SocketSource* source = new SocketSource(self._port)
-        return unique_ptr[SocketSource](source)
+        cdef cppstring allocation_filter = _serialize_allocation_filter(
+            self._allocation_filter
+        )
+        cdef SocketSource* source = new SocketSource(self._port, allocation_filter)
+        return unique_ptr[Source](source)
 
     def __enter__(self):
         if self._impl is not NULL:
@@ -1371,7 +1825,9 @@ cdef class SocketReader:
         self._reader = make_shared[RecordReader](move(self._make_source()))
         self._header = self._reader.get().getHeader()
 
-        self._impl = new BackgroundSocketReader(self._reader)
+        self._impl = new BackgroundSocketReader(
+            self._reader, self._history_retention_ms, self._history_interval_ms
+        )
         self._impl.start()
 
         return self
@@ -1410,6 +1866,10 @@ cdef class SocketReader:
             return False
         return self._header["native_traces"]
 
+    @property
+    def history_retention(self):
+        return self._history_retention_ms / 1000
+
     def get_current_snapshot(self, *, bool merge_threads):
         if self._impl is NULL:
             return
@@ -1420,6 +1880,126 @@ cdef class SocketReader:
             (<AllocationRecord> alloc)._reader = self._reader
             yield alloc
 
+    def get_snapshot_delta(self, since_version=0):
+        """Return the locations whose allocations changed since a snapshot version.
+
+        The returned ``SnapshotDelta`` has the version of the snapshot it
+        brings the caller up to date with, which should be passed as
+        ``since_version`` on the next call. Its ``records`` map a stable
+        location ID to an `AllocationRecord` with the location's current
+        totals; a record with no allocations means the location no longer
+        holds any memory. If ``full`` is set, ``records`` contains every
+        location that holds memory, and any previously received state must
+        be discarded. This happens when ``since_version`` is 0 or is too old
+        for the changes since it to still be known.
+        """
+        if self._impl is NULL:
+            return SnapshotDelta(since_version, False, {})
+
+        version, full, changes = self._impl.Py_GetSnapshotDelta(since_version)
+        records = {}
+        for location_id, elem in changes:
+            alloc = AllocationRecord(elem)
+            (<AllocationRecord> alloc)._reader = self._reader
+            records[location_id] = alloc
+        return SnapshotDelta(version, full, records)
+
+    def get_location_rollup(self):
+        """Return the live memory rolled up by function and file.
+
+        Every Python frame of every live allocation contributes to the
+        location of its function and file name, like in `aggregate_allocations`,
+        but the stacks are walked natively and cached across calls. Returns a
+        tuple of a list of ``(function, file, own_memory, total_memory,
+        n_allocations, thread_ids)`` tuples sorted by decreasing total memory,
+        and a dict mapping the ID of every thread holding memory to its name.
+        """
+        if self._impl is NULL:
+            return [], {}
+
+        return self._impl.Py_GetLocationRollup()
+
+    def get_live_stats(self):
+        """Return running totals for the tracked process as a `LiveStats`.
+
+        ``heap_size`` is the memory currently held by live allocations, while
+        ``total_allocations`` and ``total_allocated_bytes`` only ever grow.
+        Those totals are ``None`` if the tracked process aggregates the
+        allocations itself, since it only sends the totals of each location.
+        ``rss`` and ``time`` come from the latest memory record sent by the
+        tracked process, and are ``None`` until the first one arrives.
+        """
+        if self._impl is NULL:
+            return LiveStats(0, 0, 0, None, None)
+
+        stats = LiveStats(*self._impl.Py_GetLiveStats())
+        if self._header["file_format"] == FileFormat.AGGREGATED_ALLOCATIONS:
+            stats = stats._replace(total_allocations=None, total_allocated_bytes=None)
+        return stats
+
+    def get_history_timestamps(self):
+        """Return the times at which the retained history samples were taken.
+
+        Samples are taken at most every ``history_interval`` seconds, as the
+        tracked process reports its memory usage, and kept for
+        ``history_retention`` seconds. The times are in milliseconds since
+        the epoch, according to the tracked process, oldest first.
+        """
+        if self._impl is NULL:
+            return []
+
+        return self._impl.Py_GetHistoryTimestamps()
+
+    def get_history_location_rollup(self, sample_index):
+        """Like `get_location_rollup`, for the memory held when the history
+        sample with the given index was taken."""
+        if self._impl is NULL:
+            raise IndexError("history sample index out of range")
+
+        return self._impl.Py_GetHistoryLocationRollup(sample_index)
+
+    def get_history_snapshot(self, sample_index):
+        """Like `get_current_snapshot` with ``merge_threads=False``, for the
+        memory held when the history sample with the given index was taken."""
+        if self._impl is NULL:
+            raise IndexError("history sample index out of range")
+
+        records = []
+        for elem in self._impl.Py_GetHistorySnapshotAllocationRecords(sample_index):
+            alloc = AllocationRecord(elem)
+            (<AllocationRecord> alloc)._reader = self._reader
+            records.append(alloc)
+        return records
+
+
+cdef class SharedMemoryReader(SocketReader):
+    """Read the records of a process tracked with a `SharedMemoryDestination`.
+
+    This provides the same interface as a `SocketReader`, but it attaches to
+    the shared memory segment with the given name instead of connecting to a
+    port. Entering the context waits until the tracked process has created
+    the segment. Only one reader can ever attach to a given segment.
+    """
+    cdef object _name
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        history_retention: float = 0.0,
+        history_interval: float = 1.0,
+    ):
+        self._set_history(history_retention, history_interval)
+        self._header = {}
+        self._name = name
+
+    cdef unique_ptr[Source] _make_source(self) except*:
+        # See SocketReader._make_source for why make_unique can't be used.
+        cdef SharedMemorySource* source = new SharedMemorySource(
+            _shared_memory_name(self._name)
+        )
+        return unique_ptr[Source](source)
+
 cpdef enum SymbolicSupport:
     NONE = 1
     FUNCTION_NAME_ONLY = 2
@@ -1446,6 +2026,29 @@ RTLD_NOW = _RTLD_NOW
 RTLD_DEFAULT = <long long>_RTLD_DEFAULT
 
 
+cdef extern from "ptrace_injector.h" namespace "memray::attach":
+    bool ptraceInjectionSupported()
+    int injectClient(int pid, const cppstring& library_path, int port, cppstring* errmsg) nogil
+
+
+PTRACE_INJECTION_SUPPORTED = ptraceInjectionSupported()
+
+
+def ptrace_inject(int pid, str library_path, int port):
+    """Make a process load the injector at ``library_path`` using ptrace.
+
+    Raises an `OSError` (or the subclass matching its ``errno``) if the
+    injector couldn't be loaded.
+    """
+    cdef cppstring path = os.fsencode(library_path)
+    cdef cppstring errmsg
+    cdef int rc
+    with nogil:
+        rc = injectClient(pid, path, port, &errmsg)
+    if rc != 0:
+        raise OSError(rc, errmsg.decode("utf-8", "replace"))
+
+
 cdef extern from "snapshot.h":
     """
     std::vector<memray::tracking_api::AggregatedAllocation>
@@ -1522,6 +2125,100 @@ cdef class HighWaterMarkAggregatorTestHarness:
         return ret
 
 
+cdef class IncrementalSnapshotAggregatorTestHarness:
+    cdef IncrementalSnapshotAggregator aggregator
+    cdef unique_ptr[SnapshotHistory] history
+
+    def __cinit__(self, history_retention_ms=0):
+        self.history.reset(new SnapshotHistory(history_retention_ms))
+
+    def add_allocation(
+        self,
+        tid,
+        address,
+        size,
+        allocator,
+        native_frame_id,
+        frame_index,
+        native_segment_generation,
+    ):
+        cdef _Allocation allocation
+        allocation.tid = tid
+        allocation.address = address
+        allocation.size = size
+        allocation.allocator = <Allocator><int>allocator
+        allocation.native_frame_id = native_frame_id
+        allocation.frame_index = frame_index
+        allocation.native_segment_generation = native_segment_generation
+        allocation.n_allocations = 1
+        self.aggregator.addAllocation(allocation)
+
+    def set_location_totals(
+        self,
+        tid,
+        size,
+        n_allocations,
+        native_frame_id,
+        frame_index,
+        native_segment_generation,
+    ):
+        cdef _Allocation allocation
+        allocation.tid = tid
+        allocation.address = 0
+        allocation.size = size
+        allocation.allocator = <Allocator><int>AllocatorType.MALLOC
+        allocation.native_frame_id = native_frame_id
+        allocation.frame_index = frame_index
+        allocation.native_segment_generation = native_segment_generation
+        allocation.n_allocations = n_allocations
+        self.aggregator.setLocationTotals(allocation)
+
+    def get_snapshot_delta(self, since_version=0):
+        version, full, changes = Py_TupleFromSnapshotDelta(
+            self.aggregator.getSnapshotDelta(since_version)
+        )
+        records = {}
+        for location_id, elem in changes:
+            records[location_id] = AllocationRecord(elem)
+        return SnapshotDelta(version, full, records)
+
+    def get_snapshot_allocations(self, merge_threads):
+        return [
+            AllocationRecord(elem)
+            for elem in Py_ListFromSnapshotAllocationRecords(
+                self.aggregator.getSnapshotAllocations(merge_threads)
+            )
+        ]
+
+    @property
+    def heap_size(self):
+        return self.aggregator.getHeapSize()
+
+    @property
+    def total_allocations(self):
+        return self.aggregator.getTotalAllocations()
+
+    @property
+    def total_allocated_bytes(self):
+        return self.aggregator.getTotalAllocatedBytes()
+
+    def take_history_sample(self, timestamp_ms):
+        self.history.get().addSample(
+            timestamp_ms, self.aggregator.takeChangesSinceLastSample()
+        )
+
+    def get_history_timestamps(self):
+        return list(self.history.get().getTimestamps())
+
+    def get_history_allocations(self, sample_index):
+        cdef vector[_Allocation] locations = (
+            self.history.get().getLiveLocationsAt(sample_index)
+        )
+        return [
+            AllocationRecord(location.toPythonObject()) for location in locations
+        ]
+
+
 cdef class AllocationLifetimeAggregatorTestHarness:
     cdef AllocationLifetimeAggregator aggregator
 
@@ -0,0 +1,170 @@
+#include <algorithm>
+#include <cstring>
+#include <sstream>
+#include <string_view>
+
+#include "allocation_filter.h"
+
+namespace memray::tracking_api {
+
+namespace {  // unnamed
+
+const char FILTER_MAGIC[] = "memray-filter";
+const int FILTER_PROTOCOL_VERSION = 1;
+
+bool
+isDelimitedPathSegment(std::string_view path, size_t pos)
+{
+    return pos == 0 || path[pos - 1] == '/';
+}
+
+bool
+containsPathSegment(std::string_view path, std::string_view needle)
+{
+    for (size_t pos = path.find(needle); pos != std::string_view::npos; pos = path.find(needle, pos + 1))
+    {
+        if (isDelimitedPathSegment(path, pos)) {
+            return true;
+        }
+    }
+    return false;
+}
+
+bool
+endsWithPathSegment(std::string_view path, std::string_view needle)
+{
+    if (path.size() < needle.size()) {
+        return false;
+    }
+    size_t pos = path.size() - needle.size();
+    return path.compare(pos, std::string_view::npos, needle) == 0 && isDelimitedPathSegment(path, pos);
+}
+
+bool
+matchesModule(std::string_view filename, const std::string& module)
+{
+    // Module names are turned into the paths their files would have, so
+    // "pkg.sub" matches both ".../pkg/sub.py" and anything under ".../pkg/sub/".
+    std::string path = module;
+    std::replace(path.begin(), path.end(), '.', '/');
+    return containsPathSegment(filename, path + "/") || endsWithPathSegment(filename, path + ".py");
+}
+
+}  // unnamed namespace
+
+bool
+AllocationFilter::empty() const
+{
+    return min_size == 0 && !filtersThreads() && !filtersLocations();
+}
+
+bool
+AllocationFilter::filtersThreads() const
+{
+    return !native_thread_ids.empty();
+}
+
+bool
+AllocationFilter::filtersLocations() const
+{
+    return !file_prefixes.empty() || !modules.empty();
+}
+
+bool
+AllocationFilter::matchesThread(uint64_t native_thread_id) const
+{
+    return !filtersThreads()
+           || std::find(native_thread_ids.begin(), native_thread_ids.end(), native_thread_id)
+                      != native_thread_ids.end();
+}
+
+bool
+AllocationFilter::matchesFile(const char* filename) const
+{
+    if (!filtersLocations()) {
+        return true;
+    }
+    std::string_view path{filename};
+    for (const auto& prefix : file_prefixes) {
+        if (path.compare(0, prefix.size(), prefix) == 0) {
+            return true;
+        }
+    }
+    return std::any_of(modules.begin(), modules.end(), [&](const auto& module) {
+        return matchesModule(path, module);
+    });
+}
+
+std::string
+AllocationFilter::serialize() const
+{
+    std::ostringstream message;
+    message << FILTER_MAGIC << " " << FILTER_PROTOCOL_VERSION << "\n";
+    if (min_size) {
+        message << "min-size " << min_size << "\n";
+    }
+    for (auto tid : native_thread_ids) {
+        message << "thread " << tid << "\n";
+    }
+    for (const auto& prefix : file_prefixes) {
+        message << "file " << prefix << "\n";
+    }
+    for (const auto& module : modules) {
+        message << "module " << module << "\n";
+    }
+    message << "end\n";
+    return message.str();
+}
+
+std::optional<AllocationFilter>
+AllocationFilter::parse(const std::string& message)
+{
+    std::istringstream lines(message);
+    std::string line;
+
+    std::string magic;
+    int version = 0;
+    if (!std::getline(lines, line) || !(std::istringstream(line) >> magic >> version)
+        || magic != FILTER_MAGIC || version != FILTER_PROTOCOL_VERSION)
+    {
+        return std::nullopt;
+    }
+
+    AllocationFilter filter;
+    while (std::getline(lines, line)) {
+        if (line == "end") {
+            return filter;
+        }
+
+        size_t space = line.find(' ');
+        if (space == std::string::npos || space + 1 == line.size()) {
+            return std::nullopt;
+        }
+        std::string key = line.substr(0, space);
+        std::string value = line.substr(space + 1);
+
+        if (key == "file") {
+            filter.file_prefixes.push_back(std::move(value));
+        } else if (key == "module") {
+            filter.modules.push_back(std::move(value));
+        } else {
+            std::istringstream number(value);
+            uint64_t parsed;
+            if (!(number >> parsed) || !number.eof()) {
+                return std::nullopt;
+            }
+            if (key == "min-size") {
+                filter.min_size = parsed;
+            } else if (key == "thread") {
+                filter.native_thread_ids.push_back(parsed);
+            } else {
+                return std::nullopt;
+            }
+        }
+    }
+
+    // The "end" line is missing.
+    return std::nullopt;
+}
+
+}  // namespace memray::tracking_api
@@ -0,0 +1,46 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <optional>
+#include <string>
+#include <vector>
+
+namespace memray::tracking_api {
+
+// A filter that a live reader sends to the tracked process when it connects,
+// so that allocations it isn't interested in are dropped by the Tracker
+// instead of being sent over the socket. An allocation is kept only if it
+// passes every kind of rule that the filter sets:
+//
+// - it is at least `min_size` bytes,
+// - it was made by one of the `native_thread_ids` threads,
+// - one of the Python frames on the stack at the time it was made comes from
+//   a file starting with one of the `file_prefixes` or from one of the
+//   `modules` (or from a package nested in one of them).
+//
+// Deallocations are never filtered, as the Tracker doesn't know which
+// allocation they correspond to.
+struct AllocationFilter
+{
+    size_t min_size{0};
+    std::vector<uint64_t> native_thread_ids;
+    std::vector<std::string> file_prefixes;
+    std::vector<std::string> modules;
+
+    bool empty() const;
+    bool filtersThreads() const;
+    bool filtersLocations() const;
+    bool matchesThread(uint64_t native_thread_id) const;
+    bool matchesFile(const char* filename) const;
+
+    // The filter is sent as a few lines of text: a "memray-filter" line with
+    // the protocol version, one line per rule, and a final "end" line.
+    std::string serialize() const;
+    static std::optional<AllocationFilter> parse(const std::string& message);
+};
+
+// The longest filter message a tracked process accepts.
+constexpr size_t MAX_ALLOCATION_FILTER_MESSAGE_SIZE = 64 * 1024;
+
+}  // namespace memray::tracking_api
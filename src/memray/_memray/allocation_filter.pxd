@@ -0,0 +1,12 @@
+from libc.stdint cimport uint64_t
+from libcpp.string cimport string
+from libcpp.vector cimport vector
+
+
+cdef extern from "allocation_filter.h" namespace "memray::tracking_api":
+    cdef cppclass AllocationFilter:
+        size_t min_size
+        vector[uint64_t] native_thread_ids
+        vector[string] file_prefixes
+        vector[string] modules
+        string serialize() except+
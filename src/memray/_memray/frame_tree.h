@@ -43,6 +43,13 @@ class FrameTree
         return getTraceIndexUnsafe(parent_index, frame, tracecallback_t());
     }
 
+    // An estimate of the memory used by the tree, in bytes.
+    size_t memoryUsage() const noexcept
+    {
+        // Every node but the root is reached through one edge of its parent.
+        return d_graph.capacity() * sizeof(Node) + (d_graph.size() - 1) * sizeof(DescendentEdge);
+    }
+
   private:
     size_t getTraceIndexUnsafe(index_t parent_index, frame_id_t frame, const tracecallback_t& callback)
     {
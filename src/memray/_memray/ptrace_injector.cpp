@@ -0,0 +1,789 @@
+#include "ptrace_injector.h"
+
+#include <cerrno>
+
+#if defined(__linux__) && (defined(__x86_64__) || defined(__aarch64__))
+#    define MEMRAY_HAS_PTRACE_INJECTOR 1
+#endif
+
+#ifdef MEMRAY_HAS_PTRACE_INJECTOR
+#    include <dlfcn.h>
+#    include <elf.h>
+#    include <fcntl.h>
+#    include <signal.h>
+#    include <sys/mman.h>
+#    include <sys/ptrace.h>
+#    include <sys/stat.h>
+#    include <sys/syscall.h>
+#    include <sys/uio.h>
+#    include <sys/user.h>
+#    include <sys/wait.h>
+#    include <unistd.h>
+
+#    include <algorithm>
+#    include <cstdint>
+#    include <cstring>
+#    include <fstream>
+#    include <iomanip>
+#    include <sstream>
+#    include <unordered_map>
+#    include <vector>
+
+#    ifndef NT_X86_XSTATE
+#        define NT_X86_XSTATE 0x202
+#    endif
+#    ifndef NT_ARM_SYSTEM_CALL
+#        define NT_ARM_SYSTEM_CALL 0x404
+#    endif
+#    ifndef NT_ARM_SVE
+#        define NT_ARM_SVE 0x405
+#    endif
+#endif
+
+namespace memray::attach {
+
+#ifdef MEMRAY_HAS_PTRACE_INJECTOR
+
+namespace {  // unnamed
+
+using Registers = struct user_regs_struct;
+
+#    if defined(__x86_64__)
+const Elf64_Half EXPECTED_MACHINE = EM_X86_64;
+// The extended register sets to save, most complete first. The XSAVE area
+// includes the AVX registers, which the legacy FP register set lacks.
+const int EXTENDED_REGISTER_SETS[] = {NT_X86_XSTATE, NT_PRFPREG};
+#    else
+const Elf64_Half EXPECTED_MACHINE = EM_AARCH64;
+const int EXTENDED_REGISTER_SETS[] = {NT_ARM_SVE, NT_PRFPREG};
+const uint32_t SVC_0_INSTRUCTION = 0xd4000001;
+#    endif
+
+// Stay clear of the x86_64 red zone (and of anything else the interrupted
+// code might be keeping just below its stack pointer) when calling functions.
+const uintptr_t STACK_GAP = 256;
+
+// Large enough for any extended register set we know about (the biggest, the
+// SVE registers with the largest vector length, is under 9 KiB).
+const size_t MAX_EXTENDED_REGISTERS_SIZE = 64 * 1024;
+
+const size_t SCRATCH_SIZE = 4096;
+
+const char SPAWN_CLIENT_FUNCTION[] = "memray_spawn_client";
+
+// Thrown for any failure, and turned into an errno value and a message by
+// injectClient().
+struct InjectionError
+{
+    int code;
+    std::string message;
+};
+
+[[noreturn]] void
+fail(int code, std::string message)
+{
+    throw InjectionError{code, std::move(message)};
+}
+
+[[noreturn]] void
+failWithErrno(const std::string& what)
+{
+    const int code = errno;
+    if (code == ESRCH || code == ENOENT) {
+        fail(ESRCH, "The process does not exist");
+    }
+    fail(code, what + ": " + std::strerror(code));
+}
+
+std::string
+procPath(pid_t pid, const std::string& name)
+{
+    return "/proc/" + std::to_string(pid) + "/" + name;
+}
+
+// A read-only mapping of a file, unmapped on destruction.
+class MappedFile
+{
+  public:
+    explicit MappedFile(const std::string& path)
+    {
+        const int fd = ::open(path.c_str(), O_RDONLY | O_CLOEXEC);
+        if (fd == -1) {
+            return;
+        }
+        struct stat st;
+        if (::fstat(fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0) {
+            void* data = ::mmap(nullptr, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+            if (data != MAP_FAILED) {
+                d_data = static_cast<const char*>(data);
+                d_size = st.st_size;
+            }
+        }
+        ::close(fd);
+    }
+
+    ~MappedFile()
+    {
+        if (d_data) {
+            ::munmap(const_cast<char*>(d_data), d_size);
+        }
+    }
+
+    MappedFile(const MappedFile&) = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
+
+    // Returns the `count` objects of type T found at `offset`, or nullptr if
+    // they aren't all inside of the file.
+    template<typename T>
+    const T* at(uint64_t offset, uint64_t count = 1) const
+    {
+        if (!d_data || offset > d_size || count > (d_size - offset) / sizeof(T)) {
+            return nullptr;
+        }
+        return reinterpret_cast<const T*>(d_data + offset);
+    }
+
+  private:
+    const char* d_data{nullptr};
+    size_t d_size{0};
+};
+
+// Look for the functions named in `symbols` in the dynamic symbol table of
+// the ELF file at `path`, which is mapped at `base` in the target process.
+// Functions that are found have their address in the target process stored
+// in `symbols`, unless an earlier file already defined them.
+void
+findSymbolsInImage(
+        const std::string& path,
+        uintptr_t base,
+        std::unordered_map<std::string, uintptr_t>& symbols)
+{
+    MappedFile file(path);
+    const auto* ehdr = file.at<Elf64_Ehdr>(0);
+    if (!ehdr || std::memcmp(ehdr->e_ident, ELFMAG, SELFMAG) != 0
+        || ehdr->e_ident[EI_CLASS] != ELFCLASS64 || ehdr->e_phentsize != sizeof(Elf64_Phdr)
+        || ehdr->e_shentsize != sizeof(Elf64_Shdr))
+    {
+        return;
+    }
+
+    // The mapping at offset 0 holds the lowest loadable segment, so the
+    // difference between both tells us where the file was loaded.
+    const auto* phdrs = file.at<Elf64_Phdr>(ehdr->e_phoff, ehdr->e_phnum);
+    if (!phdrs) {
+        return;
+    }
+    uintptr_t lowest_vaddr = UINTPTR_MAX;
+    for (unsigned i = 0; i < ehdr->e_phnum; ++i) {
+        if (phdrs[i].p_type == PT_LOAD && phdrs[i].p_vaddr < lowest_vaddr) {
+            lowest_vaddr = phdrs[i].p_vaddr;
+        }
+    }
+    if (lowest_vaddr == UINTPTR_MAX) {
+        return;
+    }
+    const uintptr_t page_size = ::sysconf(_SC_PAGESIZE);
+    const uintptr_t load_bias = base - (lowest_vaddr & ~(page_size - 1));
+
+    const auto* shdrs = file.at<Elf64_Shdr>(ehdr->e_shoff, ehdr->e_shnum);
+    if (!shdrs) {
+        return;
+    }
+    for (unsigned i = 0; i < ehdr->e_shnum; ++i) {
+        const Elf64_Shdr& dynsym = shdrs[i];
+        if (dynsym.sh_type != SHT_DYNSYM || dynsym.sh_link >= ehdr->e_shnum) {
+            continue;
+        }
+        const Elf64_Shdr& dynstr = shdrs[dynsym.sh_link];
+        const auto* syms = file.at<Elf64_Sym>(dynsym.sh_offset, dynsym.sh_size / sizeof(Elf64_Sym));
+        const auto* strings = file.at<char>(dynstr.sh_offset, dynstr.sh_size);
+        if (!syms || !strings || dynstr.sh_size == 0 || strings[dynstr.sh_size - 1] != '\0') {
+            return;
+        }
+        for (size_t j = 0; j < dynsym.sh_size / sizeof(Elf64_Sym); ++j) {
+            const Elf64_Sym& sym = syms[j];
+            const int binding = ELF64_ST_BIND(sym.st_info);
+            if (sym.st_shndx == SHN_UNDEF || ELF64_ST_TYPE(sym.st_info) != STT_FUNC
+                || (binding != STB_GLOBAL && binding != STB_WEAK) || sym.st_name >= dynstr.sh_size)
+            {
+                continue;
+            }
+            auto it = symbols.find(strings + sym.st_name);
+            if (it != symbols.end() && it->second == 0) {
+                it->second = load_bias + sym.st_value;
+            }
+        }
+        return;
+    }
+}
+
+// Find the address in the process `pid` of each function named in `names`,
+// by reading the dynamic symbol table of every ELF file mapped into it.
+// Functions that can't be found are given an address of 0.
+std::unordered_map<std::string, uintptr_t>
+findSymbols(pid_t pid, const std::vector<std::string>& names)
+{
+    std::unordered_map<std::string, uintptr_t> symbols;
+    for (const auto& name : names) {
+        symbols[name] = 0;
+    }
+
+    std::ifstream maps(procPath(pid, "maps"));
+    if (!maps) {
+        failWithErrno("Failed to read the process's memory mappings");
+    }
+
+    // Open the files through the process's root directory, in case it's
+    // running in a different mount namespace, like in a container.
+    const std::string root = procPath(pid, "root");
+    std::vector<std::string> seen;
+    std::string line;
+    while (std::getline(maps, line)) {
+        std::string range, perms, offset, device, inode, path;
+        std::istringstream fields(line);
+        if (!(fields >> range >> perms >> offset >> device >> inode) || offset != "00000000") {
+            continue;
+        }
+        std::getline(fields >> std::ws, path);
+        if (path.empty() || path[0] != '/' || path.find(" (deleted)") != std::string::npos
+            || std::find(seen.begin(), seen.end(), path) != seen.end())
+        {
+            continue;
+        }
+        seen.push_back(path);
+        findSymbolsInImage(root + path, std::stoull(range, nullptr, 16), symbols);
+    }
+    return symbols;
+}
+
+void
+checkArchitecture(pid_t pid)
+{
+    MappedFile exe(procPath(pid, "exe"));
+    const auto* ehdr = exe.at<Elf64_Ehdr>(0);
+    if (!ehdr) {
+        if (::access(procPath(pid, "").c_str(), F_OK) != 0) {
+            failWithErrno("Failed to find the process");
+        }
+        fail(EACCES, "Failed to read the process's executable");
+    }
+    if (std::memcmp(ehdr->e_ident, ELFMAG, SELFMAG) != 0 || ehdr->e_ident[EI_CLASS] != ELFCLASS64
+        || ehdr->e_machine != EXPECTED_MACHINE)
+    {
+        fail(ENOEXEC, "The process was built for a different architecture than Memray");
+    }
+}
+
+uintptr_t&
+programCounter(Registers& regs)
+{
+#    if defined(__x86_64__)
+    return reinterpret_cast<uintptr_t&>(regs.rip);
+#    else
+    return reinterpret_cast<uintptr_t&>(regs.pc);
+#    endif
+}
+
+uintptr_t&
+stackPointer(Registers& regs)
+{
+#    if defined(__x86_64__)
+    return reinterpret_cast<uintptr_t&>(regs.rsp);
+#    else
+    return reinterpret_cast<uintptr_t&>(regs.sp);
+#    endif
+}
+
+// A process whose main thread we've seized with ptrace. The thread keeps
+// running until interrupt() is called. Once it has been interrupted, the
+// destructor restores its registers and resumes it.
+class Tracee
+{
+  public:
+    explicit Tracee(pid_t pid)
+    : d_pid(pid)
+    {
+        if (::ptrace(PTRACE_SEIZE, d_pid, nullptr, nullptr) == -1) {
+            failWithErrno("Failed to attach to the process");
+        }
+    }
+
+    ~Tracee()
+    {
+        try {
+            detach();
+        } catch (const InjectionError&) {
+            // Nothing else we can do. If the process is still alive, the
+            // kernel detaches from it when we exit.
+        }
+    }
+
+    Tracee(const Tracee&) = delete;
+    Tracee& operator=(const Tracee&) = delete;
+
+    void interrupt()
+    {
+        if (::ptrace(PTRACE_INTERRUPT, d_pid, nullptr, nullptr) == -1) {
+            failWithErrno("Failed to stop the process");
+        }
+        int status = waitForStop();
+        while (status >> 16 != PTRACE_EVENT_STOP) {
+            // A signal arrived before the interruption. Hold on to it until
+            // we're done and keep waiting.
+            d_pending_signals.push_back(WSTOPSIG(status));
+            resume();
+            status = waitForStop();
+        }
+        d_stopped = true;
+        if (WSTOPSIG(status) != SIGTRAP) {
+            // This is a group-stop: the process was stopped by a signal, and
+            // resuming it to run our code would go against that.
+            fail(EAGAIN, "The process is stopped. Resume it and try again");
+        }
+
+        getRegisters(d_saved_registers);
+        for (int regset : EXTENDED_REGISTER_SETS) {
+            d_saved_extended_registers.resize(MAX_EXTENDED_REGISTERS_SIZE);
+            struct iovec iov = {d_saved_extended_registers.data(), d_saved_extended_registers.size()};
+            if (::ptrace(PTRACE_GETREGSET, d_pid, regset, &iov) == 0) {
+                d_saved_extended_registers.resize(iov.iov_len);
+                d_extended_register_set = regset;
+                break;
+            }
+        }
+        if (!d_extended_register_set) {
+            failWithErrno("Failed to save the process's floating point registers");
+        }
+#    if defined(__aarch64__)
+        struct iovec iov = {&d_saved_syscall_number, sizeof(d_saved_syscall_number)};
+        if (::ptrace(PTRACE_GETREGSET, d_pid, NT_ARM_SYSTEM_CALL, &iov) == -1) {
+            failWithErrno("Failed to read the process's registers");
+        }
+#    endif
+    }
+
+    // Whether the thread was interrupted in a system call, or just before or
+    // after making one. It can't be in the middle of updating any data
+    // structure at that point, so it's safe to call into libc.
+    bool stoppedAtSyscall()
+    {
+#    if defined(__x86_64__)
+        return static_cast<long long>(d_saved_registers.orig_rax) >= 0;
+#    else
+        // The kernel has already forgotten about any syscall by the time it
+        // stops the thread, but it leaves the program counter pointing at the
+        // `svc` instruction if the syscall is going to be restarted, or right
+        // after it otherwise.
+        errno = 0;
+        const uintptr_t pc = programCounter(d_saved_registers);
+        const long words = ::ptrace(PTRACE_PEEKTEXT, d_pid, pc - 4, nullptr);
+        if (errno) {
+            return false;
+        }
+        const auto before = static_cast<uint32_t>(words);
+        const auto at = static_cast<uint32_t>(static_cast<uint64_t>(words) >> 32);
+        return before == SVC_0_INSTRUCTION || at == SVC_0_INSTRUCTION;
+#    endif
+    }
+
+    // Call the function at `function` in the tracee with up to six integer
+    // or pointer arguments, and return whatever it returns. The function
+    // returns to address 0, and we catch the resulting segmentation fault.
+    uintptr_t call(uintptr_t function, std::initializer_list<uintptr_t> args)
+    {
+        Registers regs = d_saved_registers;
+        uintptr_t sp = (stackPointer(regs) - STACK_GAP) & ~uintptr_t(15);
+#    if defined(__x86_64__)
+        unsigned long long* arg_registers[] =
+                {&regs.rdi, &regs.rsi, &regs.rdx, &regs.rcx, &regs.r8, &regs.r9};
+        // Push the return address, leaving the stack aligned like the ABI
+        // requires right after a `call` instruction.
+        sp -= sizeof(uintptr_t);
+        const uintptr_t return_address = 0;
+        write(sp, &return_address, sizeof(return_address));
+        regs.rax = 0;
+        // Keep the kernel from treating this as an interrupted syscall.
+        regs.orig_rax = -1;
+        // Clear the direction flag, as the ABI requires.
+        regs.eflags &= ~0x400ULL;
+#    else
+        unsigned long long* arg_registers[] = {
+                &regs.regs[0],
+                &regs.regs[1],
+                &regs.regs[2],
+                &regs.regs[3],
+                &regs.regs[4],
+                &regs.regs[5]};
+        regs.regs[30] = 0;  // the link register
+        setSyscallNumber(-1);
+#    endif
+        size_t i = 0;
+        for (uintptr_t arg : args) {
+            *arg_registers[i++] = arg;
+        }
+        stackPointer(regs) = sp;
+        programCounter(regs) = function;
+        setRegisters(regs);
+
+        d_registers_modified = true;
+        while (true) {
+            resume();
+            const int status = waitForStop();
+            if (status >> 16 == PTRACE_EVENT_STOP) {
+                continue;
+            }
+            const int signal = WSTOPSIG(status);
+            if (signal == SIGSEGV) {
+                getRegisters(regs);
+                if (programCounter(regs) != 0) {
+                    fail(EFAULT, "The process crashed while loading Memray");
+                }
+                break;
+            }
+            d_pending_signals.push_back(signal);
+        }
+#    if defined(__x86_64__)
+        return regs.rax;
+#    else
+        return regs.regs[0];
+#    endif
+    }
+
+    void write(uintptr_t address, const void* data, size_t size)
+    {
+        const auto* bytes = static_cast<const char*>(data);
+        for (size_t offset = 0; offset < size; offset += sizeof(long)) {
+            long word = 0;
+            const size_t chunk = std::min(sizeof(long), size - offset);
+            if (chunk < sizeof(long)) {
+                errno = 0;
+                word = ::ptrace(PTRACE_PEEKDATA, d_pid, address + offset, nullptr);
+                if (errno) {
+                    failWithErrno("Failed to read the process's memory");
+                }
+            }
+            std::memcpy(&word, bytes + offset, chunk);
+            if (::ptrace(PTRACE_POKEDATA, d_pid, address + offset, word) == -1) {
+                failWithErrno("Failed to write to the process's memory");
+            }
+        }
+    }
+
+    std::string readString(uintptr_t address, size_t max_size)
+    {
+        std::string ret;
+        while (ret.size() < max_size) {
+            errno = 0;
+            const long word = ::ptrace(PTRACE_PEEKDATA, d_pid, address + ret.size(), nullptr);
+            if (errno) {
+                break;
+            }
+            const auto* bytes = reinterpret_cast<const char*>(&word);
+            const size_t length = strnlen(bytes, sizeof(word));
+            ret.append(bytes, length);
+            if (length < sizeof(word)) {
+                break;
+            }
+        }
+        return ret;
+    }
+
+    // Restore the registers of the interrupted thread and let it resume
+    // whatever it was doing, delivering any signal that arrived meanwhile.
+    void detach()
+    {
+        if (d_detached) {
+            return;
+        }
+        d_detached = true;
+        if (!d_stopped) {
+            // PTRACE_DETACH only works on a stopped tracee.
+            if (::ptrace(PTRACE_INTERRUPT, d_pid, nullptr, nullptr) == -1) {
+                failWithErrno("Failed to stop the process");
+            }
+            int status = waitForStop();
+            while (status >> 16 != PTRACE_EVENT_STOP) {
+                d_pending_signals.push_back(WSTOPSIG(status));
+                resume();
+                status = waitForStop();
+            }
+        }
+        if (d_registers_modified) {
+            setRegisters(d_saved_registers);
+            struct iovec iov = {d_saved_extended_registers.data(), d_saved_extended_registers.size()};
+            if (::ptrace(PTRACE_SETREGSET, d_pid, d_extended_register_set, &iov) == -1) {
+                failWithErrno("Failed to restore the process's floating point registers");
+            }
+#    if defined(__aarch64__)
+            setSyscallNumber(d_saved_syscall_number);
+#    endif
+        }
+        if (::ptrace(PTRACE_DETACH, d_pid, nullptr, nullptr) == -1) {
+            failWithErrno("Failed to detach from the process");
+        }
+        for (int signal : d_pending_signals) {
+            ::syscall(SYS_tgkill, d_pid, d_pid, signal);
+        }
+    }
+
+  private:
+    int waitForStop()
+    {
+        int status;
+        while (::waitpid(d_pid, &status, __WALL) == -1) {
+            if (errno != EINTR) {
+                failWithErrno("Failed to wait for the process");
+            }
+        }
+        if (WIFEXITED(status) || WIFSIGNALED(status)) {
+            d_detached = true;
+            fail(ESRCH, "The process exited while Memray was attaching to it");
+        }
+        return status;
+    }
+
+    void resume()
+    {
+        if (::ptrace(PTRACE_CONT, d_pid, nullptr, nullptr) == -1) {
+            failWithErrno("Failed to resume the process");
+        }
+    }
+
+    void getRegisters(Registers& regs)
+    {
+        struct iovec iov = {&regs, sizeof(regs)};
+        if (::ptrace(PTRACE_GETREGSET, d_pid, NT_PRSTATUS, &iov) == -1) {
+            failWithErrno("Failed to read the process's registers");
+        }
+    }
+
+    void setRegisters(Registers& regs)
+    {
+        struct iovec iov = {&regs, sizeof(regs)};
+        if (::ptrace(PTRACE_SETREGSET, d_pid, NT_PRSTATUS, &iov) == -1) {
+            failWithErrno("Failed to set the process's registers");
+        }
+    }
+
+#    if defined(__aarch64__)
+    void setSyscallNumber(int number)
+    {
+        struct iovec iov = {&number, sizeof(number)};
+        if (::ptrace(PTRACE_SETREGSET, d_pid, NT_ARM_SYSTEM_CALL, &iov) == -1) {
+            failWithErrno("Failed to set the process's registers");
+        }
+    }
+
+    int d_saved_syscall_number{-1};
+#    endif
+
+    pid_t d_pid;
+    bool d_stopped{false};
+    bool d_detached{false};
+    bool d_registers_modified{false};
+    Registers d_saved_registers{};
+    std::vector<char> d_saved_extended_registers;
+    int d_extended_register_set{0};
+    std::vector<int> d_pending_signals;
+};
+
+// Unmaps a scratch page in the tracee unless release() was called.
+class ScratchPage
+{
+  public:
+    ScratchPage(Tracee& tracee, uintptr_t munmap, uintptr_t address)
+    : d_tracee(tracee)
+    , d_munmap(munmap)
+    , d_address(address)
+    {
+    }
+
+    ~ScratchPage()
+    {
+        if (d_address) {
+            try {
+                d_tracee.call(d_munmap, {d_address, SCRATCH_SIZE});
+            } catch (const InjectionError&) {
+                // We're already failing: report the original error.
+            }
+        }
+    }
+
+    ScratchPage(const ScratchPage&) = delete;
+    ScratchPage& operator=(const ScratchPage&) = delete;
+
+    uintptr_t address() const
+    {
+        return d_address;
+    }
+
+    void release()
+    {
+        d_address = 0;
+    }
+
+  private:
+    Tracee& d_tracee;
+    uintptr_t d_munmap;
+    uintptr_t d_address;
+};
+
+void
+loadLibrary(
+        Tracee& tracee,
+        std::unordered_map<std::string, uintptr_t>& symbols,
+        const ScratchPage& scratch,
+        const std::string& library_path,
+        int port)
+{
+    const uintptr_t path_address = scratch.address();
+    const uintptr_t function_address = path_address + library_path.size() + 1;
+    tracee.write(path_address, library_path.c_str(), library_path.size() + 1);
+    tracee.write(function_address, SPAWN_CLIENT_FUNCTION, sizeof(SPAWN_CLIENT_FUNCTION));
+
+    const uintptr_t handle = tracee.call(symbols["dlopen"], {path_address, RTLD_NOW});
+    if (!handle) {
+        const uintptr_t error = tracee.call(symbols["dlerror"], {});
+        fail(ENOEXEC, "Failed to load Memray into the process: " + tracee.readString(error, 4096));
+    }
+    const uintptr_t spawn_client = tracee.call(symbols["dlsym"], {handle, function_address});
+    if (!spawn_client) {
+        fail(ENOEXEC, "Failed to find Memray's injector in the process");
+    }
+    const int rc = static_cast<int>(tracee.call(spawn_client, {static_cast<uintptr_t>(port)}));
+    if (rc != 0) {
+        fail(rc, std::string("Failed to start Memray's thread in the process: ") + std::strerror(rc));
+    }
+}
+
+std::string
+pendingCallScript(const std::string& library_path, int port, uintptr_t scratch_address)
+{
+    // The script runs in the __main__ module's namespace, so it must not
+    // bind any names, and it must not raise, or the interpreter would fail
+    // with a SystemError as the pending call would return an error.
+    std::ostringstream path_hex;
+    for (unsigned char c : library_path) {
+        path_hex << std::hex << std::setw(2) << std::setfill('0') << static_cast<int>(c);
+    }
+    std::ostringstream script;
+    script << "try:\n"
+           << "    __import__('ctypes').CDLL(__import__('os').fsdecode(bytes.fromhex('" << path_hex.str()
+           << "'))).memray_spawn_client(" << port << ")\n"
+           << "    __import__('ctypes').CDLL(None).munmap("
+           << "__import__('ctypes').c_void_p(" << scratch_address << "), " << SCRATCH_SIZE << ")\n"
+           << "except BaseException:\n"
+           << "    __import__('traceback').print_exc()\n";
+    return script.str();
+}
+
+void
+schedulePendingCall(
+        Tracee& tracee,
+        std::unordered_map<std::string, uintptr_t>& symbols,
+        ScratchPage& scratch,
+        const std::string& library_path,
+        int port)
+{
+    const std::string script = pendingCallScript(library_path, port, scratch.address());
+    if (script.size() + 1 > SCRATCH_SIZE) {
+        fail(ENAMETOOLONG, "The path to Memray's injector is too long");
+    }
+    tracee.write(scratch.address(), script.c_str(), script.size() + 1);
+
+    const int rc = static_cast<int>(tracee.call(
+            symbols["Py_AddPendingCall"],
+            {symbols["PyRun_SimpleString"], scratch.address()}));
+    if (rc != 0) {
+        fail(EAGAIN, "Failed to schedule a call in the process: Python's pending call queue is full");
+    }
+    // The script unmaps the page once it has run.
+    scratch.release();
+}
+
+}  // unnamed namespace
+
+bool
+ptraceInjectionSupported()
+{
+    return true;
+}
+
+int
+injectClient(pid_t pid, const std::string& library_path, int port, std::string* errmsg)
+{
+    try {
+        checkArchitecture(pid);
+
+        // Resolve everything before stopping the process, to keep it stopped
+        // for as little time as possible.
+        auto symbols = findSymbols(
+                pid,
+                {"dlopen",
+                 "dlsym",
+                 "dlerror",
+                 "mmap",
+                 "munmap",
+                 "PyGILState_Ensure",
+                 "Py_AddPendingCall",
+                 "PyRun_SimpleString"});
+        for (const char* name : {"PyGILState_Ensure", "Py_AddPendingCall", "PyRun_SimpleString"}) {
+            if (!symbols[name]) {
+                fail(ENOEXEC, "The process does not seem to be running Python 3.7 or newer");
+            }
+        }
+        for (const char* name : {"dlopen", "dlsym", "dlerror", "mmap", "munmap"}) {
+            if (!symbols[name]) {
+                fail(ENOEXEC, std::string("Failed to find ") + name + " in the process");
+            }
+        }
+
+        Tracee tracee(pid);
+        tracee.interrupt();
+
+        {
+            const uintptr_t address = tracee.call(
+                    symbols["mmap"],
+                    {0,
+                     SCRATCH_SIZE,
+                     PROT_READ | PROT_WRITE,
+                     MAP_PRIVATE | MAP_ANONYMOUS,
+                     static_cast<uintptr_t>(-1),
+                     0});
+            if (address == reinterpret_cast<uintptr_t>(MAP_FAILED)) {
+                fail(ENOMEM, "Failed to allocate memory in the process");
+            }
+            ScratchPage scratch(tracee, symbols["munmap"], address);
+
+            if (tracee.stoppedAtSyscall()) {
+                loadLibrary(tracee, symbols, scratch, library_path, port);
+            } else {
+                schedulePendingCall(tracee, symbols, scratch, library_path, port);
+            }
+        }
+        tracee.detach();
+    } catch (const InjectionError& e) {
+        *errmsg = e.message;
+        return e.code;
+    }
+    return 0;
+}
+
+#else
+
+bool
+ptraceInjectionSupported()
+{
+    return false;
+}
+
+int
+injectClient(pid_t, const std::string&, int, std::string* errmsg)
+{
+    *errmsg = "Injecting with ptrace is not supported on this platform";
+    return ENOTSUP;
+}
+
+#endif
+
+}  // namespace memray::attach
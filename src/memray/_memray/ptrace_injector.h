@@ -0,0 +1,30 @@
+#pragma once
+
+#include <string>
+
+#include <sys/types.h>
+
+namespace memray::attach {
+
+// Whether injectClient() is implemented for this platform. It is only
+// available on Linux for x86_64 and aarch64.
+bool
+ptraceInjectionSupported();
+
+// Use ptrace to make the process `pid` load the `_inject` extension module
+// found at `library_path` and call its `memray_spawn_client(port)` function,
+// like our gdb and lldb scripts do, but without needing a debugger. The
+// process's main thread is only stopped while a few functions are called in
+// it, which takes milliseconds.
+//
+// If the main thread is blocked in a system call, the extension is loaded
+// right away. Otherwise the thread is probably running Python code and might
+// be holding locks that `dlopen` needs, so instead we schedule a pending call
+// that loads it the next time the interpreter checks for them.
+//
+// Returns 0 on success. On failure, returns an errno value describing the
+// failure and stores a description of it in `errmsg`.
+int
+injectClient(pid_t pid, const std::string& library_path, int port, std::string* errmsg);
+
+}  // namespace memray::attach
@@ -321,6 +321,63 @@ RecordReader::processNativeAllocationRecord(const NativeAllocationRecord& record
     return true;
 }
 
+bool
+RecordReader::parseTransientAllocationsRecord(
+        TransientAllocationsRecord* record,
+        unsigned int flags,
+        bool native)
+{
+    record->allocator = static_cast<hooks::Allocator>(flags);
+
+    if (!readIntegralDelta(&d_last.data_pointer, &record->address) || !readVarint(&record->size)
+        || !d_input->read(reinterpret_cast<char*>(&record->deallocator), sizeof(record->deallocator))
+        || !readVarint(&record->count))
+    {
+        return false;
+    }
+
+    if (!native) {
+        record->native_frame_id = 0;
+        return true;
+    }
+    return readIntegralDelta(&d_last.native_frame_id, &record->native_frame_id);
+}
+
+bool
+RecordReader::processTransientAllocationsRecord(const TransientAllocationsRecord& record, bool native)
+{
+    // The run is handed out as the allocations and deallocations it stands
+    // for, one per call to nextRecord(), so that our callers can't tell it
+    // apart from a capture that wrote each of them.
+    d_transient_allocations = record;
+    d_transient_allocations_have_native_frames = native;
+    d_transient_allocation_records_left = 2 * record.count;
+    return true;
+}
+
+RecordReader::RecordResult
+RecordReader::nextTransientAllocation()
+{
+    const auto& run = d_transient_allocations;
+    d_transient_allocation_records_left -= 1;
+
+    bool processed;
+    if (d_transient_allocation_records_left % 2 == 0) {
+        processed = processAllocationRecord(AllocationRecord{run.address, 0, run.deallocator});
+    } else if (d_transient_allocations_have_native_frames) {
+        processed = processNativeAllocationRecord(
+                NativeAllocationRecord{run.address, run.size, run.allocator, run.native_frame_id});
+    } else {
+        processed = processAllocationRecord(AllocationRecord{run.address, run.size, run.allocator});
+    }
+
+    if (!processed) {
+        LOG(ERROR) << "Failed to process transient allocations record";
+        return RecordResult::ERROR;
+    }
+    return RecordResult::ALLOCATION_RECORD;
+}
+
 bool
 RecordReader::parseMemoryMapStart()
 {
@@ -452,6 +509,71 @@ RecordReader::processAggregatedAllocationRecord(const AggregatedAllocation& reco
     return true;
 }
 
+bool
+RecordReader::parseAggregatedAllocationIntervalRecord(AggregatedAllocationInterval* record)
+{
+    return d_input->read(reinterpret_cast<char*>(record), sizeof(*record));
+}
+
+bool
+RecordReader::processAggregatedAllocationIntervalRecord(const AggregatedAllocationInterval& record)
+{
+    d_latest_aggregated_allocation_interval = record;
+    return true;
+}
+
+bool
+RecordReader::parseSnapshotHighWaterMarkRecord(size_t* bytes)
+{
+    return d_input->read(reinterpret_cast<char*>(bytes), sizeof(*bytes));
+}
+
+bool
+RecordReader::processSnapshotHighWaterMarkRecord(size_t bytes)
+{
+    d_high_water_mark_bytes_by_snapshot.push_back(bytes);
+    return true;
+}
+
+bool
+RecordReader::parseAllocationStatsRecord(AllocationStatsEntry* record)
+{
+    return d_input->read(reinterpret_cast<char*>(record), sizeof(*record));
+}
+
+bool
+RecordReader::processAllocationStatsRecord(const AllocationStatsEntry& record)
+{
+    d_latest_allocation_stats_entry = record;
+    return true;
+}
+
+bool
+RecordReader::parseTemporaryAllocationsRecord(AggregatedTemporaryAllocations* record)
+{
+    return d_input->read(reinterpret_cast<char*>(record), sizeof(*record));
+}
+
+bool
+RecordReader::processTemporaryAllocationsRecord(const AggregatedTemporaryAllocations& record)
+{
+    d_latest_temporary_allocations = record;
+    return true;
+}
+
+bool
+RecordReader::parseTemporaryAllocationThresholdRecord(size_t* threshold)
+{
+    return d_input->read(reinterpret_cast<char*>(threshold), sizeof(*threshold));
+}
+
+bool
+RecordReader::processTemporaryAllocationThresholdRecord(size_t threshold)
+{
+    d_temporary_allocation_threshold = threshold;
+    return true;
+}
+
 bool
 RecordReader::parsePythonTraceIndexRecord(std::pair<frame_id_t, FrameTree::index_t>* record)
 {
@@ -513,6 +635,10 @@ RecordReader::nextRecord()
 RecordReader::RecordResult
 RecordReader::nextRecordFromAllAllocationsFile()
 {
+    if (d_transient_allocation_records_left) {
+        return nextTransientAllocation();
+    }
+
     while (true) {
         RecordTypeAndFlags record_type_and_flags;
         if (!d_input->read(
@@ -556,6 +682,22 @@ RecordReader::nextRecordFromAllAllocationsFile()
                 }
                 return RecordResult::ALLOCATION_RECORD;
             } break;
+            case RecordType::TRANSIENT_ALLOCATIONS:
+            case RecordType::TRANSIENT_ALLOCATIONS_WITH_NATIVE: {
+                bool native =
+                        (record_type_and_flags.record_type
+                         == RecordType::TRANSIENT_ALLOCATIONS_WITH_NATIVE);
+                TransientAllocationsRecord record;
+                if (!parseTransientAllocationsRecord(&record, record_type_and_flags.flags, native)
+                    || record.count == 0 || !processTransientAllocationsRecord(record, native))
+                {
+                    if (d_input->is_open()) {
+                        LOG(ERROR) << "Failed to process transient allocations record";
+                    }
+                    return RecordResult::ERROR;
+                }
+                return nextTransientAllocation();
+            } break;
             case RecordType::MEMORY_RECORD: {
                 MemoryRecord record;
                 if (!parseMemoryRecord(&record) || !processMemoryRecord(record)) {
@@ -665,6 +807,66 @@ RecordReader::nextRecordFromAggregatedAllocationsFile()
                 return RecordResult::AGGREGATED_ALLOCATION_RECORD;
             } break;
 
+            case AggregatedRecordType::AGGREGATED_ALLOCATION_INTERVAL: {
+                AggregatedAllocationInterval record;
+                if (!parseAggregatedAllocationIntervalRecord(&record)
+                    || !processAggregatedAllocationIntervalRecord(record))
+                {
+                    if (d_input->is_open()) {
+                        LOG(ERROR) << "Failed to process aggregated allocation interval record";
+                    }
+                    return RecordResult::ERROR;
+                }
+
+                return RecordResult::AGGREGATED_ALLOCATION_INTERVAL;
+            } break;
+
+            case AggregatedRecordType::SNAPSHOT_HIGH_WATER_MARK: {
+                size_t bytes;
+                if (!parseSnapshotHighWaterMarkRecord(&bytes)
+                    || !processSnapshotHighWaterMarkRecord(bytes))
+                {
+                    if (d_input->is_open()) LOG(ERROR) << "Failed to process high water mark record";
+                    return RecordResult::ERROR;
+                }
+            } break;
+
+            case AggregatedRecordType::TEMPORARY_ALLOCATION_THRESHOLD: {
+                size_t threshold;
+                if (!parseTemporaryAllocationThresholdRecord(&threshold)
+                    || !processTemporaryAllocationThresholdRecord(threshold))
+                {
+                    if (d_input->is_open()) {
+                        LOG(ERROR) << "Failed to process temporary allocation threshold record";
+                    }
+                    return RecordResult::ERROR;
+                }
+            } break;
+
+            case AggregatedRecordType::ALLOCATION_STATS: {
+                AllocationStatsEntry record;
+                if (!parseAllocationStatsRecord(&record) || !processAllocationStatsRecord(record)) {
+                    if (d_input->is_open()) LOG(ERROR) << "Failed to process allocation stats record";
+                    return RecordResult::ERROR;
+                }
+
+                return RecordResult::ALLOCATION_STATS;
+            } break;
+
+            case AggregatedRecordType::TEMPORARY_ALLOCATIONS: {
+                AggregatedTemporaryAllocations record;
+                if (!parseTemporaryAllocationsRecord(&record)
+                    || !processTemporaryAllocationsRecord(record))
+                {
+                    if (d_input->is_open()) {
+                        LOG(ERROR) << "Failed to process temporary allocations record";
+                    }
+                    return RecordResult::ERROR;
+                }
+
+                return RecordResult::TEMPORARY_ALLOCATIONS;
+            } break;
+
             case AggregatedRecordType::PYTHON_TRACE_INDEX: {
                 std::pair<frame_id_t, FrameTree::index_t> record;
                 if (!parsePythonTraceIndexRecord(&record) || !processPythonTraceIndexRecord(record)) {
@@ -794,6 +996,37 @@ error:
     return nullptr;
 }
 
+void
+RecordReader::getPythonStackFrameIds(
+        FrameTree::index_t index,
+        thread_id_t tid,
+        std::vector<frame_id_t>* frame_ids) const
+{
+    frame_ids->clear();
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        FrameTree::index_t current_index = index;
+        while (current_index != 0) {
+            auto [frame_id, next_index] = d_tree.nextNode(current_index);
+            frame_ids->push_back(frame_id);
+            current_index = next_index;
+        }
+    }
+
+    // Hide the frames above the call that started tracking, like stack_trace() does.
+    if (tid == getMainThreadTid()) {
+        size_t to_skip = std::min(getSkippedFramesOnMainThread(), frame_ids->size());
+        frame_ids->resize(frame_ids->size() - to_skip);
+    }
+}
+
+Frame
+RecordReader::getPythonFrame(frame_id_t frame_id) const
+{
+    std::lock_guard<std::mutex> lock(d_mutex);
+    return d_frame_map.at(frame_id);
+}
+
 PyObject*
 RecordReader::Py_GetNativeStackFrame(FrameTree::index_t index, size_t generation, size_t max_stacks)
 {
@@ -906,6 +1139,42 @@ RecordReader::getLatestMemorySnapshot() const noexcept
     return d_latest_memory_snapshot;
 }
 
+AggregatedAllocationInterval
+RecordReader::getLatestAggregatedAllocationInterval() const noexcept
+{
+    return d_latest_aggregated_allocation_interval;
+}
+
+std::vector<size_t>
+RecordReader::getHighWaterMarkBytesBySnapshot() const noexcept
+{
+    return d_high_water_mark_bytes_by_snapshot;
+}
+
+AllocationStatsEntry
+RecordReader::getLatestAllocationStatsEntry() const noexcept
+{
+    return d_latest_allocation_stats_entry;
+}
+
+AggregatedTemporaryAllocations
+RecordReader::getLatestTemporaryAllocations() const noexcept
+{
+    return d_latest_temporary_allocations;
+}
+
+bool
+RecordReader::hasAllocationStats() const noexcept
+{
+    return d_temporary_allocation_threshold.has_value();
+}
+
+size_t
+RecordReader::getTemporaryAllocationThreshold() const noexcept
+{
+    return d_temporary_allocation_threshold.value_or(0);
+}
+
 PyObject*
 RecordReader::dumpAllRecords()
 {
@@ -1040,6 +1309,45 @@ RecordReader::dumpAllRecordsFromAllAllocationsFile()
                        record.size,
                        allocator);
             } break;
+            case RecordType::TRANSIENT_ALLOCATIONS:
+            case RecordType::TRANSIENT_ALLOCATIONS_WITH_NATIVE: {
+                bool native =
+                        (record_type_and_flags.record_type
+                         == RecordType::TRANSIENT_ALLOCATIONS_WITH_NATIVE);
+                printf("%s ", native ? "TRANSIENT_ALLOCATIONS_WITH_NATIVE" : "TRANSIENT_ALLOCATIONS");
+
+                TransientAllocationsRecord record;
+                if (!parseTransientAllocationsRecord(&record, record_type_and_flags.flags, native)) {
+                    Py_RETURN_NONE;
+                }
+
+                const char* allocator = allocatorName(record.allocator);
+                const char* deallocator = allocatorName(record.deallocator);
+
+                std::string unknownAllocator;
+                if (!allocator) {
+                    unknownAllocator =
+                            "<unknown allocator " + std::to_string((int)record.allocator) + ">";
+                    allocator = unknownAllocator.c_str();
+                }
+                std::string unknownDeallocator;
+                if (!deallocator) {
+                    unknownDeallocator =
+                            "<unknown allocator " + std::to_string((int)record.deallocator) + ">";
+                    deallocator = unknownDeallocator.c_str();
+                }
+
+                printf("address=%p size=%zd allocator=%s deallocator=%s count=%zd",
+                       (void*)record.address,
+                       record.size,
+                       allocator,
+                       deallocator,
+                       record.count);
+                if (native) {
+                    printf(" native_frame_id=%zd", record.native_frame_id);
+                }
+                printf("\n");
+            } break;
             case RecordType::FRAME_PUSH: {
                 printf("FRAME_PUSH ");
 
@@ -1210,6 +1518,120 @@ RecordReader::dumpAllRecordsFromAggregatedAllocationsFile()
                        record.bytes_leaked);
             } break;
 
+            case AggregatedRecordType::AGGREGATED_ALLOCATION_INTERVAL: {
+                printf("AGGREGATED_ALLOCATION_INTERVAL ");
+
+                AggregatedAllocationInterval record;
+                if (!parseAggregatedAllocationIntervalRecord(&record)) {
+                    Py_RETURN_NONE;
+                }
+
+                const char* allocator = allocatorName(record.allocator);
+
+                std::string unknownAllocator;
+                if (!allocator) {
+                    unknownAllocator =
+                            "<unknown allocator " + std::to_string((int)record.allocator) + ">";
+                    allocator = unknownAllocator.c_str();
+                }
+
+                printf("tid=%lu allocator=%s native_frame_id=%zd python_frame_id=%zd"
+                       " native_segment_generation=%zd allocated_before_snapshot=%zd"
+                       " deallocated_before_snapshot=%zd n_allocations=%zd n_bytes=%zd\n",
+                       record.tid,
+                       allocator,
+                       record.native_frame_id,
+                       record.frame_index,
+                       record.native_segment_generation,
+                       record.allocated_before_snapshot,
+                       record.deallocated_before_snapshot,
+                       record.n_allocations,
+                       record.n_bytes);
+            } break;
+
+            case AggregatedRecordType::SNAPSHOT_HIGH_WATER_MARK: {
+                printf("SNAPSHOT_HIGH_WATER_MARK ");
+
+                size_t bytes;
+                if (!parseSnapshotHighWaterMarkRecord(&bytes)) {
+                    Py_RETURN_NONE;
+                }
+
+                printf("bytes=%zd\n", bytes);
+            } break;
+
+            case AggregatedRecordType::TEMPORARY_ALLOCATION_THRESHOLD: {
+                printf("TEMPORARY_ALLOCATION_THRESHOLD ");
+
+                size_t threshold;
+                if (!parseTemporaryAllocationThresholdRecord(&threshold)) {
+                    Py_RETURN_NONE;
+                }
+
+                printf("threshold=%zd\n", threshold);
+            } break;
+
+            case AggregatedRecordType::ALLOCATION_STATS: {
+                printf("ALLOCATION_STATS ");
+
+                AllocationStatsEntry record;
+                if (!parseAllocationStatsRecord(&record)) {
+                    Py_RETURN_NONE;
+                }
+
+                const char* kind = "<unknown kind>";
+                switch (record.kind) {
+                    case AllocationStatsEntry::Kind::BY_SIZE:
+                        kind = "BY_SIZE";
+                        break;
+                    case AllocationStatsEntry::Kind::BY_ALLOCATOR:
+                        kind = "BY_ALLOCATOR";
+                        break;
+                    case AllocationStatsEntry::Kind::BY_PYTHON_FRAME:
+                        kind = "BY_PYTHON_FRAME";
+                        break;
+                    case AllocationStatsEntry::Kind::WITHOUT_PYTHON_FRAME:
+                        kind = "WITHOUT_PYTHON_FRAME";
+                        break;
+                }
+
+                printf("kind=%s key=%zd n_allocations=%zd n_bytes=%zd\n",
+                       kind,
+                       record.key,
+                       record.n_allocations,
+                       record.n_bytes);
+            } break;
+
+            case AggregatedRecordType::TEMPORARY_ALLOCATIONS: {
+                printf("TEMPORARY_ALLOCATIONS ");
+
+                AggregatedTemporaryAllocations record;
+                if (!parseTemporaryAllocationsRecord(&record)) {
+                    Py_RETURN_NONE;
+                }
+
+                const char* allocator = allocatorName(record.allocator);
+
+                std::string unknownAllocator;
+                if (!allocator) {
+                    unknownAllocator =
+                            "<unknown allocator " + std::to_string((int)record.allocator) + ">";
+                    allocator = unknownAllocator.c_str();
+                }
+
+                printf("tid=%lu allocator=%s native_frame_id=%zd python_frame_id=%zd"
+                       " native_segment_generation=%zd distance=%zd n_allocations=%zd"
+                       " n_bytes=%zd\n",
+                       record.tid,
+                       allocator,
+                       record.native_frame_id,
+                       record.frame_index,
+                       record.native_segment_generation,
+                       record.distance,
+                       record.n_allocations,
+                       record.n_bytes);
+            } break;
+
             case AggregatedRecordType::PYTHON_TRACE_INDEX: {
                 printf("PYTHON_TRACE_INDEX ");
 
@@ -33,6 +33,9 @@ class RecordReader
     enum class RecordResult {
         ALLOCATION_RECORD,
         AGGREGATED_ALLOCATION_RECORD,
+        AGGREGATED_ALLOCATION_INTERVAL,
+        ALLOCATION_STATS,
+        TEMPORARY_ALLOCATIONS,
         MEMORY_RECORD,
         MEMORY_SNAPSHOT,
         ERROR,
@@ -52,6 +55,11 @@ class RecordReader
             size_t generation,
             size_t max_stacks = std::numeric_limits<size_t>::max());
     std::optional<frame_id_t> getLatestPythonFrameId(const Allocation& allocation) const;
+    void getPythonStackFrameIds(
+            FrameTree::index_t index,
+            thread_id_t tid,
+            std::vector<frame_id_t>* frame_ids) const;
+    Frame getPythonFrame(frame_id_t frame_id) const;
     PyObject* Py_GetFrame(std::optional<frame_id_t> frame);
 
     RecordResult nextRecord();
@@ -64,6 +72,14 @@ class RecordReader
     MemoryRecord getLatestMemoryRecord() const noexcept;
     AggregatedAllocation getLatestAggregatedAllocation() const noexcept;
     MemorySnapshot getLatestMemorySnapshot() const noexcept;
+    AggregatedAllocationInterval getLatestAggregatedAllocationInterval() const noexcept;
+    std::vector<size_t> getHighWaterMarkBytesBySnapshot() const noexcept;
+    AllocationStatsEntry getLatestAllocationStatsEntry() const noexcept;
+    AggregatedTemporaryAllocations getLatestTemporaryAllocations() const noexcept;
+    // Whether an AGGREGATED_ALLOCATIONS capture holds allocation statistics
+    // and temporary allocations. Ones written by older versions don't.
+    bool hasAllocationStats() const noexcept;
+    size_t getTemporaryAllocationThreshold() const noexcept;
 
   private:
     // Aliases
@@ -81,6 +97,7 @@ class RecordReader
     template<typename T>
     bool readIntegralDelta(T* cache, T* new_val);
     RecordResult nextRecordFromAllAllocationsFile();
+    RecordResult nextTransientAllocation();
     RecordResult nextRecordFromAggregatedAllocationsFile();
     PyObject* dumpAllRecordsFromAllAllocationsFile();
     PyObject* dumpAllRecordsFromAggregatedAllocationsFile();
@@ -99,9 +116,17 @@ class RecordReader
     DeltaEncodedFields d_last;
     std::unordered_map<thread_id_t, std::string> d_thread_names;
     Allocation d_latest_allocation;
+    TransientAllocationsRecord d_transient_allocations{};
+    bool d_transient_allocations_have_native_frames{false};
+    size_t d_transient_allocation_records_left{0};
     AggregatedAllocation d_latest_aggregated_allocation;
     MemoryRecord d_latest_memory_record{};
     MemorySnapshot d_latest_memory_snapshot{};
+    AggregatedAllocationInterval d_latest_aggregated_allocation_interval{};
+    std::vector<size_t> d_high_water_mark_bytes_by_snapshot{};
+    AllocationStatsEntry d_latest_allocation_stats_entry{};
+    AggregatedTemporaryAllocations d_latest_temporary_allocations{};
+    std::optional<size_t> d_temporary_allocation_threshold{};
 
     // Methods
     [[nodiscard]] bool parseFramePush(FramePush* record);
@@ -122,6 +147,11 @@ class RecordReader
     [[nodiscard]] bool parseNativeAllocationRecord(NativeAllocationRecord* record, unsigned int flags);
     [[nodiscard]] bool processNativeAllocationRecord(const NativeAllocationRecord& record);
 
+    [[nodiscard]] bool
+    parseTransientAllocationsRecord(TransientAllocationsRecord* record, unsigned int flags, bool native);
+    [[nodiscard]] bool
+    processTransientAllocationsRecord(const TransientAllocationsRecord& record, bool native);
+
     [[nodiscard]] static bool parseMemoryMapStart();
     [[nodiscard]] bool processMemoryMapStart();
 
@@ -146,6 +176,22 @@ class RecordReader
     [[nodiscard]] bool parseAggregatedAllocationRecord(AggregatedAllocation* record);
     [[nodiscard]] bool processAggregatedAllocationRecord(const AggregatedAllocation& record);
 
+    [[nodiscard]] bool parseAggregatedAllocationIntervalRecord(AggregatedAllocationInterval* record);
+    [[nodiscard]] bool
+    processAggregatedAllocationIntervalRecord(const AggregatedAllocationInterval& record);
+
+    [[nodiscard]] bool parseSnapshotHighWaterMarkRecord(size_t* bytes);
+    [[nodiscard]] bool processSnapshotHighWaterMarkRecord(size_t bytes);
+
+    [[nodiscard]] bool parseAllocationStatsRecord(AllocationStatsEntry* record);
+    [[nodiscard]] bool processAllocationStatsRecord(const AllocationStatsEntry& record);
+
+    [[nodiscard]] bool parseTemporaryAllocationsRecord(AggregatedTemporaryAllocations* record);
+    [[nodiscard]] bool processTemporaryAllocationsRecord(const AggregatedTemporaryAllocations& record);
+
+    [[nodiscard]] bool parseTemporaryAllocationThresholdRecord(size_t* threshold);
+    [[nodiscard]] bool processTemporaryAllocationThresholdRecord(size_t threshold);
+
     [[nodiscard]] bool parsePythonTraceIndexRecord(std::pair<frame_id_t, FrameTree::index_t>* record);
     [[nodiscard]] bool processPythonTraceIndexRecord(const std::pair<frame_id_t, FrameTree::index_t>&);
 
@@ -1,5 +1,8 @@
 from _memray.records cimport AggregatedAllocation
+from _memray.records cimport AggregatedAllocationInterval
+from _memray.records cimport AggregatedTemporaryAllocations
 from _memray.records cimport Allocation
+from _memray.records cimport AllocationStatsEntry
 from _memray.records cimport HeaderRecord
 from _memray.records cimport MemoryRecord
 from _memray.records cimport MemorySnapshot
@@ -15,6 +18,9 @@ cdef extern from "record_reader.h" namespace "memray::api":
     cdef enum RecordResult 'memray::api::RecordReader::RecordResult':
         RecordResultAllocationRecord 'memray::api::RecordReader::RecordResult::ALLOCATION_RECORD'
         RecordResultAggregatedAllocationRecord 'memray::api::RecordReader::RecordResult::AGGREGATED_ALLOCATION_RECORD'
+        RecordResultAggregatedAllocationInterval 'memray::api::RecordReader::RecordResult::AGGREGATED_ALLOCATION_INTERVAL'
+        RecordResultAllocationStats 'memray::api::RecordReader::RecordResult::ALLOCATION_STATS'
+        RecordResultTemporaryAllocations 'memray::api::RecordReader::RecordResult::TEMPORARY_ALLOCATIONS'
         RecordResultMemoryRecord 'memray::api::RecordReader::RecordResult::MEMORY_RECORD'
         RecordResultMemorySnapshot 'memray::api::RecordReader::RecordResult::MEMORY_SNAPSHOT'
         RecordResultError 'memray::api::RecordReader::RecordResult::ERROR'
@@ -47,3 +53,9 @@ cdef extern from "record_reader.h" namespace "memray::api":
         MemoryRecord getLatestMemoryRecord()
         AggregatedAllocation getLatestAggregatedAllocation()
         MemorySnapshot getLatestMemorySnapshot()
+        AggregatedAllocationInterval getLatestAggregatedAllocationInterval()
+        vector[size_t] getHighWaterMarkBytesBySnapshot()
+        AllocationStatsEntry getLatestAllocationStatsEntry()
+        AggregatedTemporaryAllocations getLatestTemporaryAllocations()
+        bool hasAllocationStats()
+        size_t getTemporaryAllocationThreshold()
@@ -1,15 +1,23 @@
 #include "record_writer.h"
 
+#include <algorithm>
 #include <cerrno>
 #include <chrono>
 #include <cstring>
+#include <deque>
 #include <fcntl.h>
 #include <memory>
+#include <optional>
 #include <stdexcept>
+#include <thread>
+#include <utility>
 
+#include "exceptions.h"
 #include "frame_tree.h"
+#include "logging.h"
 #include "records.h"
 #include "snapshot.h"
+#include "tracking_api.h"
 
 #if PY_VERSION_HEX >= 0x030D0000
 // This function still exists in 3.13 but Python.h no longer has its prototype.
@@ -21,6 +29,11 @@ namespace memray::tracking_api {
 
 using namespace std::chrono;
 
+// The most memory snapshots an aggregating writer keeps the high water mark
+// history for. Once there are more, the history is compacted, so that it stays
+// bounded even when there is no memory budget.
+static const size_t MAX_MEMORY_SNAPSHOTS = 4096;
+
 static PythonAllocatorType
 getPythonAllocator()
 {
@@ -49,6 +62,18 @@ RecordWriter::RecordWriter(std::unique_ptr<memray::io::Sink> sink)
 {
 }
 
+std::string
+RecordWriter::dumpCapture()
+{
+    throw std::runtime_error("This destination does not keep records in memory");
+}
+
+std::optional<AllocationFilter>
+RecordWriter::receiveAllocationFilter()
+{
+    return d_sink->receiveAllocationFilter();
+}
+
 class StreamingRecordWriter : public RecordWriter
 {
   public:
@@ -56,7 +81,8 @@ class StreamingRecordWriter : public RecordWriter
             std::unique_ptr<memray::io::Sink> sink,
             const std::string& command_line,
             bool native_traces,
-            bool trace_python_allocators);
+            bool trace_python_allocators,
+            std::optional<millis_t> start_time = std::nullopt);
 
     StreamingRecordWriter(StreamingRecordWriter& other) = delete;
     StreamingRecordWriter(StreamingRecordWriter&& other) = delete;
@@ -81,14 +107,36 @@ class StreamingRecordWriter : public RecordWriter
     void setMainTidAndSkippedFrames(thread_id_t main_tid, size_t skipped_frames_on_main_tid) override;
     std::unique_ptr<RecordWriter> cloneInChildProcess() override;
 
-  private:
+  protected:
+    // A run of allocations that were each deallocated right after being made,
+    // which hasn't been written yet. `record.count` is the number of complete
+    // pairs, and `allocated` tells whether one more allocation is waiting for
+    // its deallocation.
+    struct PendingTransientAllocations
+    {
+        thread_id_t tid;
+        bool native;
+        bool allocated;
+        TransientAllocationsRecord record;
+    };
+
     bool maybeWriteContextSwitchRecordUnsafe(thread_id_t tid);
+    bool maybeExtendTransientAllocations(
+            thread_id_t tid,
+            uintptr_t address,
+            size_t size,
+            hooks::Allocator allocator,
+            std::optional<frame_id_t> native_frame_id);
+    bool flushTransientAllocations();
+    bool writeAllocationRecordUnsafe(const AllocationRecord& record);
+    bool writeAllocationRecordUnsafe(const NativeAllocationRecord& record);
 
     // Data members
     int d_version{CURRENT_HEADER_VERSION};
     HeaderRecord d_header{};
     TrackerStats d_stats{};
     DeltaEncodedFields d_last;
+    std::optional<PendingTransientAllocations> d_pending_transient_allocations{};
 };
 
 class AggregatingRecordWriter : public RecordWriter
@@ -98,7 +146,9 @@ class AggregatingRecordWriter : public RecordWriter
             std::unique_ptr<memray::io::Sink> sink,
             const std::string& command_line,
             bool native_traces,
-            bool trace_python_allocators);
+            bool trace_python_allocators,
+            size_t temporary_allocation_threshold,
+            size_t memory_budget);
 
     AggregatingRecordWriter(StreamingRecordWriter& other) = delete;
     AggregatingRecordWriter(StreamingRecordWriter&& other) = delete;
@@ -123,11 +173,21 @@ class AggregatingRecordWriter : public RecordWriter
     void setMainTidAndSkippedFrames(thread_id_t main_tid, size_t skipped_frames_on_main_tid) override;
     std::unique_ptr<RecordWriter> cloneInChildProcess() override;
 
+    std::string dumpCapture() override;
+
   private:
     // Aliases
     using python_stack_ids_t = std::vector<FrameTree::index_t>;
     using python_stack_ids_by_tid = std::unordered_map<thread_id_t, python_stack_ids_t>;
 
+    bool writeCapture(bool point_in_time);
+    bool writeAllocationHistory();
+    bool writeAllocationStats();
+    void addAllocation(const Allocation& allocation);
+    size_t memoryUsage() const;
+    void compactHistory();
+    void enforceMemoryBudget();
+
     // Data members
     HeaderRecord d_header;
     TrackerStats d_stats;
@@ -139,6 +199,214 @@ class AggregatingRecordWriter : public RecordWriter
     FrameTree d_python_frame_tree;
     python_stack_ids_by_tid d_python_stack_ids_by_thread;
     api::HighWaterMarkAggregator d_high_water_mark_aggregator;
+    api::AllocationStatsAggregator d_allocation_stats_aggregator;
+    api::TemporaryAllocationsCounter d_temporary_allocations_counter;
+    size_t d_memory_budget;
+    size_t d_next_compaction_at;
+    bool d_over_budget_warning_shown{false};
+    size_t d_frames_and_mappings_bytes{0};
+};
+
+// Writes the AGGREGATED_ALLOCATIONS format as a stream, for a reader that
+// consumes the records as they arrive. Allocations are aggregated by location,
+// and every memory record flushes the locations whose totals changed since the
+// previous one, followed by a memory snapshot. Each aggregated allocation
+// record holds the live totals of its location, replacing any earlier record
+// for the same location, so only the leaked fields are filled in.
+class LiveAggregatingRecordWriter : public RecordWriter
+{
+  public:
+    explicit LiveAggregatingRecordWriter(
+            std::unique_ptr<memray::io::Sink> sink,
+            const std::string& command_line,
+            bool native_traces,
+            bool trace_python_allocators);
+
+    LiveAggregatingRecordWriter(LiveAggregatingRecordWriter& other) = delete;
+    LiveAggregatingRecordWriter(LiveAggregatingRecordWriter&& other) = delete;
+    void operator=(const LiveAggregatingRecordWriter&) = delete;
+    void operator=(LiveAggregatingRecordWriter&&) = delete;
+
+    bool writeRecord(const MemoryRecord& record) override;
+    bool writeRecord(const pyrawframe_map_val_t& item) override;
+    bool writeRecord(const UnresolvedNativeFrame& record) override;
+
+    bool writeMappings(const std::vector<ImageSegments>& mappings) override;
+
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePop& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePush& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const AllocationRecord& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const NativeAllocationRecord& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record) override;
+
+    bool writeHeader(bool seek_to_start) override;
+    bool writeTrailer() override;
+
+    void setMainTidAndSkippedFrames(thread_id_t main_tid, size_t skipped_frames_on_main_tid) override;
+    std::unique_ptr<RecordWriter> cloneInChildProcess() override;
+
+  private:
+    // Aliases
+    using python_stack_ids_t = std::vector<FrameTree::index_t>;
+    using python_stack_ids_by_tid = std::unordered_map<thread_id_t, python_stack_ids_t>;
+
+    bool writeChangedLocations();
+
+    // Data members
+    HeaderRecord d_header;
+    TrackerStats d_stats;
+    UnresolvedNativeFrame d_last_native_frame{};
+    size_t d_mappings_generation{0};
+    FrameTree d_python_frame_tree;
+    FrameTree::index_t d_last_written_trace_index{0};
+    python_stack_ids_by_tid d_python_stack_ids_by_thread;
+    api::IncrementalSnapshotAggregator d_aggregator;
+    uint64_t d_last_written_version{0};
+};
+
+// Keeps the most recent records in memory instead of writing them anywhere,
+// like a flight recorder. Records are kept in a window bounded by the number
+// of bytes they use and, optionally, by their age. Allocations and
+// deallocations that fall out of the window are folded into a baseline that
+// tracks every allocation they leave alive, so a dump is still a replayable
+// ALL_ALLOCATIONS capture: it holds the surviving older allocations, followed
+// by every record in the window.
+class RingBufferRecordWriter : public RecordWriter
+{
+  public:
+    explicit RingBufferRecordWriter(
+            const std::string& command_line,
+            bool native_traces,
+            bool trace_python_allocators,
+            size_t max_bytes,
+            unsigned int max_seconds);
+
+    RingBufferRecordWriter(RingBufferRecordWriter& other) = delete;
+    RingBufferRecordWriter(RingBufferRecordWriter&& other) = delete;
+    void operator=(const RingBufferRecordWriter&) = delete;
+    void operator=(RingBufferRecordWriter&&) = delete;
+
+    bool writeRecord(const MemoryRecord& record) override;
+    bool writeRecord(const pyrawframe_map_val_t& item) override;
+    bool writeRecord(const UnresolvedNativeFrame& record) override;
+
+    bool writeMappings(const std::vector<ImageSegments>& mappings) override;
+
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePop& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePush& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const AllocationRecord& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const NativeAllocationRecord& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record) override;
+
+    bool writeHeader(bool seek_to_start) override;
+    bool writeTrailer() override;
+
+    void setMainTidAndSkippedFrames(thread_id_t main_tid, size_t skipped_frames_on_main_tid) override;
+    std::unique_ptr<RecordWriter> cloneInChildProcess() override;
+
+    std::string dumpCapture() override;
+
+  private:
+    // Aliases
+    using python_stack_ids_t = std::vector<FrameTree::index_t>;
+    using python_stack_ids_by_tid = std::unordered_map<thread_id_t, python_stack_ids_t>;
+
+    // A record in the window. Memory records store the RSS in `address` and
+    // the timestamp in `size`.
+    struct BufferedRecord
+    {
+        enum class Type : unsigned char { ALLOCATION, NATIVE_ALLOCATION, MEMORY };
+
+        Type type;
+        hooks::Allocator allocator;
+        FrameTree::index_t frame_index;
+        uint32_t native_segment_generation;
+        thread_id_t tid;
+        uintptr_t address;
+        size_t size;
+        frame_id_t native_frame_id;
+    };
+
+    void pushRecord(const BufferedRecord& record);
+    void evictOldestRecord();
+    FrameTree::index_t currentStackId(thread_id_t tid);
+
+    // Data members
+    HeaderRecord d_header;
+    const size_t d_max_records;
+    const millis_t d_max_ms;
+    pyframe_map_t d_frames_by_id;
+    std::vector<UnresolvedNativeFrame> d_native_frames{};
+    std::vector<std::vector<ImageSegments>> d_mappings_by_generation{};
+    std::unordered_map<thread_id_t, std::string> d_thread_name_by_tid;
+    FrameTree d_python_frame_tree;
+    python_stack_ids_by_tid d_python_stack_ids_by_thread;
+    std::deque<BufferedRecord> d_window;
+    std::unordered_map<uintptr_t, Allocation> d_baseline_allocations;
+    api::IntervalTree<Allocation> d_baseline_ranges;
+};
+
+// A writer that splits an ALL_ALLOCATIONS capture into numbered segments. A
+// new segment is started once the current one grows past a size, or gets
+// older than a time limit. Each segment starts with the frames, mappings,
+// thread names and Python stacks that its records may refer to, so that it
+// can be read on its own.
+class RotatingRecordWriter : public StreamingRecordWriter
+{
+  public:
+    explicit RotatingRecordWriter(
+            const std::string& path,
+            bool overwrite,
+            bool compress,
+            const std::string& command_line,
+            bool native_traces,
+            bool trace_python_allocators,
+            size_t max_bytes,
+            unsigned int max_seconds,
+            unsigned int keep);
+    ~RotatingRecordWriter() override;
+
+    RotatingRecordWriter(RotatingRecordWriter& other) = delete;
+    RotatingRecordWriter(RotatingRecordWriter&& other) = delete;
+    void operator=(const RotatingRecordWriter&) = delete;
+    void operator=(RotatingRecordWriter&&) = delete;
+
+    bool writeRecord(const MemoryRecord& record) override;
+    bool writeRecord(const pyrawframe_map_val_t& item) override;
+    bool writeRecord(const UnresolvedNativeFrame& record) override;
+
+    bool writeMappings(const std::vector<ImageSegments>& mappings) override;
+
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePop& record) override;
+    bool writeThreadSpecificRecord(thread_id_t tid, const FramePush& record) override;
+    using StreamingRecordWriter::writeThreadSpecificRecord;
+    bool writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record) override;
+
+    std::unique_ptr<RecordWriter> cloneInChildProcess() override;
+
+  private:
+    std::string segmentPath(unsigned int segment) const;
+    std::unique_ptr<io::Sink> openSegment(unsigned int segment);
+    bool startNextSegment(millis_t now);
+    void closeSegment(std::unique_ptr<io::Sink> sink, std::string expired_segment_path);
+
+    // Data members
+    const std::string d_path;
+    const std::string d_path_stem;
+    const bool d_overwrite;
+    const bool d_compress;
+    const size_t d_max_bytes;
+    const millis_t d_max_ms;
+    const unsigned int d_keep;
+    unsigned int d_segment{1};
+    io::FileSink* d_segment_sink{nullptr};
+    std::thread d_segment_closer;
+    pyframe_map_t d_frames_by_id;
+    std::vector<UnresolvedNativeFrame> d_native_frames{};
+    std::vector<ImageSegments> d_mappings{};
+    bool d_mappings_written{false};
+    std::unordered_map<thread_id_t, std::string> d_thread_name_by_tid;
+    std::unordered_map<thread_id_t, std::vector<frame_id_t>> d_python_stack_by_tid;
 };
 
 std::unique_ptr<RecordWriter>
@@ -147,7 +415,10 @@ createRecordWriter(
         const std::string& command_line,
         bool native_traces,
         FileFormat file_format,
-        bool trace_python_allocators)
+        bool trace_python_allocators,
+        bool streaming,
+        size_t temporary_allocation_threshold,
+        size_t memory_budget)
 {
     switch (file_format) {
         case FileFormat::ALL_ALLOCATIONS:
@@ -157,11 +428,20 @@ createRecordWriter(
                     native_traces,
                     trace_python_allocators);
         case FileFormat::AGGREGATED_ALLOCATIONS:
+            if (streaming) {
+                return std::make_unique<LiveAggregatingRecordWriter>(
+                        std::move(sink),
+                        command_line,
+                        native_traces,
+                        trace_python_allocators);
+            }
             return std::make_unique<AggregatingRecordWriter>(
                     std::move(sink),
                     command_line,
                     native_traces,
-                    trace_python_allocators);
+                    trace_python_allocators,
+                    temporary_allocation_threshold,
+                    memory_budget);
         default:
             throw std::runtime_error("Invalid file format enumerator");
     }
@@ -171,9 +451,14 @@ StreamingRecordWriter::StreamingRecordWriter(
         std::unique_ptr<memray::io::Sink> sink,
         const std::string& command_line,
         bool native_traces,
-        bool trace_python_allocators)
+        bool trace_python_allocators,
+        std::optional<millis_t> start_time)
 : RecordWriter(std::move(sink))
-, d_stats({0, 0, duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count()})
+, d_stats(
+          {0,
+           0,
+           start_time.value_or(
+                   duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count())})
 {
     d_header = HeaderRecord{
             "",
@@ -203,7 +488,7 @@ bool
 StreamingRecordWriter::writeRecord(const MemoryRecord& record)
 {
     RecordTypeAndFlags token{RecordType::MEMORY_RECORD, 0};
-    return writeSimpleType(token) && writeVarint(record.rss)
+    return flushTransientAllocations() && writeSimpleType(token) && writeVarint(record.rss)
            && writeVarint(record.ms_since_epoch - d_stats.start_time) && d_sink->flush();
 }
 
@@ -212,7 +497,8 @@ StreamingRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
 {
     d_stats.n_frames += 1;
     RecordTypeAndFlags token{RecordType::FRAME_INDEX, !item.second.is_entry_frame};
-    return writeSimpleType(token) && writeIntegralDelta(&d_last.python_frame_id, item.first)
+    return flushTransientAllocations() && writeSimpleType(token)
+           && writeIntegralDelta(&d_last.python_frame_id, item.first)
            && writeString(item.second.function_name) && writeString(item.second.filename)
            && writeIntegralDelta(&d_last.python_line_number, item.second.lineno);
 }
@@ -220,7 +506,8 @@ StreamingRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
 bool
 StreamingRecordWriter::writeRecord(const UnresolvedNativeFrame& record)
 {
-    return writeSimpleType(RecordTypeAndFlags{RecordType::NATIVE_TRACE_INDEX, 0})
+    return flushTransientAllocations()
+           && writeSimpleType(RecordTypeAndFlags{RecordType::NATIVE_TRACE_INDEX, 0})
            && writeIntegralDelta(&d_last.instruction_pointer, record.ip)
            && writeIntegralDelta(&d_last.native_frame_id, record.index);
 }
@@ -228,7 +515,7 @@ StreamingRecordWriter::writeRecord(const UnresolvedNativeFrame& record)
 bool
 StreamingRecordWriter::writeMappings(const std::vector<ImageSegments>& mappings)
 {
-    return writeMappingsCommon(mappings);
+    return flushTransientAllocations() && writeMappingsCommon(mappings);
 }
 
 bool
@@ -277,7 +564,7 @@ StreamingRecordWriter::maybeWriteContextSwitchRecordUnsafe(thread_id_t tid)
 bool
 StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePop& record)
 {
-    if (!maybeWriteContextSwitchRecordUnsafe(tid)) {
+    if (!flushTransientAllocations() || !maybeWriteContextSwitchRecordUnsafe(tid)) {
         return false;
     }
 
@@ -300,7 +587,7 @@ StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePop
 bool
 StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePush& record)
 {
-    if (!maybeWriteContextSwitchRecordUnsafe(tid)) {
+    if (!flushTransientAllocations() || !maybeWriteContextSwitchRecordUnsafe(tid)) {
         return false;
     }
 
@@ -311,11 +598,148 @@ StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePus
 bool
 StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const AllocationRecord& record)
 {
-    if (!maybeWriteContextSwitchRecordUnsafe(tid)) {
+    d_stats.n_allocations += 1;
+    if (maybeExtendTransientAllocations(tid, record.address, record.size, record.allocator, {})) {
+        return true;
+    }
+    if (!flushTransientAllocations()) {
         return false;
     }
+    if (hooks::allocatorKind(record.allocator) == hooks::AllocatorKind::SIMPLE_ALLOCATOR) {
+        d_pending_transient_allocations = PendingTransientAllocations{
+                tid,
+                false,
+                true,
+                {record.address, record.size, record.allocator, record.allocator, 0, 0}};
+        return true;
+    }
+    return maybeWriteContextSwitchRecordUnsafe(tid) && writeAllocationRecordUnsafe(record);
+}
 
+bool
+StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const NativeAllocationRecord& record)
+{
     d_stats.n_allocations += 1;
+    if (maybeExtendTransientAllocations(
+                tid,
+                record.address,
+                record.size,
+                record.allocator,
+                record.native_frame_id))
+    {
+        return true;
+    }
+    if (!flushTransientAllocations()) {
+        return false;
+    }
+    if (hooks::allocatorKind(record.allocator) == hooks::AllocatorKind::SIMPLE_ALLOCATOR) {
+        d_pending_transient_allocations = PendingTransientAllocations{
+                tid,
+                true,
+                true,
+                {record.address,
+                 record.size,
+                 record.allocator,
+                 record.allocator,
+                 record.native_frame_id,
+                 0}};
+        return true;
+    }
+    return maybeWriteContextSwitchRecordUnsafe(tid) && writeAllocationRecordUnsafe(record);
+}
+
+bool
+StreamingRecordWriter::maybeExtendTransientAllocations(
+        thread_id_t tid,
+        uintptr_t address,
+        size_t size,
+        hooks::Allocator allocator,
+        std::optional<frame_id_t> native_frame_id)
+{
+    // Tight loops often allocate a buffer, use it, and free it again, and
+    // the allocator hands out the same address every time. Rather than
+    // writing each of these allocations and deallocations, we count them,
+    // and write the whole run as one record once it's broken. Any other
+    // record breaks the run, so every allocation in it has the same stack.
+    if (!d_pending_transient_allocations || d_pending_transient_allocations->tid != tid) {
+        return false;
+    }
+    auto& pending = *d_pending_transient_allocations;
+    auto& run = pending.record;
+    if (run.address != address) {
+        return false;
+    }
+
+    if (pending.allocated) {
+        // Only a deallocation that frees the pending allocation extends the
+        // run, and all of the run's deallocations must use the same function.
+        if (hooks::allocatorKind(allocator) != hooks::AllocatorKind::SIMPLE_DEALLOCATOR
+            || (run.count != 0 && run.deallocator != allocator))
+        {
+            return false;
+        }
+        run.deallocator = allocator;
+        run.count += 1;
+        pending.allocated = false;
+        return true;
+    }
+
+    if (run.size != size || run.allocator != allocator || pending.native != native_frame_id.has_value()
+        || (native_frame_id && run.native_frame_id != *native_frame_id))
+    {
+        return false;
+    }
+    pending.allocated = true;
+    return true;
+}
+
+bool
+StreamingRecordWriter::flushTransientAllocations()
+{
+    if (!d_pending_transient_allocations) {
+        return true;
+    }
+    PendingTransientAllocations pending = *d_pending_transient_allocations;
+    d_pending_transient_allocations.reset();
+
+    const auto& run = pending.record;
+    if (!maybeWriteContextSwitchRecordUnsafe(pending.tid)) {
+        return false;
+    }
+
+    auto write_allocation = [&]() {
+        if (pending.native) {
+            return writeAllocationRecordUnsafe(
+                    NativeAllocationRecord{run.address, run.size, run.allocator, run.native_frame_id});
+        }
+        return writeAllocationRecordUnsafe(AllocationRecord{run.address, run.size, run.allocator});
+    };
+
+    if (run.count > 1) {
+        RecordTypeAndFlags token{
+                pending.native ? RecordType::TRANSIENT_ALLOCATIONS_WITH_NATIVE
+                               : RecordType::TRANSIENT_ALLOCATIONS,
+                static_cast<unsigned char>(run.allocator)};
+        if (!writeSimpleType(token) || !writeIntegralDelta(&d_last.data_pointer, run.address)
+            || !writeVarint(run.size) || !writeSimpleType(run.deallocator) || !writeVarint(run.count)
+            || (pending.native && !writeIntegralDelta(&d_last.native_frame_id, run.native_frame_id)))
+        {
+            return false;
+        }
+    } else if (run.count == 1) {
+        // A single pair takes about as much space written out in full.
+        AllocationRecord deallocation{run.address, 0, run.deallocator};
+        if (!write_allocation() || !writeAllocationRecordUnsafe(deallocation)) {
+            return false;
+        }
+    }
+
+    return !pending.allocated || write_allocation();
+}
+
+bool
+StreamingRecordWriter::writeAllocationRecordUnsafe(const AllocationRecord& record)
+{
     RecordTypeAndFlags token{RecordType::ALLOCATION, static_cast<unsigned char>(record.allocator)};
     return writeSimpleType(token) && writeIntegralDelta(&d_last.data_pointer, record.address)
            && (hooks::allocatorKind(record.allocator) == hooks::AllocatorKind::SIMPLE_DEALLOCATOR
@@ -323,13 +747,8 @@ StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const Allocati
 }
 
 bool
-StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const NativeAllocationRecord& record)
+StreamingRecordWriter::writeAllocationRecordUnsafe(const NativeAllocationRecord& record)
 {
-    if (!maybeWriteContextSwitchRecordUnsafe(tid)) {
-        return false;
-    }
-
-    d_stats.n_allocations += 1;
     RecordTypeAndFlags token{
             RecordType::ALLOCATION_WITH_NATIVE,
             static_cast<unsigned char>(record.allocator)};
@@ -341,7 +760,7 @@ StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const NativeAl
 bool
 StreamingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record)
 {
-    if (!maybeWriteContextSwitchRecordUnsafe(tid)) {
+    if (!flushTransientAllocations() || !maybeWriteContextSwitchRecordUnsafe(tid)) {
         return false;
     }
 
@@ -386,7 +805,7 @@ StreamingRecordWriter::writeTrailer()
     // The FileSource will ignore trailing 0x00 bytes. This non-zero trailer
     // marks the boundary between bytes we wrote and padding bytes.
     RecordTypeAndFlags token{RecordType::OTHER, int(OtherRecordType::TRAILER)};
-    return writeSimpleType(token);
+    return flushTransientAllocations() && writeSimpleType(token);
 }
 
 std::unique_ptr<RecordWriter>
@@ -407,8 +826,13 @@ AggregatingRecordWriter::AggregatingRecordWriter(
         std::unique_ptr<memray::io::Sink> sink,
         const std::string& command_line,
         bool native_traces,
-        bool trace_python_allocators)
+        bool trace_python_allocators,
+        size_t temporary_allocation_threshold,
+        size_t memory_budget)
 : RecordWriter(std::move(sink))
+, d_temporary_allocations_counter(temporary_allocation_threshold)
+, d_memory_budget(memory_budget)
+, d_next_compaction_at(memory_budget)
 {
     memcpy(d_header.magic, MAGIC, sizeof(d_header.magic));
     d_header.version = CURRENT_HEADER_VERSION;
@@ -441,6 +865,12 @@ AggregatingRecordWriter::writeHeader(bool seek_to_start)
 
 bool
 AggregatingRecordWriter::writeTrailer()
+{
+    return writeCapture(false);
+}
+
+bool
+AggregatingRecordWriter::writeCapture(bool point_in_time)
 {
     d_stats.end_time = duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count();
     d_header.stats = d_stats;
@@ -448,9 +878,13 @@ AggregatingRecordWriter::writeTrailer()
         return false;
     }
 
-    for (const auto& memory_snapshot : d_memory_snapshots) {
-        if (!writeSimpleType(AggregatedRecordType::MEMORY_SNAPSHOT) || !writeSimpleType(memory_snapshot))
-        {
+    // A point in time capture only describes the latest memory snapshot.
+    auto first_memory_snapshot = d_memory_snapshots.begin();
+    if (point_in_time && !d_memory_snapshots.empty()) {
+        first_memory_snapshot = std::prev(d_memory_snapshots.end());
+    }
+    for (auto it = first_memory_snapshot; it != d_memory_snapshots.end(); ++it) {
+        if (!writeSimpleType(AggregatedRecordType::MEMORY_SNAPSHOT) || !writeSimpleType(*it)) {
             return false;
         }
     }
@@ -503,7 +937,14 @@ AggregatingRecordWriter::writeTrailer()
         }
     }
 
-    d_high_water_mark_aggregator.visitAllocations([&](const AggregatedAllocation& allocation) {
+    d_high_water_mark_aggregator.visitAllocations([&](AggregatedAllocation allocation) {
+        if (point_in_time) {
+            // Only the allocations that are alive right now are described,
+            // and they are also reported as the high water mark, so that
+            // every reporter shows them.
+            allocation.n_allocations_in_high_water_mark = allocation.n_allocations_leaked;
+            allocation.bytes_in_high_water_mark = allocation.bytes_leaked;
+        }
         if (allocation.n_allocations_in_high_water_mark == 0 && allocation.n_allocations_leaked == 0) {
             return true;
         }
@@ -512,6 +953,14 @@ AggregatingRecordWriter::writeTrailer()
                && writeSimpleType(allocation);
     });
 
+    if (!point_in_time && !writeAllocationHistory()) {
+        return false;
+    }
+
+    if (!writeAllocationStats()) {
+        return false;
+    }
+
     // The FileSource will ignore trailing 0x00 bytes. This non-zero trailer
     // marks the boundary between bytes we wrote and padding bytes.
     if (!writeSimpleType(AggregatedRecordType::AGGREGATED_TRAILER)) {
@@ -521,6 +970,61 @@ AggregatingRecordWriter::writeTrailer()
     return true;
 }
 
+bool
+AggregatingRecordWriter::writeAllocationHistory()
+{
+    // Describe how each location contributed to the high water mark of every
+    // memory snapshot, so that temporal reports can be generated. Runs of
+    // snapshots with the same contribution are written as a single interval.
+    for (size_t bytes : d_high_water_mark_aggregator.highWaterMarkBytesBySnapshot()) {
+        if (!writeSimpleType(AggregatedRecordType::SNAPSHOT_HIGH_WATER_MARK) || !writeSimpleType(bytes))
+        {
+            return false;
+        }
+    }
+
+    for (const auto& lifetime : d_high_water_mark_aggregator.generateIndex()) {
+        if (lifetime.n_allocations == 0 && lifetime.n_bytes == 0) {
+            continue;
+        }
+        AggregatedAllocationInterval interval{
+                lifetime.key.thread_id,
+                lifetime.key.allocator,
+                lifetime.key.native_frame_id,
+                lifetime.key.python_frame_id,
+                lifetime.key.native_segment_generation,
+                lifetime.allocatedBeforeSnapshot,
+                lifetime.deallocatedBeforeSnapshot,
+                lifetime.n_allocations,
+                lifetime.n_bytes};
+        if (!writeSimpleType(AggregatedRecordType::AGGREGATED_ALLOCATION_INTERVAL)
+            || !writeSimpleType(interval))
+        {
+            return false;
+        }
+    }
+    return true;
+}
+
+bool
+AggregatingRecordWriter::writeAllocationStats()
+{
+    // Statistics about every allocation, and the temporary allocations found
+    // with every threshold up to the configured one. Unlike the rest of the
+    // capture, these aren't limited to the allocations alive at some point.
+    if (!writeSimpleType(AggregatedRecordType::TEMPORARY_ALLOCATION_THRESHOLD)
+        || !writeSimpleType(d_temporary_allocations_counter.maxDistance()))
+    {
+        return false;
+    }
+
+    return d_allocation_stats_aggregator.visitStatsEntries([&](const AllocationStatsEntry& entry) {
+        return writeSimpleType(AggregatedRecordType::ALLOCATION_STATS) && writeSimpleType(entry);
+    }) && d_temporary_allocations_counter.visitTemporaryAllocations([&](const auto& record) {
+        return writeSimpleType(AggregatedRecordType::TEMPORARY_ALLOCATIONS) && writeSimpleType(record);
+    });
+}
+
 std::unique_ptr<RecordWriter>
 AggregatingRecordWriter::cloneInChildProcess()
 {
@@ -532,7 +1036,25 @@ AggregatingRecordWriter::cloneInChildProcess()
             std::move(new_sink),
             d_header.command_line,
             d_header.native_traces,
-            d_header.trace_python_allocators);
+            d_header.trace_python_allocators,
+            d_temporary_allocations_counter.maxDistance(),
+            d_memory_budget);
+}
+
+std::string
+AggregatingRecordWriter::dumpCapture()
+{
+    // Write a capture of the allocations that are alive right now to another
+    // sink, then go back to aggregating for the capture in progress.
+    std::string capture;
+    std::unique_ptr<io::Sink> sink = std::make_unique<io::MemorySink>(capture);
+    std::swap(d_sink, sink);
+    bool written = writeCapture(true);
+    std::swap(d_sink, sink);
+    if (!written) {
+        throw exception::IoError{"Failed to write the capture"};
+    }
+    return capture;
 }
 
 bool
@@ -543,6 +1065,13 @@ AggregatingRecordWriter::writeRecord(const MemoryRecord& record)
             record.rss,
             d_high_water_mark_aggregator.getCurrentHeapSize()};
     d_memory_snapshots.push_back(snapshot);
+    d_high_water_mark_aggregator.captureSnapshot();
+    if (d_memory_snapshots.size() > MAX_MEMORY_SNAPSHOTS) {
+        compactHistory();
+    }
+    if (d_memory_budget != 0 && memoryUsage() > d_next_compaction_at) {
+        enforceMemoryBudget();
+    }
     return true;
 }
 
@@ -551,9 +1080,13 @@ AggregatingRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
 {
     d_stats.n_frames += 1;
     const auto& [frame_id, raw] = item;
-    d_frames_by_id.emplace(
+    auto [it, inserted] = d_frames_by_id.emplace(
             frame_id,
             Frame{raw.function_name, raw.filename, raw.lineno, raw.is_entry_frame});
+    if (inserted) {
+        d_frames_and_mappings_bytes += sizeof(pyframe_map_t::value_type) + 2 * sizeof(void*)
+                                       + it->second.function_name.size() + it->second.filename.size();
+    }
     return true;
 }
 
@@ -568,6 +1101,10 @@ bool
 AggregatingRecordWriter::writeMappings(const std::vector<ImageSegments>& mappings)
 {
     d_mappings_by_generation.push_back(mappings);
+    for (const auto& mapping : mappings) {
+        d_frames_and_mappings_bytes += sizeof(ImageSegments) + mapping.filename.size()
+                                       + mapping.segments.size() * sizeof(Segment);
+    }
     return true;
 }
 
@@ -616,7 +1153,7 @@ AggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const Alloca
     }
     allocation.native_segment_generation = 0;
     allocation.n_allocations = 1;
-    d_high_water_mark_aggregator.addAllocation(allocation);
+    addAllocation(allocation);
     return true;
 }
 
@@ -633,7 +1170,7 @@ AggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const Native
     allocation.frame_index = stack.empty() ? 0 : stack.back();
     allocation.native_segment_generation = d_mappings_by_generation.size();
     allocation.n_allocations = 1;
-    d_high_water_mark_aggregator.addAllocation(allocation);
+    addAllocation(allocation);
     return true;
 }
 
@@ -644,4 +1181,917 @@ AggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const Thread
     return true;
 }
 
+void
+AggregatingRecordWriter::addAllocation(const Allocation& allocation)
+{
+    d_high_water_mark_aggregator.addAllocation(allocation);
+    d_temporary_allocations_counter.addAllocation(allocation);
+
+    std::optional<frame_id_t> python_frame_id;
+    if (allocation.frame_index != 0) {
+        python_frame_id = d_python_frame_tree.nextNode(allocation.frame_index).first;
+    }
+    d_allocation_stats_aggregator.countAllocation(allocation, python_frame_id);
+}
+
+size_t
+AggregatingRecordWriter::memoryUsage() const
+{
+    size_t usage =
+            d_high_water_mark_aggregator.memoryUsage() + d_allocation_stats_aggregator.memoryUsage()
+            + d_temporary_allocations_counter.memoryUsage() + d_python_frame_tree.memoryUsage()
+            + d_memory_snapshots.capacity() * sizeof(MemorySnapshot)
+            + d_native_frames.capacity() * sizeof(UnresolvedNativeFrame) + d_frames_and_mappings_bytes;
+    for (const auto& [tid, thread_name] : d_thread_name_by_tid) {
+        usage += sizeof(std::pair<const thread_id_t, std::string>) + 2 * sizeof(void*)
+                 + thread_name.size();
+    }
+    for (const auto& [tid, stack] : d_python_stack_ids_by_thread) {
+        usage += stack.capacity() * sizeof(FrameTree::index_t);
+    }
+    return usage;
+}
+
+void
+AggregatingRecordWriter::compactHistory()
+{
+    // Halve the resolution of the high water mark history. Each memory
+    // snapshot that's kept is the one taken at the end of the pair of
+    // snapshots it replaces.
+    d_high_water_mark_aggregator.compactSnapshots();
+
+    std::vector<MemorySnapshot> memory_snapshots;
+    memory_snapshots.reserve(d_high_water_mark_aggregator.numSnapshots());
+    for (size_t i = 1; i < d_memory_snapshots.size(); i += 2) {
+        memory_snapshots.push_back(d_memory_snapshots[i]);
+    }
+    if (d_memory_snapshots.size() % 2 == 1) {
+        memory_snapshots.push_back(d_memory_snapshots.back());
+    }
+    d_memory_snapshots = std::move(memory_snapshots);
+    assert(d_memory_snapshots.size() == d_high_water_mark_aggregator.numSnapshots());
+}
+
+void
+AggregatingRecordWriter::enforceMemoryBudget()
+{
+    size_t usage_before = memoryUsage();
+    compactHistory();
+
+    size_t usage_after = memoryUsage();
+    if (usage_after <= d_memory_budget) {
+        d_next_compaction_at = d_memory_budget;
+        return;
+    }
+
+    // The allocations that are alive right now take most of the budget, so
+    // compacting again won't help until the history grows back.
+    d_next_compaction_at = usage_before;
+    if (!d_over_budget_warning_shown) {
+        LOG(WARNING) << "Memray's aggregated allocations use " << usage_after
+                     << " bytes, more than the memory budget of " << d_memory_budget << " bytes";
+        d_over_budget_warning_shown = true;
+    }
+}
+
+LiveAggregatingRecordWriter::LiveAggregatingRecordWriter(
+        std::unique_ptr<memray::io::Sink> sink,
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators)
+: RecordWriter(std::move(sink))
+{
+    memcpy(d_header.magic, MAGIC, sizeof(d_header.magic));
+    d_header.version = CURRENT_HEADER_VERSION;
+    d_header.native_traces = native_traces;
+    d_header.file_format = FileFormat::AGGREGATED_ALLOCATIONS;
+    d_header.command_line = command_line;
+    d_header.pid = ::getpid();
+    d_header.python_allocator = getPythonAllocator();
+    d_header.trace_python_allocators = trace_python_allocators;
+
+    d_stats.start_time = duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count();
+    d_last_written_trace_index = d_python_frame_tree.minIndex() - 1;
+}
+
+void
+LiveAggregatingRecordWriter::setMainTidAndSkippedFrames(
+        thread_id_t main_tid,
+        size_t skipped_frames_on_main_tid)
+{
+    d_header.main_tid = main_tid;
+    d_header.skipped_frames_on_main_tid = skipped_frames_on_main_tid;
+}
+
+bool
+LiveAggregatingRecordWriter::writeHeader(bool seek_to_start)
+{
+    if (seek_to_start) {
+        // If we can't seek to the beginning to the stream (e.g. dealing with a socket), just give
+        // up.
+        if (!d_sink->seek(0, SEEK_SET)) {
+            return false;
+        }
+    }
+
+    d_stats.end_time = duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count();
+    d_header.stats = d_stats;
+    return writeHeaderCommon(d_header);
+}
+
+bool
+LiveAggregatingRecordWriter::writeTrailer()
+{
+    // The FileSource will ignore trailing 0x00 bytes. This non-zero trailer
+    // marks the boundary between bytes we wrote and padding bytes.
+    return writeChangedLocations() && writeSimpleType(AggregatedRecordType::AGGREGATED_TRAILER)
+           && d_sink->flush();
+}
+
+std::unique_ptr<RecordWriter>
+LiveAggregatingRecordWriter::cloneInChildProcess()
+{
+    std::unique_ptr<io::Sink> new_sink = d_sink->cloneInChildProcess();
+    if (!new_sink) {
+        return {};
+    }
+    return std::make_unique<LiveAggregatingRecordWriter>(
+            std::move(new_sink),
+            d_header.command_line,
+            d_header.native_traces,
+            d_header.trace_python_allocators);
+}
+
+bool
+LiveAggregatingRecordWriter::writeChangedLocations()
+{
+    // Stacks must be known by the reader before any allocation refers to them.
+    for (FrameTree::index_t index = d_last_written_trace_index + 1;
+         index <= d_python_frame_tree.maxIndex();
+         ++index)
+    {
+        auto [frame_id, parent_index] = d_python_frame_tree.nextNode(index);
+        if (!writeSimpleType(AggregatedRecordType::PYTHON_TRACE_INDEX) || !writeSimpleType(frame_id)
+            || !writeSimpleType(parent_index))
+        {
+            return false;
+        }
+        d_last_written_trace_index = index;
+    }
+
+    api::SnapshotDelta delta = d_aggregator.getSnapshotDelta(d_last_written_version);
+    d_last_written_version = delta.version;
+    for (const auto& [location_id, location] : delta.changed_locations) {
+        AggregatedAllocation record{
+                location.tid,
+                location.allocator,
+                location.native_frame_id,
+                location.frame_index,
+                location.native_segment_generation,
+                0,
+                location.n_allocations,
+                0,
+                location.size};
+        if (!writeSimpleType(AggregatedRecordType::AGGREGATED_ALLOCATION) || !writeSimpleType(record)) {
+            return false;
+        }
+    }
+    return true;
+}
+
+bool
+LiveAggregatingRecordWriter::writeRecord(const MemoryRecord& record)
+{
+    MemorySnapshot snapshot{record.ms_since_epoch, record.rss, d_aggregator.getHeapSize()};
+    return writeChangedLocations() && writeSimpleType(AggregatedRecordType::MEMORY_SNAPSHOT)
+           && writeSimpleType(snapshot) && d_sink->flush();
+}
+
+bool
+LiveAggregatingRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
+{
+    d_stats.n_frames += 1;
+    const auto& [frame_id, raw] = item;
+    return writeSimpleType(AggregatedRecordType::PYTHON_FRAME_INDEX) && writeSimpleType(frame_id)
+           && writeString(raw.function_name) && writeString(raw.filename) && writeSimpleType(raw.lineno)
+           && writeSimpleType(raw.is_entry_frame);
+}
+
+bool
+LiveAggregatingRecordWriter::writeRecord(const UnresolvedNativeFrame& record)
+{
+    return writeSimpleType(AggregatedRecordType::NATIVE_TRACE_INDEX)
+           && writeIntegralDelta(&d_last_native_frame.ip, record.ip)
+           && writeIntegralDelta(&d_last_native_frame.index, record.index);
+}
+
+bool
+LiveAggregatingRecordWriter::writeMappings(const std::vector<ImageSegments>& mappings)
+{
+    d_mappings_generation += 1;
+    return writeMappingsCommon(mappings);
+}
+
+bool
+LiveAggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePop& record)
+{
+    auto count = record.count;
+    auto& stack = d_python_stack_ids_by_thread[tid];
+    assert(stack.size() >= record.count);
+    while (count) {
+        count -= 1;
+        stack.pop_back();
+    }
+    return true;
+}
+
+bool
+LiveAggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePush& record)
+{
+    auto [it, inserted] = d_python_stack_ids_by_thread.emplace(tid, python_stack_ids_t{});
+    auto& stack = it->second;
+    if (inserted) {
+        stack.reserve(1024);
+    }
+    FrameTree::index_t current_stack_id = stack.empty() ? 0 : stack.back();
+    FrameTree::index_t new_stack_id =
+            d_python_frame_tree.getTraceIndex(current_stack_id, record.frame_id);
+    stack.push_back(new_stack_id);
+    return true;
+}
+
+bool
+LiveAggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const AllocationRecord& record)
+{
+    d_stats.n_allocations += 1;
+    Allocation allocation;
+    allocation.tid = tid;
+    allocation.address = record.address;
+    allocation.size = record.size;
+    allocation.allocator = record.allocator;
+    allocation.native_frame_id = 0;
+    if (!hooks::isDeallocator(record.allocator)) {
+        auto& stack = d_python_stack_ids_by_thread[tid];
+        allocation.frame_index = stack.empty() ? 0 : stack.back();
+    } else {
+        allocation.frame_index = 0;
+    }
+    allocation.native_segment_generation = 0;
+    allocation.n_allocations = 1;
+    d_aggregator.addAllocation(allocation);
+    return true;
+}
+
+bool
+LiveAggregatingRecordWriter::writeThreadSpecificRecord(
+        thread_id_t tid,
+        const NativeAllocationRecord& record)
+{
+    d_stats.n_allocations += 1;
+    Allocation allocation;
+    allocation.tid = tid;
+    allocation.address = record.address;
+    allocation.size = record.size;
+    allocation.allocator = record.allocator;
+    allocation.native_frame_id = record.native_frame_id;
+    auto& stack = d_python_stack_ids_by_thread[tid];
+    allocation.frame_index = stack.empty() ? 0 : stack.back();
+    allocation.native_segment_generation = d_mappings_generation;
+    allocation.n_allocations = 1;
+    d_aggregator.addAllocation(allocation);
+    return true;
+}
+
+bool
+LiveAggregatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record)
+{
+    return writeSimpleType(AggregatedRecordType::CONTEXT_SWITCH) && writeSimpleType(ContextSwitch{tid})
+           && writeSimpleType(AggregatedRecordType::THREAD_RECORD) && writeString(record.name);
+}
+
+std::unique_ptr<RecordWriter>
+createRingBufferRecordWriter(
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds)
+{
+    return std::make_unique<RingBufferRecordWriter>(
+            command_line,
+            native_traces,
+            trace_python_allocators,
+            max_bytes,
+            max_seconds);
+}
+
+RingBufferRecordWriter::RingBufferRecordWriter(
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds)
+: RecordWriter(std::make_unique<io::NullSink>())
+, d_max_records(std::max<size_t>(1, max_bytes / sizeof(BufferedRecord)))
+, d_max_ms(static_cast<millis_t>(max_seconds) * 1000)
+{
+    memcpy(d_header.magic, MAGIC, sizeof(d_header.magic));
+    d_header.version = CURRENT_HEADER_VERSION;
+    d_header.native_traces = native_traces;
+    d_header.file_format = FileFormat::ALL_ALLOCATIONS;
+    d_header.command_line = command_line;
+    d_header.pid = ::getpid();
+    d_header.python_allocator = getPythonAllocator();
+    d_header.trace_python_allocators = trace_python_allocators;
+
+    d_header.stats.start_time =
+            duration_cast<milliseconds>(system_clock::now().time_since_epoch()).count();
+}
+
+void
+RingBufferRecordWriter::setMainTidAndSkippedFrames(
+        thread_id_t main_tid,
+        size_t skipped_frames_on_main_tid)
+{
+    d_header.main_tid = main_tid;
+    d_header.skipped_frames_on_main_tid = skipped_frames_on_main_tid;
+}
+
+bool
+RingBufferRecordWriter::writeHeader(bool seek_to_start)
+{
+    // Nothing to do; everything is written by dumpCapture.
+    (void)seek_to_start;
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeTrailer()
+{
+    // Nothing to do; everything is written by dumpCapture.
+    return true;
+}
+
+std::unique_ptr<RecordWriter>
+RingBufferRecordWriter::cloneInChildProcess()
+{
+    // The dumps are triggered from Python code that the child doesn't own.
+    return {};
+}
+
+void
+RingBufferRecordWriter::pushRecord(const BufferedRecord& record)
+{
+    d_window.push_back(record);
+    while (d_window.size() > d_max_records) {
+        evictOldestRecord();
+    }
+}
+
+void
+RingBufferRecordWriter::evictOldestRecord()
+{
+    const BufferedRecord& record = d_window.front();
+    if (record.type != BufferedRecord::Type::MEMORY) {
+        Allocation allocation{
+                record.tid,
+                record.address,
+                record.size,
+                record.allocator,
+                record.native_frame_id,
+                record.frame_index,
+                record.native_segment_generation,
+                1};
+        switch (hooks::allocatorKind(record.allocator)) {
+            case hooks::AllocatorKind::SIMPLE_ALLOCATOR:
+                d_baseline_allocations[record.address] = allocation;
+                break;
+            case hooks::AllocatorKind::SIMPLE_DEALLOCATOR:
+                d_baseline_allocations.erase(record.address);
+                break;
+            case hooks::AllocatorKind::RANGED_ALLOCATOR:
+                d_baseline_ranges.addInterval(record.address, record.size, allocation);
+                break;
+            case hooks::AllocatorKind::RANGED_DEALLOCATOR:
+                d_baseline_ranges.removeInterval(record.address, record.size);
+                break;
+        }
+    }
+    d_window.pop_front();
+}
+
+FrameTree::index_t
+RingBufferRecordWriter::currentStackId(thread_id_t tid)
+{
+    auto& stack = d_python_stack_ids_by_thread[tid];
+    return stack.empty() ? 0 : stack.back();
+}
+
+bool
+RingBufferRecordWriter::writeRecord(const MemoryRecord& record)
+{
+    pushRecord(
+            {BufferedRecord::Type::MEMORY,
+             hooks::Allocator::MALLOC,
+             0,
+             0,
+             0,
+             record.rss,
+             record.ms_since_epoch,
+             0});
+
+    if (d_max_ms) {
+        // Ages are only known at the granularity of memory records, so drop
+        // everything that came before the oldest one that is recent enough.
+        const millis_t cutoff = static_cast<millis_t>(record.ms_since_epoch) - d_max_ms;
+        while (d_window.front().type != BufferedRecord::Type::MEMORY
+               || static_cast<millis_t>(d_window.front().size) < cutoff)
+        {
+            evictOldestRecord();
+        }
+    }
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
+{
+    d_header.stats.n_frames += 1;
+    const auto& [frame_id, raw] = item;
+    d_frames_by_id.emplace(
+            frame_id,
+            Frame{raw.function_name, raw.filename, raw.lineno, raw.is_entry_frame});
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeRecord(const UnresolvedNativeFrame& record)
+{
+    d_native_frames.emplace_back(record);
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeMappings(const std::vector<ImageSegments>& mappings)
+{
+    d_mappings_by_generation.push_back(mappings);
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePop& record)
+{
+    auto count = record.count;
+    auto& stack = d_python_stack_ids_by_thread[tid];
+    assert(stack.size() >= record.count);
+    while (count) {
+        count -= 1;
+        stack.pop_back();
+    }
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePush& record)
+{
+    auto [it, inserted] = d_python_stack_ids_by_thread.emplace(tid, python_stack_ids_t{});
+    auto& stack = it->second;
+    if (inserted) {
+        stack.reserve(1024);
+    }
+    FrameTree::index_t current_stack_id = stack.empty() ? 0 : stack.back();
+    FrameTree::index_t new_stack_id =
+            d_python_frame_tree.getTraceIndex(current_stack_id, record.frame_id);
+    stack.push_back(new_stack_id);
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const AllocationRecord& record)
+{
+    pushRecord(
+            {BufferedRecord::Type::ALLOCATION,
+             record.allocator,
+             hooks::isDeallocator(record.allocator) ? 0 : currentStackId(tid),
+             0,
+             tid,
+             record.address,
+             record.size,
+             0});
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const NativeAllocationRecord& record)
+{
+    pushRecord(
+            {BufferedRecord::Type::NATIVE_ALLOCATION,
+             record.allocator,
+             currentStackId(tid),
+             static_cast<uint32_t>(d_mappings_by_generation.size()),
+             tid,
+             record.address,
+             record.size,
+             record.native_frame_id});
+    return true;
+}
+
+bool
+RingBufferRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record)
+{
+    d_thread_name_by_tid[tid] = record.name;
+    return true;
+}
+
+std::string
+RingBufferRecordWriter::dumpCapture()
+{
+    std::string capture;
+    StreamingRecordWriter writer(
+            std::make_unique<io::MemorySink>(capture),
+            d_header.command_line,
+            d_header.native_traces,
+            d_header.trace_python_allocators,
+            d_header.stats.start_time);
+    writer.setMainTidAndSkippedFrames(d_header.main_tid, d_header.skipped_frames_on_main_tid);
+
+    auto check = [&](bool written) {
+        if (!written) {
+            throw exception::IoError{"Failed to write the capture"};
+        }
+    };
+
+    check(writer.writeHeader(false));
+    for (const auto& [frame_id, frame] : d_frames_by_id) {
+        RawFrame raw{
+                frame.function_name.c_str(),
+                frame.filename.c_str(),
+                frame.lineno,
+                frame.is_entry_frame};
+        check(writer.writeRecord(pyrawframe_map_val_t{frame_id, raw}));
+    }
+    for (const auto& record : d_native_frames) {
+        check(writer.writeRecord(record));
+    }
+    for (const auto& [tid, thread_name] : d_thread_name_by_tid) {
+        check(writer.writeThreadSpecificRecord(tid, ThreadRecord{thread_name.c_str()}));
+    }
+
+    // Native allocations are attributed to the mappings that were written
+    // last, so each generation is written just before the first allocation
+    // that belongs to it.
+    size_t mappings_written = 0;
+    auto writeMappingsUpTo = [&](size_t generation) {
+        while (mappings_written < generation) {
+            check(writer.writeMappings(d_mappings_by_generation[mappings_written++]));
+        }
+    };
+
+    // The Python stacks are rebuilt from the frame tree, pushing and popping
+    // only the frames that differ from the last stack written for the thread.
+    python_stack_ids_by_tid written_stacks;
+    auto moveToStack = [&](thread_id_t tid, FrameTree::index_t stack_id) {
+        python_stack_ids_t target;
+        for (auto index = stack_id; index != 0; index = d_python_frame_tree.nextNode(index).second) {
+            target.push_back(index);
+        }
+        std::reverse(target.begin(), target.end());
+
+        auto& current = written_stacks[tid];
+        size_t common = 0;
+        while (common < current.size() && common < target.size() && current[common] == target[common]) {
+            ++common;
+        }
+        if (current.size() > common) {
+            check(writer.writeThreadSpecificRecord(tid, FramePop{current.size() - common}));
+        }
+        for (size_t i = common; i < target.size(); ++i) {
+            frame_id_t frame_id = d_python_frame_tree.nextNode(target[i]).first;
+            check(writer.writeThreadSpecificRecord(tid, FramePush{frame_id}));
+        }
+        current = std::move(target);
+    };
+
+    auto writeAllocation = [&](const Allocation& allocation, bool native) {
+        if (!hooks::isDeallocator(allocation.allocator)) {
+            moveToStack(allocation.tid, allocation.frame_index);
+        }
+        if (native) {
+            writeMappingsUpTo(allocation.native_segment_generation);
+            check(writer.writeThreadSpecificRecord(
+                    allocation.tid,
+                    NativeAllocationRecord{
+                            allocation.address,
+                            allocation.size,
+                            allocation.allocator,
+                            allocation.native_frame_id}));
+        } else {
+            check(writer.writeThreadSpecificRecord(
+                    allocation.tid,
+                    AllocationRecord{allocation.address, allocation.size, allocation.allocator}));
+        }
+    };
+
+    std::vector<Allocation> baseline;
+    baseline.reserve(d_baseline_allocations.size());
+    for (const auto& [address, allocation] : d_baseline_allocations) {
+        baseline.push_back(allocation);
+    }
+    for (const auto& [interval, allocation] : d_baseline_ranges) {
+        baseline.push_back(allocation);
+        baseline.back().address = interval.begin;
+        baseline.back().size = interval.size();
+    }
+    std::sort(baseline.begin(), baseline.end(), [](const auto& lhs, const auto& rhs) {
+        return std::tie(lhs.native_segment_generation, lhs.tid, lhs.frame_index)
+               < std::tie(rhs.native_segment_generation, rhs.tid, rhs.frame_index);
+    });
+    for (const auto& allocation : baseline) {
+        // The tracker writes the mappings before any allocation, so only
+        // native allocations have a generation.
+        writeAllocation(allocation, allocation.native_segment_generation != 0);
+    }
+
+    for (const auto& record : d_window) {
+        if (record.type == BufferedRecord::Type::MEMORY) {
+            check(writer.writeRecord(MemoryRecord{record.size, record.address}));
+            continue;
+        }
+        writeAllocation(
+                Allocation{
+                        record.tid,
+                        record.address,
+                        record.size,
+                        record.allocator,
+                        record.native_frame_id,
+                        record.frame_index,
+                        record.native_segment_generation,
+                        1},
+                record.type == BufferedRecord::Type::NATIVE_ALLOCATION);
+    }
+    writeMappingsUpTo(d_mappings_by_generation.size());
+
+    check(writer.writeTrailer());
+    check(writer.writeHeader(true));
+    return capture;
+}
+
+std::unique_ptr<RecordWriter>
+createRotatingRecordWriter(
+        const std::string& path,
+        bool overwrite,
+        bool compress,
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds,
+        unsigned int keep)
+{
+    return std::make_unique<RotatingRecordWriter>(
+            path,
+            overwrite,
+            compress,
+            command_line,
+            native_traces,
+            trace_python_allocators,
+            max_bytes,
+            max_seconds,
+            keep);
+}
+
+static std::string
+removePidSuffix(const std::string& path)
+{
+    // Children of a child process are named after the original path, just
+    // like the output files of a FileSink.
+    const std::string suffix = "." + std::to_string(::getpid());
+    if (path.size() > suffix.size()
+        && path.compare(path.size() - suffix.size(), std::string::npos, suffix) == 0)
+    {
+        return path.substr(0, path.size() - suffix.size());
+    }
+    return path;
+}
+
+RotatingRecordWriter::RotatingRecordWriter(
+        const std::string& path,
+        bool overwrite,
+        bool compress,
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds,
+        unsigned int keep)
+: StreamingRecordWriter(
+        std::make_unique<io::NullSink>(),
+        command_line,
+        native_traces,
+        trace_python_allocators)
+, d_path(path)
+, d_path_stem(removePidSuffix(path))
+, d_overwrite(overwrite)
+, d_compress(compress)
+, d_max_bytes(max_bytes)
+, d_max_ms(static_cast<millis_t>(max_seconds) * 1000)
+, d_keep(keep)
+{
+    d_sink = openSegment(d_segment);
+}
+
+RotatingRecordWriter::~RotatingRecordWriter()
+{
+    if (d_segment_closer.joinable()) {
+        d_segment_closer.join();
+    }
+}
+
+std::string
+RotatingRecordWriter::segmentPath(unsigned int segment) const
+{
+    return d_path + "." + std::to_string(segment);
+}
+
+std::unique_ptr<io::Sink>
+RotatingRecordWriter::openSegment(unsigned int segment)
+{
+    auto sink = std::make_unique<io::FileSink>(segmentPath(segment), d_overwrite, d_compress);
+    d_segment_sink = sink.get();
+    return sink;
+}
+
+bool
+RotatingRecordWriter::startNextSegment(millis_t now)
+{
+    if (!writeTrailer() || !writeHeader(true)) {
+        return false;
+    }
+
+    std::unique_ptr<io::Sink> finished_segment;
+    try {
+        finished_segment = std::exchange(d_sink, openSegment(d_segment + 1));
+    } catch (const exception::IoError& e) {
+        LOG(ERROR) << "Memray failed to start a new capture segment: " << e.what();
+        return false;
+    }
+    d_segment += 1;
+    std::string expired_segment_path;
+    if (d_keep && d_segment > d_keep) {
+        expired_segment_path = segmentPath(d_segment - d_keep);
+    }
+    closeSegment(std::move(finished_segment), std::move(expired_segment_path));
+
+    d_stats = TrackerStats{0, 0, now};
+    d_last = DeltaEncodedFields{};
+    if (!writeHeader(false)) {
+        return false;
+    }
+
+    for (const auto& [frame_id, frame] : d_frames_by_id) {
+        RawFrame raw{
+                frame.function_name.c_str(),
+                frame.filename.c_str(),
+                frame.lineno,
+                frame.is_entry_frame};
+        if (!StreamingRecordWriter::writeRecord(pyrawframe_map_val_t{frame_id, raw})) {
+            return false;
+        }
+    }
+    for (const auto& record : d_native_frames) {
+        if (!StreamingRecordWriter::writeRecord(record)) {
+            return false;
+        }
+    }
+    if (d_mappings_written && !StreamingRecordWriter::writeMappings(d_mappings)) {
+        return false;
+    }
+    for (const auto& [tid, thread_name] : d_thread_name_by_tid) {
+        if (!StreamingRecordWriter::writeThreadSpecificRecord(tid, ThreadRecord{thread_name.c_str()})) {
+            return false;
+        }
+    }
+    for (const auto& [tid, stack] : d_python_stack_by_tid) {
+        for (frame_id_t frame_id : stack) {
+            if (!StreamingRecordWriter::writeThreadSpecificRecord(tid, FramePush{frame_id})) {
+                return false;
+            }
+        }
+    }
+    return true;
+}
+
+void
+RotatingRecordWriter::closeSegment(std::unique_ptr<io::Sink> sink, std::string expired_segment_path)
+{
+    // We're called with the tracker's lock held, and destroying the sink
+    // compresses the finished segment if requested, which can take a while.
+    // Do it on a thread of its own instead. Segments are closed one at a
+    // time, so that they are removed in order when only some are kept.
+    if (d_segment_closer.joinable()) {
+        d_segment_closer.join();
+    }
+    d_segment_closer = std::thread(
+            [sink = std::move(sink), expired_segment_path = std::move(expired_segment_path)]() mutable {
+                // Don't track our own allocations, or take the tracker's lock.
+                tracking_api::RecursionGuard::isActive = true;
+                sink.reset();
+                if (!expired_segment_path.empty()) {
+                    ::unlink(expired_segment_path.c_str());
+                }
+            });
+}
+
+bool
+RotatingRecordWriter::writeRecord(const MemoryRecord& record)
+{
+    if (!StreamingRecordWriter::writeRecord(record)) {
+        return false;
+    }
+
+    // Memory records are written periodically, so this is where we check
+    // whether the current segment is done.
+    bool full = d_max_bytes && d_segment_sink->bytesWritten() >= d_max_bytes;
+    bool expired = d_max_ms && record.ms_since_epoch - d_stats.start_time >= d_max_ms;
+    if (full || expired) {
+        return startNextSegment(record.ms_since_epoch);
+    }
+    return true;
+}
+
+bool
+RotatingRecordWriter::writeRecord(const pyrawframe_map_val_t& item)
+{
+    const auto& [frame_id, raw] = item;
+    d_frames_by_id.emplace(
+            frame_id,
+            Frame{raw.function_name, raw.filename, raw.lineno, raw.is_entry_frame});
+    return StreamingRecordWriter::writeRecord(item);
+}
+
+bool
+RotatingRecordWriter::writeRecord(const UnresolvedNativeFrame& record)
+{
+    d_native_frames.emplace_back(record);
+    return StreamingRecordWriter::writeRecord(record);
+}
+
+bool
+RotatingRecordWriter::writeMappings(const std::vector<ImageSegments>& mappings)
+{
+    // Only the latest mappings are needed to resolve the native frames of
+    // the allocations in later segments.
+    d_mappings = mappings;
+    d_mappings_written = true;
+    return StreamingRecordWriter::writeMappings(mappings);
+}
+
+bool
+RotatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePop& record)
+{
+    auto& stack = d_python_stack_by_tid[tid];
+    assert(stack.size() >= record.count);
+    stack.resize(stack.size() - record.count);
+    return StreamingRecordWriter::writeThreadSpecificRecord(tid, record);
+}
+
+bool
+RotatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const FramePush& record)
+{
+    d_python_stack_by_tid[tid].push_back(record.frame_id);
+    return StreamingRecordWriter::writeThreadSpecificRecord(tid, record);
+}
+
+bool
+RotatingRecordWriter::writeThreadSpecificRecord(thread_id_t tid, const ThreadRecord& record)
+{
+    d_thread_name_by_tid[tid] = record.name;
+    return StreamingRecordWriter::writeThreadSpecificRecord(tid, record);
+}
+
+std::unique_ptr<RecordWriter>
+RotatingRecordWriter::cloneInChildProcess()
+{
+    return std::make_unique<RotatingRecordWriter>(
+            d_path_stem + "." + std::to_string(::getpid()),
+            true,
+            d_compress,
+            d_header.command_line,
+            d_header.native_traces,
+            d_header.trace_python_allocators,
+            d_max_bytes,
+            static_cast<unsigned int>(d_max_ms / 1000),
+            d_keep);
+}
+
+void
+writeCaptureToFile(const std::string& capture, const std::string& path, bool overwrite)
+{
+    // The file is compressed when the sink is destroyed.
+    io::FileSink sink(path, overwrite, true);
+    if (!sink.writeAll(capture.data(), capture.size())) {
+        throw exception::IoError{"Failed to write to " + path};
+    }
+}
+
 }  // namespace memray::tracking_api
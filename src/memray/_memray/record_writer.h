@@ -1,6 +1,7 @@
 #pragma once
 
 #include <limits>
+#include <optional>
 #include <string>
 #include <type_traits>
 #include <unistd.h>
@@ -37,6 +38,17 @@ class RecordWriter
     virtual void setMainTidAndSkippedFrames(thread_id_t main_tid, size_t skipped_frames_on_main_tid) = 0;
     virtual std::unique_ptr<RecordWriter> cloneInChildProcess() = 0;
 
+    // Return the contents of a new capture file holding what this writer
+    // keeps in memory, without disturbing the capture in progress. Writers
+    // that write each record out as it comes, and so keep nothing to dump,
+    // throw. This is fast enough to be called with the tracker's lock held,
+    // unlike writing the capture to a file with writeCaptureToFile().
+    virtual std::string dumpCapture();
+
+    // Return the allocation filter sent by the reader that the records are
+    // written to, once it has arrived. This never blocks.
+    std::optional<AllocationFilter> receiveAllocationFilter();
+
   protected:
     // Expose the sink for use by the following helper functions.
     explicit RecordWriter(std::unique_ptr<memray::io::Sink> sink);
@@ -57,13 +69,51 @@ class RecordWriter
     bool inline writeIntegralDelta(T* prev, T new_val);
 };
 
+// `temporary_allocation_threshold` is the largest threshold that temporary
+// allocations can be found with in an AGGREGATED_ALLOCATIONS capture, and
+// `memory_budget` is how many bytes the aggregation may use before the high
+// water mark history is compacted, or 0 for no limit.
 std::unique_ptr<RecordWriter>
 createRecordWriter(
         std::unique_ptr<memray::io::Sink> sink,
         const std::string& command_line,
         bool native_traces,
         FileFormat file_format,
-        bool trace_python_allocators);
+        bool trace_python_allocators,
+        bool streaming = false,
+        size_t temporary_allocation_threshold = 1,
+        size_t memory_budget = 0);
+
+// Create a writer that keeps the most recent records in memory, and folds the
+// older ones into the set of allocations they leave alive, until dumpCapture()
+// is called. `max_seconds` may be 0 to keep records regardless of their age.
+std::unique_ptr<RecordWriter>
+createRingBufferRecordWriter(
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds);
+
+// Create a writer that splits an ALL_ALLOCATIONS capture into segments named
+// `path.1`, `path.2`, and so on, starting a new one once the current one holds
+// `max_bytes` bytes or is `max_seconds` old. Either limit may be 0 to disable
+// it. If `keep` isn't 0, only the `keep` most recent segments are kept.
+std::unique_ptr<RecordWriter>
+createRotatingRecordWriter(
+        const std::string& path,
+        bool overwrite,
+        bool compress,
+        const std::string& command_line,
+        bool native_traces,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds,
+        unsigned int keep);
+
+// Write and compress a capture returned by RecordWriter::dumpCapture().
+void
+writeCaptureToFile(const std::string& capture, const std::string& path, bool overwrite);
 
 template<typename T>
 bool inline RecordWriter::writeSimpleType(const T& item)
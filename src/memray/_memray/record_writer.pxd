@@ -14,4 +14,25 @@ cdef extern from "record_writer.h" namespace "memray::api":
         bool native_trace,
         FileFormat file_format,
         bool trace_python_allocators,
+        bool streaming,
+        size_t temporary_allocation_threshold,
+        size_t memory_budget,
+    ) except+
+    cdef unique_ptr[RecordWriter] createRingBufferRecordWriter(
+        string command_line,
+        bool native_trace,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds,
+    ) except+
+    cdef unique_ptr[RecordWriter] createRotatingRecordWriter(
+        string path,
+        bool overwrite,
+        bool compress,
+        string command_line,
+        bool native_trace,
+        bool trace_python_allocators,
+        size_t max_bytes,
+        unsigned int max_seconds,
+        unsigned int keep,
     ) except+
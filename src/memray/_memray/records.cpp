@@ -85,6 +85,21 @@ AggregatedAllocation::contributionToLeaks() const
     };
 }
 
+Allocation
+AggregatedTemporaryAllocations::toAllocation() const
+{
+    return {
+            tid,
+            0,
+            n_bytes,
+            allocator,
+            native_frame_id,
+            frame_index,
+            native_segment_generation,
+            n_allocations,
+    };
+}
+
 PyObject*
 Frame::toPythonObject(python_helpers::PyUnicode_Cache& pystring_cache) const
 {
@@ -18,7 +18,7 @@
 namespace memray::tracking_api {
 
 extern const char MAGIC[7];  // Value assigned in records.cpp
-const int CURRENT_HEADER_VERSION = 11;
+const int CURRENT_HEADER_VERSION = 12;
 
 using frame_id_t = size_t;
 using thread_id_t = unsigned long;
@@ -38,6 +38,8 @@ enum class RecordType : unsigned char {
     THREAD_RECORD = 10,
     MEMORY_RECORD = 11,
     CONTEXT_SWITCH = 12,
+    TRANSIENT_ALLOCATIONS = 13,
+    TRANSIENT_ALLOCATIONS_WITH_NATIVE = 14,
 };
 
 enum class OtherRecordType : unsigned char {
@@ -57,10 +59,15 @@ enum class AggregatedRecordType : unsigned char {
     MEMORY_MAP_START = 6,
     SEGMENT_HEADER = 7,
     SEGMENT = 8,
+    AGGREGATED_ALLOCATION_INTERVAL = 9,
     THREAD_RECORD = 10,
+    SNAPSHOT_HIGH_WATER_MARK = 11,
     CONTEXT_SWITCH = 12,
+    ALLOCATION_STATS = 13,
+    TEMPORARY_ALLOCATIONS = 14,
 
     AGGREGATED_TRAILER = 15,
+    TEMPORARY_ALLOCATION_THRESHOLD = 16,
 };
 
 struct RecordTypeAndFlags
@@ -149,6 +156,19 @@ struct NativeAllocationRecord
     frame_id_t native_frame_id{0};
 };
 
+// Stands for `count` pairs of records in a row, each pair being an allocation
+// and its deallocation, all made by the same thread at the same location and
+// with the same address and size. Tight loops make lots of these.
+struct TransientAllocationsRecord
+{
+    uintptr_t address;
+    size_t size;
+    hooks::Allocator allocator;
+    hooks::Allocator deallocator;
+    frame_id_t native_frame_id{0};
+    size_t count;
+};
+
 struct Allocation
 {
     thread_id_t tid;
@@ -180,6 +200,63 @@ struct AggregatedAllocation
     Allocation contributionToLeaks() const;
 };
 
+// A run of memory snapshots during which a location contributed the same
+// amount to the heap at each snapshot's high water mark. Together, these
+// describe how the high water mark evolved over time in an
+// AGGREGATED_ALLOCATIONS capture. `deallocated_before_snapshot` is SIZE_MAX
+// if the run lasted until tracking stopped.
+struct AggregatedAllocationInterval
+{
+    thread_id_t tid;
+    hooks::Allocator allocator;
+    frame_id_t native_frame_id;
+    size_t frame_index;
+    size_t native_segment_generation;
+
+    size_t allocated_before_snapshot;
+    size_t deallocated_before_snapshot;
+    size_t n_allocations;
+    size_t n_bytes;
+};
+
+// Totals for every allocation made while tracking, which are written to
+// AGGREGATED_ALLOCATIONS captures so that statistics can be computed from
+// them. Depending on `kind`, `key` is an allocation size, an allocator, or the
+// id of the Python frame that made the allocations. `n_bytes` is always 0 for
+// BY_ALLOCATOR entries.
+struct AllocationStatsEntry
+{
+    enum class Kind : unsigned char {
+        BY_SIZE = 1,
+        BY_ALLOCATOR = 2,
+        BY_PYTHON_FRAME = 3,
+        WITHOUT_PYTHON_FRAME = 4,
+    };
+
+    Kind kind;
+    size_t key;
+    size_t n_allocations;
+    size_t n_bytes;
+};
+
+// Allocations from one location that were deallocated after their thread had
+// made `distance` other allocations, in an AGGREGATED_ALLOCATIONS capture.
+// They're temporary allocations for any threshold of at least `distance`.
+struct AggregatedTemporaryAllocations
+{
+    thread_id_t tid;
+    hooks::Allocator allocator;
+    frame_id_t native_frame_id;
+    size_t frame_index;
+    size_t native_segment_generation;
+
+    size_t distance;
+    size_t n_allocations;
+    size_t n_bytes;
+
+    Allocation toAllocation() const;
+};
+
 struct MemoryMapStart
 {
 };
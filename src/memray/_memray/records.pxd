@@ -63,6 +63,34 @@ cdef extern from "records.h" namespace "memray::tracking_api":
        Allocation contributionToHighWaterMark()
        Allocation contributionToLeaks()
 
+   cdef cppclass AggregatedAllocationInterval:
+       thread_id_t tid
+       Allocator allocator
+       frame_id_t native_frame_id
+       size_t frame_index
+       size_t native_segment_generation
+
+       size_t allocated_before_snapshot
+       size_t deallocated_before_snapshot
+       size_t n_allocations
+       size_t n_bytes
+
+   cdef cppclass AllocationStatsEntry:
+       pass
+
+   cdef cppclass AggregatedTemporaryAllocations:
+       thread_id_t tid
+       Allocator allocator
+       frame_id_t native_frame_id
+       size_t frame_index
+       size_t native_segment_generation
+
+       size_t distance
+       size_t n_allocations
+       size_t n_bytes
+
+       Allocation toAllocation()
+
    struct MemoryRecord:
        unsigned long int ms_since_epoch
        size_t rss
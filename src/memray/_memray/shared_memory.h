@@ -0,0 +1,50 @@
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+
+namespace memray::io {
+
+// Layout of the control block at the start of a shared memory segment used
+// to transfer records between a SharedMemorySink and a SharedMemorySource.
+// The ring's data immediately follows this header in the segment.
+//
+// The ring has exactly one producer and one consumer, so it needs no locks:
+// each offset is only ever advanced by one side, and is only read by the
+// other. Offsets count the total number of bytes that have gone through the
+// ring and are never wrapped, so the ring is empty when both offsets are
+// equal and full when they are `capacity` bytes apart.
+//
+// The producer holds an exclusive flock() on the segment for as long as it's
+// open, so that the consumer can tell when it died without closing the ring.
+struct SharedMemoryRingHeader
+{
+    // Written last by the producer, once the rest of the header is valid.
+    std::atomic<uint64_t> magic;
+    uint64_t capacity;  // Always a power of two.
+
+    // Each offset lives in its own cache line so that the producer and the
+    // consumer don't keep invalidating each other's caches.
+    alignas(64) std::atomic<uint64_t> write_offset;
+    alignas(64) std::atomic<uint64_t> read_offset;
+
+    alignas(64) std::atomic<bool> reader_attached;
+    std::atomic<bool> reader_closed;
+    std::atomic<bool> writer_closed;
+};
+
+static_assert(
+        std::atomic<uint64_t>::is_always_lock_free && std::atomic<bool>::is_always_lock_free,
+        "Shared memory rings need address free atomics");
+
+constexpr uint64_t SHARED_MEMORY_RING_MAGIC = 0x4d454d5241595247;  // "MEMRAYRG"
+
+inline size_t
+sharedMemoryRingDataOffset()
+{
+    // Keep the start of the data aligned to a cache line as well.
+    return (sizeof(SharedMemoryRingHeader) + 63) & ~size_t{63};
+}
+
+}  // namespace memray::io
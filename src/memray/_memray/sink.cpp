@@ -1,17 +1,25 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 
+#include <algorithm>
 #include <cerrno>
+#include <chrono>
 #include <cstdio>
+#include <new>
+#include <thread>
 
 #include <arpa/inet.h>
 #include <fcntl.h>
+#include <sys/file.h>
 #include <sys/mman.h>
 #include <sys/socket.h>
+#include <sys/stat.h>
 #include <sys/types.h>
 #include <unistd.h>
 #include <utility>
 
+#include <lz4.h>
+
 #include "exceptions.h"
 #include "lz4_stream.h"
 #include "sink.h"
@@ -55,6 +63,16 @@ removeSuffix(const std::string& s, const std::string& suffix)
     return s.substr(0, s.size() - suffix.size());
 }
 
+size_t
+roundUpToPowerOfTwo(size_t value)
+{
+    size_t ret = 1;
+    while (ret < value) {
+        ret <<= 1;
+    }
+    return ret;
+}
+
 }  // unnamed namespace
 
 bool
@@ -181,6 +199,12 @@ FileSink::bytesBeyondBufferNeedle()
     return bytesBeyondBuffer - positionWithinBuffer;
 }
 
+size_t
+FileSink::bytesWritten() const
+{
+    return d_bufferOffset + (d_bufferNeedle - d_buffer);
+}
+
 std::unique_ptr<Sink>
 FileSink::cloneInChildProcess()
 {
@@ -240,19 +264,25 @@ FileSink::~FileSink()
     }
 }
 
-SocketSink::SocketSink(std::string host, uint16_t port)
+SocketSink::SocketSink(std::string host, uint16_t port, bool compress)
 : d_host(std::move(host))
 , d_port(port)
-, d_buffer(new char[BUFFER_SIZE])
+, d_compress(compress)
+, d_batch_size(compress ? MIN_COMPRESSED_BATCH_SIZE : PIPE_BUF)
+, d_buffer(new char[compress ? MAX_COMPRESSED_FRAME_SIZE : PIPE_BUF])
 , d_bufferNeedle(d_buffer.get())
 {
+    if (d_compress) {
+        d_frame.reset(
+                new char[sizeof(CompressedFrameHeader) + LZ4_COMPRESSBOUND(MAX_COMPRESSED_FRAME_SIZE)]);
+    }
     open();
 }
 
 size_t
 SocketSink::freeSpaceInBuffer()
 {
-    return BUFFER_SIZE - (d_bufferNeedle - d_buffer.get());
+    return d_batch_size - (d_bufferNeedle - d_buffer.get());
 }
 
 bool
@@ -264,9 +294,12 @@ SocketSink::writeAll(const char* data, size_t length)
         d_bufferNeedle += toWrite;
         data += toWrite;
         length -= toWrite;
-        if (!flush()) {
+        if (!_flush()) {
             return false;
         }
+        if (d_compress) {
+            d_batch_size = std::min(d_batch_size * 2, MAX_COMPRESSED_FRAME_SIZE);
+        }
     }
 
     memcpy(d_bufferNeedle, data, length);
@@ -277,6 +310,9 @@ SocketSink::writeAll(const char* data, size_t length)
 bool
 SocketSink::flush()
 {
+    if (d_compress && static_cast<size_t>(d_bufferNeedle - d_buffer.get()) < d_batch_size / 4) {
+        d_batch_size = std::max(d_batch_size / 2, MIN_COMPRESSED_BATCH_SIZE);
+    }
     return _flush();
 }
 
@@ -288,6 +324,48 @@ SocketSink::_flush()
 
     d_bufferNeedle = d_buffer.get();
 
+    if (!d_compress) {
+        return sendAll(data, length);
+    }
+    if (length == 0) {
+        return true;
+    }
+    if (!d_sent_stream_magic) {
+        if (!sendAll(COMPRESSED_STREAM_MAGIC, sizeof(COMPRESSED_STREAM_MAGIC))) {
+            return false;
+        }
+        d_sent_stream_magic = true;
+    }
+    return sendFrame(data, length);
+}
+
+bool
+SocketSink::sendFrame(const char* data, size_t length)
+{
+    char* payload = d_frame.get() + sizeof(CompressedFrameHeader);
+    int stored_size = LZ4_compress_default(
+            data,
+            payload,
+            static_cast<int>(length),
+            LZ4_COMPRESSBOUND(MAX_COMPRESSED_FRAME_SIZE));
+
+    CompressedFrameHeader header;
+    header.raw_size = htonl(static_cast<uint32_t>(length));
+    if (stored_size <= 0 || static_cast<size_t>(stored_size) >= length) {
+        // Compressing didn't help, so send the records as they are.
+        header.stored_size = header.raw_size;
+        ::memcpy(d_frame.get(), &header, sizeof(header));
+        return sendAll(d_frame.get(), sizeof(header)) && sendAll(data, length);
+    }
+
+    header.stored_size = htonl(static_cast<uint32_t>(stored_size));
+    ::memcpy(d_frame.get(), &header, sizeof(header));
+    return sendAll(d_frame.get(), sizeof(header) + stored_size);
+}
+
+bool
+SocketSink::sendAll(const char* data, size_t length)
+{
     while (length) {
         ssize_t ret = ::send(d_socket_fd, data, length, 0);
         if (ret < 0 && errno != EINTR) {
@@ -383,6 +461,232 @@ SocketSink::open()
     d_socket_open = true;
 }
 
+std::optional<tracking_api::AllocationFilter>
+SocketSink::receiveAllocationFilter()
+{
+    // Readers send their filter as soon as they connect, but readers that
+    // predate filters never send one, so this never waits: it takes whatever
+    // part of the filter has arrived so far, and returns the filter once all
+    // of it is here. Until then, every allocation is tracked.
+    if (!d_socket_open || !d_waiting_for_allocation_filter) {
+        return std::nullopt;
+    }
+
+    char buf[4096];
+    while (true) {
+        ssize_t ret = ::recv(d_socket_fd, buf, sizeof(buf), MSG_DONTWAIT);
+        if (ret < 0 && errno == EINTR) {
+            continue;
+        }
+        if (ret < 0 && (errno == EAGAIN || errno == EWOULDBLOCK)) {
+            return std::nullopt;
+        }
+        if (ret <= 0) {
+            // The reader won't send anything else.
+            d_waiting_for_allocation_filter = false;
+            d_allocation_filter_message.clear();
+            return std::nullopt;
+        }
+
+        d_allocation_filter_message.append(buf, ret);
+        const std::string& message = d_allocation_filter_message;
+        if (message.size() >= 5 && message.compare(message.size() - 5, 5, "\nend\n") == 0) {
+            d_waiting_for_allocation_filter = false;
+            auto filter = tracking_api::AllocationFilter::parse(message);
+            d_allocation_filter_message.clear();
+            if (!filter) {
+                LOG(WARNING) << "Received an invalid allocation filter, tracking every allocation";
+            }
+            return filter;
+        }
+        if (message.size() >= tracking_api::MAX_ALLOCATION_FILTER_MESSAGE_SIZE) {
+            LOG(WARNING) << "Received an allocation filter that is too long, tracking every allocation";
+            d_waiting_for_allocation_filter = false;
+            d_allocation_filter_message.clear();
+            return std::nullopt;
+        }
+    }
+}
+
+SharedMemorySink::SharedMemorySink(std::string name, size_t capacity)
+: d_name(std::move(name))
+{
+    open(capacity);
+    waitForReader();
+}
+
+void
+SharedMemorySink::open(size_t capacity)
+{
+    capacity = roundUpToPowerOfTwo(std::max(capacity, size_t{PIPE_BUF}));
+    d_mapping_size = sharedMemoryRingDataOffset() + capacity;
+
+    d_fd = ::shm_open(d_name.c_str(), O_CREAT | O_EXCL | O_RDWR, 0600);
+    if (d_fd == -1) {
+        LOG(ERROR) << "Encountered error in 'shm_open' call: " << strerror(errno);
+        throw IoError{"Failed to create shared memory segment " + d_name};
+    }
+
+    if (::ftruncate(d_fd, static_cast<off_t>(d_mapping_size)) == -1) {
+        LOG(ERROR) << "Encountered error in 'ftruncate' call: " << strerror(errno);
+        ::close(d_fd);
+        ::shm_unlink(d_name.c_str());
+        throw IoError{"Failed to resize shared memory segment " + d_name};
+    }
+
+    d_mapping = ::mmap(nullptr, d_mapping_size, PROT_READ | PROT_WRITE, MAP_SHARED, d_fd, 0);
+    if (d_mapping == MAP_FAILED) {
+        LOG(ERROR) << "Encountered error in 'mmap' call: " << strerror(errno);
+        d_mapping = nullptr;
+        ::close(d_fd);
+        ::shm_unlink(d_name.c_str());
+        throw IoError{"Failed to map shared memory segment " + d_name};
+    }
+
+    // Released by the kernel when we exit, however that happens.
+    if (::flock(d_fd, LOCK_EX | LOCK_NB) == -1) {
+        LOG(WARNING) << "Encountered error in 'flock' call: " << strerror(errno);
+    }
+
+    d_header = new (d_mapping) SharedMemoryRingHeader();
+    d_header->capacity = capacity;
+    d_data = static_cast<char*>(d_mapping) + sharedMemoryRingDataOffset();
+    d_mask = capacity - 1;
+    d_header->magic.store(SHARED_MEMORY_RING_MAGIC, std::memory_order_release);
+}
+
+void
+SharedMemorySink::waitForReader()
+{
+    LOG(DEBUG) << "Waiting for a reader to attach to " << d_name;
+    while (!d_header->reader_attached.load(std::memory_order_acquire)) {
+        Py_BEGIN_ALLOW_THREADS;
+        std::this_thread::sleep_for(std::chrono::milliseconds(10));
+        Py_END_ALLOW_THREADS;
+        // Give a chance to check for signals arriving so we don't block the main thread.
+        if (PyErr_CheckSignals() < 0) {
+            return;
+        }
+    }
+
+    // The reader has mapped the segment, so nobody needs to find it anymore.
+    ::shm_unlink(d_name.c_str());
+    d_unlinked = true;
+}
+
+bool
+SharedMemorySink::writeAll(const char* data, size_t length)
+{
+    const uint64_t capacity = d_mask + 1;
+    while (length) {
+        uint64_t free_space = capacity - (d_write_offset - d_read_offset);
+        if (free_space == 0) {
+            d_read_offset = d_header->read_offset.load(std::memory_order_acquire);
+            if (d_write_offset - d_read_offset < capacity) {
+                continue;
+            }
+            if (d_header->reader_closed.load(std::memory_order_acquire)) {
+                return false;
+            }
+            // The reader is behind. Give it a chance to catch up, the same
+            // way a socket would block once the peer stops receiving.
+            std::this_thread::sleep_for(std::chrono::microseconds(50));
+            continue;
+        }
+
+        uint64_t start = d_write_offset & d_mask;
+        size_t chunk = std::min({static_cast<uint64_t>(length), free_space, capacity - start});
+        ::memcpy(d_data + start, data, chunk);
+        d_write_offset += chunk;
+        data += chunk;
+        length -= chunk;
+        d_header->write_offset.store(d_write_offset, std::memory_order_release);
+    }
+    return true;
+}
+
+bool
+SharedMemorySink::flush()
+{
+    // Every write is visible to the reader as soon as it's made, so there's
+    // nothing to flush, but this is a cheap place to notice the reader left.
+    return !d_header->reader_closed.load(std::memory_order_acquire);
+}
+
+bool
+SharedMemorySink::seek(__attribute__((unused)) off_t offset, __attribute__((unused)) int whence)
+{
+    return false;
+}
+
+std::unique_ptr<Sink>
+SharedMemorySink::cloneInChildProcess()
+{
+    // The ring has a single producer, so a child process can't share it, and
+    // we can't block waiting for a new reader to attach to a new segment.
+    return {};
+}
+
+void
+SharedMemorySink::unmap()
+{
+    if (d_mapping && ::munmap(d_mapping, d_mapping_size) != 0) {
+        LOG(ERROR) << "Failed to unmap shared memory segment: " << strerror(errno);
+    }
+    d_mapping = nullptr;
+    d_header = nullptr;
+    d_data = nullptr;
+}
+
+SharedMemorySink::~SharedMemorySink()
+{
+    if (d_header) {
+        d_header->writer_closed.store(true, std::memory_order_release);
+    }
+    unmap();
+    ::close(d_fd);
+    if (!d_unlinked) {
+        ::shm_unlink(d_name.c_str());
+    }
+}
+
+MemorySink::MemorySink(std::string& contents)
+: d_contents(contents)
+{
+    d_contents.clear();
+}
+
+MemorySink::~MemorySink()
+{
+}
+
+bool
+MemorySink::writeAll(const char* data, size_t length)
+{
+    size_t overwritten = std::min(length, d_contents.size() - d_position);
+    d_contents.replace(d_position, overwritten, data, length);
+    d_position += length;
+    return true;
+}
+
+bool
+MemorySink::seek(off_t offset, int whence)
+{
+    // Writers only ever seek back to rewrite what they already wrote.
+    if (whence != SEEK_SET || offset < 0 || static_cast<size_t>(offset) > d_contents.size()) {
+        errno = EINVAL;
+        return false;
+    }
+    d_position = offset;
+    return true;
+}
+
+std::unique_ptr<Sink>
+MemorySink::cloneInChildProcess()
+{
+    return {};
+}
+
 NullSink::~NullSink()
 {
 }
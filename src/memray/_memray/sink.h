@@ -2,10 +2,14 @@
 
 #include <cerrno>
 #include <memory>
+#include <optional>
 #include <string>
 #include <unistd.h>
 
+#include "allocation_filter.h"
 #include "records.h"
+#include "shared_memory.h"
+#include "socket_framing.h"
 
 namespace memray::io {
 
@@ -20,6 +24,14 @@ class Sink
     {
         return true;
     }
+
+    // Return the allocation filter sent by the reader at the other end of the
+    // sink, once it has fully arrived. This never blocks, and only returns a
+    // given filter once.
+    virtual std::optional<tracking_api::AllocationFilter> receiveAllocationFilter()
+    {
+        return std::nullopt;
+    }
 };
 
 class FileSink : public memray::io::Sink
@@ -36,6 +48,9 @@ class FileSink : public memray::io::Sink
     bool seek(off_t offset, int whence) override;
     std::unique_ptr<Sink> cloneInChildProcess() override;
 
+    // The offset just past the last byte written to the file.
+    size_t bytesWritten() const;
+
   private:
     void compress() noexcept;
     bool grow(size_t needed);
@@ -57,7 +72,7 @@ class FileSink : public memray::io::Sink
 class SocketSink : public Sink
 {
   public:
-    explicit SocketSink(std::string host, uint16_t port);
+    SocketSink(std::string host, uint16_t port, bool compress = false);
     ~SocketSink() override;
 
     SocketSink(SocketSink&) = delete;
@@ -69,22 +84,92 @@ class SocketSink : public Sink
     bool seek(off_t offset, int whence) override;
     std::unique_ptr<Sink> cloneInChildProcess() override;
     bool flush() override;
+    std::optional<tracking_api::AllocationFilter> receiveAllocationFilter() override;
 
   private:
     size_t freeSpaceInBuffer();
     void open();
     bool _flush();
+    bool sendAll(const char* data, size_t length);
+    bool sendFrame(const char* data, size_t length);
 
     const std::string d_host;
     uint16_t d_port;
     int d_socket_fd{-1};
     bool d_socket_open{false};
-
-    const size_t BUFFER_SIZE{PIPE_BUF};
+    bool d_waiting_for_allocation_filter{true};
+    std::string d_allocation_filter_message;
+
+    // When compressing, records are batched into frames whose size adapts to
+    // how fast they're produced: a batch that fills up before the periodic
+    // flush makes the next one bigger, and a periodic flush that finds the
+    // batch mostly empty makes the next one smaller.
+    const bool d_compress;
+    const size_t MIN_COMPRESSED_BATCH_SIZE{16 * 1024};
+    size_t d_batch_size;
+    bool d_sent_stream_magic{false};
     std::unique_ptr<char[]> d_buffer{nullptr};
+    std::unique_ptr<char[]> d_frame{nullptr};
     char* d_bufferNeedle{nullptr};
 };
 
+class SharedMemorySink : public Sink
+{
+  public:
+    SharedMemorySink(std::string name, size_t capacity);
+    ~SharedMemorySink() override;
+
+    SharedMemorySink(SharedMemorySink&) = delete;
+    SharedMemorySink(SharedMemorySink&&) = delete;
+    void operator=(const SharedMemorySink&) = delete;
+    void operator=(const SharedMemorySink&&) = delete;
+
+    bool writeAll(const char* data, size_t length) override;
+    bool seek(off_t offset, int whence) override;
+    std::unique_ptr<Sink> cloneInChildProcess() override;
+    bool flush() override;
+
+  private:
+    void open(size_t capacity);
+    void waitForReader();
+    void unmap();
+
+    const std::string d_name;
+    int d_fd{-1};
+    bool d_unlinked{false};
+    void* d_mapping{nullptr};
+    size_t d_mapping_size{0};
+    SharedMemoryRingHeader* d_header{nullptr};
+    char* d_data{nullptr};
+    uint64_t d_mask{0};
+    // Local copies of the ring offsets. The write offset is only advanced by
+    // us, and the read offset is only reloaded when the ring seems full, so
+    // that we don't touch the consumer's cache line on every write.
+    uint64_t d_write_offset{0};
+    uint64_t d_read_offset{0};
+};
+
+// Writes to a string in memory, so that a capture can be built quickly while
+// a lock is held, and written to a file after the lock is released.
+class MemorySink : public Sink
+{
+  public:
+    explicit MemorySink(std::string& contents);
+    ~MemorySink() override;
+    MemorySink(MemorySink&) = delete;
+    MemorySink(MemorySink&&) = delete;
+    void operator=(const MemorySink&) = delete;
+    void operator=(const MemorySink&&) = delete;
+
+    bool writeAll(const char* data, size_t length) override;
+    bool seek(off_t offset, int whence) override;
+    std::unique_ptr<Sink> cloneInChildProcess() override;
+
+  private:
+    std::string& d_contents;
+    size_t d_position{0};
+};
+
 class NullSink : public Sink
 {
   public:
@@ -11,7 +11,10 @@ cdef extern from "sink.h" namespace "memray::io":
         FileSink(const string& file_name, bool overwrite, bool compress) except +IOError
 
     cdef cppclass SocketSink(Sink):
-        SocketSink(string host, unsigned int port) except +IOError
+        SocketSink(string host, unsigned int port, bool compress) except +IOError
+
+    cdef cppclass SharedMemorySink(Sink):
+        SharedMemorySink(string name, size_t capacity) except +IOError
 
     cdef cppclass NullSink(Sink):
         NullSink() except +IOError
@@ -2,6 +2,7 @@
 
 #include <numeric>
 #include <unordered_set>
+#include <utility>
 
 namespace memray::api {
 
@@ -173,6 +174,293 @@ SnapshotAllocationAggregator::getSnapshotAllocations(bool merge_threads)
     return stack_to_allocation;
 }
 
+size_t
+IncrementalSnapshotAggregator::getLocationId(const Allocation& allocation)
+{
+    auto loc_key = LocationKey{allocation.frame_index, allocation.native_frame_id, allocation.tid};
+    auto it = d_location_ids.find(loc_key);
+    if (it != d_location_ids.end()) {
+        return it->second;
+    }
+
+    size_t location_id = d_locations.size();
+    Allocation location_allocation = allocation;
+    location_allocation.size = 0;
+    location_allocation.n_allocations = 0;
+    d_locations.push_back(LocationState{location_allocation});
+    d_location_ids.emplace(loc_key, location_id);
+    return location_id;
+}
+
+IncrementalSnapshotAggregator::LocationState&
+IncrementalSnapshotAggregator::changedLocation(size_t location_id)
+{
+    LocationState& state = d_locations[location_id];
+    if (state.changed_in_version != d_version) {
+        state.changed_in_version = d_version;
+        d_dirty_locations.push_back(location_id);
+    }
+    if (!state.changed_since_sample) {
+        state.changed_since_sample = true;
+        d_sample_dirty_locations.push_back(location_id);
+    }
+    return state;
+}
+
+void
+IncrementalSnapshotAggregator::addAllocation(const Allocation& allocation)
+{
+    switch (hooks::allocatorKind(allocation.allocator)) {
+        case hooks::AllocatorKind::SIMPLE_ALLOCATOR: {
+            size_t location_id = getLocationId(allocation);
+            auto [it, inserted] = d_ptr_to_allocation.try_emplace(
+                    allocation.address,
+                    LiveAllocation{location_id, allocation.size});
+            if (!inserted) {
+                // We missed the deallocation of whatever used to live here.
+                LocationState& old_state = changedLocation(it->second.location_id);
+                old_state.allocation.size -= it->second.size;
+                old_state.allocation.n_allocations -= 1;
+                d_heap_size -= it->second.size;
+                it->second = LiveAllocation{location_id, allocation.size};
+            }
+            LocationState& state = changedLocation(location_id);
+            state.allocation.size += allocation.size;
+            state.allocation.n_allocations += 1;
+            d_heap_size += allocation.size;
+            d_total_allocations += 1;
+            d_total_allocated_bytes += allocation.size;
+            break;
+        }
+        case hooks::AllocatorKind::SIMPLE_DEALLOCATOR: {
+            auto it = d_ptr_to_allocation.find(allocation.address);
+            if (it != d_ptr_to_allocation.end()) {
+                LocationState& state = changedLocation(it->second.location_id);
+                state.allocation.size -= it->second.size;
+                state.allocation.n_allocations -= 1;
+                d_heap_size -= it->second.size;
+                d_ptr_to_allocation.erase(it);
+            }
+            break;
+        }
+        case hooks::AllocatorKind::RANGED_ALLOCATOR: {
+            if (allocation.size == 0) {
+                break;
+            }
+            size_t location_id = getLocationId(allocation);
+            d_interval_tree.addInterval(allocation.address, allocation.size, location_id);
+            LocationState& state = changedLocation(location_id);
+            state.allocation.size += allocation.size;
+            state.allocation.n_allocations += 1;
+            d_heap_size += allocation.size;
+            d_total_allocations += 1;
+            d_total_allocated_bytes += allocation.size;
+            break;
+        }
+        case hooks::AllocatorKind::RANGED_DEALLOCATOR: {
+            // Every range left in the interval tree counts as one allocation,
+            // just like in SnapshotAllocationAggregator::getSnapshotAllocations.
+            auto removal_stats = d_interval_tree.removeInterval(allocation.address, allocation.size);
+            for (const auto& [interval, location_id] : removal_stats.freed_allocations) {
+                LocationState& state = changedLocation(location_id);
+                state.allocation.size -= interval.size();
+                state.allocation.n_allocations -= 1;
+                d_heap_size -= interval.size();
+            }
+            for (const auto& [interval, location_id] : removal_stats.shrunk_allocations) {
+                LocationState& state = changedLocation(location_id);
+                state.allocation.size -= interval.size();
+                d_heap_size -= interval.size();
+            }
+            for (const auto& [interval, location_id] : removal_stats.split_allocations) {
+                LocationState& state = changedLocation(location_id);
+                state.allocation.size -= interval.size();
+                state.allocation.n_allocations += 1;
+                d_heap_size -= interval.size();
+            }
+            break;
+        }
+    }
+}
+
+void
+IncrementalSnapshotAggregator::setLocationTotals(const Allocation& location_totals)
+{
+    LocationState& state = changedLocation(getLocationId(location_totals));
+    d_heap_size -= state.allocation.size;
+    d_heap_size += location_totals.size;
+    state.allocation.size = location_totals.size;
+    state.allocation.n_allocations = location_totals.n_allocations;
+}
+
+reduced_snapshot_map_t
+IncrementalSnapshotAggregator::getSnapshotAllocations(bool merge_threads)
+{
+    reduced_snapshot_map_t stack_to_allocation{};
+
+    for (const auto& state : d_locations) {
+        const Allocation& record = state.allocation;
+        if (record.n_allocations == 0) {
+            continue;
+        }
+        const thread_id_t thread_id = merge_threads ? NO_THREAD_INFO : record.tid;
+        auto loc_key = LocationKey{record.frame_index, record.native_frame_id, thread_id};
+        auto alloc_it = stack_to_allocation.find(loc_key);
+        if (alloc_it == stack_to_allocation.end()) {
+            stack_to_allocation.insert(alloc_it, std::pair(loc_key, record));
+        } else {
+            alloc_it->second.size += record.size;
+            alloc_it->second.n_allocations += record.n_allocations;
+        }
+    }
+
+    return stack_to_allocation;
+}
+
+std::vector<Allocation>
+IncrementalSnapshotAggregator::getLiveLocations() const
+{
+    std::vector<Allocation> live_locations;
+    for (const auto& state : d_locations) {
+        if (state.allocation.n_allocations != 0) {
+            live_locations.push_back(state.allocation);
+        }
+    }
+    return live_locations;
+}
+
+std::vector<std::pair<size_t, Allocation>>
+IncrementalSnapshotAggregator::takeChangesSinceLastSample()
+{
+    std::vector<std::pair<size_t, Allocation>> changes;
+    changes.reserve(d_sample_dirty_locations.size());
+    for (size_t location_id : d_sample_dirty_locations) {
+        LocationState& state = d_locations[location_id];
+        state.changed_since_sample = false;
+        changes.emplace_back(location_id, state.allocation);
+    }
+    d_sample_dirty_locations.clear();
+    return changes;
+}
+
+size_t
+IncrementalSnapshotAggregator::getHeapSize() const
+{
+    return d_heap_size;
+}
+
+uint64_t
+IncrementalSnapshotAggregator::getTotalAllocations() const
+{
+    return d_total_allocations;
+}
+
+uint64_t
+IncrementalSnapshotAggregator::getTotalAllocatedBytes() const
+{
+    return d_total_allocated_bytes;
+}
+
+SnapshotDelta
+IncrementalSnapshotAggregator::getSnapshotDelta(uint64_t since_version)
+{
+    const uint64_t version = d_version++;
+    d_retained_versions.emplace_back(version, std::move(d_dirty_locations));
+    d_dirty_locations.clear();
+    if (d_retained_versions.size() > MAX_RETAINED_VERSIONS) {
+        d_retained_versions.pop_front();
+    }
+
+    SnapshotDelta delta{version, false, {}};
+    const uint64_t oldest_retained_version = d_retained_versions.front().first;
+    if (since_version == 0 || since_version >= version || since_version + 1 < oldest_retained_version) {
+        delta.is_full = true;
+        for (size_t location_id = 0; location_id < d_locations.size(); ++location_id) {
+            const Allocation& record = d_locations[location_id].allocation;
+            if (record.n_allocations != 0) {
+                delta.changed_locations.emplace_back(location_id, record);
+            }
+        }
+        return delta;
+    }
+
+    std::vector<size_t> changed_ids;
+    for (const auto& [retained_version, location_ids] : d_retained_versions) {
+        if (retained_version > since_version) {
+            changed_ids.insert(changed_ids.end(), location_ids.begin(), location_ids.end());
+        }
+    }
+    std::sort(changed_ids.begin(), changed_ids.end());
+    changed_ids.erase(std::unique(changed_ids.begin(), changed_ids.end()), changed_ids.end());
+
+    delta.changed_locations.reserve(changed_ids.size());
+    for (size_t location_id : changed_ids) {
+        delta.changed_locations.emplace_back(location_id, d_locations[location_id].allocation);
+    }
+    return delta;
+}
+
+SnapshotHistory::SnapshotHistory(uint64_t retention_ms)
+: d_retention_ms(retention_ms)
+{
+}
+
+void
+SnapshotHistory::applySample(const Sample& sample, std::vector<Allocation>* locations)
+{
+    for (const auto& [location_id, allocation] : sample.changed_locations) {
+        if (location_id >= locations->size()) {
+            Allocation empty{};
+            empty.n_allocations = 0;
+            locations->resize(location_id + 1, empty);
+        }
+        (*locations)[location_id] = allocation;
+    }
+}
+
+void
+SnapshotHistory::addSample(
+        uint64_t timestamp_ms,
+        std::vector<std::pair<size_t, Allocation>> changed_locations)
+{
+    d_samples.push_back(Sample{timestamp_ms, std::move(changed_locations)});
+    while (d_samples.front().timestamp_ms + d_retention_ms < timestamp_ms) {
+        applySample(d_samples.front(), &d_base);
+        d_samples.pop_front();
+    }
+}
+
+std::vector<uint64_t>
+SnapshotHistory::getTimestamps() const
+{
+    std::vector<uint64_t> timestamps;
+    timestamps.reserve(d_samples.size());
+    for (const auto& sample : d_samples) {
+        timestamps.push_back(sample.timestamp_ms);
+    }
+    return timestamps;
+}
+
+std::vector<Allocation>
+SnapshotHistory::getLiveLocationsAt(size_t sample_index) const
+{
+    if (sample_index >= d_samples.size()) {
+        throw std::out_of_range("history sample index out of range");
+    }
+
+    std::vector<Allocation> locations = d_base;
+    for (size_t i = 0; i <= sample_index; ++i) {
+        applySample(d_samples[i], &locations);
+    }
+    locations.erase(
+            std::remove_if(
+                    locations.begin(),
+                    locations.end(),
+                    [](const Allocation& allocation) { return allocation.n_allocations == 0; }),
+            locations.end());
+    return locations;
+}
+
 TemporaryAllocationsAggregator::TemporaryAllocationsAggregator(size_t max_items)
 : d_max_items(max_items)
 {
@@ -267,7 +555,7 @@ AggregatedCaptureReaggregator::getSnapshotAllocations(bool merge_threads)
             stack_to_allocation.insert(alloc_it, std::pair(loc_key, record));
         } else {
             alloc_it->second.size += record.size;
-            alloc_it->second.n_allocations += 1;
+            alloc_it->second.n_allocations += record.n_allocations;
         }
     }
 
@@ -286,8 +574,118 @@ operator!=(const Contribution& lhs, const Contribution& rhs)
     return !(lhs == rhs);
 }
 
-UsageHistory&
-HighWaterMarkAggregator::getUsageHistory(const Allocation& allocation)
+size_t
+LiveAllocationTable::homeSlot(uintptr_t address) const noexcept
+{
+    // Fibonacci hashing: addresses are aligned, so their low bits are mostly
+    // zeros, but the high bits of their product with this constant aren't.
+    const auto bits = static_cast<unsigned>(__builtin_ctzll(d_slots.size()));
+    const uint64_t hash = static_cast<uint64_t>(address) * 11400714819323198485ull;
+    return static_cast<size_t>(hash >> (64 - bits));
+}
+
+size_t
+LiveAllocationTable::findSlot(uintptr_t address) const noexcept
+{
+    // Return the slot holding this address, or the empty slot ending its run.
+    const size_t mask = d_slots.size() - 1;
+    size_t slot = homeSlot(address);
+    while (d_slots[slot].address != EMPTY_SLOT && d_slots[slot].address != address) {
+        slot = (slot + 1) & mask;
+    }
+    return slot;
+}
+
+void
+LiveAllocationTable::rehash(size_t new_capacity)
+{
+    std::vector<Entry> old_slots =
+            std::exchange(d_slots, std::vector<Entry>(new_capacity, Entry{EMPTY_SLOT, 0, 0}));
+    for (const auto& entry : old_slots) {
+        if (entry.address != EMPTY_SLOT) {
+            d_slots[findSlot(entry.address)] = entry;
+        }
+    }
+}
+
+void
+LiveAllocationTable::insert(const Entry& entry)
+{
+    if (entry.address == EMPTY_SLOT) {
+        d_size += d_null_entry ? 0 : 1;
+        d_null_entry = entry;
+        return;
+    }
+
+    // Keep the load factor at or below 3/4.
+    if (d_slots.empty()) {
+        rehash(MIN_CAPACITY);
+    } else if ((d_size + 1) * 4 > d_slots.size() * 3) {
+        rehash(d_slots.size() * 2);
+    }
+
+    Entry& slot = d_slots[findSlot(entry.address)];
+    if (slot.address == EMPTY_SLOT) {
+        d_size += 1;
+    }
+    slot = entry;
+}
+
+std::optional<LiveAllocationTable::Entry>
+LiveAllocationTable::remove(uintptr_t address)
+{
+    if (address == EMPTY_SLOT) {
+        std::optional<Entry> ret;
+        std::swap(ret, d_null_entry);
+        d_size -= ret ? 1 : 0;
+        return ret;
+    }
+    if (d_slots.empty()) {
+        return std::nullopt;
+    }
+
+    const size_t mask = d_slots.size() - 1;
+    size_t hole = findSlot(address);
+    if (d_slots[hole].address == EMPTY_SLOT) {
+        return std::nullopt;
+    }
+    Entry ret = d_slots[hole];
+    d_size -= 1;
+
+    // Shift back any following entries in the same run that would no longer
+    // be reachable from their home slot, instead of leaving a tombstone.
+    for (size_t slot = (hole + 1) & mask; d_slots[slot].address != EMPTY_SLOT; slot = (slot + 1) & mask)
+    {
+        size_t home = homeSlot(d_slots[slot].address);
+        bool reachable = hole <= slot ? (hole < home && home <= slot) : (hole < home || home <= slot);
+        if (!reachable) {
+            d_slots[hole] = d_slots[slot];
+            hole = slot;
+        }
+    }
+    d_slots[hole].address = EMPTY_SLOT;
+
+    // Give memory back once most of the table is empty.
+    if (d_slots.size() > MIN_CAPACITY && d_size * 8 < d_slots.size()) {
+        rehash(d_slots.size() / 2);
+    }
+    return ret;
+}
+
+size_t
+LiveAllocationTable::size() const noexcept
+{
+    return d_size;
+}
+
+size_t
+LiveAllocationTable::memoryUsage() const noexcept
+{
+    return d_slots.capacity() * sizeof(Entry);
+}
+
+size_t
+HighWaterMarkAggregator::getLocationId(const Allocation& allocation)
 {
     HighWaterMarkLocationKey loc_key{
             allocation.tid,
@@ -296,10 +694,10 @@ HighWaterMarkAggregator::getUsageHistory(const Allocation& allocation)
             allocation.native_segment_generation,
             allocation.allocator};
 
-    auto it = d_usage_history_by_location.find(loc_key);
-    if (it == d_usage_history_by_location.end()) {
+    auto [it, inserted] = d_location_ids.emplace(loc_key, d_usage_by_location.size());
+    if (inserted) {
         assert(!hooks::isDeallocator(allocation.allocator));
-        it = d_usage_history_by_location.emplace(loc_key, UsageHistory{}).first;
+        d_usage_by_location.push_back(LocationUsage{loc_key, UsageHistory{}});
     }
     return it->second;
 }
@@ -365,7 +763,10 @@ UsageHistory::recordContributionsToCompletedSnapshots(
             heap_contribution_by_snapshot.push_back(hc);
         }
 
-        if (history.count_since_last_peak) {
+        // Freeing one allocation and making another of a different size
+        // changes the bytes contributed to the next snapshot even though it
+        // leaves the number of allocations unchanged, so check both.
+        if (history.count_since_last_peak || history.bytes_since_last_peak) {
             history.last_known_snapshot++;
         } else {
             history.last_known_snapshot = current_snapshot;
@@ -396,6 +797,49 @@ UsageHistory::recordUsageDelta(
     d_history.bytes_since_last_peak += bytes_delta;
 }
 
+void
+UsageHistory::compactSnapshots(
+        const std::vector<size_t>& highest_peak_by_snapshot,
+        const std::vector<size_t>& kept_snapshots)
+{
+    // First record our contributions to every completed snapshot, so that
+    // the one kept for each pair of snapshots can be looked up.
+    if (d_history.last_known_snapshot < highest_peak_by_snapshot.size()) {
+        d_history = recordContributionsToCompletedSnapshots(
+                highest_peak_by_snapshot,
+                d_heap_contribution_by_snapshot);
+    }
+
+    std::vector<HistoricalContribution> compacted;
+    auto it = d_heap_contribution_by_snapshot.cbegin();
+    Contribution contrib{0, 0};
+    for (size_t new_snapshot = 0; new_snapshot < kept_snapshots.size(); ++new_snapshot) {
+        size_t old_snapshot = kept_snapshots[new_snapshot];
+        while (it != d_heap_contribution_by_snapshot.cend() && it->as_of_snapshot <= old_snapshot) {
+            contrib = it->contrib;
+            ++it;
+        }
+
+        Contribution last = compacted.empty() ? Contribution{0, 0} : compacted.back().contrib;
+        if (contrib != last) {
+            compacted.push_back(HistoricalContribution{
+                    new_snapshot,
+                    highest_peak_by_snapshot[old_snapshot],
+                    contrib});
+        }
+    }
+
+    compacted.shrink_to_fit();
+    d_heap_contribution_by_snapshot = std::move(compacted);
+    d_history.last_known_snapshot = kept_snapshots.size();
+}
+
+size_t
+UsageHistory::numHistoricalContributions() const noexcept
+{
+    return d_heap_contribution_by_snapshot.size();
+}
+
 Contribution
 UsageHistory::highWaterMarkContribution(size_t highest_peak) const
 {
@@ -473,10 +917,7 @@ UsageHistory::contributionsBySnapshot(
 }
 
 void
-HighWaterMarkAggregator::recordUsageDelta(
-        const Allocation& allocation,
-        size_t count_delta,
-        size_t bytes_delta)
+HighWaterMarkAggregator::recordUsageDelta(size_t location_id, size_t count_delta, size_t bytes_delta)
 {
     size_t new_heap_size = d_current_heap_size + bytes_delta;
     if (d_current_heap_size >= d_heap_size_at_last_peak && new_heap_size < d_current_heap_size) {
@@ -486,12 +927,14 @@ HighWaterMarkAggregator::recordUsageDelta(
     }
     d_current_heap_size = new_heap_size;
 
-    auto& history = getUsageHistory(allocation);
+    auto& history = d_usage_by_location[location_id].history;
+    d_num_historical_contributions -= history.numHistoricalContributions();
     history.recordUsageDelta(
             d_high_water_mark_index_by_snapshot,
             d_peak_count,
             count_delta,
             bytes_delta);
+    d_num_historical_contributions += history.numHistoricalContributions();
 }
 
 void
@@ -503,38 +946,38 @@ HighWaterMarkAggregator::addAllocation(const Allocation& allocation_or_deallocat
     switch (hooks::allocatorKind(allocation_or_deallocation.allocator)) {
         case hooks::AllocatorKind::SIMPLE_ALLOCATOR: {
             const Allocation& allocation = allocation_or_deallocation;
-            recordUsageDelta(allocation, 1, allocation.size);
-            d_ptr_to_allocation[allocation.address] = allocation;
+            size_t location_id = getLocationId(allocation);
+            recordUsageDelta(location_id, 1, allocation.size);
+            d_live_allocations.insert({allocation.address, allocation.size, location_id});
             break;
         }
         case hooks::AllocatorKind::SIMPLE_DEALLOCATOR: {
             const Allocation& deallocation = allocation_or_deallocation;
-            auto it = d_ptr_to_allocation.find(deallocation.address);
-            if (it != d_ptr_to_allocation.end()) {
-                const Allocation& allocation = it->second;
-                recordUsageDelta(allocation, -1, -allocation.size);
-                d_ptr_to_allocation.erase(it);
+            auto entry = d_live_allocations.remove(deallocation.address);
+            if (entry) {
+                recordUsageDelta(entry->location_id, -1, -entry->size);
             }
             break;
         }
         case hooks::AllocatorKind::RANGED_ALLOCATOR: {
             const Allocation& allocation = allocation_or_deallocation;
-            recordUsageDelta(allocation, 1, allocation.size);
-            d_mmap_intervals.addInterval(allocation.address, allocation.size, allocation);
+            size_t location_id = getLocationId(allocation);
+            recordUsageDelta(location_id, 1, allocation.size);
+            d_mmap_intervals.addInterval(allocation.address, allocation.size, location_id);
             break;
         }
         case hooks::AllocatorKind::RANGED_DEALLOCATOR: {
             const Allocation& deallocation = allocation_or_deallocation;
             auto removal_stats =
                     d_mmap_intervals.removeInterval(deallocation.address, deallocation.size);
-            for (const auto& [interval, allocation] : removal_stats.freed_allocations) {
-                recordUsageDelta(allocation, -1, -interval.size());
+            for (const auto& [interval, location_id] : removal_stats.freed_allocations) {
+                recordUsageDelta(location_id, -1, -interval.size());
             }
-            for (const auto& [interval, allocation] : removal_stats.shrunk_allocations) {
-                recordUsageDelta(allocation, 0, -interval.size());
+            for (const auto& [interval, location_id] : removal_stats.shrunk_allocations) {
+                recordUsageDelta(location_id, 0, -interval.size());
             }
-            for (const auto& [interval, allocation] : removal_stats.split_allocations) {
-                recordUsageDelta(allocation, 1, -interval.size());
+            for (const auto& [interval, location_id] : removal_stats.split_allocations) {
+                recordUsageDelta(location_id, 1, -interval.size());
             }
             break;
         }
@@ -559,6 +1002,69 @@ HighWaterMarkAggregator::captureSnapshot()
     d_heap_size_at_last_peak = d_current_heap_size;
 }
 
+void
+HighWaterMarkAggregator::compactSnapshots()
+{
+    const size_t num_snapshots = d_high_water_mark_index_by_snapshot.size();
+    if (num_snapshots < 2) {
+        return;
+    }
+
+    // Of each pair of snapshots, keep the one with the higher high water
+    // mark, which is the high water mark of the two of them combined.
+    std::vector<size_t> kept_snapshots;
+    kept_snapshots.reserve((num_snapshots + 1) / 2);
+    for (size_t i = 0; i < num_snapshots; i += 2) {
+        size_t kept = i;
+        if (i + 1 < num_snapshots
+            && d_high_water_mark_bytes_by_snapshot[i + 1] > d_high_water_mark_bytes_by_snapshot[i])
+        {
+            kept = i + 1;
+        }
+        kept_snapshots.push_back(kept);
+    }
+
+    d_num_historical_contributions = 0;
+    for (auto& location : d_usage_by_location) {
+        location.history.compactSnapshots(d_high_water_mark_index_by_snapshot, kept_snapshots);
+        d_num_historical_contributions += location.history.numHistoricalContributions();
+    }
+
+    std::vector<size_t> index_by_snapshot;
+    std::vector<size_t> bytes_by_snapshot;
+    index_by_snapshot.reserve(kept_snapshots.size());
+    bytes_by_snapshot.reserve(kept_snapshots.size());
+    for (size_t kept : kept_snapshots) {
+        index_by_snapshot.push_back(d_high_water_mark_index_by_snapshot[kept]);
+        bytes_by_snapshot.push_back(d_high_water_mark_bytes_by_snapshot[kept]);
+    }
+    d_high_water_mark_index_by_snapshot = std::move(index_by_snapshot);
+    d_high_water_mark_bytes_by_snapshot = std::move(bytes_by_snapshot);
+}
+
+size_t
+HighWaterMarkAggregator::numSnapshots() const noexcept
+{
+    return d_high_water_mark_index_by_snapshot.size();
+}
+
+size_t
+HighWaterMarkAggregator::memoryUsage() const noexcept
+{
+    // Each node of an unordered_map also holds a pointer to the next node,
+    // and the map has an array of pointers to buckets.
+    const size_t location_id_entry_size =
+            sizeof(std::pair<const HighWaterMarkLocationKey, size_t>) + 2 * sizeof(void*);
+    const size_t num_mmap_intervals = d_mmap_intervals.end() - d_mmap_intervals.begin();
+
+    return d_live_allocations.memoryUsage() + num_mmap_intervals * sizeof(std::pair<Interval, size_t>)
+           + d_usage_by_location.capacity() * sizeof(LocationUsage)
+           + d_location_ids.size() * location_id_entry_size
+           + d_num_historical_contributions * sizeof(HistoricalContribution)
+           + d_high_water_mark_index_by_snapshot.capacity() * sizeof(size_t)
+           + d_high_water_mark_bytes_by_snapshot.capacity() * sizeof(size_t);
+}
+
 size_t
 HighWaterMarkAggregator::getCurrentHeapSize() const noexcept
 {
@@ -584,7 +1090,7 @@ HighWaterMarkAggregator::generateIndex() const
         final_peak_count++;
     }
 
-    for (const auto& [location, history] : d_usage_history_by_location) {
+    for (const auto& [location, history] : d_usage_by_location) {
         auto contribs =
                 history.contributionsBySnapshot(d_high_water_mark_index_by_snapshot, final_peak_count);
 
@@ -644,26 +1150,180 @@ HighWaterMarkAggregator::visitAllocations(const allocation_callback_t& callback)
         final_peak_bytes = d_current_heap_size;
     }
 
-    return std::all_of(
-            d_usage_history_by_location.begin(),
-            d_usage_history_by_location.end(),
-            [&](const auto& entry) {
-                const auto& [loc, usage] = entry;
-                Contribution hwm = usage.highWaterMarkContribution(final_peak_count);
-                Contribution leaks = usage.leaksContribution();
-                AggregatedAllocation alloc{
-                        loc.thread_id,
-                        loc.allocator,
-                        loc.native_frame_id,
-                        loc.python_frame_id,
-                        loc.native_segment_generation,
-                        hwm.allocations,
-                        leaks.allocations,
-                        hwm.bytes,
-                        leaks.bytes};
-
-                return callback(alloc);
-            });
+    return std::all_of(d_usage_by_location.begin(), d_usage_by_location.end(), [&](const auto& entry) {
+        const auto& [loc, usage] = entry;
+        Contribution hwm = usage.highWaterMarkContribution(final_peak_count);
+        Contribution leaks = usage.leaksContribution();
+        AggregatedAllocation alloc{
+                loc.thread_id,
+                loc.allocator,
+                loc.native_frame_id,
+                loc.python_frame_id,
+                loc.native_segment_generation,
+                hwm.allocations,
+                leaks.allocations,
+                hwm.bytes,
+                leaks.bytes};
+
+        return callback(alloc);
+    });
+}
+
+void
+AggregatedCaptureIntervalReaggregator::addInterval(const AggregatedAllocationInterval& interval)
+{
+    HighWaterMarkLocationKey key{
+            interval.tid,
+            interval.frame_index,
+            interval.native_frame_id,
+            interval.native_segment_generation,
+            interval.allocator};
+    d_lifetimes.push_back(AllocationLifetime{
+            interval.allocated_before_snapshot,
+            interval.deallocated_before_snapshot,
+            key,
+            interval.n_allocations,
+            interval.n_bytes});
+}
+
+std::vector<AllocationLifetime>
+AggregatedCaptureIntervalReaggregator::generateIndex(bool merge_threads) const
+{
+    std::vector<AllocationLifetime> index = d_lifetimes;
+    if (merge_threads) {
+        for (auto& lifetime : index) {
+            lifetime.key.thread_id = 0;
+        }
+    }
+
+    // Sort so that all intervals for a given location are contiguous, and
+    // combine the ones that different threads contributed to the same runs
+    // of snapshots.
+    std::sort(index.begin(), index.end());
+    std::vector<AllocationLifetime> merged;
+    for (const auto& lifetime : index) {
+        if (!merged.empty() && merged.back().key == lifetime.key
+            && merged.back().allocatedBeforeSnapshot == lifetime.allocatedBeforeSnapshot
+            && merged.back().deallocatedBeforeSnapshot == lifetime.deallocatedBeforeSnapshot)
+        {
+            merged.back().n_allocations += lifetime.n_allocations;
+            merged.back().n_bytes += lifetime.n_bytes;
+        } else {
+            merged.push_back(lifetime);
+        }
+    }
+    return merged;
+}
+
+TemporaryAllocationsCounter::TemporaryAllocationsCounter(size_t max_distance)
+: d_max_distance(max_distance)
+{
+}
+
+void
+TemporaryAllocationsCounter::addAllocation(const Allocation& allocation)
+{
+    // This finds temporary allocations the same way that the
+    // TemporaryAllocationsAggregator does, but it keeps running totals.
+    hooks::AllocatorKind kind = hooks::allocatorKind(allocation.allocator);
+    switch (kind) {
+        case hooks::AllocatorKind::SIMPLE_ALLOCATOR:
+        case hooks::AllocatorKind::RANGED_ALLOCATOR: {
+            auto& recent_allocations = d_recent_allocations[allocation.tid];
+            recent_allocations.emplace_front(allocation);
+            if (recent_allocations.size() > d_max_distance + 1) {
+                recent_allocations.pop_back();
+            }
+            break;
+        }
+        case hooks::AllocatorKind::SIMPLE_DEALLOCATOR:
+        case hooks::AllocatorKind::RANGED_DEALLOCATOR: {
+            auto it = d_recent_allocations.find(allocation.tid);
+            if (it == d_recent_allocations.end()) {
+                break;
+            }
+
+            auto& recent_allocations = it->second;
+            auto alloc_it = std::find_if(
+                    recent_allocations.begin(),
+                    recent_allocations.end(),
+                    [&](auto& recent_allocation) {
+                        bool match = (recent_allocation.address == allocation.address);
+                        if (kind == hooks::AllocatorKind::RANGED_DEALLOCATOR) {
+                            match = match && (recent_allocation.size == allocation.size);
+                        }
+                        return match;
+                    });
+            if (alloc_it == recent_allocations.end()) {
+                break;
+            }
+
+            HighWaterMarkLocationKey key{
+                    alloc_it->tid,
+                    alloc_it->frame_index,
+                    alloc_it->native_frame_id,
+                    alloc_it->native_segment_generation,
+                    alloc_it->allocator};
+            auto& contributions = d_contributions_by_distance[key];
+            contributions.resize(d_max_distance + 1);
+            auto& contribution = contributions[alloc_it - recent_allocations.begin()];
+            contribution.allocations += 1;
+            contribution.bytes += alloc_it->size;
+            break;
+        }
+    }
+}
+
+size_t
+TemporaryAllocationsCounter::maxDistance() const noexcept
+{
+    return d_max_distance;
+}
+
+size_t
+TemporaryAllocationsCounter::memoryUsage() const noexcept
+{
+    // Each node of an unordered_map also holds a pointer to the next node,
+    // and the map has an array of pointers to buckets.
+    const size_t recent_allocations_entry_size =
+            sizeof(std::pair<const thread_id_t, std::deque<Allocation>>) + 2 * sizeof(void*);
+    const size_t contributions_entry_size =
+            sizeof(std::pair<const HighWaterMarkLocationKey, std::vector<Contribution>>)
+            + 2 * sizeof(void*) + (d_max_distance + 1) * sizeof(Contribution);
+
+    size_t usage = d_recent_allocations.size() * recent_allocations_entry_size
+                   + d_contributions_by_distance.size() * contributions_entry_size;
+    for (const auto& [tid, recent_allocations] : d_recent_allocations) {
+        usage += recent_allocations.size() * sizeof(Allocation);
+    }
+    return usage;
+}
+
+bool
+TemporaryAllocationsCounter::visitTemporaryAllocations(
+        const temporary_allocations_callback_t& callback) const
+{
+    for (const auto& [key, contributions] : d_contributions_by_distance) {
+        for (size_t distance = 0; distance < contributions.size(); ++distance) {
+            const auto& contribution = contributions[distance];
+            if (contribution.allocations == 0) {
+                continue;
+            }
+            AggregatedTemporaryAllocations record{
+                    key.thread_id,
+                    key.allocator,
+                    key.native_frame_id,
+                    key.python_frame_id,
+                    key.native_segment_generation,
+                    distance,
+                    contribution.allocations,
+                    contribution.bytes};
+            if (!callback(record)) {
+                return false;
+            }
+        }
+    }
+    return true;
 }
 
 void
@@ -915,6 +1575,14 @@ AllocationStatsAggregator::addAllocation(
         std::optional<frame_id_t> python_frame_id)
 {
     d_high_water_mark_finder.processAllocation(allocation);
+    countAllocation(allocation, python_frame_id);
+}
+
+void
+AllocationStatsAggregator::countAllocation(
+        const Allocation& allocation,
+        std::optional<frame_id_t> python_frame_id)
+{
     if (hooks::isDeallocator(allocation.allocator)) {
         return;
     }
@@ -927,6 +1595,79 @@ AllocationStatsAggregator::addAllocation(
     size_and_count.second += 1;
 }
 
+size_t
+AllocationStatsAggregator::memoryUsage() const noexcept
+{
+    // Each node of an unordered_map also holds a pointer to the next node,
+    // and the map has an array of pointers to buckets.
+    const size_t location_entry_size = sizeof(SizeAndCountByLocation::value_type) + 2 * sizeof(void*);
+    const size_t size_entry_size = sizeof(std::pair<const size_t, uint64_t>) + 2 * sizeof(void*);
+    const size_t allocator_entry_size = sizeof(std::pair<const int, uint64_t>) + 2 * sizeof(void*);
+
+    return d_size_and_count_by_location.size() * location_entry_size
+           + d_allocation_count_by_size.size() * size_entry_size
+           + d_allocation_count_by_allocator.size() * allocator_entry_size;
+}
+
+bool
+AllocationStatsAggregator::visitStatsEntries(const stats_entry_callback_t& callback) const
+{
+    using Kind = AllocationStatsEntry::Kind;
+    for (const auto& [size, count] : d_allocation_count_by_size) {
+        if (!callback({Kind::BY_SIZE, size, count, size * count})) {
+            return false;
+        }
+    }
+    for (const auto& [allocator, count] : d_allocation_count_by_allocator) {
+        if (!callback({Kind::BY_ALLOCATOR, static_cast<size_t>(allocator), count, 0})) {
+            return false;
+        }
+    }
+    for (const auto& [location, size_and_count] : d_size_and_count_by_location) {
+        const auto& [bytes, count] = size_and_count;
+        AllocationStatsEntry entry{Kind::WITHOUT_PYTHON_FRAME, 0, count, bytes};
+        if (location) {
+            entry.kind = Kind::BY_PYTHON_FRAME;
+            entry.key = location.value();
+        }
+        if (!callback(entry)) {
+            return false;
+        }
+    }
+    return true;
+}
+
+void
+AllocationStatsAggregator::addStatsEntry(const AllocationStatsEntry& entry)
+{
+    switch (entry.kind) {
+        case AllocationStatsEntry::Kind::BY_SIZE: {
+            d_total_allocations += entry.n_allocations;
+            d_total_bytes_allocated += entry.n_bytes;
+            d_allocation_count_by_size[entry.key] += entry.n_allocations;
+        } break;
+        case AllocationStatsEntry::Kind::BY_ALLOCATOR: {
+            d_allocation_count_by_allocator[static_cast<int>(entry.key)] += entry.n_allocations;
+        } break;
+        case AllocationStatsEntry::Kind::BY_PYTHON_FRAME:
+        case AllocationStatsEntry::Kind::WITHOUT_PYTHON_FRAME: {
+            std::optional<frame_id_t> location;
+            if (entry.kind == AllocationStatsEntry::Kind::BY_PYTHON_FRAME) {
+                location = entry.key;
+            }
+            auto& size_and_count = d_size_and_count_by_location[location];
+            size_and_count.first += entry.n_bytes;
+            size_and_count.second += entry.n_allocations;
+        } break;
+    }
+}
+
+void
+AllocationStatsAggregator::addHighWaterMarkContribution(const Allocation& allocation)
+{
+    d_high_water_mark_finder.processAllocation(allocation);
+}
+
 PyObject*
 Py_ListFromSnapshotAllocationRecords(const reduced_snapshot_map_t& stack_to_allocation)
 {
@@ -947,6 +1688,34 @@ Py_ListFromSnapshotAllocationRecords(const reduced_snapshot_map_t& stack_to_allo
     return list;
 }
 
+PyObject*
+Py_TupleFromSnapshotDelta(const SnapshotDelta& delta)
+{
+    PyObject* changes = PyList_New(delta.changed_locations.size());
+    if (changes == nullptr) {
+        return nullptr;
+    }
+    size_t list_index = 0;
+    for (const auto& [location_id, record] : delta.changed_locations) {
+        PyObject* pyrecord = record.toPythonObject();
+        if (pyrecord == nullptr) {
+            Py_DECREF(changes);
+            return nullptr;
+        }
+        PyObject* change = Py_BuildValue("(nN)", static_cast<Py_ssize_t>(location_id), pyrecord);
+        if (change == nullptr) {
+            Py_DECREF(changes);
+            return nullptr;
+        }
+        PyList_SET_ITEM(changes, list_index++, change);
+    }
+    return Py_BuildValue(
+            "(KON)",
+            static_cast<unsigned long long>(delta.version),
+            delta.is_full ? Py_True : Py_False,
+            changes);
+}
+
 PyObject*
 Py_GetSnapshotAllocationRecords(
         const allocations_t& all_records,
@@ -215,9 +215,117 @@ class AggregatedCaptureReaggregator : public AbstractAggregator
     std::vector<Allocation> d_allocations;
 };
 
+struct SnapshotDelta
+{
+    uint64_t version;
+    bool is_full;
+    std::vector<std::pair<size_t, Allocation>> changed_locations;
+};
+
+// Like SnapshotAllocationAggregator, but keeps running totals for each
+// location as allocations and deallocations are seen, so that the current
+// snapshot doesn't need to be recomputed from every live allocation. Every
+// location is given a stable ID, and the locations that changed since a given
+// version of the snapshot can be retrieved with getSnapshotDelta.
+class IncrementalSnapshotAggregator : public AbstractAggregator
+{
+  public:
+    // How many versions remember which locations changed in them. Requesting
+    // a delta from an older version returns the full snapshot instead.
+    static constexpr size_t MAX_RETAINED_VERSIONS = 16;
+
+    void addAllocation(const Allocation& allocation) override;
+    reduced_snapshot_map_t getSnapshotAllocations(bool merge_threads) override;
+
+    // Replace the totals of the location of the given allocation with its
+    // size and n_allocations, for sources that were aggregated upstream.
+    // These don't count towards the total allocations and allocated bytes.
+    void setLocationTotals(const Allocation& location_totals);
+
+    // Close the current version and return the state of every location that
+    // changed after since_version, including locations that no longer hold
+    // any memory. If since_version is 0, or too old to compute a delta from,
+    // every location holding memory is returned and is_full is set.
+    SnapshotDelta getSnapshotDelta(uint64_t since_version);
+
+    // Return the totals of every location currently holding memory.
+    std::vector<Allocation> getLiveLocations() const;
+
+    // Return the state of every location that changed since the last call,
+    // independently of the versions used by getSnapshotDelta.
+    std::vector<std::pair<size_t, Allocation>> takeChangesSinceLastSample();
+
+    // Running totals, kept up to date as allocations are added.
+    size_t getHeapSize() const;
+    uint64_t getTotalAllocations() const;
+    uint64_t getTotalAllocatedBytes() const;
+
+  private:
+    struct LocationState
+    {
+        Allocation allocation;
+        uint64_t changed_in_version{0};
+        bool changed_since_sample{false};
+    };
+
+    struct LiveAllocation
+    {
+        size_t location_id;
+        size_t size;
+    };
+
+    size_t getLocationId(const Allocation& allocation);
+    LocationState& changedLocation(size_t location_id);
+
+    uint64_t d_version{1};
+    std::vector<LocationState> d_locations;
+    std::unordered_map<LocationKey, size_t, index_thread_pair_hash> d_location_ids;
+    std::unordered_map<uintptr_t, LiveAllocation> d_ptr_to_allocation;
+    IntervalTree<size_t> d_interval_tree;
+    std::vector<size_t> d_dirty_locations;
+    std::vector<size_t> d_sample_dirty_locations;
+    size_t d_heap_size{0};
+    uint64_t d_total_allocations{0};
+    uint64_t d_total_allocated_bytes{0};
+    std::deque<std::pair<uint64_t, std::vector<size_t>>> d_retained_versions;
+};
+
+// A sliding window of periodic samples of the locations tracked by an
+// IncrementalSnapshotAggregator. Each sample only stores the locations that
+// changed since the previous one, and samples that fall out of the window are
+// folded into a base state, so memory use grows with how much changed during
+// the window rather than with the number of samples.
+class SnapshotHistory
+{
+  public:
+    explicit SnapshotHistory(uint64_t retention_ms);
+
+    void addSample(uint64_t timestamp_ms, std::vector<std::pair<size_t, Allocation>> changed_locations);
+    std::vector<uint64_t> getTimestamps() const;
+    // Return the totals of every location that held memory when the sample
+    // with the given index (oldest first) was taken.
+    std::vector<Allocation> getLiveLocationsAt(size_t sample_index) const;
+
+  private:
+    struct Sample
+    {
+        uint64_t timestamp_ms;
+        std::vector<std::pair<size_t, Allocation>> changed_locations;
+    };
+
+    static void applySample(const Sample& sample, std::vector<Allocation>* locations);
+
+    uint64_t d_retention_ms;
+    std::vector<Allocation> d_base;
+    std::deque<Sample> d_samples;
+};
+
 PyObject*
 Py_ListFromSnapshotAllocationRecords(const reduced_snapshot_map_t& stack_to_allocation);
 
+PyObject*
+Py_TupleFromSnapshotDelta(const SnapshotDelta& delta);
+
 struct HighWatermark
 {
     size_t index{0};
@@ -311,6 +419,14 @@ class UsageHistory
             const std::vector<size_t>& highest_peak_by_snapshot,
             size_t current_peak) const;
 
+    // Merge consecutive completed snapshots, as HighWaterMarkAggregator
+    // does: `kept_snapshots` holds, for each new snapshot, the old snapshot
+    // whose high water mark it keeps.
+    void compactSnapshots(
+            const std::vector<size_t>& highest_peak_by_snapshot,
+            const std::vector<size_t>& kept_snapshots);
+    size_t numHistoricalContributions() const noexcept;
+
   private:
     // This class represents allocations observed at some location over time.
     // When an allocation or deallocation is observed, we first check if a new
@@ -358,6 +474,44 @@ struct AllocationLifetime
     size_t n_bytes;
 };
 
+// An open addressing hash table mapping the address of each live allocation
+// to its size and to the ID of the location that made it. Entries are stored
+// inline in one array that's probed linearly, so each one takes a few dozen
+// bytes instead of the hundred or so that a node of an std::unordered_map
+// holding a whole Allocation takes.
+class LiveAllocationTable
+{
+  public:
+    struct Entry
+    {
+        uintptr_t address;
+        size_t size;
+        size_t location_id;
+    };
+
+    // Add an entry, replacing any entry for the same address.
+    void insert(const Entry& entry);
+    // Remove the entry for the given address, returning it if there was one.
+    std::optional<Entry> remove(uintptr_t address);
+
+    size_t size() const noexcept;
+    size_t memoryUsage() const noexcept;
+
+  private:
+    // Slots with this address are empty, so the (unlikely) entry for the
+    // null pointer is kept aside.
+    static constexpr uintptr_t EMPTY_SLOT = 0;
+    static constexpr size_t MIN_CAPACITY = 16;
+
+    size_t homeSlot(uintptr_t address) const noexcept;
+    size_t findSlot(uintptr_t address) const noexcept;
+    void rehash(size_t new_capacity);
+
+    std::vector<Entry> d_slots;
+    size_t d_size{0};
+    std::optional<Entry> d_null_entry;
+};
+
 class HighWaterMarkAggregator
 {
   public:
@@ -366,6 +520,15 @@ class HighWaterMarkAggregator
     void addAllocation(const Allocation& allocation);
     void captureSnapshot();
 
+    // Halve the number of completed snapshots by merging each pair of
+    // consecutive ones into a snapshot that ends where the second one ends,
+    // and keeps whichever of their high water marks is higher. This bounds
+    // the memory used by each location's history at the cost of resolution.
+    void compactSnapshots();
+    size_t numSnapshots() const noexcept;
+    // An estimate of the memory used by this aggregator, in bytes.
+    size_t memoryUsage() const noexcept;
+
     size_t getCurrentHeapSize() const noexcept;
     std::vector<size_t> highWaterMarkBytesBySnapshot() const;
     Index generateIndex() const;
@@ -388,22 +551,65 @@ class HighWaterMarkAggregator
     size_t d_heap_size_at_last_peak{};
     size_t d_current_heap_size{};
 
-    // Information about allocations and deallocations, aggregated by location.
-    using UsageHistoryByLocation =
-            std::unordered_map<HighWaterMarkLocationKey, UsageHistory, HighWaterMarkLocationKeyHash>;
-    UsageHistoryByLocation d_usage_history_by_location;
+    // Information about allocations and deallocations, aggregated by location
+    // and indexed by location ID.
+    struct LocationUsage
+    {
+        HighWaterMarkLocationKey key;
+        UsageHistory history;
+    };
+    std::vector<LocationUsage> d_usage_by_location;
+    std::unordered_map<HighWaterMarkLocationKey, size_t, HighWaterMarkLocationKeyHash> d_location_ids;
+    size_t d_num_historical_contributions{0};
 
     // Simple allocations contributing to the current heap size.
-    std::unordered_map<uintptr_t, Allocation> d_ptr_to_allocation;
+    LiveAllocationTable d_live_allocations;
 
-    // Ranged allocations contributing to the current heap size.
-    IntervalTree<Allocation> d_mmap_intervals;
+    // Ranged allocations contributing to the current heap size, by location ID.
+    IntervalTree<size_t> d_mmap_intervals;
 
-    UsageHistory& getUsageHistory(const Allocation& allocation);
-    void recordUsageDelta(const Allocation& allocation, size_t count_delta, size_t bytes_delta);
+    size_t getLocationId(const Allocation& allocation);
+    void recordUsageDelta(size_t location_id, size_t count_delta, size_t bytes_delta);
     reduced_snapshot_map_t getAllocations(bool merge_threads, bool stop_at_high_water_mark) const;
 };
 
+// Rebuilds the index that a HighWaterMarkAggregator would generate from the
+// intervals stored in an AGGREGATED_ALLOCATIONS capture file, possibly with
+// threads merged.
+class AggregatedCaptureIntervalReaggregator
+{
+  public:
+    void addInterval(const AggregatedAllocationInterval& interval);
+    std::vector<AllocationLifetime> generateIndex(bool merge_threads) const;
+
+  private:
+    std::vector<AllocationLifetime> d_lifetimes;
+};
+
+// Counts temporary allocations by location while tracking, for the
+// AGGREGATED_ALLOCATIONS format. Each allocation that's deallocated before
+// its thread makes more than `max_distance` other allocations is counted
+// along with how many its thread made, so that temporary allocations can
+// later be found for any threshold up to `max_distance`.
+class TemporaryAllocationsCounter
+{
+  public:
+    explicit TemporaryAllocationsCounter(size_t max_distance);
+    void addAllocation(const Allocation& allocation);
+    size_t maxDistance() const noexcept;
+    // An estimate of the memory used by this counter, in bytes.
+    size_t memoryUsage() const noexcept;
+
+    using temporary_allocations_callback_t = std::function<bool(const AggregatedTemporaryAllocations&)>;
+    bool visitTemporaryAllocations(const temporary_allocations_callback_t& callback) const;
+
+  private:
+    size_t d_max_distance;
+    std::unordered_map<thread_id_t, std::deque<Allocation>> d_recent_allocations{};
+    std::unordered_map<HighWaterMarkLocationKey, std::vector<Contribution>, HighWaterMarkLocationKeyHash>
+            d_contributions_by_distance{};
+};
+
 class AllocationLifetimeAggregator
 {
   public:
@@ -458,6 +664,22 @@ class AllocationStatsAggregator
   public:
     void addAllocation(const Allocation& allocation, std::optional<frame_id_t> python_frame_id);
 
+    // Count an allocation without tracking the heap's peak, for callers that
+    // already track the peak some other way. Deallocations are ignored.
+    void countAllocation(const Allocation& allocation, std::optional<frame_id_t> python_frame_id);
+
+    // Support for AGGREGATED_ALLOCATIONS captures, which store the totals as
+    // a list of entries rather than every allocation, along with each
+    // location's contribution to the high water mark.
+    using stats_entry_callback_t = std::function<bool(const AllocationStatsEntry&)>;
+    bool visitStatsEntries(const stats_entry_callback_t& callback) const;
+    void addStatsEntry(const AllocationStatsEntry& entry);
+    void addHighWaterMarkContribution(const Allocation& allocation);
+
+    // An estimate of the memory used by the totals kept by countAllocation(),
+    // in bytes.
+    size_t memoryUsage() const noexcept;
+
     uint64_t totalAllocations()
     {
         return d_total_allocations;
@@ -1,6 +1,8 @@
 from _memray.hooks cimport Allocator
 from _memray.records cimport AggregatedAllocation
+from _memray.records cimport AggregatedAllocationInterval
 from _memray.records cimport Allocation
+from _memray.records cimport AllocationStatsEntry
 from _memray.records cimport optional_frame_id_t
 from libc.stdint cimport uint64_t
 from libcpp cimport bool
@@ -38,6 +40,23 @@ cdef extern from "snapshot.h" namespace "memray::api":
     cdef cppclass AggregatedCaptureReaggregator(AbstractAggregator):
         pass
 
+    cdef cppclass SnapshotDelta:
+        pass
+
+    cdef cppclass IncrementalSnapshotAggregator(AbstractAggregator):
+        SnapshotDelta getSnapshotDelta(uint64_t since_version) except+
+        vector[pair[size_t, Allocation]] takeChangesSinceLastSample() except+
+        void setLocationTotals(const Allocation& location_totals) except+
+        size_t getHeapSize()
+        uint64_t getTotalAllocations()
+        uint64_t getTotalAllocatedBytes()
+
+    cdef cppclass SnapshotHistory:
+        SnapshotHistory(uint64_t retention_ms)
+        void addSample(uint64_t timestamp_ms, vector[pair[size_t, Allocation]] changed_locations) except+
+        vector[uint64_t] getTimestamps() except+
+        vector[Allocation] getLiveLocationsAt(size_t sample_index) except+
+
     cdef cppclass LocationKey:
         size_t python_frame_id
         size_t native_frame_id
@@ -77,8 +96,14 @@ cdef extern from "snapshot.h" namespace "memray::api":
         vector[size_t] highWaterMarkBytesBySnapshot() except+
         vector[AllocationLifetime] generateIndex() except+
 
+    cdef cppclass AggregatedCaptureIntervalReaggregator:
+        void addInterval(const AggregatedAllocationInterval& interval) except+
+        vector[AllocationLifetime] generateIndex(bool merge_threads) except+
+
     cdef cppclass AllocationStatsAggregator:
         void addAllocation(const Allocation&, optional_frame_id_t python_frame_id) except+
+        void addStatsEntry(const AllocationStatsEntry& entry) except+
+        void addHighWaterMarkContribution(const Allocation& allocation) except+
         uint64_t totalAllocations()
         uint64_t totalBytesAllocated()
         uint64_t peakBytesAllocated()
@@ -88,4 +113,5 @@ cdef extern from "snapshot.h" namespace "memray::api":
         vector[pair[uint64_t, optional_frame_id_t]] topLocationsByCount(size_t num_largest) except+
 
     object Py_ListFromSnapshotAllocationRecords(const reduced_snapshot_map_t&) except+
+    object Py_TupleFromSnapshotDelta(const SnapshotDelta&) except+
     object Py_GetSnapshotAllocationRecords(const vector[Allocation]& all_records, size_t record_index, bool merge_threads) except+
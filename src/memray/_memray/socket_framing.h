@@ -0,0 +1,26 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+
+namespace memray::io {
+
+// When a SocketSink compresses its output, the stream starts with this magic
+// instead of the capture file header's, so the reader knows to decompress it.
+// Everything after it is sent as a sequence of frames, each made of a
+// CompressedFrameHeader followed by a batch of records. The batch is
+// compressed with the LZ4 block format, unless that didn't make it any
+// smaller, in which case it's sent as is and both sizes in the header match.
+constexpr char COMPRESSED_STREAM_MAGIC[8] = {'m', 'e', 'm', 'r', 'a', 'y', 'z', '\x01'};
+
+// Both sizes are in network byte order.
+struct CompressedFrameHeader
+{
+    uint32_t raw_size;
+    uint32_t stored_size;
+};
+
+// The largest batch of records a sink may put in a single frame.
+constexpr size_t MAX_COMPRESSED_FRAME_SIZE = 1024 * 1024;
+
+}  // namespace memray::io
@@ -1,6 +1,7 @@
 #include "socket_reader_thread.h"
 
-#include <iostream>
+#include <algorithm>
+#include <numeric>
 
 namespace memray::socket_thread {
 
@@ -25,20 +26,27 @@ BackgroundSocketReader::backgroundThreadWorker()
             } break;
 
             case RecordResult::MEMORY_RECORD: {
+                handleMemoryRecord(d_record_reader->getLatestMemoryRecord());
             } break;
 
+            // A live AGGREGATED_ALLOCATIONS stream sends the current totals of
+            // every location that changed, followed by a memory snapshot.
             case RecordResult::AGGREGATED_ALLOCATION_RECORD: {
-                // This should never happen. We checked the source format in
-                // the constructor, and RecordReader should never return
-                // records that don't match the source format.
-                std::cerr << "BUG: AGGREGATED_ALLOCATION_RECORD from ALL_ALLOCATIONS input" << std::endl;
-                abort();
+                std::lock_guard<std::mutex> lock(d_mutex);
+                d_aggregator.setLocationTotals(
+                        d_record_reader->getLatestAggregatedAllocation().contributionToLeaks());
             } break;
 
             case RecordResult::MEMORY_SNAPSHOT: {
-                // As above.
-                std::cerr << "BUG: MEMORY_SNAPSHOT from ALL_ALLOCATIONS input" << std::endl;
-                abort();
+                const api::MemorySnapshot snapshot = d_record_reader->getLatestMemorySnapshot();
+                handleMemoryRecord(api::MemoryRecord{snapshot.ms_since_epoch, snapshot.rss});
+            } break;
+
+            // Only written at the end of an AGGREGATED_ALLOCATIONS capture,
+            // which a live stream never has.
+            case RecordResult::AGGREGATED_ALLOCATION_INTERVAL:
+            case RecordResult::ALLOCATION_STATS:
+            case RecordResult::TEMPORARY_ALLOCATIONS: {
             } break;
 
             case RecordResult::END_OF_FILE:
@@ -49,11 +57,45 @@ BackgroundSocketReader::backgroundThreadWorker()
     }
 }
 
-BackgroundSocketReader::BackgroundSocketReader(std::shared_ptr<api::RecordReader> reader)
+void
+BackgroundSocketReader::handleMemoryRecord(const api::MemoryRecord& record)
+{
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        d_latest_memory_record = record;
+    }
+    maybeTakeHistorySample(record);
+}
+
+void
+BackgroundSocketReader::maybeTakeHistorySample(const api::MemoryRecord& record)
+{
+    if (d_history_retention_ms == 0) {
+        return;
+    }
+    if (d_last_sample_ms && record.ms_since_epoch < *d_last_sample_ms + d_history_interval_ms) {
+        return;
+    }
+    d_last_sample_ms = record.ms_since_epoch;
+
+    std::lock_guard<std::mutex> lock(d_mutex);
+    d_history.addSample(record.ms_since_epoch, d_aggregator.takeChangesSinceLastSample());
+}
+
+BackgroundSocketReader::BackgroundSocketReader(
+        std::shared_ptr<api::RecordReader> reader,
+        uint64_t history_retention_ms,
+        uint64_t history_interval_ms)
 : d_record_reader(reader)
+, d_history_retention_ms(history_retention_ms)
+, d_history_interval_ms(history_interval_ms)
+, d_history(history_retention_ms)
 {
-    if (d_record_reader->getHeader().file_format != api::FileFormat::ALL_ALLOCATIONS) {
-        throw std::runtime_error("BackgroundSocketReader only supports ALL_ALLOCATIONS");
+    const api::FileFormat file_format = d_record_reader->getHeader().file_format;
+    if (file_format != api::FileFormat::ALL_ALLOCATIONS
+        && file_format != api::FileFormat::AGGREGATED_ALLOCATIONS)
+    {
+        throw std::runtime_error("BackgroundSocketReader got an unknown file format");
     }
 }
 
@@ -82,6 +124,274 @@ BackgroundSocketReader::Py_GetSnapshotAllocationRecords(bool merge_threads)
     return api::Py_ListFromSnapshotAllocationRecords(stack_to_allocation);
 }
 
+PyObject*
+BackgroundSocketReader::Py_GetSnapshotDelta(uint64_t since_version)
+{
+    api::SnapshotDelta delta;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        delta = d_aggregator.getSnapshotDelta(since_version);
+    }
+
+    return api::Py_TupleFromSnapshotDelta(delta);
+}
+
+size_t
+BackgroundSocketReader::rollupLocationId(const std::string& function, const std::string& filename)
+{
+    std::string key = function;
+    key.push_back('\0');
+    key.append(filename);
+    auto [it, inserted] = d_rollup_location_ids.try_emplace(std::move(key), d_rollup_locations.size());
+    if (inserted) {
+        d_rollup_locations.emplace_back(function, filename);
+    }
+    return it->second;
+}
+
+const std::vector<size_t>&
+BackgroundSocketReader::rollupStack(const api::Allocation& allocation)
+{
+    // Only the main thread hides frames, so every other thread shares a key.
+    const bool is_main_thread = allocation.tid == d_record_reader->getMainThreadTid();
+    const size_t stack_key = allocation.frame_index * 2 + (is_main_thread ? 1 : 0);
+    auto [it, inserted] = d_rollup_stacks.try_emplace(stack_key);
+    if (!inserted) {
+        return it->second;
+    }
+
+    std::vector<size_t>& stack = it->second;
+    d_record_reader->getPythonStackFrameIds(allocation.frame_index, allocation.tid, &d_rollup_frame_ids);
+    if (d_rollup_frame_ids.empty()) {
+        stack.push_back(rollupLocationId("???", "???"));
+        return stack;
+    }
+
+    for (api::frame_id_t frame_id : d_rollup_frame_ids) {
+        auto frame_it = d_rollup_location_by_frame.find(frame_id);
+        if (frame_it == d_rollup_location_by_frame.end()) {
+            const auto frame = d_record_reader->getPythonFrame(frame_id);
+            size_t location_id = rollupLocationId(frame.function_name, frame.filename);
+            frame_it = d_rollup_location_by_frame.emplace(frame_id, location_id).first;
+        }
+        // Recursive calls only count once towards a location's totals.
+        if (std::find(stack.begin(), stack.end(), frame_it->second) == stack.end()) {
+            stack.push_back(frame_it->second);
+        }
+    }
+    return stack;
+}
+
+PyObject*
+BackgroundSocketReader::Py_GetLocationRollup()
+{
+    std::vector<api::Allocation> live_locations;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        live_locations = d_aggregator.getLiveLocations();
+    }
+    return Py_RollupLocations(live_locations);
+}
+
+PyObject*
+BackgroundSocketReader::Py_GetLiveStats()
+{
+    size_t heap_size;
+    uint64_t total_allocations;
+    uint64_t total_allocated_bytes;
+    std::optional<api::MemoryRecord> memory_record;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        heap_size = d_aggregator.getHeapSize();
+        total_allocations = d_aggregator.getTotalAllocations();
+        total_allocated_bytes = d_aggregator.getTotalAllocatedBytes();
+        memory_record = d_latest_memory_record;
+    }
+
+    if (!memory_record) {
+        return Py_BuildValue(
+                "nKKOO",
+                static_cast<Py_ssize_t>(heap_size),
+                static_cast<unsigned long long>(total_allocations),
+                static_cast<unsigned long long>(total_allocated_bytes),
+                Py_None,
+                Py_None);
+    }
+    return Py_BuildValue(
+            "nKKnK",
+            static_cast<Py_ssize_t>(heap_size),
+            static_cast<unsigned long long>(total_allocations),
+            static_cast<unsigned long long>(total_allocated_bytes),
+            static_cast<Py_ssize_t>(memory_record->rss),
+            static_cast<unsigned long long>(memory_record->ms_since_epoch));
+}
+
+PyObject*
+BackgroundSocketReader::Py_GetHistoryTimestamps()
+{
+    std::vector<uint64_t> timestamps;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        timestamps = d_history.getTimestamps();
+    }
+
+    PyObject* list = PyList_New(timestamps.size());
+    if (list == nullptr) {
+        return nullptr;
+    }
+    for (size_t i = 0; i < timestamps.size(); ++i) {
+        PyObject* timestamp = PyLong_FromUnsignedLongLong(timestamps[i]);
+        if (timestamp == nullptr) {
+            Py_DECREF(list);
+            return nullptr;
+        }
+        PyList_SET_ITEM(list, i, timestamp);
+    }
+    return list;
+}
+
+PyObject*
+BackgroundSocketReader::Py_GetHistoryLocationRollup(size_t sample_index)
+{
+    std::vector<api::Allocation> live_locations;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        live_locations = d_history.getLiveLocationsAt(sample_index);
+    }
+    return Py_RollupLocations(live_locations);
+}
+
+PyObject*
+BackgroundSocketReader::Py_GetHistorySnapshotAllocationRecords(size_t sample_index)
+{
+    std::vector<api::Allocation> live_locations;
+    {
+        std::lock_guard<std::mutex> lock(d_mutex);
+        live_locations = d_history.getLiveLocationsAt(sample_index);
+    }
+
+    PyObject* list = PyList_New(live_locations.size());
+    if (list == nullptr) {
+        return nullptr;
+    }
+    for (size_t i = 0; i < live_locations.size(); ++i) {
+        PyObject* record = live_locations[i].toPythonObject();
+        if (record == nullptr) {
+            Py_DECREF(list);
+            return nullptr;
+        }
+        PyList_SET_ITEM(list, i, record);
+    }
+    return list;
+}
+
+PyObject*
+BackgroundSocketReader::Py_RollupLocations(const std::vector<api::Allocation>& live_locations)
+{
+    struct LocationTotals
+    {
+        size_t own_memory{0};
+        size_t total_memory{0};
+        size_t n_allocations{0};
+        std::vector<api::thread_id_t> thread_ids;
+    };
+
+    std::lock_guard<std::mutex> rollup_lock(d_rollup_mutex);
+    std::vector<LocationTotals> totals(d_rollup_locations.size());
+    std::vector<api::thread_id_t> thread_ids;
+    for (const auto& allocation : live_locations) {
+        const std::vector<size_t>& stack = rollupStack(allocation);
+        if (totals.size() < d_rollup_locations.size()) {
+            totals.resize(d_rollup_locations.size());
+        }
+        for (size_t i = 0; i < stack.size(); ++i) {
+            LocationTotals& location = totals[stack[i]];
+            if (i == 0) {
+                location.own_memory += allocation.size;
+            }
+            location.total_memory += allocation.size;
+            location.n_allocations += allocation.n_allocations;
+            auto& tids = location.thread_ids;
+            if (std::find(tids.begin(), tids.end(), allocation.tid) == tids.end()) {
+                tids.push_back(allocation.tid);
+            }
+        }
+        if (std::find(thread_ids.begin(), thread_ids.end(), allocation.tid) == thread_ids.end()) {
+            thread_ids.push_back(allocation.tid);
+        }
+    }
+
+    std::vector<size_t> order;
+    for (size_t location_id = 0; location_id < totals.size(); ++location_id) {
+        if (totals[location_id].n_allocations != 0) {
+            order.push_back(location_id);
+        }
+    }
+    std::sort(order.begin(), order.end(), [&](size_t lhs, size_t rhs) {
+        return totals[lhs].total_memory > totals[rhs].total_memory;
+    });
+
+    PyObject* rows = PyList_New(order.size());
+    if (rows == nullptr) {
+        return nullptr;
+    }
+    for (size_t row_index = 0; row_index < order.size(); ++row_index) {
+        const auto& [function, filename] = d_rollup_locations[order[row_index]];
+        LocationTotals& location = totals[order[row_index]];
+        std::sort(location.thread_ids.begin(), location.thread_ids.end());
+
+        PyObject* tids = PyTuple_New(location.thread_ids.size());
+        if (tids == nullptr) {
+            Py_DECREF(rows);
+            return nullptr;
+        }
+        for (size_t i = 0; i < location.thread_ids.size(); ++i) {
+            PyObject* tid = PyLong_FromUnsignedLong(location.thread_ids[i]);
+            if (tid == nullptr) {
+                Py_DECREF(tids);
+                Py_DECREF(rows);
+                return nullptr;
+            }
+            PyTuple_SET_ITEM(tids, i, tid);
+        }
+
+        PyObject* row = Py_BuildValue(
+                "(ssnnnN)",
+                function.c_str(),
+                filename.c_str(),
+                static_cast<Py_ssize_t>(location.own_memory),
+                static_cast<Py_ssize_t>(location.total_memory),
+                static_cast<Py_ssize_t>(location.n_allocations),
+                tids);
+        if (row == nullptr) {
+            Py_DECREF(rows);
+            return nullptr;
+        }
+        PyList_SET_ITEM(rows, row_index, row);
+    }
+
+    PyObject* thread_names = PyDict_New();
+    if (thread_names == nullptr) {
+        Py_DECREF(rows);
+        return nullptr;
+    }
+    for (api::thread_id_t tid : thread_ids) {
+        PyObject* key = PyLong_FromUnsignedLong(tid);
+        const std::string thread_name = d_record_reader->getThreadName(tid);
+        PyObject* name = key ? PyUnicode_FromString(thread_name.c_str()) : nullptr;
+        int ret = name ? PyDict_SetItem(thread_names, key, name) : -1;
+        Py_XDECREF(key);
+        Py_XDECREF(name);
+        if (ret != 0) {
+            Py_DECREF(thread_names);
+            Py_DECREF(rows);
+            return nullptr;
+        }
+    }
+
+    return Py_BuildValue("(NN)", rows, thread_names);
+}
+
 bool
 BackgroundSocketReader::is_active() const
 {
@@ -6,7 +6,12 @@
 #include <atomic>
 #include <memory>
 #include <mutex>
+#include <optional>
+#include <string>
 #include <thread>
+#include <unordered_map>
+#include <utility>
+#include <vector>
 
 #include "record_reader.h"
 #include "snapshot.h"
@@ -22,10 +27,34 @@ class BackgroundSocketReader
     std::mutex d_mutex;
     std::shared_ptr<api::RecordReader> d_record_reader;
 
-    api::SnapshotAllocationAggregator d_aggregator;
+    api::IncrementalSnapshotAggregator d_aggregator;
+    std::optional<api::MemoryRecord> d_latest_memory_record;
     std::thread d_thread;
 
+    // Samples of the aggregator's locations, taken when memory records arrive
+    // at least d_history_interval_ms apart. Disabled if the retention is 0.
+    const uint64_t d_history_retention_ms;
+    const uint64_t d_history_interval_ms;
+    std::optional<uint64_t> d_last_sample_ms;
+    api::SnapshotHistory d_history;
+
+    // Function/file locations that Python frames are rolled up into, and
+    // the distinct locations in each Python stack, from the most recent call.
+    // Frames and stacks never change once they've been read, so these are
+    // cached across calls to Py_GetLocationRollup.
+    std::mutex d_rollup_mutex;
+    std::vector<std::pair<std::string, std::string>> d_rollup_locations;
+    std::unordered_map<std::string, size_t> d_rollup_location_ids;
+    std::unordered_map<api::frame_id_t, size_t> d_rollup_location_by_frame;
+    std::unordered_map<size_t, std::vector<size_t>> d_rollup_stacks;
+    std::vector<api::frame_id_t> d_rollup_frame_ids;
+
     void backgroundThreadWorker();
+    size_t rollupLocationId(const std::string& function, const std::string& filename);
+    const std::vector<size_t>& rollupStack(const api::Allocation& allocation);
+    PyObject* Py_RollupLocations(const std::vector<api::Allocation>& live_locations);
+    void handleMemoryRecord(const api::MemoryRecord& record);
+    void maybeTakeHistorySample(const api::MemoryRecord& record);
 
   public:
     BackgroundSocketReader(BackgroundSocketReader& other) = delete;
@@ -33,12 +62,23 @@ class BackgroundSocketReader
     void operator=(const BackgroundSocketReader&) = delete;
     void operator=(BackgroundSocketReader&&) = delete;
 
-    explicit BackgroundSocketReader(std::shared_ptr<api::RecordReader> reader);
+    explicit BackgroundSocketReader(
+            std::shared_ptr<api::RecordReader> reader,
+            uint64_t history_retention_ms = 0,
+            uint64_t history_interval_ms = 1000);
     ~BackgroundSocketReader();
 
     void start();
     bool is_active() const;
     PyObject* Py_GetSnapshotAllocationRecords(bool merge_threads);
+    PyObject* Py_GetSnapshotDelta(uint64_t since_version);
+    PyObject* Py_GetLocationRollup();
+    // (heap_size, total_allocations, total_allocated_bytes, rss, ms_since_epoch)
+    // where the last two are None until the first memory record arrives.
+    PyObject* Py_GetLiveStats();
+    PyObject* Py_GetHistoryTimestamps();
+    PyObject* Py_GetHistoryLocationRollup(size_t sample_index);
+    PyObject* Py_GetHistorySnapshotAllocationRecords(size_t sample_index);
 };
 
 }  // namespace memray::socket_thread
@@ -1,4 +1,5 @@
 from _memray.record_reader cimport RecordReader
+from libc.stdint cimport uint64_t
 from libcpp cimport bool
 from libcpp cimport int
 from libcpp.memory cimport shared_ptr
@@ -7,7 +8,18 @@ from libcpp.memory cimport shared_ptr
 cdef extern from "socket_reader_thread.h" namespace "memray::socket_thread":
     cdef cppclass BackgroundSocketReader:
         BackgroundSocketReader(shared_ptr[RecordReader]) except+
+        BackgroundSocketReader(
+            shared_ptr[RecordReader],
+            uint64_t history_retention_ms,
+            uint64_t history_interval_ms,
+        ) except+
 
         void start() except+
         bool is_active()
         object Py_GetSnapshotAllocationRecords(bool merge_threads)
+        object Py_GetSnapshotDelta(uint64_t since_version)
+        object Py_GetLocationRollup()
+        object Py_GetLiveStats()
+        object Py_GetHistoryTimestamps()
+        object Py_GetHistoryLocationRollup(size_t sample_index) except+
+        object Py_GetHistorySnapshotAllocationRecords(size_t sample_index) except+
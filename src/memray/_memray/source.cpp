@@ -3,12 +3,20 @@
 
 #include <cerrno>
 #include <cstring>
+#include <fcntl.h>
 #include <iostream>
 #include <netdb.h>
 #include <stdexcept>
+#include <sys/file.h>
+#include <sys/mman.h>
 #include <sys/socket.h>
+#include <sys/stat.h>
 #include <unistd.h>
 
+#include <arpa/inet.h>
+#include <lz4.h>
+
+#include <algorithm>
 #include <chrono>
 #include <thread>
 
@@ -136,6 +144,13 @@ SocketBuf::underflow()
         return traits_type::to_int_type(*gptr());
     }
 
+    if (d_mode == StreamMode::UNKNOWN) {
+        d_mode = isCompressedStream() ? StreamMode::COMPRESSED : StreamMode::RAW;
+    }
+    if (d_mode == StreamMode::COMPRESSED) {
+        return underflowCompressed();
+    }
+
     ssize_t bytes_read;
     do {
         bytes_read = ::recv(d_sockfd, d_buf, MAX_BUF_SIZE, 0);
@@ -156,6 +171,84 @@ SocketBuf::underflow()
     return traits_type::to_int_type(*gptr());
 }
 
+bool
+SocketBuf::isCompressedStream()
+{
+    char magic[sizeof(COMPRESSED_STREAM_MAGIC)];
+    ssize_t bytes_read;
+    do {
+        bytes_read = ::recv(d_sockfd, magic, sizeof(magic), MSG_PEEK | MSG_WAITALL);
+    } while (bytes_read < 0 && errno == EINTR);
+
+    if (bytes_read != sizeof(magic) || 0 != ::memcmp(magic, COMPRESSED_STREAM_MAGIC, sizeof(magic))) {
+        return false;
+    }
+    return recvAll(magic, sizeof(magic));
+}
+
+bool
+SocketBuf::recvAll(char* data, size_t length)
+{
+    while (length) {
+        ssize_t bytes_read = ::recv(d_sockfd, data, length, 0);
+        if (bytes_read < 0 && errno == EINTR) {
+            continue;
+        }
+        if (bytes_read <= 0) {
+            if (bytes_read < 0 && d_open) {
+                LOG(ERROR) << "Encountered error in 'recv' call: " << strerror(errno);
+            }
+            return false;
+        }
+        data += bytes_read;
+        length -= bytes_read;
+    }
+    return true;
+}
+
+int
+SocketBuf::underflowCompressed()
+{
+    CompressedFrameHeader header;
+    if (!recvAll(reinterpret_cast<char*>(&header), sizeof(header))) {
+        return traits_type::eof();
+    }
+
+    size_t raw_size = ntohl(header.raw_size);
+    size_t stored_size = ntohl(header.stored_size);
+    if (raw_size == 0 || raw_size > MAX_COMPRESSED_FRAME_SIZE || stored_size > raw_size) {
+        LOG(ERROR) << "Received a corrupt frame from the tracked process";
+        return traits_type::eof();
+    }
+
+    if (!d_frame) {
+        d_frame.reset(new char[MAX_COMPRESSED_FRAME_SIZE]);
+        d_compressed_frame.reset(new char[MAX_COMPRESSED_FRAME_SIZE]);
+    }
+
+    if (stored_size == raw_size) {
+        if (!recvAll(d_frame.get(), raw_size)) {
+            return traits_type::eof();
+        }
+    } else {
+        if (!recvAll(d_compressed_frame.get(), stored_size)) {
+            return traits_type::eof();
+        }
+        int decompressed_size = LZ4_decompress_safe(
+                d_compressed_frame.get(),
+                d_frame.get(),
+                static_cast<int>(stored_size),
+                static_cast<int>(MAX_COMPRESSED_FRAME_SIZE));
+        if (decompressed_size < 0 || static_cast<size_t>(decompressed_size) != raw_size) {
+            LOG(ERROR) << "Failed to decompress a frame from the tracked process";
+            return traits_type::eof();
+        }
+    }
+
+    setg(d_frame.get(), d_frame.get(), d_frame.get() + raw_size);
+    return traits_type::to_int_type(*gptr());
+}
+
 std::streamsize
 SocketBuf::xsgetn(char* destination, std::streamsize length)
 {
@@ -179,7 +272,7 @@ SocketBuf::xsgetn(char* destination, std::streamsize length)
     return length;
 }
 
-SocketSource::SocketSource(int port)
+SocketSource::SocketSource(int port, const std::string& allocation_filter)
 {
     struct addrinfo hints = {};
     struct addrinfo* all_addresses = nullptr;
@@ -232,6 +325,26 @@ SocketSource::SocketSource(int port)
     }
 
     freeaddrinfo(all_addresses);
+
+    // Tell the tracked process which allocations we're interested in before
+    // it starts sending us any.
+    const char* data = allocation_filter.data();
+    size_t remaining = allocation_filter.size();
+    while (remaining) {
+        ssize_t ret;
+        Py_BEGIN_ALLOW_THREADS;
+        ret = ::send(d_sockfd, data, remaining, 0);
+        Py_END_ALLOW_THREADS;
+        if (ret < 0 && errno != EINTR) {
+            LOG(ERROR) << "Encountered error sending the allocation filter: " << strerror(errno);
+            ::close(d_sockfd);
+            throw IoError{"Failed to send the allocation filter"};
+        } else if (ret >= 0) {
+            data += ret;
+            remaining -= ret;
+        }
+    }
+
     d_is_open = true;
     d_socket_buf = std::make_unique<SocketBuf>(d_sockfd);
 }
@@ -291,4 +404,197 @@ SocketSource::~SocketSource()
     _close();
 }
 
+SharedMemorySource::SharedMemorySource(const std::string& name)
+: d_name(name)
+{
+    bool attached = false;
+    while (!attached) {
+        attached = attach();
+        if (!attached) {
+            LOG(DEBUG) << "No shared memory segment yet, sleeping before retrying...";
+            Py_BEGIN_ALLOW_THREADS;
+            std::this_thread::sleep_for(std::chrono::milliseconds(100));
+            Py_END_ALLOW_THREADS;
+        }
+        // Give a chance to check for signals arriving so we don't block the main thread.
+        if (PyErr_CheckSignals() < 0) {
+            break;
+        }
+    }
+    d_is_open = attached;
+}
+
+bool
+SharedMemorySource::attach()
+{
+    d_fd = ::shm_open(d_name.c_str(), O_RDWR, 0);
+    if (d_fd == -1) {
+        if (errno == ENOENT) {
+            return false;
+        }
+        LOG(ERROR) << "Encountered error in 'shm_open' call: " << strerror(errno);
+        throw IoError{"Failed to open shared memory segment " + d_name};
+    }
+
+    struct stat info;
+    if (::fstat(d_fd, &info) == -1 || static_cast<size_t>(info.st_size) < sharedMemoryRingDataOffset()) {
+        // The tracked process hasn't finished creating the segment yet.
+        detach();
+        return false;
+    }
+
+    d_mapping_size = info.st_size;
+    d_mapping = ::mmap(nullptr, d_mapping_size, PROT_READ | PROT_WRITE, MAP_SHARED, d_fd, 0);
+    if (d_mapping == MAP_FAILED) {
+        LOG(ERROR) << "Encountered error in 'mmap' call: " << strerror(errno);
+        d_mapping = nullptr;
+        detach();
+        throw IoError{"Failed to map shared memory segment " + d_name};
+    }
+
+    d_header = static_cast<SharedMemoryRingHeader*>(d_mapping);
+    if (d_header->magic.load(std::memory_order_acquire) != SHARED_MEMORY_RING_MAGIC) {
+        detach();
+        return false;
+    }
+    if (sharedMemoryRingDataOffset() + d_header->capacity != d_mapping_size) {
+        detach();
+        throw IoError{d_name + " is not a memray shared memory segment"};
+    }
+
+    bool expected = false;
+    if (!d_header->reader_attached.compare_exchange_strong(expected, true)) {
+        detach();
+        throw IoError{"Another reader is already attached to " + d_name};
+    }
+    d_data = static_cast<const char*>(d_mapping) + sharedMemoryRingDataOffset();
+    d_mask = d_header->capacity - 1;
+    return true;
+}
+
+bool
+SharedMemorySource::writerIsAlive() const
+{
+    // The writer holds an exclusive lock until it exits. If the lock can't
+    // be checked at all, assume the writer is still there.
+    if (::flock(d_fd, LOCK_SH | LOCK_NB) == 0) {
+        ::flock(d_fd, LOCK_UN);
+        return false;
+    }
+    return true;
+}
+
+bool
+SharedMemorySource::waitForData()
+{
+    unsigned int idle_rounds = 0;
+    while (d_write_offset == d_read_offset) {
+        d_write_offset = d_header->write_offset.load(std::memory_order_acquire);
+        if (d_write_offset != d_read_offset) {
+            break;
+        }
+        if (!d_is_open) {
+            return false;
+        }
+        if (d_header->writer_closed.load(std::memory_order_acquire)) {
+            // Anything written before the writer closed is visible now.
+            d_write_offset = d_header->write_offset.load(std::memory_order_acquire);
+            return d_write_offset != d_read_offset;
+        }
+        // Poll quickly while records are flowing, and back off when idle.
+        if (idle_rounds++ < 100) {
+            std::this_thread::sleep_for(std::chrono::microseconds(10));
+            continue;
+        }
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+        if (idle_rounds % 100 == 0 && !writerIsAlive()) {
+            // The tracked process died without closing the ring, which is
+            // what a socket reader would see as the connection dropping.
+            d_write_offset = d_header->write_offset.load(std::memory_order_acquire);
+            return d_write_offset != d_read_offset;
+        }
+    }
+    return true;
+}
+
+bool
+SharedMemorySource::read(char* result, ssize_t length)
+{
+    if (!d_is_open) {
+        return false;
+    }
+
+    const uint64_t capacity = d_mask + 1;
+    while (length > 0) {
+        if (!waitForData()) {
+            return false;
+        }
+        uint64_t start = d_read_offset & d_mask;
+        size_t chunk = std::min(
+                {static_cast<uint64_t>(length), d_write_offset - d_read_offset, capacity - start});
+        ::memcpy(result, d_data + start, chunk);
+        d_read_offset += chunk;
+        result += chunk;
+        length -= chunk;
+        d_header->read_offset.store(d_read_offset, std::memory_order_release);
+    }
+    return true;
+}
+
+bool
+SharedMemorySource::getline(std::string& result, char delimiter)
+{
+    char buf;
+    while (true) {
+        if (!read(&buf, 1)) {
+            return false;
+        }
+        if (buf == delimiter) {
+            break;
+        }
+        result.push_back(buf);
+    }
+    return true;
+}
+
+void
+SharedMemorySource::close()
+{
+    if (!d_is_open) {
+        return;
+    }
+    d_is_open = false;
+    // Unblock the writer if it's waiting for room in the ring. The mapping
+    // itself is kept until we're destroyed, since another thread may still
+    // be reading from it.
+    d_header->reader_closed.store(true, std::memory_order_release);
+}
+
+bool
+SharedMemorySource::is_open()
+{
+    return d_is_open;
+}
+
+void
+SharedMemorySource::detach()
+{
+    if (d_mapping && ::munmap(d_mapping, d_mapping_size) != 0) {
+        LOG(ERROR) << "Failed to unmap shared memory segment: " << strerror(errno);
+    }
+    if (d_fd != -1) {
+        ::close(d_fd);
+    }
+    d_fd = -1;
+    d_mapping = nullptr;
+    d_header = nullptr;
+    d_data = nullptr;
+}
+
+SharedMemorySource::~SharedMemorySource()
+{
+    close();
+    detach();
+}
+
 }  // namespace memray::io
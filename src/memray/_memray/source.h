@@ -7,6 +7,8 @@
 #include <string>
 
 #include "lz4_stream.h"
+#include "shared_memory.h"
+#include "socket_framing.h"
 
 namespace memray::io {
 
@@ -54,11 +56,19 @@ class SocketBuf : public std::streambuf
     void close();
 
   private:
+    enum class StreamMode { UNKNOWN, RAW, COMPRESSED };
+
     int underflow() override;
     std::streamsize xsgetn(char_type* s, std::streamsize n) override;
+    bool isCompressedStream();
+    bool recvAll(char* data, size_t length);
+    int underflowCompressed();
     int d_sockfd{-1};
     char d_buf[MAX_BUF_SIZE];
     std::atomic<bool> d_open{true};
+    StreamMode d_mode{StreamMode::UNKNOWN};
+    std::unique_ptr<char[]> d_frame{nullptr};
+    std::unique_ptr<char[]> d_compressed_frame{nullptr};
 };
 
 class SocketSource : public Source
@@ -69,7 +79,7 @@ class SocketSource : public Source
     void operator=(const SocketSource&) = delete;
     void operator=(SocketSource&&) = delete;
 
-    SocketSource(int port);
+    SocketSource(int port, const std::string& allocation_filter);
     ~SocketSource() override;
     void close() override;
     bool is_open() override;
@@ -83,4 +93,39 @@ class SocketSource : public Source
     std::unique_ptr<SocketBuf> d_socket_buf;
 };
 
+class SharedMemorySource : public Source
+{
+  public:
+    SharedMemorySource(SharedMemorySource& other) = delete;
+    SharedMemorySource(SharedMemorySource&& other) = delete;
+    void operator=(const SharedMemorySource&) = delete;
+    void operator=(SharedMemorySource&&) = delete;
+
+    explicit SharedMemorySource(const std::string& name);
+    ~SharedMemorySource() override;
+    void close() override;
+    bool is_open() override;
+    bool read(char* result, ssize_t length) override;
+    bool getline(std::string& result, char delimiter) override;
+
+  private:
+    bool attach();
+    bool waitForData();
+    bool writerIsAlive() const;
+    void detach();
+
+    const std::string d_name;
+    int d_fd{-1};
+    void* d_mapping{nullptr};
+    size_t d_mapping_size{0};
+    SharedMemoryRingHeader* d_header{nullptr};
+    const char* d_data{nullptr};
+    uint64_t d_mask{0};
+    uint64_t d_read_offset{0};
+    // The last write offset seen, so the producer's cache line is only read
+    // once we've consumed everything we knew about.
+    uint64_t d_write_offset{0};
+    std::atomic<bool> d_is_open{false};
+};
+
 }  // namespace memray::io
@@ -5,6 +5,7 @@
 
 #ifdef __linux__
 #    include <link.h>
+#    include <sys/syscall.h>
 #elif defined(__APPLE__)
 #    include "macho_utils.h"
 #    include <mach/mach.h>
@@ -12,6 +13,7 @@
 #endif
 
 #include <algorithm>
+#include <exception>
 #include <mutex>
 #include <type_traits>
 #include <unistd.h>
@@ -19,6 +21,7 @@
 #include "compat.h"
 #include "exceptions.h"
 #include "hooks.h"
+#include "logging.h"
 #include "record_writer.h"
 #include "records.h"
 #include "tracking_api.h"
@@ -70,6 +73,31 @@ thread_id()
     return t_tid;
 }
 
+static inline uint64_t
+native_thread_id()
+{
+    // The same ID that `threading.get_native_id()` returns.
+#ifdef __linux__
+    return static_cast<uint64_t>(::syscall(SYS_gettid));
+#elif defined(__APPLE__)
+    uint64_t tid;
+    pthread_threadid_np(nullptr, &tid);
+    return tid;
+#endif
+}
+
+// Bumped every time a Tracker is created or its allocation filter changes, so
+// that threads know to check again whether they match the filter.
+static std::atomic<unsigned int> s_allocation_filter_generation = 0;
+
+struct ThreadFilterState
+{
+    unsigned int generation;
+    bool matches;
+};
+
+MEMRAY_FAST_TLS thread_local ThreadFilterState t_thread_filter_state{};
+
 // Tracker interface
 
 // This class must have a trivial destructor (and therefore all its instance
@@ -97,6 +125,8 @@ class PythonStackTracker
         PyFrameObject* frame;
         RawFrame raw_frame_record;
         FrameState state;
+        // Only meaningful once the frame has been emitted.
+        bool matches_filter;
     };
 
   public:
@@ -111,6 +141,7 @@ class PythonStackTracker
     static PythonStackTracker& get();
     void emitPendingPushesAndPops();
     void invalidateMostRecentFrameLineNumber();
+    bool hasFramesMatchingFilter() const;
     int pushPythonFrame(PyFrameObject* frame);
     void popPythonFrame();
 
@@ -132,6 +163,10 @@ class PythonStackTracker
     static std::atomic<unsigned int> s_tracker_generation;
 
     uint32_t d_num_pending_pops{};
+    // How many of the emitted frames match the Tracker's location filter, as
+    // of the filter generation that they were last matched against.
+    uint32_t d_num_matching_frames{};
+    unsigned int d_filter_generation{};
     uint32_t d_tracker_generation{};
     std::vector<LazilyEmittedFrame>* d_stack{};
     bool d_greenlet_hooks_installed{};
@@ -184,6 +219,7 @@ PythonStackTracker::emitPendingPushesAndPops()
                 // Line number was wrong; emit an artificial pop so we can push
                 // back in with the right line number.
                 d_num_pending_pops++;
+                d_num_matching_frames -= it->matches_filter;
                 it->state = FrameState::NOT_EMITTED;
                 it->raw_frame_record.lineno = lineno;
             } else {
@@ -199,6 +235,20 @@ PythonStackTracker::emitPendingPushesAndPops()
 
     Tracker* tracker = Tracker::getTracker();
     if (tracker) {
+        // The frames that were already emitted were matched against an
+        // earlier allocation filter, so match them again.
+        if (d_filter_generation != tracker->allocationFilterGeneration()) {
+            d_filter_generation = tracker->allocationFilterGeneration();
+            d_num_matching_frames = 0;
+            for (auto& emitted : *d_stack) {
+                if (emitted.state == FrameState::NOT_EMITTED) {
+                    break;
+                }
+                emitted.matches_filter = tracker->frameMatchesFilter(emitted.raw_frame_record);
+                d_num_matching_frames += emitted.matches_filter;
+            }
+        }
+
         // Emit pending pops
         if (d_num_pending_pops) {
             tracker->popFrames(d_num_pending_pops);
@@ -207,10 +257,11 @@ PythonStackTracker::emitPendingPushesAndPops()
 
         // Emit pending pushes
         for (auto to_emit = first_to_emit; to_emit != d_stack->end(); ++to_emit) {
-            if (!tracker->pushFrame(to_emit->raw_frame_record)) {
+            if (!tracker->pushFrame(to_emit->raw_frame_record, to_emit->matches_filter)) {
                 break;
             }
             to_emit->state = FrameState::EMITTED_AND_LINE_NUMBER_HAS_NOT_CHANGED;
+            d_num_matching_frames += to_emit->matches_filter;
         }
     }
 
@@ -230,6 +281,12 @@ PythonStackTracker::invalidateMostRecentFrameLineNumber()
     }
 }
 
+bool
+PythonStackTracker::hasFramesMatchingFilter() const
+{
+    return d_num_matching_frames != 0;
+}
+
 void
 PythonStackTracker::reloadStackIfTrackerChanged()
 {
@@ -247,6 +304,7 @@ PythonStackTracker::reloadStackIfTrackerChanged()
         d_stack->clear();
     }
     d_num_pending_pops = 0;
+    d_num_matching_frames = 0;
 
     std::vector<LazilyEmittedFrame> correct_stack;
 
@@ -313,6 +371,7 @@ PythonStackTracker::popPythonFrame()
     if (d_stack->back().state != FrameState::NOT_EMITTED) {
         d_num_pending_pops += 1;
         assert(d_num_pending_pops != 0);  // Ensure we didn't overflow.
+        d_num_matching_frames -= d_stack->back().matches_filter;
     }
     d_stack->pop_back();
     invalidateMostRecentFrameLineNumber();
@@ -394,6 +453,7 @@ PythonStackTracker::handleGreenletSwitch(PyObject* from, PyObject* to)
             return f.state != FrameState::NOT_EMITTED;
         });
         d_stack->clear();
+        d_num_matching_frames = 0;
         emitPendingPushesAndPops();
     }
 
@@ -536,6 +596,7 @@ PythonStackTracker::clear()
         d_num_pending_pops += (d_stack->back().state != FrameState::NOT_EMITTED);
         d_stack->pop_back();
     }
+    d_num_matching_frames = 0;
     emitPendingPushesAndPops();
     delete d_stack;
     d_stack = nullptr;
@@ -546,12 +607,15 @@ Tracker::Tracker(
         bool native_traces,
         unsigned int memory_interval,
         bool follow_fork,
-        bool trace_python_allocators)
+        bool trace_python_allocators,
+        DumpTriggers dump_triggers)
 : d_writer(std::move(record_writer))
 , d_unwind_native_frames(native_traces)
 , d_memory_interval(memory_interval)
 , d_follow_fork(follow_fork)
 , d_trace_python_allocators(trace_python_allocators)
+, d_dump_triggers(std::move(dump_triggers))
+, d_allocation_filter_generation(++s_allocation_filter_generation)
 {
     static std::once_flag once;
     call_once(once, [] {
@@ -584,7 +648,7 @@ Tracker::Tracker(
     if (d_trace_python_allocators) {
         registerPymallocHooks();
     }
-    d_background_thread = std::make_unique<BackgroundThread>(d_writer, memory_interval);
+    d_background_thread = std::make_unique<BackgroundThread>(d_writer, memory_interval, d_dump_triggers);
     d_background_thread->start();
 
     d_patcher.overwrite_symbols();
@@ -625,9 +689,11 @@ Tracker::~Tracker()
 
 Tracker::BackgroundThread::BackgroundThread(
         std::shared_ptr<RecordWriter> record_writer,
-        unsigned int memory_interval)
+        unsigned int memory_interval,
+        DumpTriggers dump_triggers)
 : d_writer(std::move(record_writer))
 , d_memory_interval(memory_interval)
+, d_dump_triggers(std::move(dump_triggers))
 {
 #ifdef __linux__
     d_procs_statm.open("/proc/self/statm");
@@ -689,16 +755,103 @@ Tracker::BackgroundThread::captureMemorySnapshot()
         return false;
     }
 
-    std::lock_guard<std::mutex> lock(*s_mutex);
-    if (!d_writer->writeRecord(MemoryRecord{now, rss})) {
-        std::cerr << "Failed to write output, deactivating tracking" << std::endl;
-        Tracker::deactivate();
-        return false;
+    std::optional<std::string> reason;
+    std::string capture;
+    {
+        std::lock_guard<std::mutex> lock(*s_mutex);
+        if (!d_writer->writeRecord(MemoryRecord{now, rss})) {
+            std::cerr << "Failed to write output, deactivating tracking" << std::endl;
+            Tracker::deactivate();
+            return false;
+        }
+
+        applyAllocationFilter();
+        reason = checkDumpTriggers(now, rss);
+        if (reason) {
+            // Only build the capture in memory while every allocating thread
+            // is waiting for the lock. Writing and compressing it is slower.
+            try {
+                capture = d_writer->dumpCapture();
+            } catch (const std::exception& e) {
+                LOG(ERROR) << "Memray failed to take a snapshot: " << e.what();
+                reason.reset();
+            }
+        }
     }
 
+    if (reason) {
+        dumpAfterTrigger(*reason, capture);
+    }
     return true;
 }
 
+std::optional<std::string>
+Tracker::BackgroundThread::checkDumpTriggers(unsigned long int now, size_t rss)
+{
+    // Each trigger fires when its condition starts to hold, and can't fire
+    // again until the condition stops holding.
+    std::optional<std::string> reason;
+    if (d_dump_triggers.rss_threshold) {
+        bool above_threshold = rss > d_dump_triggers.rss_threshold;
+        if (above_threshold && !d_rss_above_threshold) {
+            reason = "the RSS exceeded " + std::to_string(d_dump_triggers.rss_threshold) + " bytes";
+        }
+        d_rss_above_threshold = above_threshold;
+    }
+
+    if (d_dump_triggers.rss_growth_rate) {
+        if (d_growth_window_start_ms == 0) {
+            d_growth_window_start_ms = now;
+            d_growth_window_start_rss = rss;
+        } else if (now - d_growth_window_start_ms >= 1000) {
+            double growth = static_cast<double>(rss) - static_cast<double>(d_growth_window_start_rss);
+            double rate = growth * 1000 / static_cast<double>(now - d_growth_window_start_ms);
+            bool growing_fast = rate > static_cast<double>(d_dump_triggers.rss_growth_rate);
+            if (growing_fast && !d_rss_growing_fast && !reason) {
+                reason = "the RSS grew by " + std::to_string(static_cast<size_t>(rate))
+                         + " bytes per second";
+            }
+            d_rss_growing_fast = growing_fast;
+            d_growth_window_start_ms = now;
+            d_growth_window_start_rss = rss;
+        }
+    }
+    return reason;
+}
+
+void
+Tracker::BackgroundThread::dumpAfterTrigger(const std::string& reason, const std::string& capture)
+{
+    // Called without s_mutex held. Never overwrite an earlier dump, or a
+    // capture file left behind by an earlier run.
+    std::string path;
+    for (unsigned int n = 1; path.empty() || ::access(path.c_str(), F_OK) == 0; ++n) {
+        path = d_dump_triggers.path + "." + std::to_string(n);
+    }
+
+    try {
+        writeCaptureToFile(capture, path, false);
+        LOG(WARNING) << "Memray wrote a snapshot to " << path << " because " << reason;
+    } catch (const std::exception& e) {
+        LOG(ERROR) << "Memray failed to write a snapshot to " << path << ": " << e.what();
+    }
+}
+
+void
+Tracker::BackgroundThread::applyAllocationFilter()
+{
+    // Called with s_mutex held. The reader's filter arrives after tracking
+    // starts, so allocations made before then are all tracked.
+    if (auto allocation_filter = d_writer->receiveAllocationFilter()) {
+        d_pending_allocation_filter = std::move(allocation_filter);
+    }
+    Tracker* tracker = getTracker();
+    if (d_pending_allocation_filter && tracker) {
+        tracker->setAllocationFilter(std::move(*d_pending_allocation_filter));
+        d_pending_allocation_filter.reset();
+    }
+}
+
 void
 Tracker::BackgroundThread::start()
 {
@@ -793,6 +946,12 @@ Tracker::childFork()
         return;
     }
 
+    // Name the child's dumps after its pid, like its capture file.
+    DumpTriggers child_dump_triggers = old_tracker->d_dump_triggers;
+    if (!child_dump_triggers.empty()) {
+        child_dump_triggers.path += "." + std::to_string(::getpid());
+    }
+
     // Re-enable tracking with a brand new tracker.
     // Disable tracking until the new tracker is fully installed.
     s_instance_owner.reset(new Tracker(
@@ -800,7 +959,8 @@ Tracker::childFork()
             old_tracker->d_unwind_native_frames,
             old_tracker->d_memory_interval,
             old_tracker->d_follow_fork,
-            old_tracker->d_trace_python_allocators));
+            old_tracker->d_trace_python_allocators,
+            child_dump_triggers));
     Tracker::activate();
     RecursionGuard::isActive = false;
 }
@@ -838,8 +998,18 @@ Tracker::trackAllocationImpl(
         hooks::Allocator func,
         const std::optional<NativeTrace>& trace)
 {
+    if (d_filter_allocations && !allocationMatchesFilter(size)) {
+        return;
+    }
+
     registerCachedThreadName();
-    PythonStackTracker::get().emitPendingPushesAndPops();
+    PythonStackTracker& stack_tracker = PythonStackTracker::get();
+    stack_tracker.emitPendingPushesAndPops();
+    if (d_filter_allocations && d_allocation_filter.filtersLocations()
+        && !stack_tracker.hasFramesMatchingFilter())
+    {
+        return;
+    }
 
     if (d_unwind_native_frames) {
         frame_id_t native_index = 0;
@@ -865,6 +1035,61 @@ Tracker::trackAllocationImpl(
     }
 }
 
+bool
+Tracker::allocationMatchesFilter(size_t size) const
+{
+    // Only the checks that don't need the Python stack are done here, so
+    // that the frames of threads that we skip entirely are never emitted.
+    if (size < d_allocation_filter.min_size) {
+        return false;
+    }
+    if (!d_allocation_filter.filtersThreads()) {
+        return true;
+    }
+    if (t_thread_filter_state.generation != d_allocation_filter_generation) {
+        t_thread_filter_state.generation = d_allocation_filter_generation;
+        t_thread_filter_state.matches = d_allocation_filter.matchesThread(native_thread_id());
+    }
+    return t_thread_filter_state.matches;
+}
+
+void
+Tracker::setAllocationFilter(AllocationFilter allocation_filter)
+{
+    // NOTE: Tracker::s_mutex must be held
+    d_allocation_filter = std::move(allocation_filter);
+    d_filter_allocations = !d_allocation_filter.empty();
+    d_allocation_filter_generation = ++s_allocation_filter_generation;
+    d_frame_matches_filter.clear();
+}
+
+unsigned int
+Tracker::allocationFilterGeneration() const
+{
+    return d_allocation_filter_generation;
+}
+
+bool
+Tracker::frameMatchesFilter(const RawFrame& frame) const
+{
+    return d_allocation_filter.filtersLocations() && d_allocation_filter.matchesFile(frame.filename);
+}
+
+bool
+Tracker::registeredFrameMatchesFilter(frame_id_t frame_id, const RawFrame& frame)
+{
+    // Frame IDs are handed out sequentially, starting from 0, so the result
+    // for each one is cached at its index.
+    if (frame_id >= d_frame_matches_filter.size()) {
+        d_frame_matches_filter.resize(frame_id + 1, FrameFilterMatch::UNKNOWN);
+    }
+    FrameFilterMatch& match = d_frame_matches_filter[frame_id];
+    if (match == FrameFilterMatch::UNKNOWN) {
+        match = frameMatchesFilter(frame) ? FrameFilterMatch::MATCHES : FrameFilterMatch::DOES_NOT_MATCH;
+    }
+    return match == FrameFilterMatch::MATCHES;
+}
+
 void
 Tracker::trackDeallocationImpl(void* ptr, size_t size, hooks::Allocator func)
 {
@@ -1019,9 +1244,11 @@ Tracker::popFrames(uint32_t count)
 }
 
 bool
-Tracker::pushFrame(const RawFrame& frame)
+Tracker::pushFrame(const RawFrame& frame, bool& matches_filter)
 {
     const frame_id_t frame_id = registerFrame(frame);
+    matches_filter =
+            d_allocation_filter.filtersLocations() && registeredFrameMatchesFilter(frame_id, frame);
     const FramePush entry{frame_id};
     if (!d_writer->writeThreadSpecificRecord(thread_id(), entry)) {
         std::cerr << "memray: Failed to write output, deactivating tracking" << std::endl;
@@ -1058,7 +1285,8 @@ Tracker::createTracker(
         bool native_traces,
         unsigned int memory_interval,
         bool follow_fork,
-        bool trace_python_allocators)
+        bool trace_python_allocators,
+        DumpTriggers dump_triggers)
 {
     // Note: the GIL is used for synchronization of the singleton
     s_instance_owner.reset(new Tracker(
@@ -1066,7 +1294,8 @@ Tracker::createTracker(
             native_traces,
             memory_interval,
             follow_fork,
-            trace_python_allocators));
+            trace_python_allocators,
+            std::move(dump_triggers)));
 
     std::unique_lock<std::mutex> lock(*s_mutex);
     tracking_api::Tracker::activate();
@@ -1087,6 +1316,36 @@ Tracker::getTracker()
     return s_instance;
 }
 
+void
+Tracker::dumpToFile(const std::string& path, bool overwrite)
+{
+    // Note: the GIL is used for synchronization of the singleton
+    RecursionGuard guard;
+    std::string capture;
+    {
+        std::scoped_lock<std::mutex> lock(*s_mutex);
+        Tracker* tracker = getTracker();
+        if (!tracker) {
+            throw std::runtime_error("No tracker is active");
+        }
+        capture = tracker->d_writer->dumpCapture();
+    }
+
+    // Write and compress the file without blocking the threads that allocate
+    // or, as this is called with the GIL held, that run Python code.
+    std::exception_ptr error;
+    Py_BEGIN_ALLOW_THREADS;
+    try {
+        writeCaptureToFile(capture, path, overwrite);
+    } catch (...) {
+        error = std::current_exception();
+    }
+    Py_END_ALLOW_THREADS;
+    if (error) {
+        std::rethrow_exception(error);
+    }
+}
+
 static struct
 {
     PyMemAllocatorEx raw;
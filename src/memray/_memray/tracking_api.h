@@ -25,6 +25,7 @@
 #    include <execinfo.h>
 #endif
 
+#include "allocation_filter.h"
 #include "frame_tree.h"
 #include "hooks.h"
 #include "linker_shenanigans.h"
@@ -174,6 +175,26 @@ class NativeTrace
     std::vector<ip_t>& d_data;
 };
 
+/**
+ * Conditions on the resident set size that make the background thread dump
+ * the record writer's state to a new file while tracking continues. The dumps
+ * are named after `path`, with the first numeric suffix that isn't taken.
+ * */
+struct DumpTriggers
+{
+    std::string path;
+    // Dump when the RSS rises above this many bytes. 0 disables this trigger.
+    size_t rss_threshold{0};
+    // Dump when the RSS grows faster than this many bytes per second,
+    // measured over one second windows. 0 disables this trigger.
+    size_t rss_growth_rate{0};
+
+    bool empty() const
+    {
+        return rss_threshold == 0 && rss_growth_rate == 0;
+    }
+};
+
 /**
  * Singleton managing all the global state and functionality of the tracing mechanism
  *
@@ -200,10 +221,18 @@ class Tracker
             bool native_traces,
             unsigned int memory_interval,
             bool follow_fork,
-            bool trace_python_allocators);
+            bool trace_python_allocators,
+            DumpTriggers dump_triggers = {});
     static PyObject* destroyTracker();
     static Tracker* getTracker();
 
+    // Ask the active tracker's record writer to write what it keeps in memory
+    // (a ring buffer's records, or the allocations aggregated so far) to a new
+    // capture file, while tracking continues. Only copying the data blocks the
+    // other threads: the file is written after the tracker's lock and the GIL
+    // are released.
+    static void dumpToFile(const std::string& path, bool overwrite);
+
     // Allocation tracking interface
     __attribute__((always_inline)) inline static void
     trackAllocation(void* ptr, size_t size, hooks::Allocator func)
@@ -312,9 +341,15 @@ class Tracker
     }
 
     // RawFrame stack interface
-    bool pushFrame(const RawFrame& frame);
+    bool pushFrame(const RawFrame& frame, bool& matches_filter);
     bool popFrames(uint32_t count);
 
+    // Allocation filter interface. The filter is replaced when a reader
+    // sends one, so anything computed from it must be recomputed when the
+    // generation changes.
+    unsigned int allocationFilterGeneration() const;
+    bool frameMatchesFilter(const RawFrame& frame) const;
+
     // Interface to activate/deactivate the tracking
     static bool isActive();
     static void activate();
@@ -347,7 +382,10 @@ class Tracker
     {
       public:
         // Constructors
-        BackgroundThread(std::shared_ptr<RecordWriter> record_writer, unsigned int memory_interval);
+        BackgroundThread(
+                std::shared_ptr<RecordWriter> record_writer,
+                unsigned int memory_interval,
+                DumpTriggers dump_triggers);
 
         // Methods
         void start();
@@ -362,11 +400,21 @@ class Tracker
         std::condition_variable d_cv;
         std::thread d_thread;
         mutable std::ifstream d_procs_statm;
+        const DumpTriggers d_dump_triggers;
+        bool d_rss_above_threshold{false};
+        bool d_rss_growing_fast{false};
+        unsigned long int d_growth_window_start_ms{0};
+        size_t d_growth_window_start_rss{0};
+        // A filter received before the Tracker was activated.
+        std::optional<AllocationFilter> d_pending_allocation_filter;
 
         // Methods
         size_t getRSS() const;
         static unsigned long int timeElapsed();
         bool captureMemorySnapshot();
+        std::optional<std::string> checkDumpTriggers(unsigned long int now, size_t rss);
+        void dumpAfterTrigger(const std::string& reason, const std::string& capture);
+        void applyAllocationFilter();
     };
 
     // Data members
@@ -385,10 +433,21 @@ class Tracker
     linker::SymbolPatcher d_patcher;
     std::unique_ptr<BackgroundThread> d_background_thread;
     std::unordered_map<uint64_t, std::string> d_cached_thread_names;
+    const DumpTriggers d_dump_triggers;
+    AllocationFilter d_allocation_filter;
+    bool d_filter_allocations{false};
+    unsigned int d_allocation_filter_generation;
+    // Whether each registered frame matches the location filter, by frame id,
+    // for the frames that have been pushed since the filter was set.
+    enum class FrameFilterMatch : unsigned char { UNKNOWN, MATCHES, DOES_NOT_MATCH };
+    std::vector<FrameFilterMatch> d_frame_matches_filter;
 
     // Methods
     static size_t computeMainTidSkip();
     frame_id_t registerFrame(const RawFrame& frame);
+    bool allocationMatchesFilter(size_t size) const;
+    bool registeredFrameMatchesFilter(frame_id_t frame_id, const RawFrame& frame);
+    void setAllocationFilter(AllocationFilter allocation_filter);
 
     void trackAllocationImpl(
             void* ptr,
@@ -409,7 +468,8 @@ class Tracker
             bool native_traces,
             unsigned int memory_interval,
             bool follow_fork,
-            bool trace_python_allocators);
+            bool trace_python_allocators,
+            DumpTriggers dump_triggers);
 
     static bool areNativeTracesEnabled();
 };
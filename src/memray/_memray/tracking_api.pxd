@@ -8,6 +8,11 @@ from libcpp.string cimport string
 cdef extern from "tracking_api.h" namespace "memray::tracking_api":
     void install_trace_function() except*
 
+    cdef cppclass DumpTriggers:
+        string path
+        size_t rss_threshold
+        size_t rss_growth_rate
+
     cdef cppclass Tracker:
         @staticmethod
         object createTracker(
@@ -16,6 +21,7 @@ cdef extern from "tracking_api.h" namespace "memray::tracking_api":
             unsigned int memory_interval,
             bool follow_fork,
             bool trace_pymalloc,
+            DumpTriggers dump_triggers,
         ) except+
 
         @staticmethod
@@ -24,6 +30,9 @@ cdef extern from "tracking_api.h" namespace "memray::tracking_api":
         @staticmethod
         Tracker* getTracker()
 
+        @staticmethod
+        void dumpToFile(const string& path, bool overwrite) except+
+
         @staticmethod
         void forgetPythonStack() except+
 
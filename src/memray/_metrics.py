@@ -0,0 +1,198 @@
+"""Expose the data of a live tracking session as Prometheus metrics.
+
+The metrics are served over HTTP in the Prometheus text exposition format, see
+https://prometheus.io/docs/instrumenting/exposition_formats/ for details.
+Every value is computed when the endpoint is scraped. The process wide values
+come from running totals kept by the reader, but the per location values need
+the totals of every location holding live memory, so a scrape costs about as
+much as a refresh of the live TUI, and grows with the number of live
+locations.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import List
+from typing import Optional
+
+from memray import SocketReader
+from memray.reporters.tui import IncrementalAggregator
+from memray.reporters.tui import fetch_live_snapshot
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_TOP_LOCATIONS = 20
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class _MetricsWriter:
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def add(self, name: str, metric_type: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value: int, **labels: str) -> None:
+        if labels:
+            label_text = ",".join(
+                f'{key}="{_escape_label_value(val)}"' for key, val in labels.items()
+            )
+            name = f"{name}{{{label_text}}}"
+        self.lines.append(f"{name} {value}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsServer:
+    """Serve metrics about a live tracking session over HTTP.
+
+    The metrics are available at ``/metrics``. Allocation rates aren't
+    reported directly: use the ``rate()`` of the ``_total`` counters instead.
+
+    Args:
+        reader: An open reader connected to the tracked process.
+        port: The port to serve the metrics on.
+        address: The address to bind the server socket to.
+        top_locations: How many of the locations holding the most memory to
+            report individually.
+    """
+
+    def __init__(
+        self,
+        reader: SocketReader,
+        port: int,
+        address: str = "127.0.0.1",
+        top_locations: int = DEFAULT_TOP_LOCATIONS,
+    ) -> None:
+        self._reader = reader
+        self._top_locations = top_locations
+        self._aggregator = IncrementalAggregator(reader.has_native_traces)
+        # Scrapes are handled in their own threads, but the aggregator must
+        # only be updated by one of them at a time.
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((address, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        port: int = self._server.server_address[1]
+        return port
+
+    def start(self) -> None:
+        """Start serving metrics in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def render(self) -> str:
+        """Return the current metrics in the Prometheus text format."""
+        with self._lock:
+            stats = self._reader.get_live_stats()
+            snapshot = fetch_live_snapshot(self._reader, self._aggregator)
+            is_active = self._reader.is_active
+
+        writer = _MetricsWriter()
+        writer.add(
+            "memray_tracking_active",
+            "gauge",
+            "Whether the tracked process is still connected.",
+        )
+        writer.sample("memray_tracking_active", int(is_active))
+
+        writer.add(
+            "memray_heap_bytes",
+            "gauge",
+            "Memory held by live allocations in the tracked process.",
+        )
+        writer.sample("memray_heap_bytes", stats.heap_size)
+
+        if stats.rss is not None:
+            writer.add(
+                "memray_rss_bytes",
+                "gauge",
+                "Resident set size last reported by the tracked process.",
+            )
+            writer.sample("memray_rss_bytes", stats.rss)
+
+        if stats.total_allocations is not None:
+            writer.add(
+                "memray_allocations_total",
+                "counter",
+                "Allocations made by the tracked process since tracking started.",
+            )
+            writer.sample("memray_allocations_total", stats.total_allocations)
+        if stats.total_allocated_bytes is not None:
+            writer.add(
+                "memray_allocated_bytes_total",
+                "counter",
+                "Bytes allocated by the tracked process since tracking started.",
+            )
+            writer.sample("memray_allocated_bytes_total", stats.total_allocated_bytes)
+
+        top = sorted(
+            (
+                (location, entry)
+                for location, entry in snapshot.records_by_location.items()
+                if entry.total_memory > 0
+            ),
+            key=lambda item: (-item[1].total_memory, item[0].file, item[0].function),
+        )[: self._top_locations]
+        writer.add(
+            "memray_location_heap_bytes",
+            "gauge",
+            "Memory held by live allocations made by a function or the"
+            " functions it called, for the functions holding the most memory.",
+        )
+        for location, entry in top:
+            writer.sample(
+                "memray_location_heap_bytes",
+                entry.total_memory,
+                function=location.function,
+                file=location.file,
+            )
+        writer.add(
+            "memray_location_allocations",
+            "gauge",
+            "Live allocations made by a function or the functions it called,"
+            " for the functions holding the most memory.",
+        )
+        for location, entry in top:
+            writer.sample(
+                "memray_location_allocations",
+                entry.n_allocations,
+                function=location.function,
+                file=location.file,
+            )
+        return writer.render()
+
+    def _make_handler(self) -> Any:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # Don't write a line to stderr for every scrape.
+                pass
+
+        return Handler
@@ -62,6 +62,7 @@ _COMMANDS: List[Command] = [
     flamegraph.FlamegraphCommand(),
     table.TableCommand(),
     live.LiveCommand(),
+    live.BrokerCommand(),
     tree.TreeCommand(),
     parse.ParseCommand(),
     summary.SummaryCommand(),
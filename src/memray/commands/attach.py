@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import argparse
+import collections
+import concurrent.futures
 import contextlib
 import os
 import pathlib
@@ -12,6 +14,8 @@ import socket
 import subprocess
 import sys
 import threading
+from typing import Callable
+from typing import Iterator
 
 import memray
 from memray._errors import MemrayCommandError
@@ -24,7 +28,7 @@ try:
 except ImportError:
     from typing_extensions import Literal  # type: ignore
 
-TrackingMode = Literal["ACTIVATE", "DEACTIVATE", "FOR_DURATION"]
+TrackingMode = Literal["ACTIVATE", "DEACTIVATE", "FOR_DURATION", "PERIODICALLY"]
 
 
 GDB_SCRIPT = pathlib.Path(__file__).parent / "_attach.gdb"
@@ -33,6 +37,8 @@ RTLD_DEFAULT = memray._memray.RTLD_DEFAULT
 RTLD_NOW = memray._memray.RTLD_NOW
 PAYLOAD = """
 import atexit
+import dataclasses
+import os
 import time
 import threading
 import resource
@@ -83,9 +89,13 @@ def deactivate_last_tracker():
         thread.cancel()
 
 
+def create_tracker(destination):
+    return {tracker_call}
+
+
 def activate_tracker():
     deactivate_last_tracker()
-    tracker = {tracker_call}
+    tracker = create_tracker({destination})
     try:
         tracker.__enter__()
         memray._last_tracker = tracker
@@ -113,6 +123,66 @@ def track_for_duration(duration=5):
     memray._attach_event_threads.append(thread)
 
 
+# Track for `duration` seconds every `interval` seconds until exited. Each
+# period is captured to its own file, named after the destination's path plus
+# the time it started. Only the `keep` most recent captures are kept, unless
+# `keep` is 0.
+class PeriodicTracker(threading.Thread):
+    def __init__(self, destination, duration, interval, keep):
+        self._destination = destination
+        self._duration = duration
+        self._interval = interval
+        self._keep = keep
+        self._captures = []
+        self._tracker = None
+        self._canceled = threading.Event()
+        super().__init__(daemon=True)
+
+    def start_capture(self):
+        path = f"{{self._destination.path}}.{{time.strftime('%Y%m%d-%H%M%S')}}"
+        tracker = create_tracker(dataclasses.replace(self._destination, path=path))
+        tracker.__enter__()
+        self._tracker = tracker
+        self._captures.append(path)
+        while self._keep and len(self._captures) > self._keep:
+            with suppress(OSError):
+                os.remove(self._captures.pop(0))
+
+    def stop_capture(self):
+        tracker, self._tracker = self._tracker, None
+        if tracker:
+            tracker.__exit__(None, None, None)
+
+    def run(self):
+        try:
+            while True:
+                canceled = self._canceled.wait(self._duration)
+                self.stop_capture()
+                if canceled or self._canceled.wait(self._interval - self._duration):
+                    return
+                self.start_capture()
+        except Exception as exc:
+            print("memray: Periodic tracking failed:", exc, file=sys.stderr)
+        finally:
+            self.stop_capture()
+
+    def __exit__(self, *exc_info):
+        self._canceled.set()
+        if self.is_alive():
+            self.join()
+        self.stop_capture()
+
+
+def track_periodically(duration, interval, keep):
+    deactivate_last_tracker()
+    tracker = PeriodicTracker({destination}, duration, interval, keep)
+    # Start the first capture right away, so that any error is reported.
+    tracker.start_capture()
+    memray._last_tracker = tracker
+    memray._attach_event_threads = []
+    tracker.start()
+
+
 if not hasattr(memray, "_last_tracker"):
     # This only needs to be registered the first time we attach.
     atexit.register(deactivate_last_tracker)
@@ -125,14 +195,47 @@ elif {mode!r} == "DEACTIVATE":
     deactivate_last_tracker()
 elif {mode!r} == "FOR_DURATION":
     track_for_duration({duration})
+elif {mode!r} == "PERIODICALLY":
+    track_periodically({duration}, {interval}, {keep})
 """
 
 
+def _attach_failure_reason(pid: int) -> str:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return "The given process ID does not exist."
+    except PermissionError:
+        return "The given process ID is owned by a different user."
+
+    return "You most likely do not have permission to trace the process."
+
+
+def _inject_with_ptrace(
+    injecter: pathlib.Path, pid: int, port: int, verbose: bool
+) -> str | None:
+    if verbose:
+        print(f"Injecting {injecter} into process {pid} with ptrace")
+
+    try:
+        memray._memray.ptrace_inject(pid, str(injecter), port)
+    except (ProcessLookupError, PermissionError) as exc:
+        if verbose:
+            print(f"ptrace injection failed: {exc.strerror}")
+        return "Failed to attach to the process.\n" + _attach_failure_reason(pid)
+    except OSError as exc:
+        return f"Failed to inject into the process.\n{exc.strerror}."
+    return None
+
+
 def inject(debugger: str, pid: int, port: int, verbose: bool) -> str | None:
     """Executes a file in a running Python process."""
     injecter = pathlib.Path(memray.__file__).parent / "_inject.abi3.so"
     assert injecter.exists()
 
+    if debugger == "ptrace":
+        return _inject_with_ptrace(injecter, pid, port, verbose)
+
     gdb_cmd = [
         "gdb",
         "-batch",
@@ -209,14 +312,7 @@ def inject(debugger: str, pid: int, port: int, verbose: bool) -> str | None:
     if "error: attach failed: " in output or "ptrace: " in output:
         # We failed to attach to the given pid. A few likely reasons...
         errmsg = "Failed to attach a debugger to the process.\n"
-        try:
-            os.kill(pid, 0)
-        except ProcessLookupError:
-            return errmsg + "The given process ID does not exist."
-        except PermissionError:
-            return errmsg + "The given process ID is owned by a different user."
-
-        return errmsg + "You most likely do not have permission to trace the process."
+        return errmsg + _attach_failure_reason(pid)
 
     if "MEMRAY: Attached to process." not in output:
         return (
@@ -267,8 +363,52 @@ def _lldb_available(verbose: int) -> bool:
     return True
 
 
+def _ptrace_available(verbose: bool) -> bool:
+    if not memray._memray.PTRACE_INJECTION_SUPPORTED:
+        if verbose:
+            print("Injecting with ptrace isn't supported on this platform")
+        return False
+    return True
+
+
 def debugger_available(debugger: str, verbose: bool = False) -> bool:
-    return {"gdb": _gdb_available, "lldb": _lldb_available}[debugger](verbose=verbose)
+    return {
+        "ptrace": _ptrace_available,
+        "gdb": _gdb_available,
+        "lldb": _lldb_available,
+    }[debugger](verbose=verbose)
+
+
+def _get_parent_pids() -> Iterator[tuple[int, int]]:
+    if platform.system() == "Linux":
+        for stat in pathlib.Path("/proc").glob("[0-9]*/stat"):
+            # The process may have exited since we listed it.
+            with contextlib.suppress(OSError):
+                # The command name can contain spaces and parentheses, but it
+                # is followed by the state and then the parent's process ID.
+                fields = stat.read_text().rpartition(")")[2].split()
+                yield int(stat.parent.name), int(fields[1])
+        return
+
+    output = subprocess.check_output(
+        ["ps", "-A", "-o", "pid=", "-o", "ppid="], text=True
+    )
+    for line in output.splitlines():
+        pid, ppid = line.split()
+        yield int(pid), int(ppid)
+
+
+def get_process_tree(pid: int) -> list[int]:
+    """Return the given process ID followed by those of all its descendants."""
+    children: dict[int, list[int]] = collections.defaultdict(list)
+    for child, parent in _get_parent_pids():
+        children[parent].append(child)
+
+    tree = [pid]
+    # The list grows as we go, so this visits every descendant.
+    for parent in tree:
+        tree.extend(sorted(children[parent]))
+    return tree
 
 
 def recvall(sock: socket.socket) -> str:
@@ -301,7 +441,7 @@ class _DebuggerCommand:
             help="Method to use for injecting commands into the remote process",
             type=str,
             default="auto",
-            choices=["auto", "gdb", "lldb"],
+            choices=["auto", "ptrace", "gdb", "lldb"],
         )
 
         parser.add_argument(
@@ -311,6 +451,16 @@ class _DebuggerCommand:
             action="store_true",
         )
 
+        parser.add_argument(
+            "--tree",
+            help=(
+                "Also affect every process descended from the given one,"
+                " like the workers of a pre-fork server, in parallel"
+            ),
+            action="store_true",
+            default=False,
+        )
+
         parser.add_argument(
             "pid",
             help="Process id to affect",
@@ -319,9 +469,11 @@ class _DebuggerCommand:
 
     def resolve_debugger(self, method: str, *, verbose: bool = False) -> str:
         if method == "auto":
-            # Prefer gdb on Linux but lldb on macOS
+            # Prefer our own ptrace injector, which doesn't need a debugger
+            # and only pauses the process for a few milliseconds, where it's
+            # supported. Otherwise prefer gdb on Linux but lldb on macOS.
             if platform.system() == "Linux":
-                debuggers = ("gdb", "lldb")
+                debuggers: tuple[str, ...] = ("ptrace", "gdb", "lldb")
             else:
                 debuggers = ("lldb", "gdb")
 
@@ -332,6 +484,11 @@ class _DebuggerCommand:
                 "Cannot find a supported lldb or gdb executable.",
                 exit_code=1,
             )
+        elif method == "ptrace" and not debugger_available(method, verbose=verbose):
+            raise MemrayCommandError(
+                "Injecting with ptrace is not supported on this platform.",
+                exit_code=1,
+            )
         elif not debugger_available(method, verbose=verbose):
             raise MemrayCommandError(
                 f"Cannot find a supported {method} executable.",
@@ -354,6 +511,39 @@ class _DebuggerCommand:
 
             return server.accept()[0]
 
+    def send_payload(
+        self, method: str, pid: int, payload: str, *, verbose: bool = False
+    ) -> socket.socket:
+        client = self.inject_control_channel(method, pid, verbose=verbose)
+        client.sendall(payload.encode("utf-8"))
+        client.shutdown(socket.SHUT_WR)
+        return client
+
+    def run_for_process_tree(self, pid: int, func: Callable[[int], None]) -> None:
+        """Call func for the given process and all its descendants in parallel.
+
+        Failures are reported for each process that func raised a
+        `MemrayCommandError` for, after all the calls have finished.
+        """
+        pids = get_process_tree(pid)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = [executor.submit(func, pid) for pid in pids]
+
+        failures = 0
+        for pid, future in zip(pids, futures):
+            exc = future.exception()
+            if isinstance(exc, MemrayCommandError):
+                failures += 1
+                print(f"Process {pid}: {exc}", file=sys.stderr)
+            elif exc:
+                raise exc
+
+        if failures:
+            raise MemrayCommandError(
+                f"Failed for {failures} of {len(pids)} processes.",
+                exit_code=1,
+            )
+
 
 class AttachCommand(_DebuggerCommand):
     """Begin tracking allocations in an already-started process"""
@@ -419,6 +609,23 @@ class AttachCommand(_DebuggerCommand):
         parser.add_argument(
             "--duration", type=int, help="Duration to track for (in seconds)"
         )
+        parser.add_argument(
+            "--sample-every",
+            metavar="MINUTES",
+            type=float,
+            help=(
+                "Keep tracking for --duration seconds every MINUTES minutes"
+                " until detached, writing an aggregated capture file for each"
+                " period next to the output file"
+            ),
+        )
+        parser.add_argument(
+            "--keep",
+            metavar="COUNT",
+            type=int,
+            default=0,
+            help="Only keep the COUNT most recent capture files of --sample-every",
+        )
 
         super().prepare_parser(parser)
 
@@ -426,28 +633,34 @@ class AttachCommand(_DebuggerCommand):
         verbose = args.verbose
         mode: TrackingMode = "ACTIVATE"
         duration = None
-
-        if args.duration:
+        interval = None
+
+        if args.keep < 0:
+            parser.error("--keep must be non-negative.")
+
+        if args.sample_every is not None:
+            if not args.output:
+                parser.error("Can't use --sample-every without an output file.")
+            if not args.duration:
+                parser.error("Can't use --sample-every without --duration.")
+            interval = args.sample_every * 60
+            if interval <= args.duration:
+                parser.error("--sample-every must be longer than --duration.")
+            # Periodic captures are always aggregated, to keep them small.
+            args.aggregate = True
+            mode = "PERIODICALLY"
+            duration = args.duration
+        elif args.keep:
+            parser.error("Can't use --keep without --sample-every.")
+        elif args.duration:
             mode = "FOR_DURATION"
             duration = args.duration
 
-        args.method = self.resolve_debugger(args.method, verbose=verbose)
-
-        destination: memray.Destination
-        if args.output:
-            live_port = None
-            destination = memray.FileDestination(
-                path=os.path.abspath(args.output),
-                overwrite=args.force,
-                compress_on_exit=not args.no_compress,
-            )
-        else:
-            live_port = _get_free_port()
-            destination = memray.SocketDestination(server_port=live_port)
-
         if args.aggregate and not args.output:
             parser.error("Can't use aggregated mode without an output file.")
 
+        args.method = self.resolve_debugger(args.method, verbose=verbose)
+
         file_format = (
             "file_format=memray.FileFormat.AGGREGATED_ALLOCATIONS"
             if args.aggregate
@@ -455,22 +668,42 @@ class AttachCommand(_DebuggerCommand):
         )
 
         tracker_call = (
-            f"memray.Tracker(destination=memray.{destination!r},"
+            "memray.Tracker(destination=destination,"
             f" native_traces={args.native},"
             f" follow_fork={args.follow_fork},"
             f" trace_python_allocators={args.trace_python_allocators},"
             f"{file_format})"
         )
 
-        client = self.inject_control_channel(args.method, args.pid, verbose=verbose)
-        client.sendall(
-            PAYLOAD.format(
+        def make_payload(destination: memray.Destination) -> str:
+            return PAYLOAD.format(
                 tracker_call=tracker_call,
+                destination=f"memray.{destination!r}",
                 mode=mode,
                 duration=duration,
-            ).encode("utf-8")
+                interval=interval,
+                keep=args.keep,
+            )
+
+        if args.tree:
+            self.attach_to_process_tree(args, make_payload)
+            return
+
+        destination: memray.Destination
+        if args.output:
+            live_port = None
+            destination = memray.FileDestination(
+                path=os.path.abspath(args.output),
+                overwrite=args.force,
+                compress_on_exit=not args.no_compress,
+            )
+        else:
+            live_port = _get_free_port()
+            destination = memray.SocketDestination(server_port=live_port)
+
+        client = self.send_payload(
+            args.method, args.pid, make_payload(destination), verbose=verbose
         )
-        client.shutdown(socket.SHUT_WR)
 
         if not live_port:
             err = recvall(client)
@@ -510,6 +743,47 @@ class AttachCommand(_DebuggerCommand):
                     exit_code=1,
                 ) from None
 
+    def attach_to_process_tree(
+        self,
+        args: argparse.Namespace,
+        make_payload: Callable[[memray.Destination], str],
+    ) -> None:
+        live_ports: dict[int, int] = {}
+
+        def attach(pid: int) -> None:
+            destination: memray.Destination
+            if args.output:
+                # Name each capture file after its process, like --follow-fork.
+                destination = memray.FileDestination(
+                    path=f"{os.path.abspath(args.output)}.{pid}",
+                    overwrite=args.force,
+                    compress_on_exit=not args.no_compress,
+                )
+            else:
+                live_ports[pid] = _get_free_port()
+                destination = memray.SocketDestination(server_port=live_ports[pid])
+
+            client = self.send_payload(
+                args.method, pid, make_payload(destination), verbose=args.verbose
+            )
+            with contextlib.closing(client):
+                if not args.output:
+                    # The tracker only finishes starting once a reader
+                    # connects, so we can't wait for it to report errors.
+                    return
+                err = recvall(client)
+            if err:
+                raise MemrayCommandError(
+                    f"Failed to start tracking in remote process: {err}",
+                    exit_code=1,
+                )
+
+        try:
+            self.run_for_process_tree(args.pid, attach)
+        finally:
+            for pid, port in sorted(live_ports.items()):
+                print(f"Process {pid}: run `memray live {port}` to watch it")
+
 
 class DetachCommand(_DebuggerCommand):
     """End the tracking started by a previous ``memray attach`` call"""
@@ -518,20 +792,26 @@ class DetachCommand(_DebuggerCommand):
         verbose = args.verbose
         mode: TrackingMode = "DEACTIVATE"
         args.method = self.resolve_debugger(args.method, verbose=verbose)
-        client = self.inject_control_channel(args.method, args.pid, verbose=verbose)
-
-        client.sendall(
-            PAYLOAD.format(
-                tracker_call=None,
-                mode=mode,
-                duration=None,
-            ).encode("utf-8")
+        payload = PAYLOAD.format(
+            tracker_call=None,
+            destination=None,
+            mode=mode,
+            duration=None,
+            interval=None,
+            keep=None,
         )
-        client.shutdown(socket.SHUT_WR)
 
-        err = recvall(client)
-        if err:
-            raise MemrayCommandError(
-                f"Failed to stop tracking in remote process: {err}",
-                exit_code=1,
-            )
+        def detach(pid: int) -> None:
+            client = self.send_payload(args.method, pid, payload, verbose=verbose)
+            with contextlib.closing(client):
+                err = recvall(client)
+            if err:
+                raise MemrayCommandError(
+                    f"Failed to stop tracking in remote process: {err}",
+                    exit_code=1,
+                )
+
+        if args.tree:
+            self.run_for_process_tree(args.pid, detach)
+        else:
+            detach(args.pid)
@@ -1,11 +1,54 @@
 import argparse
+import time
+from contextlib import contextmanager
 from contextlib import suppress
+from typing import Iterator
 from typing import Optional
 
+from memray import AllocationFilter
+from memray import SharedMemoryReader
 from memray import SocketReader
+from memray._broker import BrokerReader
+from memray._broker import LiveBroker
 from memray._errors import MemrayCommandError
+from memray._metrics import MetricsServer
 from memray.reporters.tui import TUIApp
 
+DEFAULT_HISTORY_SECONDS = 300.0
+
+
+def _validate_port(port: int) -> None:
+    if port >= 2**16 or port <= 0:
+        raise MemrayCommandError(f"Invalid port: {port}", exit_code=1)
+
+
+@contextmanager
+def _serving_metrics(
+    reader: SocketReader, port: Optional[int], address: str = "127.0.0.1"
+) -> Iterator[None]:
+    if port is None:
+        yield
+        return
+    server = MetricsServer(reader, port, address=address)
+    server.start()
+    try:
+        yield
+    finally:
+        server.close()
+
+
+def _add_serve_metrics_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--serve-metrics",
+        help=(
+            "Serve metrics about the tracked process in the Prometheus text "
+            "format at http://<address>:PORT/metrics"
+        ),
+        metavar="PORT",
+        default=None,
+        type=int,
+    )
+
 
 class LiveCommand:
     """Remotely monitor allocations in a text-based interface"""
@@ -17,15 +60,187 @@ class LiveCommand:
             default=None,
             type=int,
         )
+        parser.add_argument(
+            "--history",
+            help=(
+                "How many seconds of history to keep, so that the interface "
+                "can be rewound to show what memory was held in the past. "
+                "Use 0 to disable."
+            ),
+            metavar="SECONDS",
+            default=DEFAULT_HISTORY_SECONDS,
+            type=float,
+        )
+        parser.add_argument(
+            "--broker",
+            help="Connect to a `memray broker` instead of to the tracked process",
+            action="store_true",
+            default=False,
+        )
+        _add_serve_metrics_argument(parser)
+
+        filters = parser.add_argument_group(
+            "allocation filters",
+            "Only the allocations matching every given filter are sent by the "
+            "tracked process. Deallocations are always sent.",
+        )
+        filters.add_argument(
+            "--thread",
+            help=(
+                "Only receive allocations made by the thread with this native "
+                "thread ID (as returned by threading.get_native_id()). Can be "
+                "given several times."
+            ),
+            metavar="NATIVE_ID",
+            dest="filter_threads",
+            action="append",
+            default=[],
+            type=int,
+        )
+        filters.add_argument(
+            "--min-size",
+            help="Only receive allocations of at least this many bytes",
+            metavar="BYTES",
+            dest="filter_min_size",
+            default=0,
+            type=int,
+        )
+        filters.add_argument(
+            "--file",
+            help=(
+                "Only receive allocations made while a function from a file "
+                "whose path starts with PREFIX is on the stack. Can be given "
+                "several times."
+            ),
+            metavar="PREFIX",
+            dest="filter_files",
+            action="append",
+            default=[],
+        )
+        filters.add_argument(
+            "--module",
+            help=(
+                "Only receive allocations made while a function from this "
+                "module or package is on the stack. Can be given several times."
+            ),
+            metavar="NAME",
+            dest="filter_modules",
+            action="append",
+            default=[],
+        )
 
     def run(self, args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+        if args.broker and args.serve_metrics is not None:
+            parser.error("--serve-metrics can't be used with --broker")
+        allocation_filter = None
+        if (
+            args.filter_threads
+            or args.filter_min_size
+            or args.filter_files
+            or args.filter_modules
+        ):
+            if args.broker:
+                parser.error("allocation filters can't be used with --broker")
+            try:
+                allocation_filter = AllocationFilter(
+                    threads=tuple(args.filter_threads),
+                    min_size=args.filter_min_size,
+                    files=tuple(args.filter_files),
+                    modules=tuple(args.filter_modules),
+                )
+            except ValueError as e:
+                parser.error(str(e))
         with suppress(KeyboardInterrupt):
-            self.start_live_interface(args.port)
+            if args.broker:
+                self.start_broker_interface(args.port)
+            else:
+                self.start_live_interface(
+                    args.port,
+                    history=args.history,
+                    metrics_port=args.serve_metrics,
+                    allocation_filter=allocation_filter,
+                )
 
     def start_live_interface(
-        self, port: int, cmdline_override: Optional[str] = None
+        self,
+        port: int,
+        cmdline_override: Optional[str] = None,
+        history: float = DEFAULT_HISTORY_SECONDS,
+        metrics_port: Optional[int] = None,
+        shared_memory_name: Optional[str] = None,
+        allocation_filter: Optional[AllocationFilter] = None,
     ) -> None:
-        if port >= 2**16 or port <= 0:
-            raise MemrayCommandError(f"Invalid port: {port}", exit_code=1)
-        with SocketReader(port=port) as reader:
-            TUIApp(reader, cmdline_override=cmdline_override).run()
+        if shared_memory_name is None:
+            _validate_port(port)
+        if metrics_port is not None:
+            _validate_port(metrics_port)
+        if history < 0:
+            raise MemrayCommandError(f"Invalid history length: {history}", exit_code=1)
+        reader: SocketReader
+        if shared_memory_name is not None:
+            reader = SharedMemoryReader(shared_memory_name, history_retention=history)
+        else:
+            reader = SocketReader(
+                port=port,
+                history_retention=history,
+                allocation_filter=allocation_filter,
+            )
+        with reader:
+            with _serving_metrics(reader, metrics_port):
+                TUIApp(reader, cmdline_override=cmdline_override).run()
+
+    def start_broker_interface(self, port: int) -> None:
+        _validate_port(port)
+        with BrokerReader(port=port) as reader:
+            TUIApp(reader).run()
+
+
+class BrokerCommand:
+    """Share a live tracking session between several viewers and dashboards"""
+
+    def prepare_parser(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "port",
+            help="Remote port of the tracked process to connect to",
+            type=int,
+        )
+        parser.add_argument(
+            "--listen",
+            help="Port to accept `memray live --broker` connections on",
+            metavar="PORT",
+            default=None,
+            type=int,
+        )
+        _add_serve_metrics_argument(parser)
+        parser.add_argument(
+            "--address",
+            help="Address to accept connections on",
+            default="127.0.0.1",
+        )
+
+    def run(self, args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+        if args.listen is None and args.serve_metrics is None:
+            parser.error("at least one of --listen or --serve-metrics is required")
+        for port in (args.port, args.listen, args.serve_metrics):
+            if port is not None:
+                _validate_port(port)
+
+        with SocketReader(port=args.port) as reader:
+            with _serving_metrics(reader, args.serve_metrics, args.address):
+                if args.serve_metrics is not None:
+                    print(
+                        f"Serving metrics of process {reader.pid} at"
+                        f" http://{args.address}:{args.serve_metrics}/metrics"
+                    )
+                with suppress(KeyboardInterrupt):
+                    if args.listen is None:
+                        while reader.is_active:
+                            time.sleep(1)
+                        return
+                    broker = LiveBroker(reader, args.listen, address=args.address)
+                    print(
+                        f"Serving the live session of process {reader.pid} on"
+                        f" port {broker.port}. Connect with:"
+                        f" memray live --broker {broker.port}"
+                    )
+                    broker.serve()
@@ -1,16 +1,20 @@
 import argparse
 import ast
 import contextlib
+import glob
 import os
 import pathlib
 import runpy
+import signal
 import socket
 import subprocess
 import sys
 import textwrap
 from contextlib import closing
 from contextlib import suppress
+from types import FrameType
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Optional
@@ -18,9 +22,11 @@ from typing import Optional
 from memray import Destination
 from memray import FileDestination
 from memray import FileFormat
+from memray import SharedMemoryDestination
 from memray import SocketDestination
 from memray import Tracker
 from memray._errors import MemrayCommandError
+from memray._memory_limits import parse_size
 from memray.commands.live import LiveCommand
 
 
@@ -31,6 +37,84 @@ def _get_free_port() -> int:
         return int(sock.getsockname()[1])
 
 
+_UNCATCHABLE_SIGNALS = {signal.SIGKILL, signal.SIGSTOP}
+
+
+def _parse_signal(value: str) -> signal.Signals:
+    name = value.upper()
+    if not name.startswith("SIG"):
+        name = "SIG" + name
+    try:
+        signum = signal.Signals[name]
+    except KeyError:
+        try:
+            signum = signal.Signals(int(value))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid signal: {value!r}") from None
+    if signum not in signal.valid_signals() or signum in _UNCATCHABLE_SIGNALS:
+        raise argparse.ArgumentTypeError(f"signal {signum.name} cannot be caught")
+    return signum
+
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def _parse_size(value: str) -> int:
+    try:
+        return parse_size(value, allow_percentage=False)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+def _parse_duration(value: str) -> int:
+    number, unit = value, "s"
+    if value and value[-1].lower() in _DURATION_UNITS:
+        number, unit = value[:-1], value[-1].lower()
+    try:
+        seconds = int(number) * _DURATION_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}") from None
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"duration must be positive: {value!r}")
+    return seconds
+
+
+def _parse_positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    return number
+
+
+def _parse_non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"invalid non-negative integer: {value!r}")
+    return number
+
+
+def _install_snapshot_handler(
+    tracker: Tracker, signum: signal.Signals, quiet: bool
+) -> Any:
+    def handler(signum: int, frame: Optional[FrameType]) -> None:
+        # A snapshot that fails must not raise into the tracked program.
+        try:
+            path = tracker.dump_snapshot()
+        except Exception as error:
+            print(f"Memray failed to write a snapshot: {error}", file=sys.stderr)
+        else:
+            if not quiet:
+                print(f"Memray wrote a snapshot to {path}", file=sys.stderr)
+
+    return signal.signal(signum, handler)
+
+
 def _should_modify_sys_path() -> bool:
     isolated_mode = sys.flags.isolated
     safe_path_mode = getattr(sys.flags, "safe_path", False)  # New in Python 3.11
@@ -40,7 +124,7 @@ def _should_modify_sys_path() -> bool:
 def _run_tracker(
     destination: Destination,
     args: argparse.Namespace,
-    post_run_message: Optional[str] = None,
+    post_run_message: Optional[Callable[[], str]] = None,
 ) -> None:
     try:
         kwargs: Dict[str, Any] = {}
@@ -50,13 +134,28 @@ def _run_tracker(
             kwargs["trace_python_allocators"] = True
         if args.aggregate:
             kwargs["file_format"] = FileFormat.AGGREGATED_ALLOCATIONS
+        if args.dump_when_rss_exceeds is not None:
+            kwargs["dump_when_rss_exceeds"] = args.dump_when_rss_exceeds
+        if args.dump_on_growth_rate is not None:
+            kwargs["dump_on_growth_rate"] = args.dump_on_growth_rate
+        if args.temporary_allocation_threshold is not None:
+            kwargs[
+                "temporary_allocation_threshold"
+            ] = args.temporary_allocation_threshold
+        if args.aggregation_memory_budget is not None:
+            kwargs["aggregation_memory_budget"] = args.aggregation_memory_budget
         tracker = Tracker(destination=destination, native_traces=args.native, **kwargs)
-    except OSError as error:
+    except (OSError, ValueError) as error:
         raise MemrayCommandError(str(error), exit_code=1)
 
     with tracker:
         pid = os.getpid()
+        previous_handler = None
         try:
+            if args.snapshot_signal is not None:
+                previous_handler = _install_snapshot_handler(
+                    tracker, args.snapshot_signal, args.quiet
+                )
             if args.run_as_module:
                 if _should_modify_sys_path():
                     sys.path[0] = os.getcwd()
@@ -76,32 +175,46 @@ def _run_tracker(
                 sys.argv = [args.script, *args.script_args]
                 runpy.run_path(args.script, run_name="__main__")
         finally:
+            if previous_handler is not None:
+                signal.signal(args.snapshot_signal, previous_handler)
             if not args.quiet and post_run_message is not None and pid == os.getpid():
-                print(post_run_message)
+                print(post_run_message())
 
 
 def _child_process(
     port: int,
     native: bool,
     trace_python_allocators: bool,
+    aggregate: bool,
     run_as_module: bool,
     run_as_cmd: bool,
     quiet: bool,
     script: str,
     script_args: List[str],
+    shared_memory_name: Optional[str] = None,
 ) -> None:
     args = argparse.Namespace(
         native=native,
         trace_python_allocators=trace_python_allocators,
         follow_fork=False,
-        aggregate=False,
+        aggregate=aggregate,
+        dump_when_rss_exceeds=None,
+        dump_on_growth_rate=None,
+        snapshot_signal=None,
+        temporary_allocation_threshold=None,
+        aggregation_memory_budget=None,
         run_as_module=run_as_module,
         run_as_cmd=run_as_cmd,
         quiet=quiet,
         script=script,
         script_args=script_args,
     )
-    _run_tracker(destination=SocketDestination(server_port=port), args=args)
+    destination: Destination
+    if shared_memory_name is not None:
+        destination = SharedMemoryDestination(name=shared_memory_name)
+    else:
+        destination = SocketDestination(server_port=port)
+    _run_tracker(destination=destination, args=args)
 
 
 def _run_child_process_and_attach(args: argparse.Namespace) -> None:
@@ -112,10 +225,15 @@ def _run_child_process_and_attach(args: argparse.Namespace) -> None:
         raise MemrayCommandError(f"Invalid port: {port}", exit_code=1)
 
     arguments = (
-        f"{port},{args.native},{args.trace_python_allocators},"
+        f"{port},{args.native},{args.trace_python_allocators},{args.aggregate},"
         f"{args.run_as_module},{args.run_as_cmd},{args.quiet},"
         f"{args.script!r},{args.script_args}"
     )
+    live_kwargs: Dict[str, Any] = {}
+    if args.shared_memory:
+        shared_memory_name = f"memray-{os.getpid()}"
+        arguments += f",shared_memory_name={shared_memory_name!r}"
+        live_kwargs["shared_memory_name"] = shared_memory_name
     tracked_app_cmd = [
         sys.executable,
         "-c",
@@ -130,7 +248,7 @@ def _run_child_process_and_attach(args: argparse.Namespace) -> None:
         ) as process:
             try:
                 LiveCommand().start_live_interface(
-                    port, cmdline_override=" ".join(sys.argv)
+                    port, cmdline_override=" ".join(sys.argv), **live_kwargs
                 )
             except (Exception, KeyboardInterrupt) as error:
                 process.terminate()
@@ -152,8 +270,22 @@ def _run_with_socket_output(args: argparse.Namespace) -> None:
     if not args.quiet:
         memray_cli = f"memray{sys.version_info.major}.{sys.version_info.minor}"
         print(f"Run '{memray_cli} live {port}' in another shell to see live results")
+    destination = SocketDestination(server_port=port, compress=args.live_compress)
     with suppress(KeyboardInterrupt):
-        _run_tracker(destination=SocketDestination(server_port=port), args=args)
+        _run_tracker(destination=destination, args=args)
+
+
+def _newest_segment(filename: str) -> str:
+    path = pathlib.Path(filename)
+    segments = [
+        int(suffix)
+        for suffix in (
+            candidate.name[len(path.name) + 1 :]
+            for candidate in path.parent.glob(f"{glob.escape(path.name)}.*")
+        )
+        if suffix.isdigit()
+    ]
+    return f"{filename}.{max(segments, default=1)}"
 
 
 def _run_with_file_output(args: argparse.Namespace) -> None:
@@ -167,22 +299,35 @@ def _run_with_file_output(args: argparse.Namespace) -> None:
     else:
         filename = args.output
 
+    rotating = args.rotate_size is not None or args.rotate_interval is not None
     if not args.quiet:
-        print(f"Writing profile results into {filename}")
+        if rotating:
+            print(f"Writing profile results into {filename}.1, {filename}.2, ...")
+        else:
+            print(f"Writing profile results into {filename}")
 
-    example_report_generation_message = textwrap.dedent(
-        f"""
-        [memray] Successfully generated profile results.
+    def example_report_generation_message() -> str:
+        # Each rotated segment can be used on its own, so suggest the newest
+        # one: older ones may have been removed because of --keep.
+        report_filename = _newest_segment(filename) if rotating else filename
+        return textwrap.dedent(
+            f"""
+            [memray] Successfully generated profile results.
 
-        You can now generate reports from the stored allocation records.
-        Some example commands to generate reports:
+            You can now generate reports from the stored allocation records.
+            Some example commands to generate reports:
 
-        {sys.executable} -m memray flamegraph {filename}
-        """
-    ).strip()
+            {sys.executable} -m memray flamegraph {report_filename}
+            """
+        ).strip()
 
     destination = FileDestination(
-        path=filename, overwrite=args.force, compress_on_exit=args.compress_on_exit
+        path=filename,
+        overwrite=args.force,
+        compress_on_exit=args.compress_on_exit,
+        rotate_size=args.rotate_size,
+        rotate_interval=args.rotate_interval,
+        keep=args.keep,
     )
     try:
         _run_tracker(
@@ -226,6 +371,24 @@ class RunCommand:
             default=None,
             type=int,
         )
+        parser.add_argument(
+            "--live-compress",
+            help=(
+                "Compress the records sent to the live TUI, to use less "
+                "bandwidth (requires --live-remote)"
+            ),
+            action="store_true",
+            default=False,
+        )
+        parser.add_argument(
+            "--shared-memory",
+            help=(
+                "Send records to the live TUI through shared memory instead of "
+                "a socket (requires --live)"
+            ),
+            action="store_true",
+            default=False,
+        )
         parser.add_argument(
             "--aggregate",
             help="Write aggregated stats to the output file instead of all allocations",
@@ -233,6 +396,87 @@ class RunCommand:
             default=False,
         )
 
+        parser.add_argument(
+            "--dump-when-rss-exceeds",
+            help=(
+                "Write a snapshot of the aggregated stats each time the RSS rises "
+                "above SIZE, like 2G, or above a percentage of the cgroup memory "
+                "limit, like 90%% (requires --aggregate)"
+            ),
+            metavar="SIZE",
+            default=None,
+        )
+        parser.add_argument(
+            "--dump-on-growth-rate",
+            help=(
+                "Write a snapshot of the aggregated stats each time the RSS starts "
+                "growing faster than SIZE per second, like 100M (requires --aggregate)"
+            ),
+            metavar="SIZE",
+            default=None,
+        )
+        parser.add_argument(
+            "--snapshot-signal",
+            help=(
+                "Write a snapshot of the allocations that are alive each time the "
+                "process receives SIGNAL, like SIGUSR2 (requires --aggregate)"
+            ),
+            type=_parse_signal,
+            metavar="SIGNAL",
+            default=None,
+        )
+        parser.add_argument(
+            "--temporary-allocation-threshold",
+            help=(
+                "Record enough data to find temporary allocations with any "
+                "threshold up to N, which defaults to 1 (requires --aggregate)"
+            ),
+            type=_parse_non_negative_int,
+            metavar="N",
+            default=None,
+        )
+        parser.add_argument(
+            "--aggregation-memory-budget",
+            help=(
+                "Lower the time resolution of the high water mark history whenever "
+                "the aggregated allocations use more than SIZE of memory, like 256M "
+                "or 5%% of the cgroup memory limit (requires --aggregate)"
+            ),
+            metavar="SIZE",
+            default=None,
+        )
+
+        parser.add_argument(
+            "--rotate-size",
+            help=(
+                "Split the output into numbered files, starting a new one once the "
+                "current one reaches SIZE, like 2G"
+            ),
+            type=_parse_size,
+            metavar="SIZE",
+            default=None,
+        )
+        parser.add_argument(
+            "--rotate-interval",
+            help=(
+                "Split the output into numbered files, starting a new one once the "
+                "current one is DURATION old, like 15m"
+            ),
+            type=_parse_duration,
+            metavar="DURATION",
+            default=None,
+        )
+        parser.add_argument(
+            "--keep",
+            help=(
+                "Only keep the N most recent output files "
+                "(requires --rotate-size or --rotate-interval)"
+            ),
+            type=_parse_positive_int,
+            metavar="N",
+            default=None,
+        )
+
         parser.add_argument(
             "--native",
             help="Track native (C/C++) stack frames as well",
@@ -321,10 +565,43 @@ class RunCommand:
 
         if args.live_port is not None and not args.live_remote_mode:
             parser.error("The --live-port argument requires --live-remote")
+        if args.live_compress and not args.live_remote_mode:
+            parser.error("The --live-compress argument requires --live-remote")
+        if args.shared_memory and not args.live_mode:
+            parser.error("The --shared-memory argument requires --live")
         if args.follow_fork is True and (args.live_mode or args.live_remote_mode):
             parser.error("--follow-fork cannot be used with the live TUI")
-        if args.aggregate and (args.live_mode or args.live_remote_mode):
-            parser.error("--aggregate cannot be used with the live TUI")
+        for option, value in (
+            ("--dump-when-rss-exceeds", args.dump_when_rss_exceeds),
+            ("--dump-on-growth-rate", args.dump_on_growth_rate),
+            ("--snapshot-signal", args.snapshot_signal),
+            ("--temporary-allocation-threshold", args.temporary_allocation_threshold),
+            ("--aggregation-memory-budget", args.aggregation_memory_budget),
+        ):
+            if value is None:
+                continue
+            if not args.aggregate:
+                parser.error(f"The {option} argument requires --aggregate")
+            if args.live_mode or args.live_remote_mode:
+                parser.error(f"{option} cannot be used with the live TUI")
+        for option, value in (
+            ("--rotate-size", args.rotate_size),
+            ("--rotate-interval", args.rotate_interval),
+        ):
+            if value is None:
+                continue
+            if args.aggregate:
+                parser.error(f"{option} cannot be used with --aggregate")
+            if args.live_mode or args.live_remote_mode:
+                parser.error(f"{option} cannot be used with the live TUI")
+        if (
+            args.keep is not None
+            and args.rotate_size is None
+            and args.rotate_interval is None
+        ):
+            parser.error(
+                "The --keep argument requires --rotate-size or --rotate-interval"
+            )
         with contextlib.suppress(OSError):
             if args.run_as_cmd and pathlib.Path(args.script).exists():
                 parser.error("remove the option -c to run a file")
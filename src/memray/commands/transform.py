@@ -38,6 +38,14 @@ class TransformCommand(HighWatermarkCommand):
                 f"Format not supported: {args.format}", exit_code=1
             )
 
+        needs_pyarrow = the_format in ("parquet", "arrow")
+        if needs_pyarrow and importlib.util.find_spec("pyarrow") is None:
+            raise MemrayCommandError(
+                f"The {the_format} format requires pyarrow. "
+                "Install it with: python -m pip install pyarrow",
+                exit_code=1,
+            )
+
         self.suffix = suffix
         self.reporter_name = the_format
         super().run(args, parser)
@@ -72,3 +80,9 @@ class TransformCommand(HighWatermarkCommand):
         print()
         print("To generate a graph from the transform file, run for example:")
         print(f"{command} -f json {self.output_file} | dot -Tpng -o output.png")
+
+    def post_run_pprof(self) -> None:
+        assert self.output_file is not None
+        print()
+        print("To explore the profile with the pprof tool, run for example:")
+        print(f"go tool pprof -http=: {self.output_file}")
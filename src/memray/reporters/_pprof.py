@@ -0,0 +1,178 @@
+"""Minimal writer for the pprof ``profile.proto`` format.
+
+Only the subset of the protocol buffers wire format needed to serialize a
+``perftools.profiles.Profile`` message is implemented here, so that exporting
+to pprof doesn't require any third party dependency. The message layout is
+described in https://github.com/google/pprof/blob/main/proto/profile.proto
+"""
+
+from typing import Dict
+from typing import Iterable
+from typing import Sequence
+from typing import Tuple
+
+_WIRE_VARINT = 0
+_WIRE_LENGTH_DELIMITED = 2
+
+# Field numbers of the messages in profile.proto that we emit.
+_PROFILE_SAMPLE_TYPE = 1
+_PROFILE_SAMPLE = 2
+_PROFILE_LOCATION = 4
+_PROFILE_FUNCTION = 5
+_PROFILE_STRING_TABLE = 6
+_PROFILE_TIME_NANOS = 9
+_PROFILE_DURATION_NANOS = 10
+_PROFILE_PERIOD_TYPE = 11
+_PROFILE_COMMENT = 13
+_PROFILE_DEFAULT_SAMPLE_TYPE = 14
+
+_VALUE_TYPE_TYPE = 1
+_VALUE_TYPE_UNIT = 2
+
+_SAMPLE_LOCATION_ID = 1
+_SAMPLE_VALUE = 2
+
+_LOCATION_ID = 1
+_LOCATION_LINE = 4
+
+_LINE_FUNCTION_ID = 1
+_LINE_LINE = 2
+
+_FUNCTION_ID = 1
+_FUNCTION_NAME = 2
+_FUNCTION_SYSTEM_NAME = 3
+_FUNCTION_FILENAME = 4
+
+
+def _varint(value: int) -> bytes:
+    # int64 fields are encoded as their two's complement 64 bit representation
+    value &= 0xFFFFFFFFFFFFFFFF
+    ret = bytearray()
+    while value > 0x7F:
+        ret.append((value & 0x7F) | 0x80)
+        value >>= 7
+    ret.append(value)
+    return bytes(ret)
+
+
+def _int_field(field: int, value: int) -> bytes:
+    if not value:
+        return b""
+    return _varint(field << 3 | _WIRE_VARINT) + _varint(value)
+
+
+def _bytes_field(field: int, data: bytes) -> bytes:
+    return _varint(field << 3 | _WIRE_LENGTH_DELIMITED) + _varint(len(data)) + data
+
+
+def _packed_field(field: int, values: Iterable[int]) -> bytes:
+    data = b"".join(_varint(value) for value in values)
+    if not data:
+        return b""
+    return _bytes_field(field, data)
+
+
+class ProfileBuilder:
+    """Incrementally build a serialized pprof profile.
+
+    Strings, functions and locations are interned as they are seen, so every
+    distinct frame is stored only once no matter how many samples refer to it.
+    Samples are encoded as soon as they are added.
+    """
+
+    def __init__(
+        self,
+        sample_types: Sequence[Tuple[str, str]],
+        *,
+        default_sample_type: str,
+    ) -> None:
+        self._strings: Dict[str, int] = {"": 0}
+        self._functions: Dict[Tuple[str, str], int] = {}
+        self._locations: Dict[Tuple[str, str, int], int] = {}
+        self._header = bytearray()
+        self._body = bytearray()
+        self.n_values = len(sample_types)
+        for type_name, unit in sample_types:
+            self._header += _bytes_field(
+                _PROFILE_SAMPLE_TYPE, self._value_type(type_name, unit)
+            )
+        self._default_sample_type = self.string_id(default_sample_type)
+        self._trailer = bytearray()
+
+    def string_id(self, string: str) -> int:
+        index = self._strings.get(string)
+        if index is None:
+            index = self._strings[string] = len(self._strings)
+        return index
+
+    def _value_type(self, type_name: str, unit: str) -> bytes:
+        return _int_field(_VALUE_TYPE_TYPE, self.string_id(type_name)) + _int_field(
+            _VALUE_TYPE_UNIT, self.string_id(unit)
+        )
+
+    def function_id(self, function: str, filename: str) -> int:
+        key = (function, filename)
+        function_id = self._functions.get(key)
+        if function_id is None:
+            # IDs must be non-zero, as 0 means "unset" in profile.proto
+            function_id = self._functions[key] = len(self._functions) + 1
+            name = self.string_id(function)
+            message = (
+                _int_field(_FUNCTION_ID, function_id)
+                + _int_field(_FUNCTION_NAME, name)
+                + _int_field(_FUNCTION_SYSTEM_NAME, name)
+                + _int_field(_FUNCTION_FILENAME, self.string_id(filename))
+            )
+            self._body += _bytes_field(_PROFILE_FUNCTION, message)
+        return function_id
+
+    def location_id(self, function: str, filename: str, lineno: int) -> int:
+        key = (function, filename, lineno)
+        location_id = self._locations.get(key)
+        if location_id is None:
+            location_id = self._locations[key] = len(self._locations) + 1
+            line = _int_field(
+                _LINE_FUNCTION_ID, self.function_id(function, filename)
+            ) + _int_field(_LINE_LINE, lineno)
+            message = _int_field(_LOCATION_ID, location_id) + _bytes_field(
+                _LOCATION_LINE, line
+            )
+            self._body += _bytes_field(_PROFILE_LOCATION, message)
+        return location_id
+
+    def add_sample(self, location_ids: Sequence[int], values: Sequence[int]) -> None:
+        """Add a sample. Location IDs must be ordered from the leaf frame."""
+        assert len(values) == self.n_values
+        message = _packed_field(_SAMPLE_LOCATION_ID, location_ids) + _packed_field(
+            _SAMPLE_VALUE, values
+        )
+        self._body += _bytes_field(_PROFILE_SAMPLE, message)
+
+    def set_time(self, time_nanos: int, duration_nanos: int) -> None:
+        self._trailer += _int_field(_PROFILE_TIME_NANOS, time_nanos)
+        self._trailer += _int_field(_PROFILE_DURATION_NANOS, duration_nanos)
+
+    def set_period_type(self, type_name: str, unit: str) -> None:
+        self._trailer += _bytes_field(
+            _PROFILE_PERIOD_TYPE, self._value_type(type_name, unit)
+        )
+
+    def add_comment(self, comment: str) -> None:
+        self._trailer += _int_field(_PROFILE_COMMENT, self.string_id(comment))
+
+    def serialize(self) -> bytes:
+        # Fields of a message may appear in any order, so the string table is
+        # written last, once every string has been interned.
+        string_table = b"".join(
+            _bytes_field(_PROFILE_STRING_TABLE, string.encode("utf-8"))
+            for string in self._strings
+        )
+        return b"".join(
+            (
+                self._header,
+                self._body,
+                self._trailer,
+                _int_field(_PROFILE_DEFAULT_SAMPLE_TYPE, self._default_sample_type),
+                string_table,
+            )
+        )
@@ -1,9 +1,16 @@
+import array
 import csv
+import gzip
 import json
+import sqlite3
+from pathlib import Path
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Sequence
 from typing import TextIO
 from typing import Tuple
 
@@ -11,15 +18,135 @@ from memray import AllocationRecord
 from memray import AllocatorType
 from memray import MemorySnapshot
 from memray import Metadata
+from memray.reporters._pprof import ProfileBuilder
 from memray.reporters.common import format_thread_name
 
 Location = Tuple[str, str]
 
+COLUMNAR_BATCH_SIZE = 64 * 1024
+SQLITE_BATCH_SIZE = 64 * 1024
+
+# The allocations describe a single snapshot (the high water mark or the
+# leaks), so unlike memory_snapshots they have no time column.
+SQLITE_SCHEMA = """
+CREATE TABLE frames (
+    frame_id INTEGER PRIMARY KEY,
+    function TEXT NOT NULL,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE TABLE stacks (
+    stack_id INTEGER PRIMARY KEY,
+    frame_id INTEGER NOT NULL REFERENCES frames,
+    parent_stack_id INTEGER REFERENCES stacks
+);
+CREATE TABLE threads (
+    tid INTEGER PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE allocations (
+    allocator TEXT NOT NULL,
+    num_allocations INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    tid INTEGER NOT NULL REFERENCES threads,
+    stack_id INTEGER REFERENCES stacks
+);
+CREATE TABLE memory_snapshots (
+    time INTEGER NOT NULL,
+    rss INTEGER NOT NULL,
+    heap INTEGER NOT NULL
+);
+"""
+
+# Indexes are created once all the rows are inserted, which is much faster
+# than keeping them up to date during the load.
+SQLITE_INDEXES = """
+CREATE INDEX allocations_stack_id ON allocations (stack_id);
+CREATE INDEX allocations_tid ON allocations (tid);
+CREATE INDEX allocations_size ON allocations (size);
+CREATE INDEX stacks_parent_stack_id ON stacks (parent_stack_id);
+CREATE INDEX stacks_frame_id ON stacks (frame_id);
+CREATE INDEX frames_file ON frames (file);
+CREATE INDEX frames_function ON frames (function);
+CREATE INDEX memory_snapshots_time ON memory_snapshots (time);
+"""
+
+
+class _StackInterner:
+    """Assign integer ids to distinct frames and call stacks.
+
+    Call stacks are stored as a tree, with every stack referring to the stack
+    of its caller, so that common prefixes are only stored once. The rows for
+    frames and stacks seen for the first time are queued in ``new_frames`` and
+    ``new_stacks`` until the caller drains them.
+    """
+
+    def __init__(self) -> None:
+        self._frame_ids: Dict[Tuple[str, str, int], int] = {}
+        self._stack_ids: Dict[Tuple[Optional[int], int], int] = {}
+        self.new_frames: List[Tuple[int, str, str, int]] = []
+        self.new_stacks: List[Tuple[int, int, Optional[int]]] = []
+
+    def intern(self, stack_trace: Sequence[Tuple[str, str, int]]) -> Optional[int]:
+        stack_id: Optional[int] = None
+        for frame in reversed(stack_trace):
+            frame_id = self._frame_ids.get(frame)
+            if frame_id is None:
+                frame_id = self._frame_ids[frame] = len(self._frame_ids)
+                self.new_frames.append((frame_id, *frame))
+
+            key = (stack_id, frame_id)
+            parent_id = stack_id
+            stack_id = self._stack_ids.get(key)
+            if stack_id is None:
+                stack_id = self._stack_ids[key] = len(self._stack_ids)
+                self.new_stacks.append((stack_id, frame_id, parent_id))
+        return stack_id
+
+
+class _BatchedTableWriter:
+    """Accumulate rows column by column and write them out in record batches."""
+
+    def __init__(self, writer: Any, schema: Any, batch_size: int) -> None:
+        self._writer = writer
+        self._schema = schema
+        self._batch_size = batch_size
+        self._columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+        self._pending = 0
+
+    def append(self, *row: Any) -> None:
+        for column, value in zip(self._columns.values(), row):
+            column.append(value)
+        self._pending += 1
+        if self._pending >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        import pyarrow
+
+        batch = pyarrow.RecordBatch.from_pydict(self._columns, schema=self._schema)
+        self._writer.write_batch(batch)
+        for column in self._columns.values():
+            column.clear()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
 
 class TransformReporter:
     SUFFIX_MAP = {
         "gprof2dot": ".json",
         "csv": ".csv",
+        "pprof": ".pb.gz",
+        "collapsed": ".txt",
+        "speedscope": ".json",
+        "parquet": ".parquet",
+        "arrow": ".arrow",
+        "sqlite": ".sqlite",
     }
 
     def __init__(
@@ -122,3 +249,331 @@ class TransformReporter:
                     "|".join(f"{func};{mod};{line}" for func, mod, line in stack_trace),
                 ]
             )
+
+    def render_as_pprof(
+        self,
+        outfile: TextIO,
+        metadata: Optional[Metadata] = None,
+        **kwargs: Any,
+    ) -> None:
+        # The reported snapshot holds the allocations that were alive at the
+        # chosen point (the high water mark, or the end of the process for
+        # leaks), so the alloc_* and inuse_* sample types carry the same values.
+        # For temporary allocations they carry the same values too, even though
+        # none of those allocations were alive at any single point.
+        profile = ProfileBuilder(
+            [
+                ("alloc_objects", "count"),
+                ("alloc_space", "bytes"),
+                ("inuse_objects", "count"),
+                ("inuse_space", "bytes"),
+            ],
+            default_sample_type="inuse_space",
+        )
+        profile.set_period_type("space", "bytes")
+
+        # Many records share a call stack, so the locations of each stack are
+        # looked up once, keyed by the indices that identify the stack in the
+        # reader's frame trees. The stack itself is only resolved into frames
+        # the first time it's seen. The thread is part of the key because the
+        # frames above the call that started tracking are hidden on the main
+        # thread only.
+        location_ids_by_stack: Dict[Tuple[int, ...], List[int]] = {}
+        for record in self.allocations:
+            if self.native_traces:
+                stack_key: Tuple[int, ...] = (
+                    record.tid,
+                    record.stack_id,
+                    record.native_stack_id,
+                    record.native_segment_generation,
+                )
+            else:
+                stack_key = (record.tid, record.stack_id)
+            location_ids = location_ids_by_stack.get(stack_key)
+            if location_ids is None:
+                stack_trace = (
+                    record.hybrid_stack_trace()
+                    if self.native_traces
+                    else record.stack_trace()
+                )
+                location_ids = location_ids_by_stack[stack_key] = [
+                    profile.location_id(func, mod, line)
+                    for func, mod, line in stack_trace
+                ]
+            n_allocations = record.n_allocations
+            size = record.size
+            profile.add_sample(location_ids, (n_allocations, size, n_allocations, size))
+
+        if metadata is not None:
+            start_time = metadata.start_time.timestamp()
+            end_time = metadata.end_time.timestamp()
+            profile.set_time(
+                int(start_time * 1e9), max(0, int((end_time - start_time) * 1e9))
+            )
+            profile.add_comment(metadata.command_line)
+
+        # pprof files are binary, so bypass the text layer of the output file.
+        outfile.flush()
+        with gzip.GzipFile(fileobj=outfile.buffer, mode="wb") as compressed:
+            compressed.write(profile.serialize())
+
+    def render_as_collapsed(
+        self,
+        outfile: TextIO,
+        **kwargs: Any,
+    ) -> None:
+        # Each record is written as soon as it's read, so that the memory used
+        # doesn't depend on the number of records.
+        frame_names: Dict[Tuple[str, str, int], str] = {}
+        for record in self.allocations:
+            stack_trace = (
+                record.hybrid_stack_trace()
+                if self.native_traces
+                else record.stack_trace()
+            )
+            names = []
+            for frame in stack_trace:
+                name = frame_names.get(frame)
+                if name is None:
+                    func, mod, line = frame
+                    name = frame_names[frame] = f"{func} ({mod}:{line})".replace(
+                        ";", ":"
+                    )
+                names.append(name)
+
+            if not names:
+                continue
+            names.reverse()
+            outfile.write(f"{';'.join(names)} {record.size}\n")
+
+    def render_as_speedscope(
+        self,
+        outfile: TextIO,
+        metadata: Optional[Metadata] = None,
+        **kwargs: Any,
+    ) -> None:
+        # JSON object members can appear in any order, so the samples are
+        # streamed out first, and the frame table and the weights are written
+        # once every record has been seen.
+        name = metadata.command_line if metadata is not None else "memray"
+        frame_to_index: Dict[Tuple[str, str, int], int] = {}
+        frames: List[Dict[str, Any]] = []
+        weights = array.array("q")
+
+        outfile.write('{"profiles": [{"type": "sampled", "samples": [')
+        for record in self.allocations:
+            stack_trace = (
+                record.hybrid_stack_trace()
+                if self.native_traces
+                else record.stack_trace()
+            )
+            sample = []
+            for frame in stack_trace:
+                index = frame_to_index.get(frame)
+                if index is None:
+                    func, mod, line = frame
+                    index = frame_to_index[frame] = len(frames)
+                    frames.append({"name": func, "file": mod, "line": line})
+                sample.append(index)
+            sample.reverse()
+
+            if weights:
+                outfile.write(", ")
+            outfile.write(json.dumps(sample))
+            weights.append(record.size)
+
+        outfile.write('], "weights": ')
+        json.dump(weights.tolist(), outfile)
+        profile_fields = {
+            "name": name,
+            "unit": "bytes",
+            "startValue": 0,
+            "endValue": sum(weights),
+        }
+        outfile.write(f", {json.dumps(profile_fields)[1:-1]}}}], ")
+
+        trailer = {
+            "shared": {"frames": frames},
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "memray",
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+        }
+        outfile.write(json.dumps(trailer)[1:])
+
+    def render_as_parquet(
+        self,
+        outfile: TextIO,
+        **kwargs: Any,
+    ) -> None:
+        import pyarrow.parquet
+
+        self._render_as_columnar(outfile, ".parquet", pyarrow.parquet.ParquetWriter)
+
+    def render_as_arrow(
+        self,
+        outfile: TextIO,
+        **kwargs: Any,
+    ) -> None:
+        import pyarrow.ipc
+
+        self._render_as_columnar(outfile, ".arrow", pyarrow.ipc.new_file)
+
+    def _render_as_columnar(
+        self,
+        outfile: TextIO,
+        suffix: str,
+        writer_factory: Callable[[Any, Any], Any],
+    ) -> None:
+        import pyarrow
+
+        # The allocations table goes to the output file, and the frames and
+        # stacks tables go to sibling files.
+        output_path = Path(outfile.name)
+        frames_path = output_path.with_suffix(f".frames{suffix}")
+        stacks_path = output_path.with_suffix(f".stacks{suffix}")
+
+        allocations_schema = pyarrow.schema(
+            [
+                ("allocator", pyarrow.string()),
+                ("num_allocations", pyarrow.uint64()),
+                ("size", pyarrow.uint64()),
+                ("tid", pyarrow.int64()),
+                ("thread_name", pyarrow.string()),
+                ("stack_id", pyarrow.uint32()),
+            ]
+        )
+        frames_schema = pyarrow.schema(
+            [
+                ("frame_id", pyarrow.uint32()),
+                ("function", pyarrow.string()),
+                ("file", pyarrow.string()),
+                ("line", pyarrow.int64()),
+            ]
+        )
+        stacks_schema = pyarrow.schema(
+            [
+                ("stack_id", pyarrow.uint32()),
+                ("frame_id", pyarrow.uint32()),
+                ("parent_stack_id", pyarrow.uint32()),
+            ]
+        )
+
+        outfile.flush()
+        allocations = _BatchedTableWriter(
+            writer_factory(outfile.buffer, allocations_schema),
+            allocations_schema,
+            COLUMNAR_BATCH_SIZE,
+        )
+        frames = _BatchedTableWriter(
+            writer_factory(str(frames_path), frames_schema),
+            frames_schema,
+            COLUMNAR_BATCH_SIZE,
+        )
+        stacks = _BatchedTableWriter(
+            writer_factory(str(stacks_path), stacks_schema),
+            stacks_schema,
+            COLUMNAR_BATCH_SIZE,
+        )
+
+        interner = _StackInterner()
+        try:
+            for record in self.allocations:
+                stack_trace = (
+                    tuple(record.hybrid_stack_trace())
+                    if self.native_traces
+                    else record.stack_trace()
+                )
+                stack_id = interner.intern(stack_trace)
+                for frame_row in interner.new_frames:
+                    frames.append(*frame_row)
+                for stack_row in interner.new_stacks:
+                    stacks.append(*stack_row)
+                interner.new_frames.clear()
+                interner.new_stacks.clear()
+
+                allocations.append(
+                    AllocatorType(record.allocator).name,
+                    record.n_allocations,
+                    record.size,
+                    record.tid,
+                    format_thread_name(record),
+                    stack_id,
+                )
+        finally:
+            allocations.close()
+            frames.close()
+            stacks.close()
+
+    def render_as_sqlite(
+        self,
+        outfile: TextIO,
+        **kwargs: Any,
+    ) -> None:
+        # The output file was created empty, which SQLite treats as a new
+        # database, so it can be opened by name.
+        connection = sqlite3.connect(outfile.name, isolation_level=None)
+        try:
+            self._load_sqlite_database(connection)
+        finally:
+            connection.close()
+
+    def _load_sqlite_database(self, connection: sqlite3.Connection) -> None:
+        # The database is written from scratch, so there's nothing to protect
+        # from a crash mid-load, and journaling would only slow it down.
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("BEGIN")
+        for statement in SQLITE_SCHEMA.split(";"):
+            connection.execute(statement)
+
+        interner = _StackInterner()
+        thread_names: Dict[int, str] = {}
+        allocations: List[Tuple[str, int, int, int, Optional[int]]] = []
+
+        def insert_pending_rows() -> None:
+            connection.executemany(
+                "INSERT INTO frames VALUES (?, ?, ?, ?)", interner.new_frames
+            )
+            connection.executemany(
+                "INSERT INTO stacks VALUES (?, ?, ?)", interner.new_stacks
+            )
+            connection.executemany(
+                "INSERT INTO allocations VALUES (?, ?, ?, ?, ?)", allocations
+            )
+            interner.new_frames.clear()
+            interner.new_stacks.clear()
+            allocations.clear()
+
+        for record in self.allocations:
+            stack_trace = (
+                tuple(record.hybrid_stack_trace())
+                if self.native_traces
+                else record.stack_trace()
+            )
+            stack_id = interner.intern(stack_trace)
+            if record.tid not in thread_names:
+                thread_names[record.tid] = record.thread_name
+            allocations.append(
+                (
+                    AllocatorType(record.allocator).name,
+                    record.n_allocations,
+                    record.size,
+                    record.tid,
+                    stack_id,
+                )
+            )
+            if len(allocations) >= SQLITE_BATCH_SIZE:
+                insert_pending_rows()
+
+        insert_pending_rows()
+        connection.executemany(
+            "INSERT INTO threads VALUES (?, ?)", thread_names.items()
+        )
+        connection.executemany(
+            "INSERT INTO memory_snapshots VALUES (?, ?, ?)",
+            ((record.time, record.rss, record.heap) for record in self.memory_records),
+        )
+        for statement in SQLITE_INDEXES.split(";"):
+            connection.execute(statement)
+        connection.execute("COMMIT")
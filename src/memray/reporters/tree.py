@@ -1,5 +1,6 @@
 import asyncio
 import functools
+import heapq
 import linecache
 import sys
 from dataclasses import dataclass
@@ -258,6 +259,7 @@ class TreeScreen(Screen[None]):
     def expand_first_child(self, node: TreeNode[Frame]) -> None:
         while node.children:
             node = node.children[0]
+            self.materialize_children(node)
             node.toggle()
 
     def compose(self) -> ComposeResult:
@@ -286,6 +288,7 @@ class TreeScreen(Screen[None]):
         tree = self.query_one(FrameTree)
         current_node = tree.cursor_node
         while current_node:
+            self.materialize_children(current_node)
             current_node.toggle()
             if len(current_node.children) != 1:
                 break
@@ -317,28 +320,42 @@ class TreeScreen(Screen[None]):
             ret.append_text(Text("hidden"))
         return ret
 
-    def add_children(self, tree: TreeNode[Frame], children: Iterable[Frame]) -> None:
-        # Add children to the tree from largest to smallest
+    def visible_children(self, children: Iterable[Frame]) -> Iterator[Frame]:
+        # Yield children from largest to smallest. Frames hidden by the
+        # uninteresting filter are skipped, and their own visible children are
+        # yielded in their place.
         children = sorted(children, key=lambda child: child.value, reverse=True)
 
         if self.import_system_filter is not None:
-            children = tuple(filter(self.import_system_filter, children))
+            children = list(filter(self.import_system_filter, children))
 
         for child in children:
             if self.uninteresting_filter is None or self.uninteresting_filter(child):
-                if not tree.allow_expand:
-                    assert tree.data is not None
-                    tree.label = self.frame_text(tree.data, allow_expand=True)
-                    tree.allow_expand = True
-                new_tree = tree.add(
-                    self.frame_text(child, allow_expand=False),
-                    data=child,
-                    allow_expand=False,
-                )
+                yield child
             else:
-                new_tree = tree
+                yield from self.visible_children(child.children.values())
+
+    def has_visible_children(self, node: Frame) -> bool:
+        return next(self.visible_children(node.children.values()), None) is not None
 
-            self.add_children(new_tree, child.children.values())
+    def add_children(self, tree: TreeNode[Frame], children: Iterable[Frame]) -> None:
+        # Only a single level is added. Grandchildren are materialized lazily,
+        # when their parent node gets expanded.
+        for child in self.visible_children(children):
+            allow_expand = self.has_visible_children(child)
+            tree.add(
+                self.frame_text(child, allow_expand=allow_expand),
+                data=child,
+                allow_expand=allow_expand,
+            )
+
+    def materialize_children(self, node: TreeNode[Frame]) -> None:
+        if node.children or not node.allow_expand or node.data is None:
+            return
+        self.add_children(node, node.data.children.values())
+
+    def on_tree_node_expanded(self, event: Tree.NodeExpanded[Frame]) -> None:
+        self.materialize_children(event.node)
 
     def add_elided_locations_node(self, tree: TreeNode[Frame]) -> None:
         if not self.elided_locations.n_locations:
@@ -446,8 +463,11 @@ class TreeReporter:
         native_traces: bool,
     ) -> "TreeReporter":
         data = Frame(location=ROOT_NODE, value=0, import_system=False, interesting=True)
-        sorted_records = sorted(allocations, key=lambda alloc: alloc.size, reverse=True)
-        for record in sorted_records[:biggest_allocs]:
+        records = list(allocations)
+        biggest_records = heapq.nlargest(
+            biggest_allocs, records, key=lambda alloc: alloc.size
+        )
+        for record in biggest_records:
             size = record.size
             data.value += size
             data.n_allocations += record.n_allocations
@@ -485,12 +505,15 @@ class TreeReporter:
         elided_locations = ElidedLocations()
         elided_locations.cutoff = biggest_allocs
 
-        for record in sorted_records[biggest_allocs:]:
-            data.value += record.size
-            data.n_allocations += record.n_allocations
-            elided_locations.n_locations += 1
-            elided_locations.n_bytes += record.size
-            elided_locations.n_allocations += record.n_allocations
+        # Everything that didn't make the cut is summarized without being
+        # sorted, so this stays linear in the number of locations.
+        elided_locations.n_locations = len(records) - len(biggest_records)
+        elided_locations.n_bytes = sum(record.size for record in records) - data.value
+        elided_locations.n_allocations = (
+            sum(record.n_allocations for record in records) - data.n_allocations
+        )
+        data.value += elided_locations.n_bytes
+        data.n_allocations += elided_locations.n_allocations
 
         return cls(data, elided_locations)
 
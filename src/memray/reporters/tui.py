@@ -3,6 +3,7 @@ import os
 import pathlib
 import sys
 import threading
+from collections import Counter
 from collections import defaultdict
 from collections import deque
 from dataclasses import dataclass
@@ -45,13 +46,69 @@ from textual.widgets import Static
 from textual.widgets.data_table import RowKey
 
 from memray import AllocationRecord
-from memray import SocketReader
+from memray._memray import SnapshotDelta
 from memray._memray import size_fmt
 from memray.reporters._textual_hacks import Bindings
 from memray.reporters._textual_hacks import redraw_footer
 from memray.reporters._textual_hacks import update_key_description
 
-MAX_MEMORY_RATIO = 0.95
+if sys.version_info >= (3, 8):
+    from typing import Protocol
+    from typing import runtime_checkable
+else:
+    from typing_extensions import Protocol
+    from typing_extensions import runtime_checkable
+
+# (function, file, own_memory, total_memory, n_allocations, thread_ids)
+LocationRollupRow = Tuple[str, str, int, int, int, Tuple[int, ...]]
+
+
+class LiveReader(Protocol):
+    """Anything the TUI can display a live session from, like a `SocketReader`
+    or a `BrokerReader`."""
+
+    @property
+    def pid(self) -> Optional[int]:
+        ...
+
+    @property
+    def command_line(self) -> Optional[str]:
+        ...
+
+    @property
+    def is_active(self) -> bool:
+        ...
+
+    @property
+    def has_native_traces(self) -> bool:
+        ...
+
+    @property
+    def history_retention(self) -> float:
+        ...
+
+    def get_location_rollup(self) -> Tuple[List[LocationRollupRow], Dict[int, str]]:
+        ...
+
+    def get_history_timestamps(self) -> List[int]:
+        ...
+
+    def get_history_location_rollup(
+        self, index: int
+    ) -> Tuple[List[LocationRollupRow], Dict[int, str]]:
+        ...
+
+    def get_history_snapshot(self, index: int) -> List[AllocationRecord]:
+        ...
+
+
+@runtime_checkable
+class SnapshotDeltaReader(Protocol):
+    """A live reader that can also return the records that changed since a
+    previous snapshot, like a `SocketReader`."""
+
+    def get_snapshot_delta(self, since_version: int = 0) -> SnapshotDelta:
+        ...
 
 
 @dataclass(frozen=True)
@@ -73,15 +130,30 @@ class Snapshot:
     heap_size: int
     records: List[AllocationRecord]
     records_by_location: Dict[Location, AllocationEntry]
+    thread_names: Dict[int, str]
 
 
-_EMPTY_SNAPSHOT = Snapshot(heap_size=0, records=[], records_by_location={})
+_EMPTY_SNAPSHOT = Snapshot(
+    heap_size=0, records=[], records_by_location={}, thread_names={}
+)
+
+
+@dataclass(frozen=True)
+class HistoryPoint:
+    snapshot: Snapshot
+    age: float  # Seconds before the newest history sample
 
 
 class SnapshotFetched(Message):
-    def __init__(self, snapshot: Snapshot, disconnected: bool) -> None:
+    def __init__(
+        self,
+        snapshot: Snapshot,
+        disconnected: bool,
+        history: Optional[HistoryPoint] = None,
+    ) -> None:
         self.snapshot = snapshot
         self.disconnected = disconnected
+        self.history = history
         super().__init__()
 
 
@@ -194,6 +266,28 @@ class SortableText(Text):
         return cast(bool, self.value == other.value)
 
 
+def _location_contributions(
+    allocation: AllocationRecord, native_traces: Optional[bool]
+) -> List[Tuple[Location, bool]]:
+    """Return each distinct location in an allocation's stack, along with
+    whether the allocation counts as "own" memory for that location."""
+    stack_trace = list(
+        allocation.hybrid_stack_trace() if native_traces else allocation.stack_trace()
+    )
+    if not stack_trace:
+        return [(Location(function="???", file="???"), True)]
+
+    contributions = []
+    visited = set()
+    for i, (function, file_name, _) in enumerate(stack_trace):
+        location = Location(function=function, file=file_name)
+        if location in visited:
+            continue
+        visited.add(location)
+        contributions.append((location, i == 0))
+    return contributions
+
+
 def aggregate_allocations(
     allocations: Iterable[AllocationRecord],
     memory_threshold: float = float("inf"),
@@ -215,28 +309,10 @@ def aggregate_allocations(
             break
         current_total += allocation.size
 
-        stack_trace = list(
-            allocation.hybrid_stack_trace()
-            if native_traces
-            else allocation.stack_trace()
-        )
-        if not stack_trace:
-            frame = processed_allocations[Location(function="???", file="???")]
-            frame.total_memory += allocation.size
-            frame.own_memory += allocation.size
-            frame.n_allocations += allocation.n_allocations
-            frame.thread_ids.add(allocation.tid)
-            continue
-
         # Walk upwards and sum totals
-        visited = set()
-        for i, (function, file_name, _) in enumerate(stack_trace):
-            location = Location(function=function, file=file_name)
+        for location, is_own in _location_contributions(allocation, native_traces):
             frame = processed_allocations[location]
-            if location in visited:
-                continue
-            visited.add(location)
-            if i == 0:
+            if is_own:
                 frame.own_memory += allocation.size
             frame.total_memory += allocation.size
             frame.n_allocations += allocation.n_allocations
@@ -244,6 +320,144 @@ def aggregate_allocations(
     return processed_allocations
 
 
+class IncrementalAggregator:
+    """Keep the result of `aggregate_allocations` up to date from the deltas
+    returned by `SocketReader.get_snapshot_delta`.
+
+    Only the locations named in each delta have their stacks walked, so the
+    cost of an update is proportional to how much changed rather than to the
+    number of live locations. Entries are replaced rather than mutated, so
+    snapshots that were already handed out never change.
+    """
+
+    def __init__(self, native_traces: Optional[bool] = False) -> None:
+        self._native_traces = native_traces
+        self.version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.heap_size = 0
+        self._records: Dict[int, AllocationRecord] = {}
+        self._contributions: Dict[int, List[Tuple[Location, bool]]] = {}
+        self._by_location: Dict[Location, AllocationEntry] = {}
+        self._thread_counts: Dict[Location, Counter[int]] = {}
+
+    def apply(self, delta: SnapshotDelta) -> None:
+        if delta.full:
+            self._reset()
+
+        copied: Set[Location] = set()
+        for location_id, record in delta.records.items():
+            old_record = self._records.pop(location_id, None)
+            if old_record is not None:
+                self._update(location_id, old_record, -1, copied)
+                self.heap_size -= old_record.size
+            if record.n_allocations:
+                self._records[location_id] = record
+                self._update(location_id, record, 1, copied)
+                self.heap_size += record.size
+            else:
+                self._contributions.pop(location_id, None)
+        self.version = delta.version
+
+    def _update(
+        self,
+        location_id: int,
+        record: AllocationRecord,
+        sign: int,
+        copied: Set[Location],
+    ) -> None:
+        contributions = self._contributions.get(location_id)
+        if contributions is None:
+            contributions = _location_contributions(record, self._native_traces)
+            self._contributions[location_id] = contributions
+
+        for location, is_own in contributions:
+            entry = self._by_location.get(location)
+            if entry is None:
+                entry = AllocationEntry(
+                    own_memory=0, total_memory=0, n_allocations=0, thread_ids=set()
+                )
+                copied.add(location)
+            elif location not in copied:
+                entry = AllocationEntry(
+                    own_memory=entry.own_memory,
+                    total_memory=entry.total_memory,
+                    n_allocations=entry.n_allocations,
+                    thread_ids=set(entry.thread_ids),
+                )
+                copied.add(location)
+            self._by_location[location] = entry
+
+            if is_own:
+                entry.own_memory += sign * record.size
+            entry.total_memory += sign * record.size
+            entry.n_allocations += sign * record.n_allocations
+
+            thread_counts = self._thread_counts.setdefault(location, Counter())
+            thread_counts[record.tid] += sign
+            if thread_counts[record.tid] > 0:
+                entry.thread_ids.add(record.tid)
+            else:
+                del thread_counts[record.tid]
+                entry.thread_ids.discard(record.tid)
+
+            if not thread_counts:
+                del self._thread_counts[location]
+                del self._by_location[location]
+
+    def snapshot(self) -> Snapshot:
+        records = list(self._records.values())
+        return Snapshot(
+            heap_size=self.heap_size,
+            records=records,
+            records_by_location=dict(self._by_location),
+            thread_names={record.tid: record.thread_name for record in records},
+        )
+
+
+def snapshot_from_rollup(
+    rows: Iterable[LocationRollupRow], thread_names: Dict[int, str]
+) -> Snapshot:
+    """Build a snapshot from the result of `SocketReader.get_location_rollup`.
+
+    The rollup already holds the totals for every location, so no stacks need
+    to be walked here. Individual records aren't materialized.
+    """
+    records_by_location = {}
+    heap_size = 0
+    for function, file, own_memory, total_memory, n_allocations, tids in rows:
+        records_by_location[Location(function=function, file=file)] = AllocationEntry(
+            own_memory=own_memory,
+            total_memory=total_memory,
+            n_allocations=n_allocations,
+            thread_ids=set(tids),
+        )
+        heap_size += own_memory
+    return Snapshot(
+        heap_size=heap_size,
+        records=[],
+        records_by_location=records_by_location,
+        thread_names=thread_names,
+    )
+
+
+def fetch_live_snapshot(
+    reader: LiveReader, aggregator: IncrementalAggregator
+) -> Snapshot:
+    """Fetch a snapshot of the memory currently held by a live process.
+
+    Hybrid stacks are only merged on the Python side, so in native mode the
+    changed locations are applied to the given aggregator. Otherwise, or when
+    the reader only serves per location totals, the reader's own rollup is
+    used.
+    """
+    if reader.has_native_traces and isinstance(reader, SnapshotDeltaReader):
+        aggregator.apply(reader.get_snapshot_delta(aggregator.version))
+        return aggregator.snapshot()
+    return snapshot_from_rollup(*reader.get_location_rollup())
+
+
 class TimeDisplay(Static):
     """TUI widget to display the current time."""
 
@@ -526,6 +740,8 @@ class TUI(Screen[None]):
         Binding("o", "sort(3)", "Sort by Own"),
         Binding("a", "sort(5)", "Sort by Allocations"),
         Binding("space", "toggle_pause", "Pause"),
+        Binding("left_square_bracket", "rewind(1)", "Rewind"),
+        Binding("right_square_bracket", "rewind(-1)", "Forward"),
         Binding("up", "scroll_grid('up')"),
         Binding("down", "scroll_grid('down')"),
     ]
@@ -540,11 +756,19 @@ class TUI(Screen[None]):
     snapshot = reactive(_EMPTY_SNAPSHOT)
     paused = reactive(False, init=False)
     disconnected = reactive(False, init=False)
+    history: reactive[Optional[HistoryPoint]] = reactive(None, init=False)
 
-    def __init__(self, pid: Optional[int], cmd_line: Optional[str], native: bool):
+    def __init__(
+        self,
+        pid: Optional[int],
+        cmd_line: Optional[str],
+        native: bool,
+        has_history: bool = False,
+    ):
         self.pid = pid
         self.cmd_line = cmd_line
         self.native = native
+        self.has_history = has_history
         self._name_by_tid: Dict[int, str] = {}
         self._max_memory_seen = 0
         self._merge_threads = True
@@ -597,6 +821,11 @@ class TUI(Screen[None]):
             if not self.paused:
                 self.display_snapshot()
 
+    def action_rewind(self, samples: int) -> None:
+        """Move the table further back in time, or forward towards live data."""
+        if self.has_history:
+            cast("TUIApp", self.app).move_through_history(samples)
+
     def action_scroll_grid(self, direction: str) -> None:
         """Toggle pause on keypress"""
         grid = self.query_one(DataTable)
@@ -618,6 +847,10 @@ class TUI(Screen[None]):
     def watch_paused(self) -> None:
         self.update_label()
 
+    def watch_history(self) -> None:
+        self.update_label()
+        redraw_footer(self.app)
+
     def watch_snapshot(self, snapshot: Snapshot) -> None:
         """Called automatically when the snapshot attribute is updated"""
         self._latest_snapshot = snapshot
@@ -625,6 +858,8 @@ class TUI(Screen[None]):
 
     def update_label(self) -> None:
         status_message = []
+        if self.history is not None:
+            status_message.append(f"[cyan]Showing {self.history.age:.0f}s ago[/]")
         if self.paused:
             status_message.append("[yellow]Table updates paused[/]")
         if self.disconnected:
@@ -665,9 +900,13 @@ class TUI(Screen[None]):
         if self.paused:
             return
 
-        name_by_tid = {record.tid: record.thread_name for record in snapshot.records}
-        new_tids = name_by_tid.keys() - self._name_by_tid.keys()
-        self._name_by_tid.update(name_by_tid)
+        # The graph always follows the live data, but the table and the list
+        # of threads show the point in history that was rewound to, if any.
+        if self.history is not None:
+            snapshot = self.history.snapshot
+
+        new_tids = snapshot.thread_names.keys() - self._name_by_tid.keys()
+        self._name_by_tid.update(snapshot.thread_names)
 
         if new_tids:
             threads = self.threads
@@ -698,6 +937,12 @@ class TUI(Screen[None]):
             bindings.pop("greater_than_sign")
             update_key_description(bindings, "m", "Unmerge Threads")
 
+        if not self.has_history:
+            bindings.pop("left_square_bracket")
+            bindings.pop("right_square_bracket")
+        elif self.history is None:
+            bindings.pop("right_square_bracket")
+
     @property
     def active_bindings(self) -> Dict[str, Any]:
         bindings = super().active_bindings.copy()
@@ -706,12 +951,16 @@ class TUI(Screen[None]):
 
 
 class UpdateThread(threading.Thread):
-    def __init__(self, app: "TUIApp", reader: SocketReader) -> None:
+    def __init__(self, app: "TUIApp", reader: LiveReader) -> None:
         self._app = app
         self._reader = reader
         self._update_requested = threading.Event()
         self._update_requested.set()
         self._canceled = threading.Event()
+        self._aggregator = IncrementalAggregator(reader.has_native_traces)
+        # How many history samples back from the newest one to show, or 0 to
+        # only show live data.
+        self.history_offset = 0
         super().__init__()
 
     def run(self) -> None:
@@ -720,27 +969,50 @@ class UpdateThread(threading.Thread):
                 return
             self._update_requested.clear()
 
-            records = list(self._reader.get_current_snapshot(merge_threads=False))
-            heap_size = sum(record.size for record in records)
-            records_by_location = aggregate_allocations(
-                records, MAX_MEMORY_RATIO * heap_size, self._reader.has_native_traces
-            )
-            snapshot = Snapshot(
-                heap_size=heap_size,
-                records=records,
-                records_by_location=records_by_location,
-            )
+            snapshot = fetch_live_snapshot(self._reader, self._aggregator)
+            history = self._fetch_history() if self.history_offset else None
 
             self._app.post_message(
                 SnapshotFetched(
                     snapshot,
                     not self._reader.is_active,
+                    history,
                 )
             )
 
             if not self._reader.is_active:
                 return
 
+    def _fetch_history(self) -> Optional[HistoryPoint]:
+        timestamps = self._reader.get_history_timestamps()
+        if not timestamps:
+            return None
+        self.history_offset = min(self.history_offset, len(timestamps))
+        index = len(timestamps) - self.history_offset
+
+        try:
+            if self._reader.has_native_traces:
+                records = self._reader.get_history_snapshot(index)
+                snapshot = Snapshot(
+                    heap_size=sum(record.size for record in records),
+                    records=records,
+                    records_by_location=aggregate_allocations(
+                        records, native_traces=True
+                    ),
+                    thread_names={record.tid: record.thread_name for record in records},
+                )
+            else:
+                snapshot = snapshot_from_rollup(
+                    *self._reader.get_history_location_rollup(index)
+                )
+        except IndexError:
+            # The sample fell out of the retention window after we listed it.
+            return None
+
+        return HistoryPoint(
+            snapshot=snapshot, age=(timestamps[-1] - timestamps[index]) / 1000
+        )
+
     def cancel(self) -> None:
         self._canceled.set()
         self._update_requested.set()
@@ -756,7 +1028,7 @@ class TUIApp(App[None]):
 
     def __init__(
         self,
-        reader: SocketReader,
+        reader: LiveReader,
         cmdline_override: Optional[str] = None,
         poll_interval: float = 1.0,
     ) -> None:
@@ -787,6 +1059,7 @@ class TUIApp(App[None]):
             pid=self._reader.pid,
             cmd_line=cmd_line,
             native=self._reader.has_native_traces,
+            has_history=self._reader.history_retention > 0,
         )
         self.push_screen(self.tui)
 
@@ -799,10 +1072,21 @@ class TUIApp(App[None]):
         """Method called to process each fetched snapshot."""
         assert self.tui is not None
         with self.batch_update():
+            self.tui.history = message.history
             self.tui.snapshot = message.snapshot
         if message.disconnected:
             self.tui.disconnected = True
 
+    def move_through_history(self, samples: int) -> None:
+        """Show data from further back in time, or closer to the present.
+
+        The history is shown as soon as the next update is fetched. Moving
+        forward past the newest history sample goes back to live data.
+        """
+        offset = max(self._update_thread.history_offset + samples, 0)
+        self._update_thread.history_offset = offset
+        self._update_thread.schedule_update()
+
     def on_resize(self, event: events.Resize) -> None:
         self.set_class(0 <= event.size.width < 81, "narrow")
 
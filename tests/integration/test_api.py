@@ -1,10 +1,17 @@
 """Tests for exercising the public API."""
 
+import os
+import signal
+import threading
+import time
+
 import pytest
 
+from memray import AllocatorType
 from memray import FileDestination
 from memray import FileFormat
 from memray import FileReader
+from memray import RingBufferDestination
 from memray import SocketDestination
 from memray import Tracker
 from memray._test import MemoryAllocator
@@ -95,13 +102,315 @@ def test_follow_fork_with_socket_destination():
             pass
 
 
-def test_aggregated_capture_with_socket_destination():
+def test_ring_buffer_destination_explicit_dump(tmp_path):
     # GIVEN
-    with pytest.raises(
-        RuntimeError, match="AGGREGATED_ALLOCATIONS requires an output file"
-    ):
-        with Tracker(
-            destination=SocketDestination(server_port=1234),
+    allocator = MemoryAllocator()
+    destination = RingBufferDestination(tmp_path / "test.bin")
+    output = tmp_path / "dump.bin"
+
+    # WHEN
+    with Tracker(destination=destination) as tracker:
+        allocator.valloc(1234)
+        allocator.free()
+        assert tracker.dump_ring_buffer(output) == output
+
+    # THEN
+    with FileReader(output) as reader:
+        all_allocations = reader.get_allocation_records()
+        vallocs_and_their_frees = list(filter_relevant_allocations(all_allocations))
+        assert len(vallocs_and_their_frees) == 2
+    assert not (tmp_path / "test.bin").exists()
+
+
+def test_ring_buffer_destination_keeps_surviving_allocations(tmp_path):
+    # GIVEN
+    survivor = MemoryAllocator()
+    churner = MemoryAllocator()
+    destination = RingBufferDestination(tmp_path / "test.bin", max_bytes=4096)
+
+    # WHEN
+    with Tracker(destination=destination) as tracker:
+        survivor.valloc(1234)
+        for _ in range(1000):
+            churner.valloc(4321)
+            churner.free()
+        path = tracker.dump_ring_buffer()
+        survivor.free()
+
+    # THEN
+    assert path == tmp_path / "test.bin.1"
+    with FileReader(path) as reader:
+        records = list(reader.get_allocation_records())
+        leaked = list(reader.get_leaked_allocation_records(merge_threads=False))
+
+    vallocs = [r for r in records if r.allocator == AllocatorType.VALLOC]
+    assert 0 < len(vallocs) < 1000
+    assert vallocs[0].size == 1234
+    assert [r.size for r in leaked if r.allocator == AllocatorType.VALLOC] == [1234]
+
+
+def test_ring_buffer_destination_dumps_on_exception(tmp_path):
+    # GIVEN
+    allocator = MemoryAllocator()
+    destination = RingBufferDestination(tmp_path / "test.bin")
+
+    # WHEN
+    with pytest.raises(ValueError):
+        with Tracker(destination=destination):
+            allocator.valloc(1234)
+            raise ValueError("boom")
+
+    # THEN
+    with FileReader(tmp_path / "test.bin.1") as reader:
+        all_allocations = reader.get_allocation_records()
+        vallocs = list(filter_relevant_allocations(all_allocations))
+        assert [r.size for r in vallocs] == [1234]
+    allocator.free()
+
+
+def test_ring_buffer_destination_dumps_on_signal(tmp_path):
+    # GIVEN
+    allocator = MemoryAllocator()
+    destination = RingBufferDestination(
+        tmp_path / "test.bin", dump_signal=signal.SIGUSR1, dump_on_exception=False
+    )
+    previous_handler = signal.getsignal(signal.SIGUSR1)
+
+    # WHEN
+    with Tracker(destination=destination):
+        allocator.valloc(1234)
+        allocator.free()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        os.kill(os.getpid(), signal.SIGUSR1)
+
+    # THEN
+    assert signal.getsignal(signal.SIGUSR1) is previous_handler
+    for path in (tmp_path / "test.bin.1", tmp_path / "test.bin.2"):
+        with FileReader(path) as reader:
+            all_allocations = reader.get_allocation_records()
+            vallocs_and_their_frees = list(filter_relevant_allocations(all_allocations))
+            assert len(vallocs_and_their_frees) == 2
+    assert not (tmp_path / "test.bin.3").exists()
+
+
+def test_dump_signal_off_the_main_thread_leaves_no_state_behind(tmp_path):
+    # GIVEN
+    destination = RingBufferDestination(
+        tmp_path / "test.bin", dump_signal=signal.SIGUSR1, dump_on_exception=False
+    )
+    tracker = Tracker(destination=destination)
+    previous_handler = signal.getsignal(signal.SIGUSR1)
+    errors = []
+
+    def enter_tracker():
+        try:
+            with tracker:
+                pass
+        except ValueError as error:
+            errors.append(error)
+
+    # WHEN
+    thread = threading.Thread(target=enter_tracker)
+    thread.start()
+    thread.join()
+
+    # THEN
+    assert len(errors) == 1
+    assert signal.getsignal(signal.SIGUSR1) is previous_handler
+    with tracker:
+        pass
+    assert signal.getsignal(signal.SIGUSR1) is previous_handler
+
+
+def test_dump_ring_buffer_requires_ring_buffer_destination(tmp_path):
+    # GIVEN
+    with Tracker(tmp_path / "test.bin") as tracker:
+        # WHEN/THEN
+        with pytest.raises(RuntimeError, match="Only a RingBufferDestination"):
+            tracker.dump_ring_buffer(tmp_path / "dump.bin")
+
+
+def test_dump_ring_buffer_requires_active_tracker(tmp_path):
+    # GIVEN
+    tracker = Tracker(destination=RingBufferDestination(tmp_path / "test.bin"))
+
+    # WHEN/THEN
+    with pytest.raises(RuntimeError, match="must be active"):
+        tracker.dump_ring_buffer(tmp_path / "dump.bin")
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"max_bytes": 0}, "max_bytes must be positive"),
+        ({"max_seconds": 0}, "max_seconds must be positive"),
+        ({"dump_signal": signal.SIGKILL}, "cannot be caught"),
+    ],
+)
+def test_ring_buffer_destination_invalid_limits(tmp_path, kwargs, message):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError, match=message):
+        Tracker(destination=RingBufferDestination(tmp_path / "test.bin", **kwargs))
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"file_format": FileFormat.AGGREGATED_ALLOCATIONS},
+        {"destination": RingBufferDestination("test.bin")},
+    ],
+)
+def test_rss_threshold_writes_a_snapshot(tmp_path, monkeypatch, kwargs):
+    # GIVEN
+    monkeypatch.chdir(tmp_path)
+    if "destination" not in kwargs:
+        kwargs["file_name"] = "test.bin"
+    allocator = MemoryAllocator()
+
+    # WHEN
+    # The RSS is sampled when tracking starts, and already exceeds 1 byte.
+    with Tracker(dump_when_rss_exceeds=1, **kwargs):
+        allocator.valloc(1234)
+        allocator.free()
+
+    # THEN
+    with FileReader(tmp_path / "test.bin.1") as reader:
+        assert reader.metadata.pid > 0
+    assert not (tmp_path / "test.bin.2").exists()
+
+
+def test_rss_triggers_require_a_destination_that_can_be_dumped(tmp_path):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError, match="RSS triggers require"):
+        Tracker(tmp_path / "test.bin", dump_on_growth_rate="100M")
+
+
+def test_dump_snapshot_writes_the_live_allocations(tmp_path):
+    # GIVEN
+    output = tmp_path / "test.bin"
+    freed = MemoryAllocator()
+    alive = MemoryAllocator()
+
+    # WHEN
+    with Tracker(output, file_format=FileFormat.AGGREGATED_ALLOCATIONS) as tracker:
+        freed.valloc(4096)
+        alive.valloc(1234)
+        freed.free()
+        snapshot = tracker.dump_snapshot()
+        alive.free()
+
+    # THEN
+    assert snapshot == tmp_path / "test.bin.1"
+    with FileReader(snapshot) as reader:
+        high_water_mark = list(
+            filter_relevant_allocations(
+                reader.get_high_watermark_allocation_records(merge_threads=False)
+            )
+        )
+        leaks = list(
+            filter_relevant_allocations(
+                reader.get_leaked_allocation_records(merge_threads=False)
+            )
+        )
+    assert [(a.allocator, a.size) for a in high_water_mark] == [
+        (AllocatorType.VALLOC, 1234)
+    ]
+    assert [(a.allocator, a.size) for a in leaks] == [(AllocatorType.VALLOC, 1234)]
+
+    with FileReader(output) as reader:
+        leaks = list(
+            filter_relevant_allocations(
+                reader.get_leaked_allocation_records(merge_threads=False)
+            )
+        )
+    assert leaks == []
+
+
+def test_dump_snapshot_to_an_explicit_path(tmp_path):
+    # GIVEN
+    snapshot = tmp_path / "snapshot.bin"
+    snapshot.touch()
+
+    # WHEN
+    with Tracker(
+        tmp_path / "test.bin", file_format=FileFormat.AGGREGATED_ALLOCATIONS
+    ) as tracker:
+        with pytest.raises(RuntimeError):
+            tracker.dump_snapshot(snapshot)
+        tracker.dump_snapshot(snapshot, overwrite=True)
+
+    # THEN
+    with FileReader(snapshot) as reader:
+        assert reader.metadata.file_format == FileFormat.AGGREGATED_ALLOCATIONS
+
+
+def test_dump_snapshot_requires_an_aggregated_capture_file(tmp_path):
+    # GIVEN
+    tracker = Tracker(tmp_path / "test.bin")
+
+    # WHEN/THEN
+    with tracker:
+        with pytest.raises(RuntimeError, match="Snapshots require an output file"):
+            tracker.dump_snapshot()
+
+
+def test_dump_snapshot_requires_an_active_tracker(tmp_path):
+    # GIVEN
+    tracker = Tracker(
+        tmp_path / "test.bin", file_format=FileFormat.AGGREGATED_ALLOCATIONS
+    )
+
+    # WHEN/THEN
+    with pytest.raises(RuntimeError, match="must be active"):
+        tracker.dump_snapshot()
+
+
+def test_rotating_file_destination_writes_readable_segments(tmp_path):
+    # GIVEN
+    allocator = MemoryAllocator()
+    # Every segment is larger than 1 byte, so a new one is started each time
+    # the tracker samples the RSS.
+    destination = FileDestination(tmp_path / "test.bin", rotate_size=1, keep=2)
+
+    # WHEN
+    with Tracker(destination=destination):
+        allocator.valloc(1234)
+        time.sleep(0.1)
+        allocator.free()
+        allocator.valloc(4321)
+        time.sleep(0.1)
+        allocator.free()
+
+    # THEN
+    numbers = sorted(int(path.suffix[1:]) for path in tmp_path.glob("test.bin.*"))
+    assert len(numbers) == 2
+    assert numbers[0] > 1
+    segments = [tmp_path / f"test.bin.{number}" for number in numbers]
+    for segment in segments:
+        with FileReader(segment) as reader:
+            assert reader.metadata.pid == os.getpid()
+            list(reader.get_allocation_records())
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"rotate_size": 0}, "rotate_size must be positive"),
+        ({"rotate_interval": -1}, "rotate_interval must be positive"),
+        ({"rotate_size": 10, "keep": 0}, "keep must be positive"),
+        ({"keep": 2}, "keep requires rotate_size or rotate_interval"),
+    ],
+)
+def test_rotating_file_destination_invalid_limits(tmp_path, kwargs, message):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError, match=message):
+        Tracker(destination=FileDestination(tmp_path / "test.bin", **kwargs))
+
+
+def test_rotating_file_destination_requires_all_allocations(tmp_path):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError, match="Rotation only supports"):
+        Tracker(
+            destination=FileDestination(tmp_path / "test.bin", rotate_size=10),
             file_format=FileFormat.AGGREGATED_ALLOCATIONS,
-        ):  # pragma: no cover
-            pass
+        )
@@ -147,7 +147,7 @@ def get_relevant_vallocs(records):
     ]
 
 
-@pytest.mark.parametrize("method", ["lldb", "gdb"])
+@pytest.mark.parametrize("method", ["ptrace", "lldb", "gdb"])
 def test_basic_attach(tmp_path, method):
     if not debugger_available(method):
         pytest.skip(f"a supported {method} debugger isn't installed")
@@ -165,7 +165,7 @@ def test_basic_attach(tmp_path, method):
     assert get_call_stack(valloc) == ["valloc", "baz", "bar", "foo", "<module>"]
 
 
-@pytest.mark.parametrize("method", ["lldb", "gdb"])
+@pytest.mark.parametrize("method", ["ptrace", "lldb", "gdb"])
 def test_aggregated_attach(tmp_path, method):
     if not debugger_available(method):
         pytest.skip(f"a supported {method} debugger isn't installed")
@@ -189,7 +189,29 @@ def test_aggregated_attach(tmp_path, method):
     assert get_call_stack(valloc) == ["valloc", "baz", "bar", "foo", "<module>"]
 
 
-@pytest.mark.parametrize("method", ["lldb", "gdb"])
+@pytest.mark.parametrize("method", ["ptrace", "lldb", "gdb"])
+def test_periodic_attach(tmp_path, method):
+    if not debugger_available(method):
+        pytest.skip(f"a supported {method} debugger isn't installed")
+
+    # GIVEN
+    output = tmp_path / "test.bin"
+    attach_cmd = generate_attach_command(
+        method, output, "--duration", "60", "--sample-every", "10"
+    )
+
+    # WHEN
+    run_process(attach_cmd)
+
+    # THEN
+    assert not output.exists()
+    (capture,) = tmp_path.glob("test.bin.*")
+    reader = FileReader(capture)
+    (valloc,) = get_relevant_vallocs(reader.get_high_watermark_allocation_records())
+    assert get_call_stack(valloc) == ["valloc", "baz", "bar", "foo", "<module>"]
+
+
+@pytest.mark.parametrize("method", ["ptrace", "lldb", "gdb"])
 def test_attach_time(tmp_path, method):
     if not debugger_available(method):
         pytest.skip(f"a supported {method} debugger isn't installed")
@@ -205,7 +227,7 @@ def test_attach_time(tmp_path, method):
     assert "memray: Deactivating tracking: 1 seconds have elapsed" in process_stderr
 
 
-@pytest.mark.parametrize("method", ["lldb", "gdb"])
+@pytest.mark.parametrize("method", ["ptrace", "lldb", "gdb"])
 def test_detach_without_attach(method):
     if not debugger_available(method):
         pytest.skip(f"a supported {method} debugger isn't installed")
@@ -1509,6 +1509,80 @@ class TestLiveRemoteSubcommand:
         server.terminate()
         server.wait(timeout=TIMEOUT)
 
+    def test_live_tracking_with_allocation_filter(
+        self, tmp_path, simple_test_file, free_port
+    ):
+        # GIVEN
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "memray",
+                "run",
+                "--live-remote",
+                "--live-port",
+                str(free_port),
+                str(simple_test_file),
+            ],
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+        _wait_until_process_blocks(server.pid)
+
+        client = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "memray",
+                "live",
+                "--min-size",
+                "1024",
+                "--module",
+                "json",
+                str(free_port),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.PIPE,
+        )
+
+        # WHEN
+        try:
+            server.communicate(timeout=TIMEOUT)
+            client.communicate(b"q", timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.terminate()
+            client.terminate()
+            server.wait(timeout=TIMEOUT)
+            client.wait(timeout=TIMEOUT)
+            raise
+
+        # THEN
+        assert server.returncode == 0
+        assert client.returncode == 0
+
+    def test_live_allocation_filter_with_broker(self, free_port):
+        # GIVEN/WHEN
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "memray",
+                "live",
+                "--broker",
+                "--min-size",
+                "1024",
+                str(free_port),
+            ],
+            capture_output=True,
+            text=True,
+        )
+
+        # THEN
+        assert proc.returncode != 0
+        assert "allocation filters can't be used with --broker" in proc.stderr
+
     def test_live_tracking_server_when_client_disconnects(self, free_port, tmp_path):
         # GIVEN
         test_file = tmp_path / "test.py"
@@ -8,17 +8,21 @@ import time
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Iterator
+from typing import List
 from typing import Set
 from typing import Tuple
 
 import pytest
 
+from memray import AllocationFilter
 from memray import AllocatorType
+from memray import SharedMemoryReader
 from memray import SocketReader
 from tests.utils import filter_relevant_allocations
 
 TIMEOUT = 5
 ALLOCATION_SIZE = 1234
+SMALL_ALLOCATION_SIZE = 123
 MULTI_ALLOCATION_COUNT = 10
 
 #
@@ -84,6 +88,66 @@ ALLOCATE_MANY_THEN_SNAPSHOT_THEN_FREE_MANY = textwrap.dedent(
     """
 )
 
+ALLOCATE_SMALL_AND_LARGE_THEN_SNAPSHOT_THEN_FREE = textwrap.dedent(
+    f"""
+        import time
+        small = MemoryAllocator()
+        large = MemoryAllocator()
+        with get_tracker():
+            # The reader's filter is applied shortly after it connects.
+            time.sleep(1)
+            small.valloc({SMALL_ALLOCATION_SIZE})
+            large.valloc({ALLOCATION_SIZE})
+            snapshot_point()
+            small.free()
+            large.free()
+    """
+)
+
+ALLOCATE_MANY_AGGREGATED_THEN_SNAPSHOT_THEN_FREE_MANY = textwrap.dedent(
+    f"""
+        from memray._memray import FileFormat
+
+        allocators = [MemoryAllocator() for _ in range({MULTI_ALLOCATION_COUNT})]
+        with Tracker(
+            destination=SocketDestination(server_port=port),
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+        ):
+            for allocator in allocators:
+                allocator.valloc({ALLOCATION_SIZE})
+            snapshot_point()
+            for allocator in allocators:
+                allocator.free()
+    """
+)
+
+ALLOCATE_MANY_COMPRESSED_THEN_SNAPSHOT_THEN_FREE_MANY = textwrap.dedent(
+    f"""
+        allocators = [MemoryAllocator() for _ in range({MULTI_ALLOCATION_COUNT})]
+        with Tracker(
+            destination=SocketDestination(server_port=port, compress=True)
+        ):
+            for allocator in allocators:
+                allocator.valloc({ALLOCATION_SIZE})
+            snapshot_point()
+            for allocator in allocators:
+                allocator.free()
+    """
+)
+ALLOCATE_OVER_SHARED_MEMORY_THEN_SNAPSHOT_THEN_FREE = textwrap.dedent(
+    f"""
+        from memray._memray import SharedMemoryDestination
+
+        allocator = MemoryAllocator()
+        with Tracker(
+            destination=SharedMemoryDestination(name=f"memray-test-{{port}}")
+        ):
+            allocator.valloc({ALLOCATION_SIZE})
+            snapshot_point()
+            allocator.free()
+    """
+)
+
 
 @contextmanager
 def run_till_snapshot_point(
@@ -152,6 +216,16 @@ class TestSocketReaderErrorHandling:
         with pytest.raises(StopIteration):
             next(reader.get_current_snapshot(merge_threads=False))
 
+    def test_get_snapshot_delta_is_empty_before_context(self, free_port: int) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port)
+
+        # WHEN
+        delta = reader.get_snapshot_delta(5)
+
+        # THEN
+        assert delta == (5, False, {})
+
     def test_get_is_active_after_context(self, free_port: int, tmp_path: Path) -> None:
         # GIVEN
         reader = SocketReader(port=free_port)
@@ -308,6 +382,157 @@ class TestSocketReaderAccess:
         assert filename.endswith("/_test.py")
         assert 0 < lineno < 200
 
+    @pytest.mark.valgrind
+    def test_compressed_stream_snapshot(self, free_port: int, tmp_path: Path) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port)
+        program = ALLOCATE_MANY_COMPRESSED_THEN_SNAPSHOT_THEN_FREE_MANY
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            unfiltered_snapshot = list(reader.get_current_snapshot(merge_threads=False))
+            command_line = reader.command_line
+
+        # THEN
+        snapshot = list(filter_relevant_allocations(unfiltered_snapshot))
+        assert len(snapshot) == 1
+        assert snapshot[0].size == ALLOCATION_SIZE * MULTI_ALLOCATION_COUNT
+        assert snapshot[0].allocator == AllocatorType.VALLOC
+        assert command_line is not None
+
+    @pytest.mark.parametrize(
+        "allocation_filter, expected_sizes",
+        [
+            pytest.param(
+                AllocationFilter(min_size=ALLOCATION_SIZE),
+                [ALLOCATION_SIZE],
+                id="min_size",
+            ),
+            pytest.param(
+                AllocationFilter(modules=("memray._test",)),
+                [SMALL_ALLOCATION_SIZE, ALLOCATION_SIZE],
+                id="matching_module",
+            ),
+            pytest.param(
+                AllocationFilter(files=("/nonexistent/",)),
+                [],
+                id="other_files",
+            ),
+            pytest.param(
+                AllocationFilter(threads=(0,)),
+                [],
+                id="other_threads",
+            ),
+        ],
+    )
+    def test_allocation_filter(
+        self,
+        free_port: int,
+        tmp_path: Path,
+        allocation_filter: AllocationFilter,
+        expected_sizes: List[int],
+    ) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port, allocation_filter=allocation_filter)
+        program = ALLOCATE_SMALL_AND_LARGE_THEN_SNAPSHOT_THEN_FREE
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            unfiltered_snapshot = list(reader.get_current_snapshot(merge_threads=False))
+
+        # THEN
+        snapshot = list(filter_relevant_allocations(unfiltered_snapshot))
+        assert sorted(record.size for record in snapshot) == expected_sizes
+
+    @pytest.mark.valgrind
+    def test_location_rollup(self, free_port: int, tmp_path: Path) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port)
+        program = ALLOCATE_MANY_THEN_SNAPSHOT_THEN_FREE_MANY
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            rows, thread_names = reader.get_location_rollup()
+
+        # THEN
+        valloc_rows = [
+            row for row in rows if row[0] == "valloc" and row[1].endswith("/_test.py")
+        ]
+        assert len(valloc_rows) == 1
+        _, _, own_memory, total_memory, n_allocations, tids = valloc_rows[0]
+        # The interpreter may make other allocations from the same function.
+        assert own_memory == total_memory
+        assert own_memory >= ALLOCATION_SIZE * MULTI_ALLOCATION_COUNT
+        assert n_allocations >= MULTI_ALLOCATION_COUNT
+        assert set(tids) <= thread_names.keys()
+        assert [row[3] for row in rows] == sorted(
+            (row[3] for row in rows), reverse=True
+        )
+
+    @pytest.mark.valgrind
+    def test_live_stats(self, free_port: int, tmp_path: Path) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port)
+        program = ALLOCATE_MANY_THEN_SNAPSHOT_THEN_FREE_MANY
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            stats = reader.get_live_stats()
+
+        # THEN
+        # The interpreter may make other allocations of its own.
+        assert stats.heap_size >= ALLOCATION_SIZE * MULTI_ALLOCATION_COUNT
+        assert stats.total_allocations >= MULTI_ALLOCATION_COUNT
+        assert stats.total_allocated_bytes >= stats.heap_size
+
+    @pytest.mark.valgrind
+    def test_aggregated_location_rollup(self, free_port: int, tmp_path: Path) -> None:
+        # GIVEN
+        reader = SocketReader(port=free_port)
+        program = ALLOCATE_MANY_AGGREGATED_THEN_SNAPSHOT_THEN_FREE_MANY
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            rows, _ = reader.get_location_rollup()
+            stats = reader.get_live_stats()
+
+        # THEN
+        valloc_rows = [
+            row for row in rows if row[0] == "valloc" and row[1].endswith("/_test.py")
+        ]
+        assert len(valloc_rows) == 1
+        _, _, own_memory, _, n_allocations, _ = valloc_rows[0]
+        assert own_memory >= ALLOCATION_SIZE * MULTI_ALLOCATION_COUNT
+        assert n_allocations >= MULTI_ALLOCATION_COUNT
+        assert stats.heap_size >= ALLOCATION_SIZE * MULTI_ALLOCATION_COUNT
+        assert stats.total_allocations is None
+        assert stats.total_allocated_bytes is None
+
     @pytest.mark.valgrind
     def test_multiple_context_entries_does_not_crash(
         self, free_port: int, tmp_path: Path
@@ -420,3 +645,48 @@ class TestSocketReaderAccess:
         # THEN
         assert len(traces) >= MAX_TRACES
         proc.returncode == 0
+
+
+class TestSharedMemoryReader:
+    @pytest.mark.valgrind
+    def test_single_allocation_snapshot(self, free_port: int, tmp_path: Path) -> None:
+        # GIVEN
+        reader = SharedMemoryReader(f"memray-test-{free_port}")
+        program = ALLOCATE_OVER_SHARED_MEMORY_THEN_SNAPSHOT_THEN_FREE
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            unfiltered_snapshot = list(reader.get_current_snapshot(merge_threads=False))
+            pid = reader.pid
+
+        # THEN
+        snapshot = list(filter_relevant_allocations(unfiltered_snapshot))
+        assert len(snapshot) == 1
+        assert snapshot[0].size == ALLOCATION_SIZE
+        assert snapshot[0].allocator == AllocatorType.VALLOC
+        assert pid is not None and pid != os.getpid()
+
+    def test_reader_becomes_inactive_when_tracking_stops(
+        self, free_port: int, tmp_path: Path
+    ) -> None:
+        # GIVEN
+        reader = SharedMemoryReader(f"memray-test-{free_port}")
+        program = ALLOCATE_OVER_SHARED_MEMORY_THEN_SNAPSHOT_THEN_FREE
+
+        # WHEN
+        with run_till_snapshot_point(
+            program,
+            reader=reader,
+            tmp_path=tmp_path,
+            free_port=free_port,
+        ):
+            was_active = reader.is_active
+
+        # THEN
+        assert was_active
+        assert reader.is_active is False
@@ -337,21 +337,114 @@ def test_unsupported_operations_on_aggregated_capture(tmpdir):
     # WHEN / THEN
     with pytest.raises(
         NotImplementedError,
-        match="Can't find temporary allocations using a pre-aggregated capture file",
+        match="Can't get all allocations from a pre-aggregated capture file",
     ):
-        list(reader.get_temporary_allocation_records())
+        list(reader.get_allocation_records())
 
     with pytest.raises(
         NotImplementedError,
-        match="Can't get all allocations from a pre-aggregated capture file",
+        match="Can't get the history of leaked allocations using a pre-aggregated",
     ):
-        list(reader.get_allocation_records())
+        list(reader.get_temporal_allocation_records())
 
     with pytest.raises(
-        NotImplementedError,
-        match="Can't compute statistics using a pre-aggregated capture file",
+        ValueError,
+        match="can only be found with a threshold of at most 1",
+    ):
+        list(reader.get_temporary_allocation_records(threshold=2))
+
+
+def test_statistics_from_aggregated_capture(tmp_path):
+    # GIVEN
+    allocator = MemoryAllocator()
+    output = tmp_path / "test.bin"
+
+    # WHEN
+    with Tracker(output, file_format=FileFormat.AGGREGATED_ALLOCATIONS):
+        allocator.valloc(ALLOC_SIZE)
+        allocator.free()
+        allocator.valloc(ALLOC_SIZE * 2)
+        allocator.free()
+
+    # THEN
+    stats = compute_statistics(str(output))
+    assert stats.total_num_allocations >= 2
+    assert stats.total_memory_allocated >= ALLOC_SIZE * 3
+    assert stats.peak_memory_allocated >= ALLOC_SIZE * 2
+    assert stats.allocation_count_by_allocator[AllocatorType.VALLOC.name] == 2
+    assert stats.allocation_count_by_size[ALLOC_SIZE] >= 1
+    assert stats.allocation_count_by_size[ALLOC_SIZE * 2] >= 1
+
+
+def test_aggregation_memory_budget_compacts_history(tmp_path):
+    # GIVEN
+    allocator = MemoryAllocator()
+    output = tmp_path / "test.bin"
+
+    # WHEN
+    with Tracker(
+        output,
+        file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+        memory_interval_ms=1,
+        aggregation_memory_budget=1,
     ):
-        compute_statistics(str(output))
+        allocator.valloc(ALLOC_SIZE)
+        time.sleep(0.1)
+        allocator.free()
+        time.sleep(0.1)
+
+    # THEN
+    reader = FileReader(output)
+    memory_snapshots = list(reader.get_memory_snapshots())
+    records, hwm_by_snapshot = reader.get_temporal_high_water_mark_allocation_records()
+    vallocs = [record for record in records if record.allocator == AllocatorType.VALLOC]
+
+    assert len(memory_snapshots) < 100
+    assert len(hwm_by_snapshot) == len(memory_snapshots) + 1
+    assert max(hwm_by_snapshot) >= ALLOC_SIZE
+    assert len(vallocs) == 1
+    (valloc,) = vallocs
+    assert any(interval.n_bytes == ALLOC_SIZE for interval in valloc.intervals)
+
+    high_water_mark_vallocs = [
+        record
+        for record in reader.get_high_watermark_allocation_records()
+        if record.allocator == AllocatorType.VALLOC
+    ]
+    assert len(high_water_mark_vallocs) == 1
+    assert high_water_mark_vallocs[0].size == ALLOC_SIZE
+
+
+def test_tracker_rejects_invalid_aggregation_memory_budget(tmp_path):
+    # GIVEN
+    output = tmp_path / "test.bin"
+
+    # WHEN / THEN
+    with pytest.raises(ValueError, match="requires an output file using"):
+        Tracker(output, aggregation_memory_budget="1G")
+
+    with pytest.raises(ValueError, match="Invalid size"):
+        Tracker(
+            output,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            aggregation_memory_budget="lots",
+        )
+
+
+def test_tracker_rejects_invalid_temporary_allocation_threshold(tmp_path):
+    # GIVEN
+    output = tmp_path / "test.bin"
+
+    # WHEN / THEN
+    with pytest.raises(ValueError, match="requires an output file using"):
+        Tracker(output, temporary_allocation_threshold=1)
+
+    with pytest.raises(ValueError, match="must be non-negative"):
+        Tracker(
+            output,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            temporary_allocation_threshold=-1,
+        )
 
 
 @pytest.mark.parametrize(
@@ -1256,6 +1349,43 @@ class TestTemporaryAllocations:
         assert record.allocator == AllocatorType.VALLOC
         assert record.size == 1024
 
+    def test_temporary_allocations_from_aggregated_capture(self, tmp_path):
+        # GIVEN
+        allocators = [MemoryAllocator() for _ in range(3)]
+        output = tmp_path / "test.bin"
+
+        # WHEN
+        with Tracker(
+            output,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            temporary_allocation_threshold=2,
+        ):
+            allocators[0].valloc(1024)
+            allocators[0].free()
+            for allocator in allocators:
+                allocator.valloc(1024)
+            for allocator in reversed(allocators):
+                allocator.free()
+
+        # THEN
+        reader = FileReader(output)
+
+        def count_temporary_vallocs(threshold):
+            return sum(
+                record.n_allocations
+                for record in reader.get_temporary_allocation_records(
+                    threshold=threshold
+                )
+                if record.allocator == AllocatorType.VALLOC
+            )
+
+        assert count_temporary_vallocs(threshold=0) == 2
+        assert count_temporary_vallocs(threshold=1) == 3
+        assert count_temporary_vallocs(threshold=2) == 4
+
+        with pytest.raises(ValueError, match="threshold of at most 2"):
+            list(reader.get_temporary_allocation_records(threshold=3))
+
     def test_temporary_allocations_with_two_allocators_are_detected(self, tmp_path):
         # GIVEN
         allocator1 = MemoryAllocator()
@@ -1378,6 +1508,38 @@ class TestTemporaryAllocations:
         assert allocation.size == 1024 * 10
         assert allocation.n_allocations == 10
 
+    def test_temporary_allocations_in_a_tight_loop_are_coalesced(self, tmp_path):
+        # GIVEN
+        allocator = MemoryAllocator()
+        output = tmp_path / "test.bin"
+        iterations = 10_000
+
+        # WHEN
+        with Tracker(output):
+            for _ in range(iterations):
+                allocator.valloc(1024)
+                allocator.free()
+
+        # THEN
+        reader = FileReader(output)
+        all_allocations = list(
+            filter_relevant_allocations(reader.get_allocation_records())
+        )
+        assert len(all_allocations) == 2 * iterations
+        assert reader.metadata.total_allocations >= 2 * iterations
+
+        temporary_allocations = list(
+            filter_relevant_allocations(reader.get_temporary_allocation_records())
+        )
+        assert len(temporary_allocations) == 1
+        (allocation,) = temporary_allocations
+        assert allocation.size == 1024 * iterations
+        assert allocation.n_allocations == iterations
+
+        # Writing every allocation and deallocation out would take several
+        # bytes for each iteration.
+        assert output.stat().st_size < iterations
+
     def test_unmatched_allocations_are_not_reported(self, tmp_path):
         # GIVEN
         allocator = MemoryAllocator()
@@ -1700,6 +1862,41 @@ class TestMemorySnapshots:
         assert len(memory_snapshots) <= n_snapshots // 2 + 1
         assert len(temporal_records) <= n_temporal_records // 2 + 1
 
+    def test_temporal_high_water_mark_from_aggregated_capture(self, tmp_path):
+        # GIVEN
+        allocator = MemoryAllocator()
+        output = tmp_path / "test.bin"
+
+        # WHEN
+        with Tracker(output, file_format=FileFormat.AGGREGATED_ALLOCATIONS):
+            allocator.valloc(ALLOC_SIZE)
+            time.sleep(0.11)
+            allocator.free()
+            time.sleep(0.11)
+
+        # THEN
+        reader = FileReader(output)
+        memory_snapshots = list(reader.get_memory_snapshots())
+        (
+            records,
+            hwm_by_snapshot,
+        ) = reader.get_temporal_high_water_mark_allocation_records()
+        vallocs = [
+            record for record in records if record.allocator == AllocatorType.VALLOC
+        ]
+
+        assert len(hwm_by_snapshot) == len(memory_snapshots) + 1
+        assert max(hwm_by_snapshot) >= ALLOC_SIZE
+        assert len(vallocs) == 1
+        (valloc,) = vallocs
+        assert valloc.intervals
+        assert all(interval.n_allocations == 1 for interval in valloc.intervals)
+        assert all(interval.n_bytes == ALLOC_SIZE for interval in valloc.intervals)
+        assert all(
+            interval.deallocated_before_snapshot is not None
+            for interval in valloc.intervals
+        )
+
     def test_temporary_allocations_when_filling_vector_without_preallocating(
         self, tmp_path
     ):
@@ -1,8 +1,13 @@
+import errno
 from unittest.mock import patch
 
 import pytest
 
+from memray._errors import MemrayCommandError
 from memray.commands import main
+from memray.commands.attach import AttachCommand
+from memray.commands.attach import get_process_tree
+from memray.commands.attach import inject
 
 
 @patch("memray.commands.attach.debugger_available")
@@ -20,3 +25,163 @@ class TestAttachSubCommand:
         captured = capsys.readouterr()
         print("Error", captured.err)
         assert "Can't use aggregated mode without an output file." in captured.err
+
+    @pytest.mark.parametrize(
+        "args, error",
+        [
+            (
+                ["--sample-every", "5", "--duration", "10"],
+                "Can't use --sample-every without an output file.",
+            ),
+            (
+                ["-o", "out.bin", "--sample-every", "5"],
+                "Can't use --sample-every without --duration.",
+            ),
+            (
+                ["-o", "out.bin", "--sample-every", "0.1", "--duration", "10"],
+                "--sample-every must be longer than --duration.",
+            ),
+            (
+                ["-o", "out.bin", "--keep", "3"],
+                "Can't use --keep without --sample-every.",
+            ),
+            (
+                ["-o", "out.bin", "--keep", "-1"],
+                "--keep must be non-negative.",
+            ),
+        ],
+    )
+    def test_memray_attach_invalid_periodic_arguments(
+        self, is_debugger_available_mock, capsys, args, error
+    ):
+        # GIVEN
+        is_debugger_available_mock.return_value = True
+
+        # WHEN
+        with pytest.raises(SystemExit):
+            main(["attach", *args, "1234"])
+
+        # THEN
+        captured = capsys.readouterr()
+        assert error in captured.err
+
+
+class TestResolveDebugger:
+    @patch("memray.commands.attach.platform.system", return_value="Linux")
+    @patch("memray.commands.attach.debugger_available", return_value=True)
+    def test_auto_prefers_ptrace_on_linux(self, _available, _system):
+        # GIVEN
+        command = AttachCommand()
+
+        # WHEN
+        method = command.resolve_debugger("auto")
+
+        # THEN
+        assert method == "ptrace"
+
+    @patch("memray.commands.attach.platform.system", return_value="Linux")
+    def test_auto_falls_back_to_a_debugger(self, _system):
+        # GIVEN
+        command = AttachCommand()
+
+        # WHEN
+        with patch(
+            "memray.commands.attach.debugger_available",
+            side_effect=lambda debugger, verbose: debugger == "gdb",
+        ):
+            method = command.resolve_debugger("auto")
+
+        # THEN
+        assert method == "gdb"
+
+    @patch("memray.commands.attach.debugger_available", return_value=False)
+    def test_ptrace_unsupported(self, _available):
+        # GIVEN
+        command = AttachCommand()
+
+        # WHEN
+        with pytest.raises(MemrayCommandError) as exc_info:
+            command.resolve_debugger("ptrace")
+
+        # THEN
+        assert "not supported on this platform" in str(exc_info.value)
+
+
+@patch("memray._memray.ptrace_inject")
+class TestPtraceInjection:
+    def test_success(self, ptrace_inject_mock):
+        # WHEN
+        errmsg = inject("ptrace", 1234, 5678, verbose=False)
+
+        # THEN
+        assert errmsg is None
+        ptrace_inject_mock.assert_called_once()
+        assert ptrace_inject_mock.call_args[0][0] == 1234
+        assert ptrace_inject_mock.call_args[0][2] == 5678
+
+    def test_missing_process(self, ptrace_inject_mock):
+        # GIVEN
+        ptrace_inject_mock.side_effect = OSError(errno.ESRCH, "No such process")
+
+        # WHEN
+        with patch("memray.commands.attach.os.kill", side_effect=ProcessLookupError):
+            errmsg = inject("ptrace", 1234, 5678, verbose=False)
+
+        # THEN
+        assert errmsg == (
+            "Failed to attach to the process.\nThe given process ID does not exist."
+        )
+
+    def test_other_failure(self, ptrace_inject_mock):
+        # GIVEN
+        ptrace_inject_mock.side_effect = OSError(
+            errno.ENOEXEC, "The process does not seem to be running Python"
+        )
+
+        # WHEN
+        errmsg = inject("ptrace", 1234, 5678, verbose=False)
+
+        # THEN
+        assert errmsg == (
+            "Failed to inject into the process.\n"
+            "The process does not seem to be running Python."
+        )
+
+
+@patch("memray.commands.attach._get_parent_pids")
+def test_get_process_tree(get_parent_pids_mock):
+    # GIVEN
+    get_parent_pids_mock.return_value = [
+        (1, 0),
+        (100, 1),
+        (102, 100),
+        (101, 100),
+        (200, 101),
+        (300, 1),
+    ]
+
+    # WHEN
+    tree = get_process_tree(100)
+
+    # THEN
+    assert tree == [100, 101, 102, 200]
+
+
+@patch("memray.commands.attach.get_process_tree")
+def test_run_for_process_tree_reports_each_failure(get_process_tree_mock, capsys):
+    # GIVEN
+    get_process_tree_mock.return_value = [100, 101, 102]
+    called = []
+
+    def func(pid):
+        called.append(pid)
+        if pid == 101:
+            raise MemrayCommandError("Boom", exit_code=1)
+
+    # WHEN
+    with pytest.raises(MemrayCommandError, match="Failed for 1 of 3 processes."):
+        AttachCommand().run_for_process_tree(100, func)
+
+    # THEN
+    assert sorted(called) == [100, 101, 102]
+    assert capsys.readouterr().err == "Process 101: Boom\n"
@@ -0,0 +1,164 @@
+import socket
+import time
+
+import pytest
+
+from memray._broker import BrokerReader
+from memray._broker import LiveBroker
+
+TIMEOUT = 5
+
+
+class FakeReader:
+    """A reader for a tracked process without native traces."""
+
+    has_native_traces = False
+    pid = 1234
+    command_line = "python script.py"
+
+    def __init__(self):
+        self.is_active = True
+        self.rows = []
+        self.thread_names = {}
+
+    def get_location_rollup(self):
+        return list(self.rows), dict(self.thread_names)
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def broker():
+    reader = FakeReader()
+    reader.rows = [("main", "script.py", 100, 100, 1, (1,))]
+    reader.thread_names = {1: "MainThread"}
+    broker = LiveBroker(reader, 0)
+    broker.start()
+    yield reader, broker
+    broker.close()
+
+
+def test_client_receives_full_snapshot_on_connect(broker):
+    # GIVEN
+    reader, broker = broker
+
+    # WHEN
+    with BrokerReader(broker.port) as client:
+        rows, thread_names = client.get_location_rollup()
+
+    # THEN
+    assert client.pid == 1234
+    assert client.command_line == "python script.py"
+    assert rows == [("main", "script.py", 100, 100, 1, (1,))]
+    assert thread_names == {1: "MainThread"}
+
+
+def test_clients_receive_changes_after_connecting(broker):
+    # GIVEN
+    reader, broker = broker
+    with BrokerReader(broker.port) as early:
+        wait_for(lambda: broker.n_clients == 1)
+        reader.rows = [
+            ("main", "script.py", 100, 150, 2, (1,)),
+            ("helper", "script.py", 50, 50, 1, (1,)),
+        ]
+        broker.publish()
+
+        # WHEN
+        with BrokerReader(broker.port) as late:
+            wait_for(lambda: broker.n_clients == 2)
+            reader.rows = [("helper", "script.py", 70, 70, 1, (2,))]
+            reader.thread_names = {2: "worker"}
+            broker.publish()
+            wait_for(lambda: early.version == late.version == 3)
+
+            # THEN
+            for client in (early, late):
+                assert client.get_location_rollup() == (
+                    [("helper", "script.py", 70, 70, 1, (2,))],
+                    {2: "worker"},
+                )
+
+
+def test_rows_are_sorted_by_total_memory(broker):
+    # GIVEN
+    reader, broker = broker
+    reader.rows = [
+        ("small", "script.py", 1, 1, 1, (1,)),
+        ("big", "script.py", 0, 1000, 1, (1,)),
+        ("medium", "script.py", 10, 10, 1, (1,)),
+    ]
+    broker.publish()
+
+    # WHEN
+    with BrokerReader(broker.port) as client:
+        rows, _ = client.get_location_rollup()
+
+    # THEN
+    assert [row[0] for row in rows] == ["big", "medium", "small"]
+
+
+def test_client_becomes_inactive_when_the_broker_stops(broker):
+    # GIVEN
+    reader, broker = broker
+
+    with BrokerReader(broker.port) as client:
+        wait_for(lambda: broker.n_clients == 1)
+
+        # WHEN
+        broker.close()
+
+        # THEN
+        wait_for(lambda: not client.is_active)
+
+
+def test_disconnected_client_does_not_affect_others(broker):
+    # GIVEN
+    reader, broker = broker
+    with BrokerReader(broker.port) as staying:
+        with BrokerReader(broker.port):
+            wait_for(lambda: broker.n_clients == 2)
+
+        # WHEN
+        reader.rows = []
+        wait_for(lambda: broker.publish() or broker.n_clients == 1)
+
+        # THEN
+        wait_for(lambda: staying.get_location_rollup() == ([], {1: "MainThread"}))
+        assert staying.is_active
+
+
+def test_client_that_stops_reading_is_dropped(broker, monkeypatch):
+    # GIVEN
+    reader, broker = broker
+    monkeypatch.setattr("memray._broker._MAX_PENDING_MESSAGES", 2)
+    with socket.create_connection(("127.0.0.1", broker.port)):
+        wait_for(lambda: broker.n_clients == 1)
+
+        # WHEN
+        version = 0
+
+        def publish_large_update():
+            nonlocal version
+            version += 1
+            reader.rows = [
+                (f"function_{i}_" + "x" * 1000, "script.py", version, version, 1, (1,))
+                for i in range(1000)
+            ]
+            start = time.monotonic()
+            broker.publish()
+            assert time.monotonic() - start < TIMEOUT
+            return broker.n_clients == 0
+
+        # THEN
+        wait_for(publish_large_update)
+
+    reader.rows = [("main", "script.py", 100, 100, 1, (1,))]
+    broker.publish()
+    with BrokerReader(broker.port) as client:
+        assert client.get_location_rollup()[0] == reader.rows
@@ -1,4 +1,5 @@
 import argparse
+import signal
 import sys
 from pathlib import Path
 from unittest.mock import patch
@@ -6,6 +7,7 @@ from unittest.mock import patch
 import pytest
 
 from memray import FileDestination
+from memray import FileFormat
 from memray import SocketDestination
 from memray.commands import main
 from memray.commands.flamegraph import FlamegraphCommand
@@ -168,7 +170,7 @@ class TestRunSubCommand:
                 sys.executable,
                 "-c",
                 "from memray.commands.run import _child_process;"
-                "_child_process(1234,False,False,False,False,False,"
+                "_child_process(1234,False,False,False,False,False,False,"
                 "'./directory/foobar.py',['arg1', 'arg2'])",
             ],
             stderr=-1,
@@ -209,7 +211,7 @@ class TestRunSubCommand:
                 sys.executable,
                 "-c",
                 "from memray.commands.run import _child_process;"
-                "_child_process(1234,False,True,False,False,False,"
+                "_child_process(1234,False,True,False,False,False,False,"
                 "'./directory/foobar.py',['arg1', 'arg2'])",
             ],
             stderr=-1,
@@ -221,6 +223,50 @@ class TestRunSubCommand:
             cmdline_override="./directory/foobar.py arg1 arg2",
         )
 
+    @patch("memray.commands.run.subprocess.Popen")
+    @patch("memray.commands.run.LiveCommand")
+    def test_run_with_live_and_shared_memory(
+        self,
+        live_command_mock,
+        popen_mock,
+        getpid_mock,
+        runpy_mock,
+        tracker_mock,
+        validate_mock,
+    ):
+        getpid_mock.return_value = 42
+        popen_mock().__enter__().returncode = 0
+        with patch("memray.commands.run._get_free_port", return_value=1234):
+            assert 0 == main(
+                ["run", "--live", "--shared-memory", "./directory/foobar.py"]
+            )
+        popen_mock.assert_called_with(
+            [
+                sys.executable,
+                "-c",
+                "from memray.commands.run import _child_process;"
+                "_child_process(1234,False,False,False,False,False,False,"
+                "'./directory/foobar.py',[],shared_memory_name='memray-42')",
+            ],
+            stderr=-1,
+            stdout=-3,
+            text=True,
+        )
+        live_command_mock().start_live_interface.assert_called_with(
+            1234,
+            cmdline_override=" ".join(sys.argv),
+            shared_memory_name="memray-42",
+        )
+
+    def test_run_with_shared_memory_and_without_live_mode(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", "--shared-memory", "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert "--shared-memory argument requires --live" in captured.err
+
     def test_run_with_live_remote(
         self, getpid_mock, runpy_mock, tracker_mock, validate_mock
     ):
@@ -238,6 +284,275 @@ class TestRunSubCommand:
             native_traces=False,
         )
 
+    def test_run_with_live_remote_and_aggregate(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock
+    ):
+        getpid_mock.return_value = 0
+        with patch("memray.commands.run._get_free_port", return_value=1234):
+            assert 0 == main(
+                ["run", "--live-remote", "--aggregate", "./directory/foobar.py"]
+            )
+        tracker_mock.assert_called_with(
+            destination=SocketDestination(server_port=1234, address="127.0.0.1"),
+            native_traces=False,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+        )
+
+    def test_run_with_live_remote_and_live_compress(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock
+    ):
+        getpid_mock.return_value = 0
+        with patch("memray.commands.run._get_free_port", return_value=1234):
+            assert 0 == main(
+                ["run", "--live-remote", "--live-compress", "./directory/foobar.py"]
+            )
+        tracker_mock.assert_called_with(
+            destination=SocketDestination(server_port=1234, compress=True),
+            native_traces=False,
+        )
+
+    def test_run_with_live_compress_and_without_live_remote_mode(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", "--live", "--live-compress", "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert "--live-compress argument requires --live-remote" in captured.err
+
+    def test_run_with_rss_triggers(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock
+    ):
+        getpid_mock.return_value = 0
+        assert 0 == main(
+            [
+                "run",
+                "--aggregate",
+                "--dump-when-rss-exceeds=90%",
+                "--dump-on-growth-rate=100M",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+        tracker_mock.assert_called_with(
+            destination=FileDestination("out.bin", overwrite=False),
+            native_traces=False,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            dump_when_rss_exceeds="90%",
+            dump_on_growth_rate="100M",
+        )
+
+    @pytest.mark.parametrize(
+        "option",
+        [
+            "--dump-when-rss-exceeds=2G",
+            "--dump-on-growth-rate=100M",
+            "--snapshot-signal=SIGUSR2",
+            "--temporary-allocation-threshold=2",
+            "--aggregation-memory-budget=256M",
+        ],
+    )
+    def test_run_with_rss_trigger_and_without_aggregate(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, option, capsys
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", option, "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert "argument requires --aggregate" in captured.err
+
+    def test_run_with_temporary_allocation_threshold(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock
+    ):
+        getpid_mock.return_value = 0
+        assert 0 == main(
+            [
+                "run",
+                "--aggregate",
+                "--temporary-allocation-threshold=5",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+        tracker_mock.assert_called_with(
+            destination=FileDestination("out.bin", overwrite=False),
+            native_traces=False,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            temporary_allocation_threshold=5,
+        )
+
+    def test_run_with_aggregation_memory_budget(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock
+    ):
+        getpid_mock.return_value = 0
+        assert 0 == main(
+            [
+                "run",
+                "--aggregate",
+                "--aggregation-memory-budget=5%",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+        tracker_mock.assert_called_with(
+            destination=FileDestination("out.bin", overwrite=False),
+            native_traces=False,
+            file_format=FileFormat.AGGREGATED_ALLOCATIONS,
+            aggregation_memory_budget="5%",
+        )
+
+    def test_run_with_invalid_temporary_allocation_threshold(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        with pytest.raises(SystemExit):
+            main(
+                [
+                    "run",
+                    "--aggregate",
+                    "--temporary-allocation-threshold=-1",
+                    "./directory/foobar.py",
+                ]
+            )
+
+        captured = capsys.readouterr()
+        assert "invalid non-negative integer: '-1'" in captured.err
+
+    def test_run_with_snapshot_signal(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        getpid_mock.return_value = 0
+        tracker_mock.return_value.dump_snapshot.return_value = Path("out.bin.1")
+        runpy_mock.run_path.side_effect = lambda *args, **kwargs: signal.raise_signal(
+            signal.SIGUSR2
+        )
+        previous_handler = signal.getsignal(signal.SIGUSR2)
+
+        assert 0 == main(
+            [
+                "run",
+                "--aggregate",
+                "--snapshot-signal=USR2",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+
+        tracker_mock.return_value.dump_snapshot.assert_called_once_with()
+        assert "Memray wrote a snapshot to out.bin.1" in capsys.readouterr().err
+        assert signal.getsignal(signal.SIGUSR2) is previous_handler
+
+    def test_run_with_invalid_snapshot_signal(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", "--snapshot-signal=SIGBOGUS", "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert "invalid signal: 'SIGBOGUS'" in captured.err
+
+    @pytest.mark.parametrize("value", ["KILL", "SIGSTOP", str(int(signal.SIGKILL))])
+    def test_run_with_uncatchable_snapshot_signal(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys, value
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", f"--snapshot-signal={value}", "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert "cannot be caught" in captured.err
+
+    def test_run_with_rotation(
+        self, getpid_mock, runpy_mock, tracker_mock, validate_mock, capsys
+    ):
+        getpid_mock.return_value = 0
+        assert 0 == main(
+            [
+                "run",
+                "--rotate-size=2G",
+                "--rotate-interval=15m",
+                "--keep=3",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+        tracker_mock.assert_called_with(
+            destination=FileDestination(
+                "out.bin",
+                overwrite=False,
+                rotate_size=2 * 1024**3,
+                rotate_interval=15 * 60,
+                keep=3,
+            ),
+            native_traces=False,
+        )
+        captured = capsys.readouterr()
+        assert "Writing profile results into out.bin.1, out.bin.2, ..." in captured.out
+        assert "memray flamegraph out.bin.1" in captured.out
+
+    def test_run_with_rotation_suggests_newest_segment(
+        self,
+        getpid_mock,
+        runpy_mock,
+        tracker_mock,
+        validate_mock,
+        capsys,
+        tmp_path,
+        monkeypatch,
+    ):
+        getpid_mock.return_value = 0
+        monkeypatch.chdir(tmp_path)
+        for segment in ("out.bin.9", "out.bin.10", "out.bin.10.lz4", "other.bin.11"):
+            (tmp_path / segment).touch()
+        assert 0 == main(
+            [
+                "run",
+                "--rotate-size=2G",
+                "--keep=2",
+                "-o",
+                "out.bin",
+                "./directory/foobar.py",
+            ]
+        )
+        captured = capsys.readouterr()
+        assert "memray flamegraph out.bin.10\n" in captured.out
+
+    @pytest.mark.parametrize(
+        "options, message",
+        [
+            (["--keep=3"], "The --keep argument requires --rotate-size"),
+            (
+                ["--rotate-size=2G", "--aggregate"],
+                "--rotate-size cannot be used with --aggregate",
+            ),
+            (
+                ["--rotate-interval=15m", "--live"],
+                "--rotate-interval cannot be used with the live TUI",
+            ),
+            (["--rotate-interval=15y"], "invalid duration: '15y'"),
+            (["--rotate-size=lots"], "Invalid size: 'lots'"),
+            (["--keep=0"], "invalid positive integer: '0'"),
+        ],
+    )
+    def test_run_with_invalid_rotation(
+        self,
+        getpid_mock,
+        runpy_mock,
+        tracker_mock,
+        validate_mock,
+        options,
+        message,
+        capsys,
+    ):
+        with pytest.raises(SystemExit):
+            main(["run", *options, "./directory/foobar.py"])
+
+        captured = capsys.readouterr()
+        assert message in captured.err
+
     def test_run_with_live_remote_and_live_port(
         self, getpid_mock, runpy_mock, tracker_mock, validate_mock
     ):
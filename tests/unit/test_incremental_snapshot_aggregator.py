@@ -0,0 +1,275 @@
+import pytest
+
+from memray import AllocatorType
+from memray._memray import IncrementalSnapshotAggregatorTestHarness
+
+MALLOC = AllocatorType.MALLOC
+FREE = AllocatorType.FREE
+MMAP = AllocatorType.MMAP
+MUNMAP = AllocatorType.MUNMAP
+
+MAX_RETAINED_VERSIONS = 16
+
+
+def add(tester, allocator, address, size, tid=1, frame_index=5):
+    tester.add_allocation(
+        tid=tid,
+        address=address,
+        size=size,
+        allocator=allocator,
+        native_frame_id=4,
+        frame_index=frame_index,
+        native_segment_generation=0,
+    )
+
+
+def totals(records):
+    return {
+        location_id: (record.size, record.n_allocations)
+        for location_id, record in records.items()
+    }
+
+
+def test_first_delta_is_a_full_snapshot():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    add(tester, MALLOC, address=8192, size=50)
+    add(tester, MALLOC, address=16384, size=10, frame_index=6)
+
+    # WHEN
+    delta = tester.get_snapshot_delta()
+
+    # THEN
+    assert delta.version == 1
+    assert delta.full
+    assert totals(delta.records) == {0: (150, 2), 1: (10, 1)}
+
+
+def test_delta_only_contains_changed_locations():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    add(tester, MALLOC, address=8192, size=10, frame_index=6)
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    add(tester, MALLOC, address=16384, size=20, frame_index=6)
+    delta = tester.get_snapshot_delta(first.version)
+
+    # THEN
+    assert delta.version == first.version + 1
+    assert not delta.full
+    assert totals(delta.records) == {1: (30, 2)}
+
+
+def test_freed_location_is_reported_with_no_allocations():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    add(tester, MALLOC, address=8192, size=10, frame_index=6)
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    add(tester, FREE, address=4096, size=0)
+    delta = tester.get_snapshot_delta(first.version)
+    full = tester.get_snapshot_delta()
+
+    # THEN
+    assert totals(delta.records) == {0: (0, 0)}
+    assert totals(full.records) == {1: (10, 1)}
+
+
+def test_delta_accumulates_changes_from_every_version_since():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    add(tester, MALLOC, address=4096, size=100)
+    tester.get_snapshot_delta(first.version)
+    add(tester, MALLOC, address=8192, size=10, frame_index=6)
+    tester.get_snapshot_delta(first.version)
+    delta = tester.get_snapshot_delta(first.version)
+
+    # THEN
+    assert not delta.full
+    assert totals(delta.records) == {0: (100, 1), 1: (10, 1)}
+
+
+def test_too_old_version_returns_full_snapshot():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    for _ in range(MAX_RETAINED_VERSIONS):
+        tester.get_snapshot_delta()
+    delta = tester.get_snapshot_delta(first.version)
+
+    # THEN
+    assert delta.full
+    assert totals(delta.records) == {0: (100, 1)}
+
+
+def test_unknown_future_version_returns_full_snapshot():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+
+    # WHEN
+    delta = tester.get_snapshot_delta(1000)
+
+    # THEN
+    assert delta.full
+    assert totals(delta.records) == {0: (100, 1)}
+
+
+def test_reused_address_moves_memory_between_locations():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    add(tester, MALLOC, address=4096, size=10, frame_index=6)
+    delta = tester.get_snapshot_delta(first.version)
+
+    # THEN
+    assert totals(delta.records) == {0: (0, 0), 1: (10, 1)}
+
+
+def test_partial_munmap_shrinks_and_splits_ranges():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MMAP, address=4096, size=4096)
+
+    # WHEN
+    add(tester, MUNMAP, address=4096, size=1024)
+    shrunk = tester.get_snapshot_delta()
+    add(tester, MUNMAP, address=6144, size=1024)
+    split = tester.get_snapshot_delta()
+    add(tester, MUNMAP, address=4096, size=4096)
+    freed = tester.get_snapshot_delta(split.version)
+
+    # THEN
+    assert totals(shrunk.records) == {0: (3072, 1)}
+    assert totals(split.records) == {0: (2048, 2)}
+    assert totals(freed.records) == {0: (0, 0)}
+
+
+def test_snapshot_allocations_match_a_full_delta():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100, tid=1)
+    add(tester, MALLOC, address=8192, size=10, tid=2)
+    add(tester, MMAP, address=16384, size=4096, tid=2, frame_index=6)
+    add(tester, FREE, address=4096, size=0)
+
+    # WHEN
+    per_thread = tester.get_snapshot_allocations(merge_threads=False)
+    merged = tester.get_snapshot_allocations(merge_threads=True)
+
+    # THEN
+    assert sorted((r.tid, r.size, r.n_allocations) for r in per_thread) == [
+        (2, 10, 1),
+        (2, 4096, 1),
+    ]
+    assert sorted((r.size, r.n_allocations) for r in merged) == [
+        (10, 1),
+        (4096, 1),
+    ]
+
+
+def sizes(records):
+    return sorted((record.size, record.n_allocations) for record in records)
+
+
+def test_history_samples_only_record_what_was_live_at_the_time():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness(history_retention_ms=10_000)
+    add(tester, MALLOC, address=4096, size=100)
+    tester.take_history_sample(1000)
+    add(tester, MALLOC, address=8192, size=10, frame_index=6)
+    tester.take_history_sample(2000)
+    add(tester, FREE, address=4096, size=0)
+    tester.take_history_sample(3000)
+
+    # WHEN
+    timestamps = tester.get_history_timestamps()
+    samples = [tester.get_history_allocations(i) for i in range(len(timestamps))]
+
+    # THEN
+    assert timestamps == [1000, 2000, 3000]
+    assert sizes(samples[0]) == [(100, 1)]
+    assert sizes(samples[1]) == [(10, 1), (100, 1)]
+    assert sizes(samples[2]) == [(10, 1)]
+
+
+def test_history_samples_outside_the_window_are_folded_into_the_base():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness(history_retention_ms=1500)
+    add(tester, MALLOC, address=4096, size=100)
+    tester.take_history_sample(1000)
+    add(tester, MALLOC, address=8192, size=10, frame_index=6)
+    tester.take_history_sample(2000)
+
+    # WHEN
+    add(tester, MALLOC, address=16384, size=1, frame_index=7)
+    tester.take_history_sample(3000)
+
+    # THEN
+    assert tester.get_history_timestamps() == [2000, 3000]
+    assert sizes(tester.get_history_allocations(0)) == [(10, 1), (100, 1)]
+    assert sizes(tester.get_history_allocations(1)) == [(1, 1), (10, 1), (100, 1)]
+
+
+def test_history_sample_index_out_of_range():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness(history_retention_ms=1000)
+    tester.take_history_sample(1000)
+
+    # WHEN/THEN
+    with pytest.raises(IndexError):
+        tester.get_history_allocations(1)
+
+
+def test_running_totals():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+
+    # WHEN
+    add(tester, MALLOC, address=4096, size=100)
+    add(tester, MALLOC, address=8192, size=10)
+    add(tester, FREE, address=4096, size=0)
+    add(tester, MMAP, address=16384, size=4096)
+    add(tester, MUNMAP, address=16384, size=1024)
+
+    # THEN
+    assert tester.heap_size == 10 + 3072
+    assert tester.total_allocations == 3
+    assert tester.total_allocated_bytes == 100 + 10 + 4096
+
+
+def test_location_totals_replace_the_previous_ones():
+    # GIVEN
+    tester = IncrementalSnapshotAggregatorTestHarness()
+    add(tester, MALLOC, address=4096, size=100)
+    first = tester.get_snapshot_delta()
+
+    # WHEN
+    tester.set_location_totals(
+        tid=1,
+        size=30,
+        n_allocations=3,
+        native_frame_id=4,
+        frame_index=5,
+        native_segment_generation=0,
+    )
+    delta = tester.get_snapshot_delta(first.version)
+
+    # THEN
+    assert totals(delta.records) == {0: (30, 3)}
+    assert tester.heap_size == 30
+    assert tester.total_allocations == 1
@@ -0,0 +1,63 @@
+import pytest
+
+from memray import _memory_limits
+from memray._memory_limits import parse_size
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1234, 1234),
+        ("1234", 1234),
+        ("1k", 1024),
+        ("512M", 512 * 1024**2),
+        ("2GB", 2 * 1024**3),
+        ("1.5 GiB", 3 * 1024**3 // 2),
+        ("1t", 1024**4),
+    ],
+)
+def test_parse_size(value, expected):
+    assert parse_size(value, allow_percentage=False) == expected
+
+
+@pytest.mark.parametrize("value", ["", "abc", "12Q", "-5", 0, "0M", "90%"])
+def test_parse_size_rejects_invalid_sizes(value):
+    with pytest.raises(ValueError):
+        parse_size(value, allow_percentage=False)
+
+
+def test_parse_size_percentage_of_cgroup_limit(monkeypatch):
+    monkeypatch.setattr(_memory_limits, "cgroup_memory_limit", lambda: 1000)
+    assert parse_size("90%", allow_percentage=True) == 900
+    assert parse_size(" 12.5% ", allow_percentage=True) == 125
+
+
+@pytest.mark.parametrize("value", ["0%", "101%", "x%"])
+def test_parse_size_rejects_invalid_percentages(monkeypatch, value):
+    monkeypatch.setattr(_memory_limits, "cgroup_memory_limit", lambda: 1000)
+    with pytest.raises(ValueError, match="ercentage"):
+        parse_size(value, allow_percentage=True)
+
+
+def test_parse_size_percentage_without_cgroup_limit(monkeypatch):
+    monkeypatch.setattr(_memory_limits, "cgroup_memory_limit", lambda: None)
+    with pytest.raises(ValueError, match="no cgroup memory limit"):
+        parse_size("90%", allow_percentage=True)
+
+
+@pytest.mark.parametrize(
+    "contents, expected",
+    [
+        ("1073741824\n", 1073741824),
+        ("max\n", None),
+        ("9223372036854771712\n", None),
+    ],
+)
+def test_read_limit(tmp_path, contents, expected):
+    limit_file = tmp_path / "memory.max"
+    limit_file.write_text(contents)
+    assert _memory_limits._read_limit(limit_file) == expected
+
+
+def test_read_limit_missing_file(tmp_path):
+    assert _memory_limits._read_limit(tmp_path / "memory.max") is None
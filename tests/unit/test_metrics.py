@@ -0,0 +1,140 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from memray._memray import LiveStats
+from memray._metrics import CONTENT_TYPE
+from memray._metrics import MetricsServer
+
+
+class FakeReader:
+    """A reader for a tracked process without native traces."""
+
+    has_native_traces = False
+
+    def __init__(self, rows, stats):
+        self.is_active = True
+        self.rows = rows
+        self.stats = stats
+
+    def get_live_stats(self):
+        return self.stats
+
+    def get_location_rollup(self):
+        return list(self.rows), {1: "MainThread"}
+
+
+def test_render_metrics():
+    # GIVEN
+    reader = FakeReader(
+        rows=[
+            ("main", "script.py", 0, 1500, 3, (1,)),
+            ("big", "script.py", 1000, 1000, 1, (1,)),
+            ("small", "lib.py", 500, 500, 2, (1,)),
+        ],
+        stats=LiveStats(
+            heap_size=1500,
+            total_allocations=10,
+            total_allocated_bytes=4096,
+            rss=8192,
+            time=1000,
+        ),
+    )
+    server = MetricsServer(reader, 0, top_locations=10)
+
+    # WHEN
+    try:
+        output = server.render()
+    finally:
+        server.close()
+
+    # THEN
+    samples = [line for line in output.splitlines() if not line.startswith("#")]
+    assert samples == [
+        "memray_tracking_active 1",
+        "memray_heap_bytes 1500",
+        "memray_rss_bytes 8192",
+        "memray_allocations_total 10",
+        "memray_allocated_bytes_total 4096",
+        'memray_location_heap_bytes{function="main",file="script.py"} 1500',
+        'memray_location_heap_bytes{function="big",file="script.py"} 1000',
+        'memray_location_heap_bytes{function="small",file="lib.py"} 500',
+        'memray_location_allocations{function="main",file="script.py"} 3',
+        'memray_location_allocations{function="big",file="script.py"} 1',
+        'memray_location_allocations{function="small",file="lib.py"} 2',
+    ]
+    assert "# TYPE memray_allocations_total counter" in output
+    assert "# TYPE memray_heap_bytes gauge" in output
+
+
+def test_render_metrics_limits_locations_and_escapes_labels():
+    # GIVEN
+    reader = FakeReader(
+        rows=[
+            ('say "hi"', "C:\\script.py", 300, 300, 1, (1,)),
+            ("second", "script.py", 200, 200, 1, (1,)),
+            ("third", "script.py", 100, 100, 1, (1,)),
+        ],
+        stats=LiveStats(600, 3, 600, None, None),
+    )
+    server = MetricsServer(reader, 0, top_locations=1)
+
+    # WHEN
+    try:
+        output = server.render()
+    finally:
+        server.close()
+
+    # THEN
+    assert "memray_rss_bytes" not in output
+    location_samples = [
+        line for line in output.splitlines() if line.startswith("memray_location")
+    ]
+    labels = '{function="say \\"hi\\"",file="C:\\\\script.py"}'
+    assert location_samples == [
+        f"memray_location_heap_bytes{labels} 300",
+        f"memray_location_allocations{labels} 1",
+    ]
+
+
+def test_render_metrics_without_allocation_totals():
+    # GIVEN
+    reader = FakeReader(
+        rows=[("main", "script.py", 100, 100, 1, (1,))],
+        stats=LiveStats(100, None, None, 8192, 1000),
+    )
+    server = MetricsServer(reader, 0)
+
+    # WHEN
+    try:
+        output = server.render()
+    finally:
+        server.close()
+
+    # THEN
+    assert "memray_heap_bytes 100" in output
+    assert "memray_allocations_total" not in output
+    assert "memray_allocated_bytes_total" not in output
+
+
+def test_metrics_are_served_over_http():
+    # GIVEN
+    reader = FakeReader(rows=[], stats=LiveStats(0, 0, 0, None, None))
+    server = MetricsServer(reader, 0)
+    server.start()
+
+    # WHEN
+    try:
+        with urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            content_type = response.headers["Content-Type"]
+            body = response.read().decode("utf-8")
+        with pytest.raises(HTTPError) as exc_info:
+            urlopen(f"http://127.0.0.1:{server.port}/")
+    finally:
+        server.close()
+
+    # THEN
+    assert content_type == CONTENT_TYPE
+    assert "memray_heap_bytes 0" in body
+    assert exc_info.value.code == 404
@@ -1,8 +1,19 @@
 import csv
+import gzip
 import json
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from io import BytesIO
 from io import StringIO
+from io import TextIOWrapper
+
+import pytest
 
 from memray import AllocatorType
+from memray import FileFormat
+from memray import MemorySnapshot
+from memray import Metadata
 from memray.reporters.transform import TransformReporter
 from tests.utils import MockAllocationRecord
 
@@ -373,3 +384,836 @@ class TestCSVTransformReporter:
         assert output_data == [
             ["MALLOC", "1", "1024", "1", "0x1", "me;foo.py;12|you;bar.py;21"]
         ]
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _decode_message(data):
+    fields = defaultdict(list)
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        if key & 7 == 0:
+            value, pos = _read_varint(data, pos)
+        else:
+            assert key & 7 == 2
+            length, pos = _read_varint(data, pos)
+            value = data[pos : pos + length]
+            pos += length
+        fields[key >> 3].append(value)
+    return fields
+
+
+def _decode_packed(data):
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def decode_pprof(output):
+    profile = _decode_message(gzip.decompress(output.buffer.getvalue()))
+    strings = [string.decode() for string in profile[6]]
+
+    def value_type(data):
+        message = _decode_message(data)
+        return strings[message[1][0]], strings[message[2][0]]
+
+    functions = {}
+    for data in profile[5]:
+        message = _decode_message(data)
+        functions[message[1][0]] = (strings[message[2][0]], strings[message[4][0]])
+
+    locations = {}
+    for data in profile[4]:
+        message = _decode_message(data)
+        line = _decode_message(message[4][0])
+        function, file = functions[line[1][0]]
+        locations[message[1][0]] = (function, file, line.get(2, [0])[0])
+
+    samples = []
+    for data in profile[2]:
+        message = _decode_message(data)
+        stack = [locations[loc] for loc in _decode_packed(b"".join(message[1]))]
+        samples.append((stack, _decode_packed(b"".join(message[2]))))
+
+    return {
+        "sample_types": [value_type(data) for data in profile[1]],
+        "default_sample_type": strings[profile[14][0]],
+        "period_type": value_type(profile[11][0]),
+        "samples": samples,
+        "n_functions": len(functions),
+        "n_locations": len(locations),
+        "time_nanos": profile.get(9, [0])[0],
+        "duration_nanos": profile.get(10, [0])[0],
+        "comments": [strings[index] for index in profile.get(13, [])],
+    }
+
+
+class TestPprofTransformReporter:
+    SAMPLE_TYPES = [
+        ("alloc_objects", "count"),
+        ("alloc_space", "bytes"),
+        ("inuse_objects", "count"),
+        ("inuse_space", "bytes"),
+    ]
+
+    def test_empty_report(self):
+        # GIVEN
+        reporter = TransformReporter(
+            [], format="pprof", memory_records=[], native_traces=False
+        )
+        output = TextIOWrapper(BytesIO())
+
+        # WHEN
+        reporter.render_as_pprof(output)
+
+        # THEN
+        profile = decode_pprof(output)
+        assert profile["sample_types"] == self.SAMPLE_TYPES
+        assert profile["default_sample_type"] == "inuse_space"
+        assert profile["period_type"] == ("space", "bytes")
+        assert profile["samples"] == []
+        assert profile["n_functions"] == 0
+        assert profile["n_locations"] == 0
+
+    def test_multiple_allocations(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=2,
+                n_allocations=10,
+                _stack=[
+                    ("me", "foo.py", 13),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=64,
+                allocator=AllocatorType.MALLOC,
+                stack_id=3,
+                n_allocations=1,
+                _stack=[],
+            ),
+        ]
+        output = TextIOWrapper(BytesIO())
+
+        reporter = TransformReporter(
+            peak_allocations, format="pprof", memory_records=[], native_traces=False
+        )
+
+        # WHEN
+        reporter.render_as_pprof(output)
+
+        # THEN
+        profile = decode_pprof(output)
+        assert profile["samples"] == [
+            (
+                [("me", "foo.py", 12), ("parent", "foo.py", 4)],
+                [1, 1024, 1, 1024],
+            ),
+            (
+                [("me", "foo.py", 13), ("parent", "foo.py", 4)],
+                [10, 2048, 10, 2048],
+            ),
+            ([], [1, 64, 1, 64]),
+        ]
+        assert profile["n_functions"] == 2
+        assert profile["n_locations"] == 3
+
+    def test_stacks_are_resolved_once(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            # Records with the same thread and stack id as an earlier record
+            # reuse its locations, without resolving their stack again.
+            MockAllocationRecord(
+                tid=1,
+                address=0x2000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=1,
+                n_allocations=10,
+            ),
+        ]
+        output = TextIOWrapper(BytesIO())
+
+        reporter = TransformReporter(
+            peak_allocations, format="pprof", memory_records=[], native_traces=False
+        )
+
+        # WHEN
+        reporter.render_as_pprof(output)
+
+        # THEN
+        profile = decode_pprof(output)
+        assert profile["samples"] == [
+            (
+                [("me", "foo.py", 12), ("parent", "foo.py", 4)],
+                [1, 1024, 1, 1024],
+            ),
+            (
+                [("me", "foo.py", 12), ("parent", "foo.py", 4)],
+                [10, 2048, 10, 2048],
+            ),
+        ]
+        assert profile["n_locations"] == 2
+
+    def test_native_allocation(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _hybrid_stack=[
+                    ("me", "fun.c", 12),
+                ],
+            ),
+        ]
+        output = TextIOWrapper(BytesIO())
+
+        reporter = TransformReporter(
+            peak_allocations, format="pprof", memory_records=[], native_traces=True
+        )
+
+        # WHEN
+        reporter.render_as_pprof(output)
+
+        # THEN
+        profile = decode_pprof(output)
+        assert profile["samples"] == [([("me", "fun.c", 12)], [1, 1024, 1, 1024])]
+
+    def test_metadata_is_recorded(self):
+        # GIVEN
+        metadata = Metadata(
+            start_time=datetime(2023, 1, 1, 12, 0, 0),
+            end_time=datetime(2023, 1, 1, 12, 0, 2),
+            total_allocations=0,
+            total_frames=0,
+            peak_memory=0,
+            command_line="python script.py",
+            pid=123,
+            main_thread_id=1,
+            python_allocator="pymalloc",
+            has_native_traces=False,
+            trace_python_allocators=False,
+            file_format=FileFormat.ALL_ALLOCATIONS,
+        )
+        reporter = TransformReporter(
+            [], format="pprof", memory_records=[], native_traces=False
+        )
+        output = TextIOWrapper(BytesIO())
+
+        # WHEN
+        reporter.render_as_pprof(output, metadata=metadata)
+
+        # THEN
+        profile = decode_pprof(output)
+        assert profile["time_nanos"] == int(metadata.start_time.timestamp() * 1e9)
+        assert profile["duration_nanos"] == 2_000_000_000
+        assert profile["comments"] == ["python script.py"]
+
+
+class TestCollapsedTransformReporter:
+    def test_empty_report(self):
+        # GIVEN
+        reporter = TransformReporter(
+            [], format="collapsed", memory_records=[], native_traces=False
+        )
+        output = StringIO()
+
+        # WHEN
+        reporter.render_as_collapsed(output)
+
+        # THEN
+        assert output.getvalue() == ""
+
+    def test_multiple_allocations(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=2,
+                n_allocations=10,
+                _stack=[
+                    ("you", "bar.py", 21),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+        ]
+        output = StringIO()
+
+        reporter = TransformReporter(
+            peak_allocations, format="collapsed", memory_records=[], native_traces=False
+        )
+
+        # WHEN
+        reporter.render_as_collapsed(output)
+
+        # THEN
+        assert output.getvalue().splitlines() == [
+            "parent (foo.py:4);me (foo.py:12) 1024",
+            "parent (foo.py:4);you (bar.py:21) 2048",
+        ]
+
+    def test_single_native_allocation(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _hybrid_stack=[
+                    ("me", "fun.c", 12),
+                ],
+            ),
+        ]
+        output = StringIO()
+
+        reporter = TransformReporter(
+            peak_allocations, format="collapsed", memory_records=[], native_traces=True
+        )
+
+        # WHEN
+        reporter.render_as_collapsed(output)
+
+        # THEN
+        assert output.getvalue().splitlines() == ["me (fun.c:12) 1024"]
+
+    def test_empty_stack_trace(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[],
+            ),
+        ]
+        output = StringIO()
+
+        reporter = TransformReporter(
+            peak_allocations, format="collapsed", memory_records=[], native_traces=False
+        )
+
+        # WHEN
+        reporter.render_as_collapsed(output)
+
+        # THEN
+        assert output.getvalue() == ""
+
+    def test_separator_in_frame_name(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("<lambda;1>", "foo.py", 12),
+                ],
+            ),
+        ]
+        output = StringIO()
+
+        reporter = TransformReporter(
+            peak_allocations, format="collapsed", memory_records=[], native_traces=False
+        )
+
+        # WHEN
+        reporter.render_as_collapsed(output)
+
+        # THEN
+        assert output.getvalue().splitlines() == ["<lambda:1> (foo.py:12) 1024"]
+
+
+class TestSpeedscopeTransformReporter:
+    def test_empty_report(self):
+        # GIVEN
+        reporter = TransformReporter(
+            [], format="speedscope", memory_records=[], native_traces=False
+        )
+        output = StringIO()
+
+        # WHEN
+        reporter.render_as_speedscope(output)
+
+        # THEN
+        assert json.loads(output.getvalue()) == {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "activeProfileIndex": 0,
+            "exporter": "memray",
+            "name": "memray",
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": "memray",
+                    "unit": "bytes",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                }
+            ],
+            "shared": {"frames": []},
+        }
+
+    def test_multiple_allocations(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=2,
+                n_allocations=10,
+                _stack=[
+                    ("you", "bar.py", 21),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=64,
+                allocator=AllocatorType.MALLOC,
+                stack_id=3,
+                n_allocations=1,
+                _stack=[],
+            ),
+        ]
+        output = StringIO()
+
+        reporter = TransformReporter(
+            peak_allocations,
+            format="speedscope",
+            memory_records=[],
+            native_traces=False,
+        )
+
+        # WHEN
+        reporter.render_as_speedscope(output)
+
+        # THEN
+        output_data = json.loads(output.getvalue())
+        assert output_data["shared"] == {
+            "frames": [
+                {"name": "me", "file": "foo.py", "line": 12},
+                {"name": "parent", "file": "foo.py", "line": 4},
+                {"name": "you", "file": "bar.py", "line": 21},
+            ]
+        }
+        (profile,) = output_data["profiles"]
+        assert profile["samples"] == [[1, 0], [1, 2], []]
+        assert profile["weights"] == [1024, 2048, 64]
+        assert profile["endValue"] == 3136
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+class TestColumnarTransformReporter:
+    @staticmethod
+    def read_tables(format, output_file):
+        pyarrow = pytest.importorskip("pyarrow")
+        if format == "parquet":
+            import pyarrow.parquet
+
+            read = pyarrow.parquet.read_table
+        else:
+            import pyarrow.ipc
+
+            def read(path):
+                with pyarrow.ipc.open_file(str(path)) as reader:
+                    return reader.read_all()
+
+        return {
+            "allocations": read(str(output_file)).to_pylist(),
+            "frames": read(
+                str(output_file.with_suffix(f".frames.{format}"))
+            ).to_pylist(),
+            "stacks": read(
+                str(output_file.with_suffix(f".stacks.{format}"))
+            ).to_pylist(),
+        }
+
+    def test_empty_report(self, format, tmp_path):
+        # GIVEN
+        pytest.importorskip("pyarrow")
+        reporter = TransformReporter(
+            [], format=format, memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / f"output.{format}"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            getattr(reporter, f"render_as_{format}")(output)
+
+        # THEN
+        assert self.read_tables(format, output_file) == {
+            "allocations": [],
+            "frames": [],
+            "stacks": [],
+        }
+
+    def test_multiple_allocations(self, format, tmp_path):
+        # GIVEN
+        pytest.importorskip("pyarrow")
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=2,
+                address=0x1000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=2,
+                n_allocations=10,
+                _stack=[
+                    ("you", "bar.py", 21),
+                    ("parent", "foo.py", 4),
+                ],
+                thread_name="worker",
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=64,
+                allocator=AllocatorType.MALLOC,
+                stack_id=3,
+                n_allocations=1,
+                _stack=[],
+            ),
+        ]
+        reporter = TransformReporter(
+            peak_allocations, format=format, memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / f"output.{format}"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            getattr(reporter, f"render_as_{format}")(output)
+
+        # THEN
+        tables = self.read_tables(format, output_file)
+        assert tables["frames"] == [
+            {"frame_id": 0, "function": "parent", "file": "foo.py", "line": 4},
+            {"frame_id": 1, "function": "me", "file": "foo.py", "line": 12},
+            {"frame_id": 2, "function": "you", "file": "bar.py", "line": 21},
+        ]
+        assert tables["stacks"] == [
+            {"stack_id": 0, "frame_id": 0, "parent_stack_id": None},
+            {"stack_id": 1, "frame_id": 1, "parent_stack_id": 0},
+            {"stack_id": 2, "frame_id": 2, "parent_stack_id": 0},
+        ]
+        assert tables["allocations"] == [
+            {
+                "allocator": "MALLOC",
+                "num_allocations": 1,
+                "size": 1024,
+                "tid": 1,
+                "thread_name": "0x1",
+                "stack_id": 1,
+            },
+            {
+                "allocator": "VALLOC",
+                "num_allocations": 10,
+                "size": 2048,
+                "tid": 2,
+                "thread_name": "0x2 (worker)",
+                "stack_id": 2,
+            },
+            {
+                "allocator": "MALLOC",
+                "num_allocations": 1,
+                "size": 64,
+                "tid": 1,
+                "thread_name": "0x1",
+                "stack_id": None,
+            },
+        ]
+
+    def test_rows_are_written_in_batches(self, format, tmp_path, monkeypatch):
+        # GIVEN
+        pytest.importorskip("pyarrow")
+        monkeypatch.setattr("memray.reporters.transform.COLUMNAR_BATCH_SIZE", 2)
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=i,
+                allocator=AllocatorType.MALLOC,
+                stack_id=i,
+                n_allocations=1,
+                _stack=[(f"func_{i}", "foo.py", i)],
+            )
+            for i in range(5)
+        ]
+        reporter = TransformReporter(
+            peak_allocations, format=format, memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / f"output.{format}"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            getattr(reporter, f"render_as_{format}")(output)
+
+        # THEN
+        tables = self.read_tables(format, output_file)
+        assert [row["size"] for row in tables["allocations"]] == list(range(5))
+        assert [row["stack_id"] for row in tables["allocations"]] == list(range(5))
+        assert len(tables["frames"]) == 5
+
+
+class TestSqliteTransformReporter:
+    def test_empty_report(self, tmp_path):
+        # GIVEN
+        reporter = TransformReporter(
+            [], format="sqlite", memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / "output.sqlite"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            reporter.render_as_sqlite(output)
+
+        # THEN
+        with sqlite3.connect(output_file) as connection:
+            tables = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+            ).fetchall()
+            assert tables == [
+                ("allocations",),
+                ("frames",),
+                ("memory_snapshots",),
+                ("stacks",),
+                ("threads",),
+            ]
+            for (table,) in tables:
+                assert connection.execute(f"SELECT * FROM {table}").fetchall() == []
+
+    def test_multiple_allocations(self, tmp_path):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "foo.py", 12),
+                    ("parent", "foo.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=2,
+                address=0x1000000,
+                size=2048,
+                allocator=AllocatorType.VALLOC,
+                stack_id=2,
+                n_allocations=10,
+                _stack=[
+                    ("you", "bar.py", 21),
+                    ("parent", "foo.py", 4),
+                ],
+                thread_name="worker",
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=64,
+                allocator=AllocatorType.MALLOC,
+                stack_id=3,
+                n_allocations=1,
+                _stack=[],
+            ),
+        ]
+        memory_records = [
+            MemorySnapshot(time=1000, rss=4096, heap=1024),
+            MemorySnapshot(time=1010, rss=8192, heap=3136),
+        ]
+        reporter = TransformReporter(
+            peak_allocations,
+            format="sqlite",
+            memory_records=memory_records,
+            native_traces=False,
+        )
+        output_file = tmp_path / "output.sqlite"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            reporter.render_as_sqlite(output)
+
+        # THEN
+        with sqlite3.connect(output_file) as connection:
+            assert connection.execute("SELECT * FROM frames").fetchall() == [
+                (0, "parent", "foo.py", 4),
+                (1, "me", "foo.py", 12),
+                (2, "you", "bar.py", 21),
+            ]
+            assert connection.execute("SELECT * FROM stacks").fetchall() == [
+                (0, 0, None),
+                (1, 1, 0),
+                (2, 2, 0),
+            ]
+            assert connection.execute("SELECT * FROM threads").fetchall() == [
+                (1, ""),
+                (2, "worker"),
+            ]
+            assert connection.execute("SELECT * FROM allocations").fetchall() == [
+                ("MALLOC", 1, 1024, 1, 1),
+                ("VALLOC", 10, 2048, 2, 2),
+                ("MALLOC", 1, 64, 1, None),
+            ]
+            assert connection.execute("SELECT * FROM memory_snapshots").fetchall() == [
+                (1000, 4096, 1024),
+                (1010, 8192, 3136),
+            ]
+
+    def test_indexes_are_created(self, tmp_path):
+        # GIVEN
+        reporter = TransformReporter(
+            [], format="sqlite", memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / "output.sqlite"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            reporter.render_as_sqlite(output)
+
+        # THEN
+        with sqlite3.connect(output_file) as connection:
+            indexes = set(
+                connection.execute(
+                    "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"
+                )
+            )
+        assert {
+            ("allocations", "allocations_stack_id"),
+            ("allocations", "allocations_tid"),
+            ("frames", "frames_file"),
+            ("memory_snapshots", "memory_snapshots_time"),
+            ("stacks", "stacks_parent_stack_id"),
+        } <= indexes
+
+    def test_rows_are_inserted_in_batches(self, tmp_path, monkeypatch):
+        # GIVEN
+        monkeypatch.setattr("memray.reporters.transform.SQLITE_BATCH_SIZE", 2)
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=i,
+                allocator=AllocatorType.MALLOC,
+                stack_id=i,
+                n_allocations=1,
+                _stack=[(f"func_{i}", "foo.py", i)],
+            )
+            for i in range(5)
+        ]
+        reporter = TransformReporter(
+            peak_allocations, format="sqlite", memory_records=[], native_traces=False
+        )
+        output_file = tmp_path / "output.sqlite"
+
+        # WHEN
+        with open(output_file, "w") as output:
+            reporter.render_as_sqlite(output)
+
+        # THEN
+        with sqlite3.connect(output_file) as connection:
+            assert connection.execute(
+                "SELECT size, stack_id FROM allocations"
+            ).fetchall() == [(i, i) for i in range(5)]
+            assert connection.execute("SELECT COUNT(*) FROM frames").fetchone() == (5,)
@@ -970,21 +970,7 @@ class TestTreeTui:
                 ),
                 TreeElement(
                     label="📂 4.000KB (40.00 %) grandparent  fun.py:4",
-                    children=[
-                        TreeElement(
-                            label="📂 4.000KB (40.00 %) parent  fun.py:8",
-                            children=[
-                                TreeElement(
-                                    label="📄 4.000KB (40.00 %) me  fun.py:12",
-                                    children=[],
-                                    allow_expand=False,
-                                    is_expanded=False,
-                                )
-                            ],
-                            allow_expand=True,
-                            is_expanded=False,
-                        )
-                    ],
+                    children=[],
                     allow_expand=True,
                     is_expanded=False,
                 ),
@@ -1101,21 +1087,7 @@ class TestTreeTui:
                 ),
                 TreeElement(
                     label="📂 1.000KB (9.09 %) grandparent  runpy.py:4",
-                    children=[
-                        TreeElement(
-                            label="📂 1.000KB (9.09 %) parent  runpy.py:8",
-                            children=[
-                                TreeElement(
-                                    label="📄 1.000KB (9.09 %) me  foo.py:12",
-                                    children=[],
-                                    allow_expand=False,
-                                    is_expanded=False,
-                                )
-                            ],
-                            allow_expand=True,
-                            is_expanded=False,
-                        )
-                    ],
+                    children=[],
                     allow_expand=True,
                     is_expanded=False,
                 ),
@@ -1485,6 +1457,77 @@ class TestTreeTui:
             is_expanded=True,
         )
 
+    def test_children_are_added_when_node_is_expanded(self):
+        # GIVEN
+        peak_allocations = [
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me", "fun.py", 12),
+                    ("parent", "fun.py", 8),
+                    ("grandparent", "fun.py", 4),
+                ],
+            ),
+            MockAllocationRecord(
+                tid=1,
+                address=0x1000000,
+                size=1024 * 10,
+                allocator=AllocatorType.MALLOC,
+                stack_id=1,
+                n_allocations=1,
+                _stack=[
+                    ("me2", "fun2.py", 12),
+                    ("parent2", "fun2.py", 8),
+                    ("grandparent2", "fun2.py", 4),
+                ],
+            ),
+        ]
+
+        reporter = TreeReporter.from_snapshot(
+            peak_allocations, native_traces=False, biggest_allocs=3
+        )
+        app = reporter.get_app()
+
+        # WHEN
+        async def run_test():
+            async with app.run_test() as pilot:
+                await pilot.pause()
+                tree = app.query_one(Tree)
+                child = tree.root.children[1]
+                before = tree_to_dict(child)
+                getattr(tree, "move_cursor", tree.select_node)(child)
+                await pilot.press("space")
+                await pilot.pause()
+                return before, tree_to_dict(child)
+
+        before, after = async_run(run_test())
+
+        # THEN
+        assert before == TreeElement(
+            label="📂 1.000KB (9.09 %) grandparent  fun.py:4",
+            children=[],
+            allow_expand=True,
+            is_expanded=False,
+        )
+        assert after == TreeElement(
+            label="📂 1.000KB (9.09 %) grandparent  fun.py:4",
+            children=[
+                TreeElement(
+                    label="📂 1.000KB (9.09 %) parent  fun.py:8",
+                    children=[],
+                    allow_expand=True,
+                    is_expanded=False,
+                )
+            ],
+            allow_expand=True,
+            is_expanded=True,
+        )
+
     def test_very_deep_call_is_limited(self):
         # GIVEN
         n_frames = MAX_STACKS + 50
@@ -22,12 +22,16 @@ from textual.widgets import Label
 import memray.reporters.tui
 from memray import AllocationRecord
 from memray import AllocatorType
+from memray._memray import SnapshotDelta
+from memray.reporters.tui import AllocationEntry
+from memray.reporters.tui import IncrementalAggregator
 from memray.reporters.tui import Location
 from memray.reporters.tui import MemoryGraph
 from memray.reporters.tui import Snapshot
 from memray.reporters.tui import SnapshotFetched
 from memray.reporters.tui import TUIApp
 from memray.reporters.tui import aggregate_allocations
+from memray.reporters.tui import snapshot_from_rollup
 from tests.utils import MockAllocationRecord
 from tests.utils import async_run
 
@@ -56,6 +60,7 @@ class MockApp(TUIApp):
                     records_by_location=aggregate_allocations(
                         cast(List[AllocationRecord], records), native_traces=native
                     ),
+                    thread_names={record.tid: record.thread_name for record in records},
                 ),
                 disconnected,
             )
@@ -79,6 +84,7 @@ class MockReader:
         has_native_traces: bool = True,
         pid: Optional[int] = None,
         command_line: Optional[str] = None,
+        history: Optional[Dict[int, List[MockAllocationRecord]]] = None,
     ):
         self._snapshots = cast(List[List[AllocationRecord]], snapshots)
         self._next_snapshot = 0
@@ -86,17 +92,53 @@ class MockReader:
         self.command_line = command_line
         self.pid = pid
         self.has_native_traces = has_native_traces
+        self._history = cast(Dict[int, List[AllocationRecord]], history or {})
+        self.history_retention = 300.0 if history else 0.0
 
-    def get_current_snapshot(
-        self, *, merge_threads: bool
-    ) -> Iterable[AllocationRecord]:
-        assert isinstance(merge_threads, bool)  # ignore unused argument
+    def _next(self) -> List[AllocationRecord]:
         assert self.is_active
         snapshot = self._snapshots[self._next_snapshot]
         self._next_snapshot += 1
         self.is_active = self._next_snapshot < len(self._snapshots)
         return snapshot
 
+    def get_snapshot_delta(self, since_version: int = 0) -> SnapshotDelta:
+        assert since_version == self._next_snapshot
+        return SnapshotDelta(
+            version=self._next_snapshot + 1,
+            full=True,
+            records=dict(enumerate(self._next())),
+        )
+
+    def get_location_rollup(self):
+        return self._rollup(self._next())
+
+    def get_history_timestamps(self) -> List[int]:
+        return sorted(self._history)
+
+    def get_history_snapshot(self, index: int) -> List[AllocationRecord]:
+        return self._history[self.get_history_timestamps()[index]]
+
+    def get_history_location_rollup(self, index: int):
+        return self._rollup(self.get_history_snapshot(index))
+
+    @staticmethod
+    def _rollup(snapshot):
+        entries = aggregate_allocations(snapshot, native_traces=False)
+        rows = [
+            (
+                location.function,
+                location.file,
+                entry.own_memory,
+                entry.total_memory,
+                entry.n_allocations,
+                tuple(sorted(entry.thread_ids)),
+            )
+            for location, entry in entries.items()
+        ]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows, {record.tid: record.thread_name for record in snapshot}
+
 
 @pytest.fixture
 def compare(monkeypatch, tmp_path, snap_compare):
@@ -461,11 +503,46 @@ def test_update_thread(native_traces):
         last_message = i == len(messages) - 1
         assert message.disconnected is last_message
         assert message.snapshot.heap_size == sum(a.size for a in snapshots[i])
-        assert message.snapshot.records == snapshots[i]
         assert message.snapshot.records_by_location == aggregate_allocations(
-            message.snapshot.records,
+            snapshots[i],
             native_traces=native_traces,
         )
+        assert message.snapshot.thread_names == {
+            record.tid: record.thread_name for record in snapshots[i]
+        }
+        if native_traces:
+            assert message.snapshot.records == snapshots[i]
+
+
+@pytest.mark.parametrize("native_traces", [False, True])
+def test_update_thread_fetches_history(native_traces):
+    """Test that rewinding makes the update thread also send an older snapshot."""
+    # GIVEN
+    old = [mock_allocation([("old", "fun.py", 1)], size=1024)]
+    new = [mock_allocation([("new", "fun.py", 2)], size=2048)]
+    reader = MockReader([new], native_traces, history={1000: old, 4000: new})
+    messages = []
+
+    class FakeApp:
+        def post_message(self, message):
+            messages.append(message)
+
+    thread = memray.reporters.tui.UpdateThread(FakeApp(), reader)
+
+    # WHEN
+    thread.history_offset = 5
+    thread.run()
+
+    # THEN
+    (message,) = messages
+    assert thread.history_offset == 2
+    assert message.snapshot.heap_size == 2048
+    assert message.history is not None
+    assert message.history.age == 3
+    assert message.history.snapshot.heap_size == 1024
+    assert message.history.snapshot.records_by_location == aggregate_allocations(
+        old, native_traces=native_traces
+    )
 
 
 @pytest.mark.parametrize(
@@ -1012,6 +1089,109 @@ class TestAggregateResults:
         assert me.n_allocations == 3
 
 
+def test_snapshot_from_rollup():
+    # GIVEN
+    rows = [
+        ("parent", "fun.py", 0, 30, 3, (1, 2)),
+        ("sibling", "fun.py", 20, 20, 1, (2,)),
+        ("me", "fun.py", 10, 10, 2, (1,)),
+    ]
+
+    # WHEN
+    snapshot = snapshot_from_rollup(rows, {1: "main", 2: "worker"})
+
+    # THEN
+    assert snapshot.heap_size == 30
+    assert snapshot.records == []
+    assert snapshot.thread_names == {1: "main", 2: "worker"}
+    assert snapshot.records_by_location == {
+        Location("parent", "fun.py"): AllocationEntry(0, 30, 3, {1, 2}),
+        Location("sibling", "fun.py"): AllocationEntry(20, 20, 1, {2}),
+        Location("me", "fun.py"): AllocationEntry(10, 10, 2, {1}),
+    }
+
+
+class TestIncrementalAggregator:
+    def test_matches_aggregate_allocations_after_each_delta(self):
+        # GIVEN
+        parent = mock_allocation(
+            tid=1,
+            size=10,
+            stack=[("me", "fun.py", 12), ("parent", "fun.py", 8)],
+        )
+        sibling = mock_allocation(
+            tid=2,
+            size=20,
+            stack=[("sibling", "fun.py", 16), ("parent", "fun.py", 8)],
+        )
+        grown_sibling = mock_allocation(
+            tid=2,
+            size=50,
+            n_allocations=2,
+            stack=[("sibling", "fun.py", 16), ("parent", "fun.py", 8)],
+        )
+        freed_parent = mock_allocation(
+            tid=1,
+            size=0,
+            n_allocations=0,
+            stack=[("me", "fun.py", 12), ("parent", "fun.py", 8)],
+        )
+        deltas = [
+            SnapshotDelta(1, True, {0: parent, 1: sibling}),
+            SnapshotDelta(2, False, {1: grown_sibling}),
+            SnapshotDelta(3, False, {0: freed_parent}),
+        ]
+        expected_records = [[parent, sibling], [parent, grown_sibling], [grown_sibling]]
+
+        aggregator = IncrementalAggregator(native_traces=False)
+        for delta, records in zip(deltas, expected_records):
+            # WHEN
+            aggregator.apply(delta)
+            snapshot = aggregator.snapshot()
+
+            # THEN
+            assert aggregator.version == delta.version
+            assert snapshot.records == records
+            assert snapshot.heap_size == sum(record.size for record in records)
+            assert snapshot.records_by_location == aggregate_allocations(
+                cast(List[AllocationRecord], records)
+            )
+
+    def test_full_delta_discards_previous_state(self):
+        # GIVEN
+        old = mock_allocation(size=10, stack=[("old", "fun.py", 1)])
+        new = mock_allocation(size=20, stack=[("new", "fun.py", 1)])
+        aggregator = IncrementalAggregator()
+        aggregator.apply(SnapshotDelta(1, True, {0: old}))
+
+        # WHEN
+        aggregator.apply(SnapshotDelta(7, True, {0: new}))
+
+        # THEN
+        snapshot = aggregator.snapshot()
+        assert snapshot.heap_size == 20
+        assert list(snapshot.records_by_location) == [Location("new", "fun.py")]
+
+    def test_previous_snapshots_are_not_modified(self):
+        # GIVEN
+        first = mock_allocation(tid=1, size=10, stack=[("f", "fun.py", 1)])
+        second = mock_allocation(tid=2, size=20, stack=[("f", "fun.py", 1)])
+        aggregator = IncrementalAggregator()
+        aggregator.apply(SnapshotDelta(1, True, {0: first}))
+        before = aggregator.snapshot()
+
+        # WHEN
+        aggregator.apply(SnapshotDelta(2, False, {1: second}))
+        after = aggregator.snapshot()
+
+        # THEN
+        location = Location("f", "fun.py")
+        assert before.records_by_location[location].total_memory == 10
+        assert before.records_by_location[location].thread_ids == {1}
+        assert after.records_by_location[location].total_memory == 30
+        assert after.records_by_location[location].thread_ids == {1, 2}
+
+
 def test_merge_threads(compare):
     async def run_before(pilot: Pilot) -> None:
         snapshot = [
@@ -65,6 +65,8 @@ class MockAllocationRecord:
     _stack: Optional[List[Tuple[str, str, int]]] = None
     _hybrid_stack: Optional[List[Tuple[str, str, int]]] = None
     thread_name: str = ""
+    native_stack_id: int = 0
+    native_segment_generation: int = 0
 
     @staticmethod
     def __get_stack_trace(stack, max_stacks):